@@ -0,0 +1,252 @@
+"""转换速度基准测试
+
+用lavfi的testsrc2/sine生成固定内容的测试视频，使用与转换器相同的命令构建和执行器，
+在不同输出格式、分辨率、码率和CPU编码器组合下转换，记录帧率、速度、耗时和CPU时间，
+并与保存的基准结果比较，标记变慢的组合。例如：
+
+    python benchmark.py --save-baseline baseline.json
+    python benchmark.py --baseline baseline.json --threshold 0.1
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+try:
+    import resource  # 仅POSIX系统可以统计子进程CPU时间
+except ImportError:
+    resource = None
+
+import convert_engine as engine
+import encoder_probe
+
+
+# 测试视频 {名称: (分辨率, 时长秒)}
+CLIPS = {
+    "360p_5s": ("640x360", 5),
+    "720p_5s": ("1280x720", 5),
+    "1080p_5s": ("1920x1080", 5),
+    "1080p_20s": ("1920x1080", 20),
+}
+
+# 预设测试矩阵
+MATRICES = {
+    "quick": {
+        "clips": ["720p_5s"],
+        "formats": ["mp4", "mkv"],
+        "resolutions": ["原始分辨率", "480p (854x480)"],
+        "bitrates": ["自动", "5 Mbps"],
+        "encoders": ["libx264"],
+    },
+    "full": {
+        "clips": list(CLIPS),
+        "formats": [value for _, value in engine.OUTPUT_FORMATS],
+        "resolutions": ["原始分辨率", "1080p (1920x1080)", "720p (1280x720)", "480p (854x480)"],
+        "bitrates": ["自动", "20 Mbps", "5 Mbps"],
+        "encoders": sorted(encoder_probe.CPU_ENCODERS),
+    },
+}
+
+# 基准文件格式版本
+BASELINE_VERSION = 1
+
+
+def generate_clip(ffmpeg_path, clip_dir, name):
+    """生成测试视频（已存在时直接使用），内容完全由参数决定，每次生成的结果相同"""
+    size, duration = CLIPS[name]
+    path = os.path.join(clip_dir, f"{name}.mkv")
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        return path
+    os.makedirs(clip_dir, exist_ok=True)
+    cmd = [
+        ffmpeg_path, "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={duration}",
+        "-map", "0:v", "-map", "1:a",
+        "-c:v", "libx264", "-preset", "ultrafast", "-crf", "18", "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+        "-fflags", "+bitexact", "-flags:v", "+bitexact", "-flags:a", "+bitexact",
+        "-map_metadata", "-1",
+        "-y", path
+    ]
+    code, _ = encoder_probe.run_ffmpeg(ffmpeg_path, cmd[1:], timeout=600)
+    if code != 0:
+        raise RuntimeError(f"生成测试视频失败: {' '.join(cmd)}")
+    return path
+
+
+def children_cpu_time():
+    """已结束子进程的CPU时间(用户, 系统)，不支持的平台返回(None, None)"""
+    if resource is None:
+        return None, None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime, usage.ru_stime
+
+
+def case_id(clip, output_format, resolution, bitrate, encoder):
+    """测试组合的唯一标识"""
+    return f"{clip}|{output_format}|{engine.parse_resolution(resolution) or 'source'}|" \
+           f"{engine.parse_bitrate(bitrate) or 'auto'}|{encoder}"
+
+
+def run_case(ffmpeg_path, clip_path, output_dir, output_format, resolution, bitrate, encoder):
+    """用转换执行器跑一次转换，返回测量结果"""
+    job = engine.create_jobs(
+        [clip_path],
+        output_dir,
+        output_format,
+        resolution=engine.parse_resolution(resolution),
+        bitrate=engine.parse_bitrate(bitrate),
+        video_codec=encoder
+    )[0]
+    samples = []
+
+    def on_event(event):
+        if event.kind == "progress" and event.stats is not None:
+            samples.append(event.stats)
+
+    # 单任务、不分析媒体信息、不直接复制流，只测量编码本身
+    runner = engine.ConversionRunner(ffmpeg_path, [job], max_workers=1, on_event=on_event, stream_copy=False)
+    user_before, sys_before = children_cpu_time()
+    start = time.perf_counter()
+    success = runner.run()
+    wall = time.perf_counter() - start
+    user_after, sys_after = children_cpu_time()
+
+    fps_values = [s.fps for s in samples if s.fps]
+    speed_values = [s.speed for s in samples if s.speed]
+    try:
+        output_bytes = os.path.getsize(job.output_file)
+    except OSError:
+        output_bytes = None
+    return {
+        "ok": success,
+        "wall": round(wall, 3),
+        "cpu_user": round(user_after - user_before, 3) if user_before is not None else None,
+        "cpu_sys": round(sys_after - sys_before, 3) if sys_before is not None else None,
+        # 最后一组进度数据是整个编码过程的平均值
+        "fps": fps_values[-1] if fps_values else None,
+        "speed": speed_values[-1] if speed_values else None,
+        "output_bytes": output_bytes,
+    }
+
+
+def median_result(results):
+    """多次运行取中位数（按耗时）"""
+    ok_results = [r for r in results if r["ok"]]
+    if not ok_results:
+        return results[-1]
+    ok_results.sort(key=lambda r: r["wall"])
+    result = dict(ok_results[len(ok_results) // 2])
+    result["runs"] = len(results)
+    result["wall_min"] = ok_results[0]["wall"]
+    result["wall_stdev"] = round(statistics.pstdev(r["wall"] for r in ok_results), 3)
+    return result
+
+
+def compare(results, baseline, threshold):
+    """与基准比较，返回变慢的组合列表[(组合, 基准耗时, 当前耗时, 变化比例)]"""
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base or not base.get("ok") or not result.get("ok"):
+            continue
+        change = (result["wall"] - base["wall"]) / base["wall"] if base["wall"] else 0
+        if change > threshold:
+            regressions.append((key, base["wall"], result["wall"], change))
+    return regressions
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="视频转换速度基准测试")
+    parser.add_argument("--ffmpeg", default=None, help="FFmpeg可执行文件路径")
+    parser.add_argument("--matrix", default="quick", choices=sorted(MATRICES), help="预设测试矩阵")
+    parser.add_argument("--clips", nargs="+", choices=sorted(CLIPS), help="测试视频（覆盖预设）")
+    parser.add_argument("--formats", nargs="+", help="输出格式（覆盖预设）")
+    parser.add_argument("--resolutions", nargs="+", help="分辨率选项，如\"720p (1280x720)\"（覆盖预设）")
+    parser.add_argument("--bitrates", nargs="+", help="码率选项，如\"5 Mbps\"（覆盖预设）")
+    parser.add_argument("--encoders", nargs="+", help="CPU编码器（覆盖预设）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个组合运行次数，取中位数")
+    parser.add_argument("--work-dir", default=os.path.join(engine.default_cache_dir(), "benchmark"),
+                        help="测试视频和输出文件目录")
+    parser.add_argument("--output", default=None, help="把本次结果保存为JSON")
+    parser.add_argument("--baseline", default=None, help="用于比较的基准JSON")
+    parser.add_argument("--save-baseline", default=None, help="把本次结果保存为新的基准JSON")
+    parser.add_argument("--threshold", type=float, default=0.1, help="耗时增加超过该比例视为变慢（默认0.1）")
+    return parser
+
+
+def main(argv=None):
+    """基准测试入口，有变慢的组合时返回1"""
+    args = build_parser().parse_args(argv)
+    ffmpeg_path = args.ffmpeg or encoder_probe.locate_ffmpeg()[0]
+    if not ffmpeg_path:
+        print("未找到FFmpeg", file=sys.stderr)
+        return 2
+
+    matrix = dict(MATRICES[args.matrix])
+    for key in ("clips", "formats", "resolutions", "bitrates", "encoders"):
+        if getattr(args, key):
+            matrix[key] = getattr(args, key)
+
+    # 只测试这个FFmpeg中能工作的编码器
+    capabilities = encoder_probe.probe_capabilities(ffmpeg_path)
+    encoders = [e for e in matrix["encoders"] if capabilities.works(e)]
+    skipped = sorted(set(matrix["encoders"]) - set(encoders))
+    if skipped:
+        print(f"跳过不可用的编码器: {', '.join(skipped)}")
+
+    clip_dir = os.path.join(args.work_dir, "clips")
+    output_dir = os.path.join(args.work_dir, "output")
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = {}
+    cases = list(itertools.product(matrix["clips"], matrix["formats"], matrix["resolutions"],
+                                   matrix["bitrates"], encoders))
+    print(f"{capabilities.version or 'FFmpeg'}，共 {len(cases)} 个组合，每个运行 {args.repeat} 次")
+    for n, (clip, output_format, resolution, bitrate, encoder) in enumerate(cases, 1):
+        clip_path = generate_clip(ffmpeg_path, clip_dir, clip)
+        key = case_id(clip, output_format, resolution, bitrate, encoder)
+        runs = [run_case(ffmpeg_path, clip_path, output_dir, output_format, resolution, bitrate, encoder)
+                for _ in range(max(1, args.repeat))]
+        result = median_result(runs)
+        results[key] = result
+        status = "成功" if result["ok"] else "失败"
+        fps = f"{result['fps']:.1f} fps" if result["fps"] else "- fps"
+        speed = f"{result['speed']:.2f}x" if result["speed"] else "-"
+        print(f"[{n}/{len(cases)}] {key}: {status} {result['wall']:.2f} 秒, {fps}, {speed}")
+
+    report = {
+        "version": BASELINE_VERSION,
+        "ffmpeg_version": capabilities.version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "created_at": time.time(),
+        "results": results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=1)
+            print(f"结果已保存: {path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n发现 {len(regressions)} 个变慢的组合（阈值 {args.threshold:.0%}）:")
+            for key, base_wall, wall, change in regressions:
+                print(f"  {key}: {base_wall:.2f} 秒 -> {wall:.2f} 秒 ({change:+.0%})")
+            return 1
+        print(f"\n与基准相比没有变慢的组合（阈值 {args.threshold:.0%}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
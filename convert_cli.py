@@ -0,0 +1,337 @@
+"""视频格式转换器命令行版本
+
+不依赖tkinter，可以在没有图形界面的服务器上批量转换，例如：
+
+    python convert_cli.py 输入目录或文件... -o output -f mp4 -r 1280x720 -j 4
+"""
+import argparse
+import os
+import signal
+import sys
+
+import convert_engine as engine
+import folder_scan
+import media_probe
+import output_staging
+import job_manifest
+import job_scheduler
+import job_telemetry
+import segment_encode
+import encoder_probe
+import preset_planner
+import process_supervisor
+import rendition_ladder
+import resource_manager
+import target_size
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="基于FFmpeg的批量视频格式转换（命令行版本）")
+    parser.add_argument("inputs", nargs="*", help="输入视频文件或目录")
+    parser.add_argument("-o", "--output-dir", default=os.path.join(os.getcwd(), "output"),
+                        help="输出目录（默认：当前目录下的output）")
+    parser.add_argument("-f", "--format", default="mp4",
+                        help=f"输出格式（{', '.join(value for _, value in engine.OUTPUT_FORMATS)}），"
+                             f"多个格式用逗号分隔，如mp4,mkv：编码兼容的格式只编码一次，通过tee同时写入")
+    parser.add_argument("-r", "--resolution", default="",
+                        help="输出分辨率，如1920x1080（默认：原始分辨率）")
+    parser.add_argument("-b", "--bitrate", default="",
+                        help="视频码率，如10M或\"10 Mbps\"（默认：自动）")
+    parser.add_argument("-e", "--encoder", default="auto",
+                        help="视频编码器，如libx264、h264_nvenc、h264_amf、h264_qsv；"
+                             "auto表示自动选择试编码成功的最快编码器（默认）")
+    parser.add_argument("--list-encoders", action="store_true", help="检测并列出可用的编码器后退出")
+    parser.add_argument("--refresh-encoders", action="store_true", help="忽略缓存，重新检测编码器")
+    parser.add_argument("-j", "--jobs", type=int, default=engine.default_workers(),
+                        help="并行任务数（默认：按CPU核心数计算）")
+    parser.add_argument("--ffmpeg", default=None, help="FFmpeg可执行文件路径")
+    parser.add_argument("--progress-mode", default=engine.DEFAULT_PROGRESS_MODE, choices=engine.PROGRESS_MODES,
+                        help="进度获取方式：pipe读取-progress进度流，stderr解析状态行（旧版FFmpeg）")
+    parser.add_argument("--stats-period", type=float, default=engine.DEFAULT_STATS_PERIOD,
+                        help="pipe模式下的进度刷新间隔（秒），0表示不传-stats_period")
+    parser.add_argument("--supervisor", default="async", choices=["async", "threads"],
+                        help="FFmpeg进程监控方式：async在一个asyncio事件循环中读取所有进程的输出（默认），threads每个进程使用单独的线程")
+    parser.add_argument("--idle-timeout", type=float, default=process_supervisor.DEFAULT_IDLE_TIMEOUT,
+                        help="FFmpeg进程超过这一时间（秒）没有任何输出时终止，0表示不限制"
+                             f"（仅async模式，默认：{process_supervisor.DEFAULT_IDLE_TIMEOUT}）")
+    parser.add_argument("--loglevel", default="info", help="pipe模式下FFmpeg日志级别，如info、warning、error")
+    parser.add_argument("--no-probe", action="store_true", help="转换前不使用ffprobe分析媒体信息")
+    parser.add_argument("--probe-cache", default=None, help="媒体信息缓存文件路径")
+    parser.add_argument("--no-stream-copy", action="store_true",
+                        help="始终重新编码，不直接复制兼容的音视频流")
+    parser.add_argument("--manifest", default=None,
+                        help=f"任务清单文件路径（默认：输出目录下的{job_manifest.MANIFEST_NAME}）")
+    parser.add_argument("--no-resume", action="store_true", help="不跳过之前已完成的任务，全部重新转换")
+    parser.add_argument("--segment-length", type=float, default=0,
+                        help=f"长视频分段并行编码的每段时长（秒），0表示不分段（建议{segment_encode.DEFAULT_SEGMENT_LENGTH}）")
+    parser.add_argument("--segment-workers", type=int, default=segment_encode.default_segment_workers(),
+                        help="分段模式下同时编码的分段数")
+    parser.add_argument("--segment-min-duration", type=float, default=segment_encode.DEFAULT_MIN_DURATION,
+                        help="时长达到该值（秒）的视频才分段编码")
+    parser.add_argument("--time-budget", default=None,
+                        help="整批任务的时间预算，如2h、90m、1:30:00；按实测速度为libx264任务选择能按时完成的最慢预设")
+    parser.add_argument("--budget-slowest", default="veryslow", choices=preset_planner.X264_PRESETS,
+                        help="时间预算模式下最慢可选的预设（默认：veryslow）")
+    parser.add_argument("--target-size", default=None,
+                        help="目标文件大小，如700M、1.5G；按时长计算码率，libx264使用两遍编码（需要ffprobe）")
+    parser.add_argument("--audio-bitrate", type=int, default=target_size.DEFAULT_AUDIO_BITRATE,
+                        help=f"目标大小模式下的音频码率（kbit/s，默认：{target_size.DEFAULT_AUDIO_BITRATE}）")
+    parser.add_argument("--ladder", default=None,
+                        help="多分辨率输出，如1080p,720p,480p或1920x1080,1280x720；一个FFmpeg进程解码一次，输出所有分辨率")
+    parser.add_argument("--schedule", default=job_scheduler.DEFAULT_STRATEGY, choices=list(job_scheduler.STRATEGIES),
+                        help="任务转换顺序：fifo按添加顺序，lpt工作量大的先转换（默认），spt工作量小的先转换")
+    parser.add_argument("--threads", default=None,
+                        help="FFmpeg线程总数，由同时运行的任务平分（auto为可用CPU数；默认不限制，每个FFmpeg进程使用全部核心）")
+    parser.add_argument("--pin-cpus", action="store_true", help="把每个任务绑定到互不重叠的CPU（仅Linux）")
+    parser.add_argument("--nice", type=int, default=0, help="FFmpeg进程的nice值（1~19，越大优先级越低）")
+    parser.add_argument("--ionice", default=None, choices=["idle", "best-effort"],
+                        help="FFmpeg进程的磁盘优先级（仅Linux）")
+    parser.add_argument("--scratch-dir", default=None,
+                        help="暂存目录（如本机SSD），输出先写到这里，转换成功后再发布到输出目录")
+    parser.add_argument("--scratch-limit", default=None, help="暂存空间上限，如20G（默认：只受磁盘空闲空间限制）")
+    parser.add_argument("--telemetry", default=None,
+                        help="任务性能数据记录文件（.csv或.jsonl，默认：缓存目录下每个批次一个.jsonl文件）")
+    parser.add_argument("--no-telemetry", action="store_true", help="不记录任务性能数据")
+    parser.add_argument("-q", "--quiet", action="store_true", help="不输出FFmpeg原始日志")
+    return parser
+
+
+def format_stats(stats):
+    """格式化-progress进度数据中的速度信息"""
+    if stats is None:
+        return ""
+    parts = []
+    if stats.fps is not None:
+        parts.append(f"{stats.fps:.1f} fps")
+    if stats.speed is not None:
+        parts.append(f"{stats.speed:.2f}x")
+    if stats.bitrate is not None:
+        parts.append(f"{stats.bitrate:.0f} kbit/s")
+    return " | " + ", ".join(parts) if parts else ""
+
+
+def format_renditions(renditions):
+    """格式化多分辨率输出中每个分辨率的当前输出大小"""
+    if not renditions:
+        return ""
+    return " | " + ", ".join(f"{r.name} {r.size / 1024 / 1024:.1f} MiB" for r in renditions)
+
+
+class ConsoleReporter:
+    """把转换事件输出到控制台"""
+
+    def __init__(self, quiet=False, stream=None):
+        self.quiet = quiet
+        self.stream = stream or sys.stdout
+        self.last_overall = -1
+
+    def __call__(self, event):
+        if event.kind in ("log", "error"):
+            self.write(event.job, event.message)
+        elif event.kind == "output":
+            if not self.quiet:
+                self.write(event.job, event.message)
+        elif event.kind == "probe_done":
+            self.write(None, f"媒体信息分析完成：{event.probed} 个成功，{event.failed} 个失败，"
+                             f"总时长 {engine.format_duration(event.total_duration)}\n")
+        elif event.kind == "batch_start":
+            self.write(None, f"总共要转换 {event.total} 个文件，并行任务数: {event.max_workers}\n")
+        elif event.kind == "progress":
+            # 整体进度每变化1%输出一次
+            overall = int(event.overall)
+            if overall != self.last_overall:
+                self.last_overall = overall
+                self.write(event.job, f"当前文件进度: {event.percent:.1f}% | 整体进度: {event.overall:.1f}%{format_stats(event.stats)}"
+                                      f"{format_renditions(getattr(event, 'renditions', None))}\n")
+        elif event.kind == "batch_done":
+            if event.stopped:
+                self.write(None, "转换已被停止！\n")
+            else:
+                self.write(None, f"=== 转换结束：成功 {event.completed} 个，失败 {event.failed} 个，"
+                                 f"跳过 {event.skipped} 个，耗时 {engine.format_duration(event.elapsed)} ===\n")
+            if getattr(event, "schedule", None):
+                self.write(None, f"调度策略: {event.schedule}\n")
+
+    def write(self, job, message):
+        prefix = f"[{job.index+1}] " if job is not None else ""
+        self.stream.write(prefix + message)
+        self.stream.flush()
+
+
+def main(argv=None):
+    """命令行入口，返回进程退出码"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    # 只有--list-encoders不需要输入文件
+    if not args.inputs and not args.list_encoders:
+        parser.error("请指定输入视频文件或目录")
+    try:
+        output_formats = engine.parse_formats(args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    if len(output_formats) > 1 and (args.target_size or args.ladder):
+        parser.error("多个输出格式不能与目标大小模式或多分辨率输出同时使用")
+
+    # 优先使用缓存的FFmpeg路径，FFmpeg文件没有变化时不需要运行ffmpeg -version
+    ffmpeg_path = args.ffmpeg or encoder_probe.locate_ffmpeg()[0]
+    if not ffmpeg_path:
+        print("未找到FFmpeg，请确保已安装FFmpeg并添加到系统PATH，或使用--ffmpeg指定路径", file=sys.stderr)
+        return 2
+
+    video_codec = args.encoder
+    if args.list_encoders or video_codec == "auto":
+        capabilities = encoder_probe.probe_capabilities(ffmpeg_path, refresh=args.refresh_encoders)
+        if args.list_encoders:
+            print(capabilities.version or "未知FFmpeg版本")
+            print(f"硬件加速方式: {', '.join(capabilities.hwaccels) or '无'}")
+            # 能工作的编码器按试编码耗时排列在前
+            ranked = capabilities.ranked_encoders()
+            for encoder in ranked + [e for e in encoder_probe.CANDIDATE_ENCODERS if e not in ranked]:
+                if capabilities.works(encoder):
+                    status = f"可用（试编码 {capabilities.working[encoder]:.2f} 秒）"
+                elif encoder in capabilities.available:
+                    status = "试编码失败"
+                else:
+                    status = "未编译"
+                print(f"  {encoder:<20} {status}")
+            print(f"自动选择: {capabilities.best_encoder()}")
+            return 0
+        video_codec = capabilities.best_encoder()
+        print(f"自动选择编码器: {video_codec}")
+
+    # 文件直接加入，目录并行递归查找视频文件
+    file_paths = folder_scan.scan_paths(args.inputs)
+    if not file_paths:
+        print("未找到待转换文件", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    jobs = engine.create_multi_format_jobs(
+        file_paths,
+        args.output_dir,
+        output_formats,
+        resolution=engine.parse_resolution(args.resolution),
+        bitrate=engine.parse_bitrate(args.bitrate),
+        video_codec=video_codec
+    )
+    if len(output_formats) > 1:
+        groups = engine.group_formats(output_formats, video_codec)
+        print("输出格式分组（每组编码一次）: " + "；".join(group.describe() for group in groups))
+
+    prober = None
+    segmenter = None
+    if not args.no_probe:
+        ffprobe_path = media_probe.find_ffprobe(ffmpeg_path)
+        if ffprobe_path:
+            prober = media_probe.MediaProber(ffprobe_path, media_probe.ProbeCache(args.probe_cache))
+            if args.segment_length > 0:
+                segmenter = segment_encode.SegmentEncoder(
+                    ffprobe_path,
+                    segment_length=args.segment_length,
+                    max_workers=args.segment_workers,
+                    min_duration=args.segment_min_duration
+                )
+        else:
+            print("未找到ffprobe，将在转换过程中获取时长", file=sys.stderr)
+    if args.segment_length > 0 and segmenter is None:
+        print("分段编码需要ffprobe分析关键帧，本次不分段", file=sys.stderr)
+
+    # --no-resume时仍然记录本次结果，但不跳过任何任务
+    manifest = job_manifest.JobManifest(args.manifest or job_manifest.default_manifest_path(args.output_dir),
+                                        resume=not args.no_resume)
+
+    planner = None
+    if args.time_budget:
+        try:
+            budget = preset_planner.parse_budget(args.time_budget)
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            return 2
+        planner = preset_planner.PresetPlanner(budget, slowest=args.budget_slowest)
+
+    size_encoder = None
+    if args.target_size:
+        try:
+            size_encoder = target_size.TargetSizeEncoder(target_size.parse_size(args.target_size), args.audio_bitrate)
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            return 2
+        if prober is None:
+            print("目标大小模式需要ffprobe分析时长，本次按普通模式转换", file=sys.stderr)
+            size_encoder = None
+
+    ladder = None
+    if args.ladder:
+        if size_encoder is not None:
+            print("多分辨率输出不能与目标大小模式同时使用", file=sys.stderr)
+            return 2
+        try:
+            ladder = rendition_ladder.RenditionLadder(rendition_ladder.parse_ladder(args.ladder))
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            return 2
+
+    resources = None
+    if args.threads or args.pin_cpus or args.nice or args.ionice:
+        total_threads = None
+        if args.threads and args.threads != "auto":
+            try:
+                total_threads = int(args.threads)
+            except ValueError:
+                total_threads = 0
+            if total_threads <= 0:
+                print(f"无效的线程数: {args.threads}", file=sys.stderr)
+                return 2
+        resources = resource_manager.ResourceManager(total_threads, pin=args.pin_cpus,
+                                                     nice=args.nice, ionice=args.ionice)
+
+    try:
+        staging = output_staging.create_stager(args.scratch_dir, args.scratch_limit)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
+    telemetry = None if args.no_telemetry else job_telemetry.TelemetryWriter(args.telemetry)
+
+    supervisor = None
+    if args.supervisor == "async":
+        supervisor = process_supervisor.ProcessSupervisor(idle_timeout=args.idle_timeout or None)
+
+    runner = engine.ConversionRunner(
+        ffmpeg_path,
+        jobs,
+        max_workers=args.jobs,
+        on_event=ConsoleReporter(args.quiet),
+        progress_mode=args.progress_mode,
+        stats_period=args.stats_period or None,
+        loglevel=args.loglevel,
+        prober=prober,
+        stream_copy=not args.no_stream_copy,
+        manifest=manifest,
+        segmenter=segmenter,
+        telemetry=telemetry,
+        planner=planner,
+        target_size=size_encoder,
+        ladder=ladder,
+        resources=resources,
+        scheduler=job_scheduler.JobScheduler(args.schedule),
+        supervisor=supervisor,
+        staging=staging
+    )
+
+    # Ctrl+C时终止所有FFmpeg子进程
+    def handle_interrupt(signum, frame):
+        runner.stop()
+    signal.signal(signal.SIGINT, handle_interrupt)
+
+    success = runner.run()
+    if telemetry is not None and telemetry.count:
+        print(f"性能数据已写入: {telemetry.path}")
+    if runner.stopped:
+        return 130
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1593 @@
+"""视频转换引擎
+
+不依赖tkinter的转换核心：任务描述、FFmpeg命令构建、并行执行器和进度事件。
+图形界面（视频格式转换器.py）和命令行（convert_cli.py）都基于本模块。
+"""
+import os
+import signal
+import subprocess
+import sys
+import threading
+import queue
+import time
+import traceback
+
+
+# 支持的输出格式（显示名称, 扩展名）
+OUTPUT_FORMATS = [
+    ("MP4", "mp4"), ("MKV", "mkv"), ("AVI", "avi"),
+    ("WMV", "wmv"), ("MOV", "mov"), ("FLV", "flv"),
+    ("MPEG", "mpeg"), ("3GP", "3gp")
+]
+
+# 支持的输入视频扩展名
+VIDEO_EXTENSIONS = ['.mp4', '.mkv', '.avi', '.wmv', '.mov', '.flv', '.webm', '.mpg', '.mpeg', '.3gp']
+
+# 分辨率选项
+RESOLUTIONS = [
+    "原始分辨率",
+    "4K (3840x2160)",
+    "2K (2560x1440)",
+    "1080p (1920x1080)",
+    "1080p竖屏 (1080x1920)",
+    "720p (1280x720)",
+    "720p竖屏 (720x1280)",
+    "480p (854x480)",
+    "480p竖屏 (480x854)",
+    "360p (640x360)",
+    "360p竖屏 (360x640)"
+]
+
+# 码率选项
+BITRATES = [
+    "自动",
+    "50 Mbps",
+    "40 Mbps",
+    "30 Mbps",
+    "20 Mbps",
+    "10 Mbps",
+    "5 Mbps"
+]
+
+# 加速选项对应的视频编码器
+GPU_ENCODERS = {
+    "NVIDIA CUDA": "h264_nvenc",
+    "AMD VCE": "h264_amf",
+    "Intel QSV": "h264_qsv",
+    "Apple VideoToolbox": "h264_videotoolbox",
+    "CPU编码": "libx264",
+}
+
+# 默认CPU编码器
+DEFAULT_VIDEO_CODEC = "libx264"
+DEFAULT_AUDIO_CODEC = "aac"
+
+# 各输出容器可以直接复制（不重新编码）的视频/音频编码
+CONTAINER_CODECS = {
+    "mp4": ({"h264", "hevc", "mpeg4", "av1", "vp9"},
+            {"aac", "mp3", "ac3", "eac3", "alac"}),
+    "mkv": ({"h264", "hevc", "mpeg4", "av1", "vp8", "vp9", "mpeg1video", "mpeg2video", "theora", "mjpeg", "prores"},
+            {"aac", "mp3", "mp2", "ac3", "eac3", "dts", "truehd", "flac", "opus", "vorbis", "alac",
+             "pcm_s16le", "pcm_s24le"}),
+    "mov": ({"h264", "hevc", "mpeg4", "prores", "mjpeg"},
+            {"aac", "mp3", "alac", "ac3", "pcm_s16le", "pcm_s24le"}),
+    "avi": ({"mpeg4", "h264", "mjpeg", "msmpeg4v2", "msmpeg4v3"},
+            {"mp3", "ac3", "pcm_s16le"}),
+    "wmv": ({"wmv1", "wmv2", "wmv3", "vc1"},
+            {"wmav1", "wmav2"}),
+    "flv": ({"h264", "flv1"},
+            {"aac", "mp3"}),
+    "mpeg": ({"mpeg1video", "mpeg2video"},
+             {"mp2", "mp3", "ac3"}),
+    "3gp": ({"h264", "h263", "mpeg4"},
+            {"aac", "amr_nb", "amr_wb"}),
+}
+
+# 不能容纳所选编码的容器使用的原生编码（视频编码器, 音频编码器, 质量参数），这些编码器不支持-crf，按固定量化值编码
+NATIVE_CODECS = {
+    "avi": ("mpeg4", "libmp3lame", "-q:v 2"),
+    "wmv": ("wmv2", "wmav2", "-q:v 2"),
+    "mpeg": ("mpeg2video", "mp2", "-q:v 2"),
+}
+
+# FFmpeg复用器名称与扩展名不同的格式（tee输出需要用f=指定复用器）
+MUXER_NAMES = {"mkv": "matroska", "wmv": "asf"}
+
+# 编码器输出的编码名称（用于判断能否放入容器），其他编码器取"_"之前的部分，如h264_nvenc -> h264
+ENCODER_OUTPUT_CODECS = {
+    "libx264": "h264", "libx265": "hevc", "libvpx": "vp8", "libvpx-vp9": "vp9",
+    "libaom-av1": "av1", "libsvtav1": "av1", "libmp3lame": "mp3", "libopus": "opus", "libvorbis": "vorbis",
+}
+
+# 默认使用高质量输出
+DEFAULT_QUALITY_PARAMS = "-crf 18 -preset slow"
+
+# 进度模式：pipe读取FFmpeg -progress输出的key=value进度流，stderr解析状态行（兼容旧版FFmpeg）
+PROGRESS_MODES = ["pipe", "stderr"]
+DEFAULT_PROGRESS_MODE = "pipe"
+
+# -progress模式下进度刷新间隔（秒），需要FFmpeg 5.0及以上，设为None时不传-stats_period
+DEFAULT_STATS_PERIOD = 0.5
+
+# 停止转换时等待FFmpeg进程退出的时间（秒），超时后强制结束
+STOP_TIMEOUT = 2
+
+
+def default_cache_dir():
+    """缓存目录：Windows下为%LOCALAPPDATA%\\VideoConverter，其他系统为~/.cache/video_converter"""
+    if sys.platform == 'win32':
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        return os.path.join(base, "VideoConverter")
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "video_converter")
+
+
+def default_workers():
+    """默认并行任务数：libx264单个进程通常会占用多个核心，按每4核一个任务估算"""
+    return max(1, (os.cpu_count() or 1) // 4)
+
+
+def find_ffmpeg():
+    """查找FFmpeg可执行文件"""
+    try:
+        # 尝试直接运行ffmpeg命令
+        subprocess.run(["ffmpeg", "-version"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return "ffmpeg"
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        # 尝试在当前目录查找
+        if sys.platform.startswith("win"):
+            ffmpeg_exe = "ffmpeg.exe"
+        else:
+            ffmpeg_exe = "ffmpeg"
+
+        if os.path.exists(ffmpeg_exe):
+            return ffmpeg_exe
+        if os.path.exists(os.path.join(os.getcwd(), ffmpeg_exe)):
+            return os.path.join(os.getcwd(), ffmpeg_exe)
+
+        return None
+
+
+def parse_resolution(resolution):
+    """解析分辨率选项，如"1080p (1920x1080)" -> "1920x1080"，原始分辨率返回空字符串"""
+    if not resolution or resolution == "原始分辨率":
+        return ""
+    if " (" in resolution:
+        return resolution.split(" (")[1].rstrip(")")
+    return resolution
+
+
+def parse_bitrate(bitrate):
+    """解析码率选项，如"10 Mbps" -> "10M"，自动返回空字符串"""
+    if not bitrate or bitrate == "自动":
+        return ""
+    # 移除空格，如"10Mbps"
+    bitrate_value = bitrate.replace(" ", "")
+    # 转换为FFmpeg期望的格式，如"10Mbps" -> "10M"，"800Kbps" -> "800K"
+    if bitrate_value.endswith("Mbps"):
+        bitrate_value = bitrate_value[:-4] + "M"
+    elif bitrate_value.endswith("Kbps"):
+        bitrate_value = bitrate_value[:-4] + "K"
+    return bitrate_value
+
+
+def video_codec_for(gpu_accel):
+    """根据加速选项返回视频编码器"""
+    return GPU_ENCODERS.get(gpu_accel, DEFAULT_VIDEO_CODEC)
+
+
+def output_path_for(input_file, output_dir, output_format):
+    """生成输出文件名：原始文件名_converted.目标格式"""
+    input_name, _ = os.path.splitext(os.path.basename(input_file))
+    return os.path.join(output_dir, f"{input_name}_converted.{output_format}")
+
+
+def parse_formats(value):
+    """解析输出格式列表，如"mp4,mkv" -> ["mp4", "mkv"]，有不支持的格式时抛出ValueError"""
+    formats = list(dict.fromkeys(f.strip().lower() for f in str(value).split(",") if f.strip()))
+    supported = [extension for _, extension in OUTPUT_FORMATS]
+    for output_format in formats:
+        if output_format not in supported:
+            raise ValueError(f"不支持的输出格式: {output_format}（可用：{', '.join(supported)}）")
+    if not formats:
+        raise ValueError("没有指定输出格式")
+    return formats
+
+
+def encoder_output_codec(encoder):
+    """编码器输出的编码名称，如libx264 -> h264"""
+    return ENCODER_OUTPUT_CODECS.get(encoder, encoder.split("_")[0])
+
+
+def container_accepts(output_format, video_codec, audio_codec):
+    """容器能否容纳这两个编码器的输出"""
+    video_codecs, audio_codecs = CONTAINER_CODECS.get(output_format, (set(), set()))
+    return encoder_output_codec(video_codec) in video_codecs and encoder_output_codec(audio_codec) in audio_codecs
+
+
+class FormatGroup:
+    """一次编码的输出格式组：所有格式使用同一组编码器，通过tee同时写入
+
+    quality_params为None时使用任务的质量参数（所选编码器），否则为原生编码器的质量参数。
+    """
+
+    def __init__(self, formats, video_codec, audio_codec, quality_params=None):
+        self.formats = formats
+        self.video_codec = video_codec
+        self.audio_codec = audio_codec
+        self.quality_params = quality_params
+
+    def describe(self):
+        return f"{'+'.join(self.formats)} ({self.video_codec}/{self.audio_codec})"
+
+    def __repr__(self):
+        return f"FormatGroup({self.describe()})"
+
+
+def group_formats(output_formats, video_codec=DEFAULT_VIDEO_CODEC, audio_codec=DEFAULT_AUDIO_CODEC):
+    """把输出格式分组，返回FormatGroup列表，每组对应一次编码
+
+    能容纳所选编码的容器共用一次编码；其他容器改用原生编码（NATIVE_CODECS），
+    能容纳同一组原生编码的容器也共用一次编码。没有原生编码的容器仍使用所选编码，单独编码。
+    """
+    shared = FormatGroup([], video_codec, audio_codec)
+    separate = []
+    for output_format in dict.fromkeys(f.lower() for f in output_formats):
+        if container_accepts(output_format, video_codec, audio_codec):
+            shared.formats.append(output_format)
+            continue
+        group = next((g for g in separate if g.quality_params is not None
+                      and container_accepts(output_format, g.video_codec, g.audio_codec)), None)
+        if group is None:
+            if output_format in NATIVE_CODECS:
+                group = FormatGroup([], *NATIVE_CODECS[output_format])
+            else:
+                group = FormatGroup([], video_codec, audio_codec)
+            separate.append(group)
+        group.formats.append(output_format)
+    return ([shared] if shared.formats else []) + separate
+
+
+class ConversionJob:
+    """单个转换任务的描述"""
+
+    def __init__(self, input_file, output_file, output_format, resolution="", bitrate="",
+                 video_codec=DEFAULT_VIDEO_CODEC, audio_codec=DEFAULT_AUDIO_CODEC,
+                 quality_params=DEFAULT_QUALITY_PARAMS, index=0):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.output_format = output_format
+        self.resolution = resolution  # 如"1920x1080"，空字符串表示原始分辨率
+        self.bitrate = bitrate  # 如"10M"，空字符串表示自动
+        self.video_codec = video_codec
+        self.audio_codec = audio_codec
+        self.quality_params = quality_params
+        # 时间预算规划器选择的x264预设，None表示使用quality_params中的设置
+        self.preset = None
+        # 资源管理器分配的线程数，None表示使用FFmpeg默认的线程数
+        self.threads = None
+        self.index = index
+
+        # 运行状态：pending / running / done / failed / stopped / skipped
+        self.state = "pending"
+        self.return_code = None
+        self.duration = 0
+        self.progress = 0.0
+
+        # ffprobe分析得到的媒体信息（media_probe.MediaInfo），未分析时为None
+        self.media_info = None
+
+        # 是否直接复制视频/音频流（由plan_stream_copy根据媒体信息决定）
+        self.copy_video = False
+        self.copy_audio = False
+
+        # 持久化任务队列（job_queue.JobQueue）中的任务编号，不是从队列领取的任务为None
+        self.queue_id = None
+        # 队列中的优先级（数值大的先转换），调度器先按优先级排列
+        self.priority = 0
+
+        # 多分辨率输出时每个分辨率的输出（rendition_ladder.Rendition），为空时只输出一个分辨率
+        self.renditions = []
+
+        # 同一次编码通过tee复用器同时写入的其他格式[(格式, 输出文件)]，为空时只输出一个格式
+        self.extra_outputs = []
+
+        # 本次转换的性能数据（JobMetrics），每个批次开始时重新创建
+        self.metrics = JobMetrics()
+
+    def set_media_info(self, media_info):
+        """设置媒体信息，并使用分析得到的准确时长"""
+        self.media_info = media_info
+        if media_info is not None and media_info.duration:
+            self.duration = media_info.duration
+
+    def output_formats(self):
+        """所有输出格式"""
+        return [self.output_format] + [output_format for output_format, _ in self.extra_outputs]
+
+    def output_files(self):
+        """所有输出文件"""
+        if self.renditions:
+            return [rendition.output_file for rendition in self.renditions]
+        return [self.output_file] + [path for _, path in self.extra_outputs]
+
+    def __repr__(self):
+        return f"ConversionJob({self.index}, {self.input_file!r} -> {self.output_file!r}, {self.state})"
+
+
+def create_jobs(file_paths, output_dir, output_format, resolution="", bitrate="",
+                video_codec=DEFAULT_VIDEO_CODEC, quality_params=DEFAULT_QUALITY_PARAMS):
+    """根据文件列表和输出设置创建转换任务"""
+    output_format = output_format.lower()
+    return [
+        ConversionJob(
+            input_file,
+            output_path_for(input_file, output_dir, output_format),
+            output_format,
+            resolution=resolution,
+            bitrate=bitrate,
+            video_codec=video_codec,
+            quality_params=quality_params,
+            index=i
+        )
+        for i, input_file in enumerate(file_paths)
+    ]
+
+
+def create_multi_format_jobs(file_paths, output_dir, output_formats, resolution="", bitrate="",
+                             video_codec=DEFAULT_VIDEO_CODEC, quality_params=DEFAULT_QUALITY_PARAMS):
+    """输出多个格式时创建转换任务：每个文件的每个格式组（group_formats）一个任务
+
+    同一组的格式只编码一次，第一个格式为任务的主输出，其余格式写入job.extra_outputs；
+    使用原生编码的格式组同时使用原生编码器的质量参数。
+    """
+    groups = group_formats(output_formats, video_codec)
+    jobs = []
+    for input_file in file_paths:
+        for group in groups:
+            job = create_jobs([input_file], output_dir, group.formats[0], resolution, bitrate, group.video_codec,
+                              group.quality_params or quality_params)[0]
+            job.audio_codec = group.audio_codec
+            job.extra_outputs = [(output_format, output_path_for(input_file, output_dir, output_format))
+                                 for output_format in group.formats[1:]]
+            job.index = len(jobs)
+            jobs.append(job)
+    return jobs
+
+
+def progress_args(progress_mode=DEFAULT_PROGRESS_MODE, stats_period=DEFAULT_STATS_PERIOD, loglevel="info"):
+    """进度相关的全局参数：pipe模式下进度写入stdout，stderr只保留日志"""
+    if progress_mode != "pipe":
+        return []
+    args = ["-hide_banner", "-nostats", "-loglevel", loglevel, "-progress", "pipe:1"]
+    if stats_period:
+        args.extend(["-stats_period", str(stats_period)])
+    return args
+
+
+def plan_stream_copy(job):
+    """根据媒体信息决定每个流是否可以直接复制，返回(copy_video, copy_audio)
+
+    只有分辨率为原始分辨率、码率为自动，并且源编码可以放入所有目标容器时才直接复制；
+    没有媒体信息时全部重新编码。
+    """
+    job.copy_video = False
+    job.copy_audio = False
+    info = job.media_info
+    formats = job.output_formats()
+    if info is None or any(output_format not in CONTAINER_CODECS for output_format in formats):
+        return job.copy_video, job.copy_audio
+
+    # tee输出到多个容器时，源编码需要能放入所有容器
+    video = info.video
+    audio = info.audio
+    if video is not None and not job.resolution and not job.bitrate:
+        job.copy_video = all(video.codec_name in CONTAINER_CODECS[f][0] for f in formats)
+    if audio is not None:
+        job.copy_audio = all(audio.codec_name in CONTAINER_CODECS[f][1] for f in formats)
+    return job.copy_video, job.copy_audio
+
+
+def describe_stream_plan(job):
+    """描述各个流的处理方式，用于日志"""
+    info = job.media_info
+    if info is None:
+        return ""
+    parts = []
+    if info.video is not None:
+        if job.copy_video:
+            parts.append(f"视频流: 直接复制 ({info.video.codec_name})")
+        else:
+            parts.append(f"视频流: 重新编码 ({info.video.codec_name} -> {job.video_codec})")
+    if info.audio is not None:
+        if job.copy_audio:
+            parts.append(f"音频流: 直接复制 ({info.audio.codec_name})")
+        else:
+            parts.append(f"音频流: 重新编码 ({info.audio.codec_name} -> {job.audio_codec})")
+    return " | ".join(parts)
+
+
+def quality_args(job, threads=None):
+    """质量参数列表，任务指定了预设时替换quality_params中的-preset，分配了线程数时加上-threads/-filter_threads
+
+    threads不为None时代替job.threads（如分段编码时每个分段进程的线程数）。
+    """
+    args = job.quality_params.split()
+    if job.preset:
+        if "-preset" in args[:-1]:
+            args[args.index("-preset") + 1] = job.preset
+        else:
+            args.extend(["-preset", job.preset])
+    threads = job.threads if threads is None else threads
+    if threads:
+        args.extend(["-threads", str(threads), "-filter_threads", str(threads)])
+    return args
+
+
+def build_command(ffmpeg_path, job, global_args=None):
+    """构建FFmpeg转换命令，global_args插入在输入文件之前（如进度参数）"""
+    cmd = [
+        ffmpeg_path,
+        *(global_args or []),
+        "-i", job.input_file,
+        "-y",  # 覆盖输出文件
+    ]
+
+    # 添加视频/音频编码参数，可以直接复制的流不重新编码
+    cmd.extend(["-vcodec", "copy" if job.copy_video else job.video_codec])
+    cmd.extend(["-acodec", "copy" if job.copy_audio else job.audio_codec])
+
+    # HEVC直接复制到MP4/MOV时使用hvc1标签，保证苹果设备可以播放
+    if (job.copy_video and all(f in ("mp4", "mov") for f in job.output_formats())
+            and job.media_info.video.codec_name == "hevc"):
+        cmd.extend(["-tag:v", "hvc1"])
+
+    if not job.copy_video:
+        # 添加分辨率参数
+        if job.resolution:
+            cmd.extend(["-s", job.resolution])
+
+        # 添加码率参数
+        if job.bitrate:
+            cmd.extend(["-b:v", job.bitrate])
+
+        # 添加质量参数 - 确保正确分割参数
+        cmd.extend(quality_args(job))
+
+    if job.extra_outputs:
+        # 只编码一次，通过tee复用器写入所有格式
+        cmd.extend(tee_output_args(job))
+    else:
+        # 添加输出文件
+        cmd.append(job.output_file)
+    return cmd
+
+
+def tee_escape(path):
+    """转义tee输出文件名中的特殊字符（\\、'、|）"""
+    for char in ("\\", "'", "|"):
+        path = path.replace(char, "\\" + char)
+    return path
+
+
+def tee_output_args(job):
+    """tee输出参数：显式选择视频和音频流，编码器使用全局头（MP4/MKV等容器需要），每个格式一个输出"""
+    args = ["-map", "0:v:0?", "-map", "0:a:0?"]
+    if not job.copy_video:
+        args.extend(["-flags:v", "+global_header"])
+    if not job.copy_audio:
+        args.extend(["-flags:a", "+global_header"])
+    outputs = [(job.output_format, job.output_file)] + job.extra_outputs
+    spec = "|".join(f"[f={MUXER_NAMES.get(output_format, output_format)}]{tee_escape(path)}"
+                    for output_format, path in outputs)
+    args.extend(["-f", "tee", spec])
+    return args
+
+
+def build_copy_command(ffmpeg_path, job, global_args=None):
+    """构建简化命令：只进行格式转换，不重新编码"""
+    return [
+        ffmpeg_path,
+        *(global_args or []),
+        "-i", job.input_file,
+        "-y",
+        "-c", "copy",  # 直接复制流，不重新编码
+        job.output_file
+    ]
+
+
+def build_shell_command(cmd):
+    """把参数列表转换为shell命令字符串（路径使用引号包裹）"""
+    if sys.platform == 'win32':
+        return subprocess.list2cmdline(cmd)
+    import shlex
+    return shlex.join(cmd)
+
+
+def parse_timestamp(value):
+    """解析"HH:MM:SS.xx"格式的时间，返回秒数；无法解析（如N/A）时返回None"""
+    try:
+        h, m, s = value.strip().split(":")
+        return float(h) * 3600 + float(m) * 60 + float(s)
+    except ValueError:
+        return None
+
+
+def format_duration(seconds):
+    """把秒数格式化为 HH:MM:SS"""
+    seconds = int(seconds or 0)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def parse_speed(value):
+    """解析速度，如"2.5x" -> 2.5"""
+    try:
+        return float(value.strip().rstrip("x"))
+    except ValueError:
+        return None
+
+
+def parse_bitrate_kbits(value):
+    """解析码率，如"1234.5kbits/s" -> 1234.5（kbit/s）"""
+    try:
+        return float(value.strip().replace("kbits/s", ""))
+    except ValueError:
+        return None
+
+
+def parse_int(value):
+    """解析整数，N/A等无法解析的值返回None"""
+    try:
+        return int(value.strip())
+    except ValueError:
+        return None
+
+
+class ProgressInfo:
+    """FFmpeg -progress输出的一组进度数据，无法解析的字段为None"""
+
+    def __init__(self, frame=None, fps=None, bitrate=None, total_size=None,
+                 out_time_us=None, speed=None, progress="continue"):
+        self.frame = frame
+        self.fps = fps  # 帧/秒
+        self.bitrate = bitrate  # kbit/s
+        self.total_size = total_size  # 字节
+        self.out_time_us = out_time_us  # 已输出时长（微秒）
+        self.speed = speed  # 相对实时速度的倍数
+        self.progress = progress  # continue / end
+
+    @property
+    def out_time(self):
+        """已输出时长（秒）"""
+        if self.out_time_us is None:
+            return None
+        return self.out_time_us / 1000000
+
+    @property
+    def finished(self):
+        """是否是最后一组进度数据"""
+        return self.progress == "end"
+
+    def __repr__(self):
+        return (f"ProgressInfo(out_time_us={self.out_time_us}, fps={self.fps}, speed={self.speed}, "
+                f"bitrate={self.bitrate}, total_size={self.total_size}, progress={self.progress!r})")
+
+
+class ProgressParser:
+    """解析FFmpeg -progress输出的key=value进度流
+
+    每组数据以"progress=continue"或"progress=end"结束，feed()在一组数据结束时返回ProgressInfo。
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    def feed(self, line):
+        """输入一行，一组数据结束时返回ProgressInfo，否则返回None"""
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        self.values[key] = value
+        if key != "progress":
+            return None
+
+        values, self.values = self.values, {}
+        fps = values.get("fps")
+        try:
+            fps = float(fps) if fps is not None else None
+        except ValueError:
+            fps = None
+        # 旧版FFmpeg的out_time_ms实际单位也是微秒
+        out_time_us = parse_int(values.get("out_time_us", values.get("out_time_ms", "N/A")))
+        return ProgressInfo(
+            frame=parse_int(values.get("frame", "N/A")),
+            fps=fps,
+            bitrate=parse_bitrate_kbits(values.get("bitrate", "N/A")),
+            total_size=parse_int(values.get("total_size", "N/A")),
+            out_time_us=out_time_us if out_time_us is not None and out_time_us >= 0 else None,
+            speed=parse_speed(values.get("speed", "N/A")),
+            progress=value
+        )
+
+
+def parse_status_line(line):
+    """解析旧版FFmpeg状态行（frame=... fps=... speed=...）中的帧率和速度，不是状态行时返回None"""
+    if "fps=" not in line:
+        return None
+    values = {}
+    for key in ("fps", "speed"):
+        parts = line.split(f"{key}=", 1)
+        if len(parts) == 2 and parts[1].split():
+            values[key] = parts[1].split()[0]
+    try:
+        fps = float(values["fps"]) if "fps" in values else None
+    except ValueError:
+        fps = None
+    speed = parse_speed(values["speed"]) if "speed" in values else None
+    return ProgressInfo(fps=fps, speed=speed)
+
+
+def wait_process(process, timeout=None):
+    """等待进程结束（阻塞当前线程），返回(返回码, CPU时间)，CPU时间为(用户态秒数, 内核态秒数)
+
+    POSIX系统上由启动进程的线程阻塞调用os.wait4回收进程，得到该进程自己的CPU时间（并行任务之间互不影响）；
+    其他线程只用signal_process发送信号，不回收进程。超过timeout秒时强制结束进程并抛出subprocess.TimeoutExpired。
+    其他平台CPU时间为None。
+    """
+    if not hasattr(os, "wait4") or process.returncode is not None:
+        return process.wait(timeout), None
+
+    expired = threading.Event()
+    timer = None
+    if timeout is not None:
+        def expire():
+            expired.set()
+            signal_process(process, kill=True)
+        timer = threading.Timer(timeout, expire)
+        timer.daemon = True
+        timer.start()
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        # 已被其他代码回收，返回码未知
+        process.returncode = -1 if process.returncode is None else process.returncode
+        return process.returncode, None
+    finally:
+        if timer is not None:
+            timer.cancel()
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if expired.is_set():
+        raise subprocess.TimeoutExpired(process.args, timeout)
+    return process.returncode, (usage.ru_utime, usage.ru_stime)
+
+
+def signal_process(process, kill=False):
+    """向进程发送终止（kill为True时强制结束）信号，不回收进程；进程已经结束时什么也不做
+
+    POSIX上不能用Popen.terminate()/kill()：它们会先调用poll()，可能抢先回收进程，
+    使wait_process得不到返回码和CPU时间。监控器中的进程（SupervisedProcess）本身不会回收进程。
+    """
+    if process.returncode is not None:
+        return
+    if sys.platform == "win32" or not isinstance(process, subprocess.Popen):
+        try:
+            process.kill() if kill else process.terminate()
+        except OSError:
+            pass
+        return
+    try:
+        os.kill(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+    except OSError:
+        pass
+
+
+class JobMetrics:
+    """单个任务的性能数据，分段编码时由多个线程同时记录"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = None  # 开始转换的时间戳
+        self.probe_time = None  # 媒体信息分析耗时（秒）
+        self.spawn_latencies = []  # 每个FFmpeg进程的创建耗时（秒）
+        self.encode_time = None  # 转换耗时（秒）
+        self.publish_time = None  # 从暂存目录发布输出文件的耗时（秒）
+        self.cpu_user = None  # 所有FFmpeg进程的用户态CPU时间（秒）
+        self.cpu_sys = None  # 所有FFmpeg进程的内核态CPU时间（秒）
+        self.fps_samples = []
+        self.speed_samples = []
+
+    def add_spawn(self, latency):
+        """记录一个FFmpeg进程的创建耗时"""
+        with self.lock:
+            self.spawn_latencies.append(latency)
+
+    def add_usage(self, usage):
+        """累加一个FFmpeg进程的CPU时间，usage为wait_process返回的CPU时间"""
+        if usage is None:
+            return
+        with self.lock:
+            self.cpu_user = (self.cpu_user or 0) + usage[0]
+            self.cpu_sys = (self.cpu_sys or 0) + usage[1]
+
+    def add_sample(self, stats):
+        """记录一组进度数据中的帧率和速度（刚启动时的0值不计入）"""
+        with self.lock:
+            if stats.fps:
+                self.fps_samples.append(stats.fps)
+            if stats.speed:
+                self.speed_samples.append(stats.speed)
+
+    def to_dict(self, job):
+        """导出为一条记录"""
+        def mean(values):
+            return round(sum(values) / len(values), 3) if values else None
+
+        def rounded(value):
+            return round(value, 3) if value is not None else None
+
+        input_bytes = output_bytes = None
+        try:
+            input_bytes = os.path.getsize(job.input_file)
+        except OSError:
+            pass
+        if job.state == "done":
+            try:
+                # 多分辨率或多格式输出时为所有输出文件的总大小
+                output_bytes = sum(os.path.getsize(path) for path in job.output_files())
+            except OSError:
+                pass
+
+        with self.lock:
+            return {
+                "input": job.input_file,
+                "output": job.output_file,
+                "state": job.state,
+                "return_code": job.return_code,
+                "output_format": job.output_format,
+                "video_codec": "copy" if job.copy_video else job.video_codec,
+                "audio_codec": "copy" if job.copy_audio else job.audio_codec,
+                "resolution": job.resolution,
+                "bitrate": job.bitrate,
+                "preset": job.preset,
+                "threads": job.threads,
+                "duration": rounded(job.duration),
+                "started_at": rounded(self.started_at),
+                "probe_time": rounded(self.probe_time),
+                "processes": len(self.spawn_latencies),
+                "spawn_latency": mean(self.spawn_latencies),
+                "encode_time": rounded(self.encode_time),
+                "publish_time": rounded(self.publish_time),
+                "cpu_user": rounded(self.cpu_user),
+                "cpu_sys": rounded(self.cpu_sys),
+                "fps_avg": mean(self.fps_samples),
+                "fps_min": min(self.fps_samples, default=None),
+                "speed_avg": mean(self.speed_samples),
+                "speed_min": min(self.speed_samples, default=None),
+                "input_bytes": input_bytes,
+                "output_bytes": output_bytes,
+                "compression_ratio": round(output_bytes / input_bytes, 4) if output_bytes and input_bytes else None,
+            }
+
+
+def popen_options():
+    """子进程参数：在Windows上隐藏命令窗口"""
+    options = {}
+    if sys.platform == 'win32':
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        options["startupinfo"] = startupinfo
+        options["creationflags"] = subprocess.CREATE_NO_WINDOW
+    return options
+
+
+class ConversionEvent:
+    """转换过程中产生的事件
+
+    kind取值：
+        probe_done   媒体信息分析结束（probed, failed, total_duration）
+        batch_start  批量转换开始（total, max_workers）
+        job_start    单个任务开始
+        log          日志消息（message）
+        output       FFmpeg原始输出行（message）
+        duration     解析到总时长（duration）
+        progress     进度更新（percent, overall, count, stats）
+                     pipe模式下stats为ProgressInfo，stderr模式下为None；
+                     多分辨率输出时还有renditions（rendition_ladder.Rendition列表）
+        job_done     单个任务结束（return_code, success）
+        job_skipped  任务已在之前的批次中完成，被跳过
+        batch_done   批量转换结束（stopped, completed, failed, skipped, elapsed）
+                     使用调度器时还有schedule（调度结果摘要）
+        error        执行器内部错误（message）
+    """
+
+    def __init__(self, kind, job=None, **data):
+        self.kind = kind
+        self.job = job
+        self.message = ""
+        self.__dict__.update(data)
+
+    def __repr__(self):
+        return f"ConversionEvent({self.kind!r}, job={self.job!r})"
+
+
+class ConversionRunner:
+    """转换执行器：用有限大小的工作线程池并行执行转换任务
+
+    所有事件通过on_event回调发出，回调在工作线程中调用，调用方需要自行保证线程安全。
+    """
+
+    def __init__(self, ffmpeg_path, jobs, max_workers=None, on_event=None,
+                 progress_mode=DEFAULT_PROGRESS_MODE, stats_period=DEFAULT_STATS_PERIOD, loglevel="info",
+                 prober=None, stream_copy=True, manifest=None, segmenter=None, telemetry=None,
+                 planner=None, target_size=None, job_queue=None, ladder=None, resources=None,
+                 scheduler=None, supervisor=None, staging=None, job_source=None):
+        self.ffmpeg_path = ffmpeg_path
+        self.jobs = list(jobs)
+        self.max_workers = max(1, min(max_workers or default_workers(), len(self.jobs) or 1))
+        self.on_event = on_event
+        self.progress_mode = progress_mode
+        self.stats_period = stats_period
+        self.loglevel = loglevel
+        # 媒体信息分析器（media_probe.MediaProber），为None时不在转换前分析
+        self.prober = prober
+        # 根据媒体信息自动直接复制兼容的音视频流
+        self.stream_copy = stream_copy
+        # 任务清单（job_manifest.JobManifest），为None时不记录也不跳过已完成的任务
+        self.manifest = manifest
+        # 长视频分段编码器（segment_encode.SegmentEncoder），为None时不分段
+        self.segmenter = segmenter
+        # 性能数据记录器（job_telemetry.TelemetryWriter），为None时不记录
+        self.telemetry = telemetry
+        # 时间预算预设规划器（preset_planner.PresetPlanner），为None时使用固定的质量参数
+        self.planner = planner
+        # 目标文件大小编码器（target_size.TargetSizeEncoder），为None时按码率/质量参数编码
+        self.target_size = target_size
+        # 持久化任务队列（job_queue.JobQueue），任务状态变化时写回队列
+        self.job_queue = job_queue
+        # 多分辨率输出编码器（rendition_ladder.RenditionLadder），为None时只输出一个分辨率
+        self.ladder = ladder
+        # 资源管理器（resource_manager.ResourceManager），为None时不限制线程数和优先级
+        self.resources = resources
+        # 任务调度器（job_scheduler.JobScheduler），为None时按添加顺序转换
+        self.scheduler = scheduler
+        # asyncio进程监控器（process_supervisor.ProcessSupervisor），为None时每个进程用线程读取输出
+        self.supervisor = supervisor
+        # 输出暂存器（output_staging.OutputStager），为None时FFmpeg直接写入输出目录
+        self.staging = staging
+        # 待转换的任务转换完后调用job_source(起始编号)领取更多任务（如从持久化队列分批领取），
+        # 返回空列表时不再领取；为None时只转换jobs
+        self.job_source = job_source
+
+        self.active_processes = {}
+        self.process_jobs = {}  # 进程标识 -> 所属任务，取消单个任务时终止它的进程
+        self.cancelled_queue_ids = set()  # 在任务队列中被取消的任务编号
+        self.lock = threading.Lock()
+        # 进程取消登记（已被回收）时通知，停止转换时据此判断进程是否已经退出
+        self.process_exited = threading.Condition(self.lock)
+        self._stop_event = threading.Event()
+        self._job_queue = queue.Queue()
+        self._refill_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def stopped(self):
+        """转换是否已被停止"""
+        return self._stop_event.is_set()
+
+    def emit(self, kind, job=None, **data):
+        """发出事件"""
+        if self.on_event is not None:
+            self.on_event(ConversionEvent(kind, job, **data))
+
+    def log(self, message, job=None):
+        """发出日志事件"""
+        self.emit("log", job, message=message)
+
+    def overall_progress(self):
+        """根据所有任务的进度计算整体进度
+
+        所有任务的时长都已知时按时长加权，否则每个任务权重相同。
+        """
+        if not self.jobs:
+            return 100.0
+        with self.lock:
+            if all(job.duration > 0 for job in self.jobs):
+                total_duration = sum(job.duration for job in self.jobs)
+                return min(sum(job.progress * job.duration for job in self.jobs) / total_duration, 100)
+            return min(sum(job.progress for job in self.jobs) / len(self.jobs), 100)
+
+    def probe_jobs(self, jobs=None):
+        """转换开始前并行分析所有输入文件（或jobs）的媒体信息"""
+        pending = [job for job in (self.jobs if jobs is None else jobs) if job.media_info is None]
+        if not pending:
+            return
+        self.log(f"正在分析 {len(pending)} 个文件的媒体信息...\n")
+        results = self.prober.probe_many([job.input_file for job in pending])
+
+        failed = 0
+        for job in pending:
+            info = results.get(job.input_file)
+            if info is None:
+                failed += 1
+                self.log(f"⚠ 无法分析媒体信息: {job.input_file}\n", job)
+            else:
+                job.set_media_info(info)
+        total_duration = sum(job.duration for job in self.jobs)
+        self.emit("probe_done", probed=len(pending) - failed, failed=failed, total_duration=total_duration)
+
+    def prepare_jobs(self, jobs):
+        """分析媒体信息并准备任务（流复制、多分辨率、目标大小），跳过已完成的任务，返回按调度策略排列的待转换任务"""
+        if self.prober is not None and not self.stopped:
+            try:
+                self.probe_jobs(jobs)
+            except Exception as e:
+                self.log(f"分析媒体信息时出错: {str(e)}\n")
+
+        for job in jobs:
+            if self.ladder is not None:
+                # 多分辨率输出：一个进程解码一次，输出所有分辨率
+                self.ladder.prepare(job)
+            if self.stream_copy:
+                plan_stream_copy(job)
+            else:
+                job.copy_video = job.copy_audio = False
+            if self.target_size is not None:
+                # 目标大小模式下始终重新编码，并按时长计算码率
+                self.target_size.prepare(job)
+
+        pending = []
+        for job in jobs:
+            job.state = "pending"
+            job.progress = 0.0
+            job.metrics = JobMetrics()
+            job.preset = None
+            job.threads = None
+            if job.media_info is not None:
+                job.metrics.probe_time = getattr(job.media_info, "probe_time", None)
+            # 之前的批次中已经完成且参数相同的任务直接跳过
+            if self.manifest is not None and self.manifest.is_complete(job):
+                job.state = "skipped"
+                job.progress = 100.0
+                if self.job_queue is not None:
+                    self.job_queue.mark(job, "skipped")
+                self.log(f"已完成，跳过: {job.input_file}\n", job)
+                self.emit("job_skipped", job)
+                continue
+            pending.append(job)
+
+        if self.scheduler is not None:
+            pending = self.scheduler.order(self, pending)
+        return pending
+
+    def refill(self):
+        """本地待转换的任务已经领完时从job_source领取下一批，返回是否还有任务可以转换"""
+        with self._refill_lock:
+            if not self._job_queue.empty():
+                return True
+            if self.job_source is None or self.stopped:
+                return False
+            try:
+                with self.lock:
+                    start_index = len(self.jobs)
+                jobs = self.job_source(start_index)
+            except Exception as e:
+                self.log(f"领取任务时出错: {str(e)}\n")
+                jobs = []
+            if not jobs:
+                self.job_source = None
+                return False
+            with self.lock:
+                self.jobs.extend(jobs)
+            for job in self.prepare_jobs(jobs):
+                self._job_queue.put(job)
+            return True
+
+    def start(self):
+        """在后台线程中开始批量转换"""
+        self._thread = threading.Thread(target=self.run, daemon=True, name="conversion-runner")
+        self._thread.start()
+        return self._thread
+
+    def wait(self, timeout=None):
+        """等待后台转换结束"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        """执行批量转换（阻塞），所有任务成功时返回True
+
+        停止状态不会在这里清除：run()开始前已经调用过stop()时不转换任何任务。
+        每批转换都创建新的执行器，执行器停止后不再重复使用。
+        """
+        batch_start = time.perf_counter()
+        for job in self.prepare_jobs(list(self.jobs)):
+            self._job_queue.put(job)
+
+        if self.planner is not None:
+            self.planner.begin(self)
+        if self.resources is not None:
+            self.log(f"资源管理: {self.resources.describe()}\n")
+        if self.staging is not None:
+            self.log(f"输出暂存: {self.staging.describe()}\n")
+        self.emit("batch_start", total=len(self.jobs), max_workers=self.max_workers)
+        try:
+            workers = [
+                threading.Thread(target=self._worker, daemon=True, name=f"convert-worker-{n+1}")
+                for n in range(self.max_workers)
+            ]
+            for t in workers:
+                t.start()
+            for t in workers:
+                t.join()
+        except Exception as e:
+            error_msg = f"\n转换出错: {str(e)}\n"
+            error_msg += f"详细信息: {traceback.format_exc()}\n"
+            self.emit("error", message=error_msg)
+            return False
+        finally:
+            with self.lock:
+                self.active_processes = {}
+                self.process_jobs = {}
+                self.process_exited.notify_all()
+            if self.stopped and self.job_queue is not None:
+                # 停止时还没有开始转换的任务放回持久化队列
+                for job in self.jobs:
+                    if job.state == "pending" and job.queue_id is not None:
+                        self.job_queue.release(job.queue_id)
+
+        completed = sum(1 for job in self.jobs if job.state == "done")
+        failed = sum(1 for job in self.jobs if job.state == "failed")
+        skipped = sum(1 for job in self.jobs if job.state == "skipped")
+        summary = {}
+        if self.scheduler is not None:
+            summary["schedule"] = self.scheduler.summary()
+        self.emit("batch_done", stopped=self.stopped, completed=completed, failed=failed, skipped=skipped,
+                  elapsed=time.perf_counter() - batch_start, **summary)
+        return not self.stopped and completed + skipped == len(self.jobs)
+
+    def stop(self):
+        """停止转换：不再领取新任务，并向所有正在运行的FFmpeg进程发送终止信号，返回被终止的进程数
+
+        不阻塞：进程由各自的工作线程回收，STOP_TIMEOUT秒后仍未退出的进程在后台线程中强制结束。
+        需要等待转换结束时调用wait()或等待batch_done事件。
+        """
+        with self.lock:
+            self._stop_event.set()
+            processes = dict(self.active_processes)
+
+        for process in processes.values():
+            signal_process(process)
+        if processes:
+            threading.Thread(target=self._kill_remaining, args=(processes,), daemon=True,
+                             name="conversion-stop").start()
+        return len(processes)
+
+    def _kill_remaining(self, processes):
+        """等待被终止的进程退出，超时后强制结束"""
+        def exited():
+            return all(self.active_processes.get(key) is not process for key, process in processes.items())
+
+        with self.process_exited:
+            if self.process_exited.wait_for(exited, STOP_TIMEOUT):
+                return
+            remaining = [process for key, process in processes.items() if self.active_processes.get(key) is process]
+        for process in remaining:
+            signal_process(process, kill=True)
+
+    def job_cancelled(self, job):
+        """任务是否已在任务队列中被取消"""
+        return job.queue_id is not None and job.queue_id in self.cancelled_queue_ids
+
+    def cancel_jobs(self, queue_ids):
+        """取消任务队列中的部分任务（如被其他进程取消）：终止它们正在运行的进程，还没开始的不再转换，返回被终止的进程数
+
+        其他任务继续转换。
+        """
+        with self.lock:
+            new_ids = set(queue_ids) - self.cancelled_queue_ids
+            if not new_ids:
+                return 0
+            self.cancelled_queue_ids |= new_ids
+            processes = [process for key, process in self.active_processes.items()
+                         if getattr(self.process_jobs.get(key), "queue_id", None) in new_ids]
+        for process in processes:
+            signal_process(process)
+        return len(processes)
+
+    def signal_processes(self, keys):
+        """向指定键中正在运行的进程发送终止信号（如一个分段编码失败后终止同一任务的其他分段），返回被终止的进程数"""
+        with self.lock:
+            processes = [self.active_processes[key] for key in keys if key in self.active_processes]
+        for process in processes:
+            signal_process(process)
+        return len(processes)
+
+    def _worker(self):
+        """工作线程：从共享队列中领取任务并转换，直到队列为空或转换被停止"""
+        while not self.stopped:
+            try:
+                job = self._job_queue.get_nowait()
+            except queue.Empty:
+                if self.refill():
+                    continue
+                break
+            if self.job_cancelled(job):
+                self.set_state(job, "cancelled")
+                self.log(f"已取消，跳过: {job.input_file}\n", job)
+                continue
+            try:
+                self.convert(job)
+            except Exception as e:
+                self.set_state(job, "failed")
+                error_msg = f"\n第 {job.index+1}/{len(self.jobs)} 个文件转换出错: {str(e)}\n"
+                error_msg += f"详细信息: {traceback.format_exc()}\n"
+                self.log(error_msg, job)
+
+    def global_args(self):
+        """当前进度模式对应的FFmpeg全局参数"""
+        return progress_args(self.progress_mode, self.stats_period, self.loglevel)
+
+    def check_paths(self, job):
+        """检查输出目录写入权限和输入文件读取权限"""
+        output_dir = os.path.dirname(job.output_file) or "."
+
+        # 确保输出目录存在
+        os.makedirs(output_dir, exist_ok=True)
+
+        # 检查输出目录权限（测试文件名包含序号，避免并行任务互相干扰）
+        try:
+            test_file = os.path.join(output_dir, f".test_write_{job.index}.txt")
+            with open(test_file, 'w') as f:
+                f.write("test")
+            os.remove(test_file)
+            self.log("✓ 输出目录写入权限检查通过\n", job)
+        except Exception as e:
+            self.log(f"⚠ 输出目录写入权限检查失败: {str(e)}\n", job)
+
+        # 检查输入文件是否可读取
+        try:
+            with open(job.input_file, 'rb') as f:
+                f.read(100)  # 读取前100字节测试
+            self.log("✓ 输入文件读取权限检查通过\n", job)
+        except Exception as e:
+            self.log(f"⚠ 输入文件读取权限检查失败: {str(e)}\n", job)
+
+    def spawn(self, job, cmd):
+        """启动FFmpeg进程：优先直接执行，失败后尝试shell=True，最后尝试仅格式转换"""
+        options = popen_options()
+        popen_kwargs = dict(
+            stdout=subprocess.PIPE,
+            # pipe模式下stdout是进度流，stderr单独读取日志；否则合并到stdout解析
+            stderr=subprocess.PIPE if self.progress_mode == "pipe" else subprocess.STDOUT,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=0,  # 禁用缓冲
+            **options
+        )
+        execution_attempts = []
+
+        # 尝试1：直接执行（推荐方式）
+        try:
+            self.log("尝试1：直接执行FFmpeg命令\n", job)
+            process = subprocess.Popen(cmd, **popen_kwargs)
+            execution_attempts.append("直接执行成功")
+            return process
+        except Exception as e:
+            execution_attempts.append(f"直接执行失败: {str(e)}")
+
+        # 尝试2：使用shell=True（Windows特殊情况）
+        try:
+            self.log("尝试2：使用shell=True执行FFmpeg命令\n", job)
+            process = subprocess.Popen(build_shell_command(cmd), shell=True, **popen_kwargs)
+            execution_attempts.append("shell=True执行成功")
+            return process
+        except Exception as e:
+            execution_attempts.append(f"shell=True执行失败: {str(e)}")
+
+        # 尝试3：简化命令，只进行格式转换，不修改编码
+        try:
+            self.log("尝试3：使用简化命令执行FFmpeg（仅格式转换）\n", job)
+            process = subprocess.Popen(build_copy_command(self.ffmpeg_path, job, self.global_args()), **popen_kwargs)
+            execution_attempts.append("简化命令执行成功")
+            return process
+        except Exception as e:
+            execution_attempts.append(f"简化命令执行失败: {str(e)}")
+
+        # 所有尝试都失败，记录错误
+        self.log(f"所有执行尝试都失败: {'; '.join(execution_attempts)}\n", job)
+        return None
+
+    def set_state(self, job, state):
+        """更新任务状态，并写入任务清单"""
+        job.state = state
+        if self.manifest is not None:
+            self.manifest.mark(job, state)
+        if self.job_queue is not None:
+            self.job_queue.mark(job, state)
+
+    def register_process(self, key, process, job=None):
+        """登记进程，停止转换时需要终止所有正在运行的进程"""
+        with self.lock:
+            if self.stopped or (job is not None and self.job_cancelled(job)):
+                # 登记前已经停止或任务已被取消
+                signal_process(process)
+            self.active_processes[key] = process
+            self.process_jobs[key] = job
+        if self.resources is not None and job is not None:
+            self.resources.attach(key, job, process)
+
+    def unregister_process(self, key):
+        """进程结束后取消登记"""
+        with self.lock:
+            self.active_processes.pop(key, None)
+            self.process_jobs.pop(key, None)
+            self.process_exited.notify_all()
+        if self.resources is not None:
+            self.resources.detach(key)
+
+    def run_process(self, job, key, cmd, on_progress=None):
+        """运行一个辅助FFmpeg进程（分段、多遍编码等）并读取其-progress输出，返回返回码
+
+        cmd应包含 -progress pipe:1，每组进度数据调用一次on_progress(out_time, stats)。
+        """
+        if self.stopped or self.job_cancelled(job):
+            return -1
+        parser = ProgressParser()
+        errors = []
+
+        def on_stdout(line):
+            stats = parser.feed(line)
+            if stats is not None and on_progress is not None:
+                on_progress(stats.out_time, stats)
+
+        if self.supervisor is not None:
+            return_code = self.run_supervised(job, key, cmd, on_stdout, errors.append)
+        else:
+            return_code = self.run_threaded(job, key, cmd, on_stdout, errors.append)
+
+        if return_code != 0 and not self.stopped and not self.job_cancelled(job):
+            self.log(f"FFmpeg进程失败（返回码 {return_code}）: {' '.join(cmd)}\n{''.join(errors[-10:])}", job)
+        return return_code
+
+    def run_threaded(self, job, key, cmd, on_stdout, on_stderr):
+        """用subprocess运行进程：当前线程读取stdout，另一个线程读取stderr，返回返回码"""
+        spawn_start = time.perf_counter()
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            **popen_options()
+        )
+        job.metrics.add_spawn(time.perf_counter() - spawn_start)
+        self.register_process(key, process, job)
+
+        def drain_errors():
+            for line in process.stderr:
+                on_stderr(line)
+
+        error_thread = threading.Thread(target=drain_errors, daemon=True)
+        error_thread.start()
+        try:
+            for line in process.stdout:
+                on_stdout(line)
+            return_code, usage = wait_process(process)
+            job.metrics.add_usage(usage)
+        finally:
+            self.unregister_process(key)
+        error_thread.join(timeout=5)
+        return return_code
+
+    def run_supervised(self, job, key, cmd, on_stdout, on_stderr, merge_stderr=False, started_message=None):
+        """用asyncio监控器运行进程，返回返回码；无法启动进程时抛出OSError
+
+        POSIX上监控器用os.wait4回收进程，进程的CPU时间计入性能数据（Windows上为空）。
+        """
+        spawn_start = time.perf_counter()
+        started = []
+
+        def on_start(process):
+            started.append(process)
+            job.metrics.add_spawn(time.perf_counter() - spawn_start)
+            self.register_process(key, process, job)
+            if started_message:
+                self.log(started_message, job)
+
+        def on_timeout(reason):
+            self.log(f"FFmpeg进程超时（{reason}），强制终止\n", job)
+
+        try:
+            return self.supervisor.run(cmd, on_stdout, on_stderr, on_start, on_timeout, merge_stderr)
+        finally:
+            self.unregister_process(key)
+            if started:
+                job.metrics.add_usage(started[0].usage)
+
+    def convert(self, job):
+        """转换单个任务（在工作线程中执行），返回FFmpeg返回码"""
+        total = len(self.jobs)
+        self.set_state(job, "running")
+        self.emit("job_start", job)
+        self.log(f"=== 开始转换第 {job.index+1}/{total} 个文件: {job.input_file} ===\n", job)
+
+        self.check_paths(job)
+
+        stream_plan = describe_stream_plan(job)
+        if stream_plan:
+            self.log(f"{stream_plan}\n", job)
+
+        if self.planner is not None:
+            self.planner.plan(self, job)
+
+        # 输出先写入暂存目录（可能需要等待暂存空间），成功后再发布到输出目录
+        staged = self.staging is not None and self.staging.stage(self, job)
+        if self.resources is not None:
+            self.resources.start(self, job)
+        job.metrics.started_at = time.time()
+        start = time.perf_counter()
+        return_code = None
+        try:
+            if self.ladder is not None and self.ladder.should_use(job):
+                return_code = self.ladder.convert(self, job)
+            elif job.extra_outputs:
+                # 多格式tee输出只使用一个FFmpeg进程
+                return_code = self.convert_single(job)
+            elif self.target_size is not None and self.target_size.should_use(job):
+                # 按目标文件大小编码（libx264为两遍编码）
+                return_code = self.target_size.convert(self, job)
+            elif self.segmenter is not None and self.segmenter.should_split(job):
+                # 长视频分段并行编码
+                return_code = self.segmenter.convert(self, job)
+            else:
+                return_code = self.convert_single(job)
+        finally:
+            job.metrics.encode_time = time.perf_counter() - start
+            with self.lock:
+                job.progress = 100.0
+            if self.resources is not None:
+                self.resources.finish(job)
+            if staged:
+                # 出错时return_code为None，删除暂存的输出
+                return_code = self.staging.complete(self, job, return_code)
+
+        return_code = self.finalize(job, return_code, staged)
+        if self.planner is not None:
+            self.planner.record(job)
+        return return_code
+
+    def convert_single(self, job):
+        """用一个FFmpeg进程转换整个文件，无法创建进程时返回None"""
+        # 构建FFmpeg命令
+        cmd = build_command(self.ffmpeg_path, job, self.global_args())
+        self.log(f"执行FFmpeg命令: {' '.join(cmd)}\n", job)
+        self.log(f"输入文件: {job.input_file}\n", job)
+        self.log(f"输出文件: {' | '.join(job.output_files())}\n", job)
+
+        if self.supervisor is not None:
+            try:
+                return self.convert_supervised(job, cmd)
+            except OSError as e:
+                # 无法直接启动时按原来的方式依次尝试
+                self.log(f"监控器无法启动FFmpeg: {str(e)}，改用其他方式\n", job)
+
+        spawn_start = time.perf_counter()
+        process = self.spawn(job, cmd)
+
+        # 检查process是否成功创建
+        if process is None:
+            return None
+
+        job.metrics.add_spawn(time.perf_counter() - spawn_start)
+        self.register_process(job.index, process, job)
+        self.log("FFmpeg进程已启动...\n", job)
+
+        try:
+            self.monitor(job, process)
+            return self.finish(job, process)
+        finally:
+            self.unregister_process(job.index)
+
+    def convert_supervised(self, job, cmd):
+        """用asyncio监控器运行FFmpeg，返回返回码；无法启动进程时抛出OSError"""
+        if self.progress_mode == "pipe":
+            on_stdout = self.progress_line_handler(job)
+            on_stderr = lambda line: self.log_line(job, line)
+        else:
+            on_stdout = self.status_line_handler(job)
+            on_stderr = None
+        return self.run_supervised(job, job.index, cmd, on_stdout, on_stderr,
+                                   merge_stderr=self.progress_mode != "pipe",
+                                   started_message="FFmpeg进程已启动（asyncio监控）...\n")
+
+    def finalize(self, job, return_code, staged=False):
+        """根据返回码记录任务结果，返回FFmpeg返回码
+
+        staged为True时输出写在暂存目录中，暂存器已经删除了不完整的文件，输出目录中的同名文件是之前完整的结果。
+        """
+        total = len(self.jobs)
+
+        # 删除不完整的输出文件（如果转换被停止）
+        if self.stopped:
+            if not staged:
+                self.remove_incomplete(job)
+            self.set_state(job, "stopped")
+            self.record_metrics(job)
+            return return_code
+
+        if return_code != 0 and self.job_cancelled(job):
+            # 在任务队列中被取消，进程已被终止
+            if not staged:
+                self.remove_incomplete(job)
+            job.return_code = return_code
+            self.set_state(job, "cancelled")
+            self.log(f"第 {job.index+1}/{total} 个文件已取消\n\n", job)
+            self.record_metrics(job)
+            self.emit("job_done", job, return_code=return_code, success=False)
+            return return_code
+
+        if return_code is None:
+            self.set_state(job, "failed")
+            self.log(f"第 {job.index+1}/{total} 个文件转换失败：无法创建FFmpeg进程\n\n", job)
+            self.record_metrics(job)
+            self.emit("job_done", job, return_code=None, success=False)
+            return None
+
+        job.return_code = return_code
+        self.set_state(job, "done" if return_code == 0 else "failed")
+        self.log(f"FFmpeg返回码: {return_code}\n", job)
+        if return_code == 0:
+            self.log(f"第 {job.index+1}/{total} 个文件转换完成！\n\n", job)
+        else:
+            self.log(f"第 {job.index+1}/{total} 个文件转换失败！返回码: {return_code}\n\n", job)
+        self.record_metrics(job)
+        self.emit("job_done", job, return_code=return_code, success=return_code == 0)
+        return return_code
+
+    def record_metrics(self, job):
+        """把任务的性能数据写入记录文件"""
+        if self.telemetry is None:
+            return
+        try:
+            self.telemetry.write(job.metrics.to_dict(job))
+        except OSError as e:
+            self.log(f"写入性能数据失败: {str(e)}\n", job)
+
+    def monitor(self, job, process):
+        """读取FFmpeg输出，解析总时长和当前进度"""
+        if self.progress_mode == "pipe":
+            self.monitor_progress_pipe(job, process)
+        else:
+            self.monitor_stderr(job, process)
+
+    def parse_duration_line(self, job, line):
+        """从FFmpeg日志的Duration行解析总时长"""
+        if "Duration:" in line and job.duration == 0:
+            duration = parse_timestamp(line.split("Duration:")[1].split(",")[0])
+            if duration:
+                job.duration = duration
+                self.emit("duration", job, duration=duration)
+
+    def log_line(self, job, line):
+        """处理stderr中的一行日志"""
+        self.emit("output", job, message=line)
+        self.parse_duration_line(job, line)
+
+    def drain_log(self, job, stream):
+        """读取stderr中的日志（pipe模式下在单独的线程中执行）"""
+        try:
+            for line in stream:
+                self.log_line(job, line)
+        except (OSError, ValueError):
+            # 进程被终止后管道可能已关闭
+            pass
+
+    def progress_line_handler(self, job):
+        """返回处理-progress进度流中一行的函数，每组数据发出一次进度事件"""
+        parser = ProgressParser()
+        update_count = [0]
+
+        def on_line(line):
+            stats = parser.feed(line)
+            if stats is None:
+                return
+
+            update_count[0] += 1
+            if stats.finished:
+                percent = 100.0
+            elif job.duration > 0 and stats.out_time is not None:
+                percent = min((stats.out_time / job.duration) * 100, 100)
+            else:
+                percent = job.progress
+            with self.lock:
+                job.progress = percent
+            job.metrics.add_sample(stats)
+            self.emit("progress", job, percent=percent, overall=self.overall_progress(),
+                      count=update_count[0], stats=stats)
+        return on_line
+
+    def status_line_handler(self, job):
+        """返回处理旧版FFmpeg日志中一行的函数：解析总时长和状态行中的当前进度"""
+        line_count = [0]
+
+        def on_line(line):
+            line_count[0] += 1
+            self.emit("output", job, message=line)
+
+            # 解析总时长
+            self.parse_duration_line(job, line)
+
+            # 记录帧率和速度
+            status = parse_status_line(line)
+            if status is not None:
+                job.metrics.add_sample(status)
+
+            # 解析当前进度（N/A等无法解析的时间直接跳过）
+            if "time=" in line and job.duration > 0:
+                current_time = parse_timestamp(line.split("time=")[1].split()[0])
+                if current_time is not None:
+                    with self.lock:
+                        job.progress = min((current_time / job.duration) * 100, 100)
+                    self.emit("progress", job, percent=job.progress, overall=self.overall_progress(),
+                              count=line_count[0], stats=None)
+        return on_line
+
+    def monitor_progress_pipe(self, job, process):
+        """读取-progress输出的key=value进度流，每组数据发出一次进度事件"""
+        log_thread = threading.Thread(target=self.drain_log, args=(job, process.stderr), daemon=True)
+        log_thread.start()
+
+        on_line = self.progress_line_handler(job)
+        try:
+            for line in process.stdout:
+                if self.stopped:
+                    break
+                on_line(line)
+        except Exception as e:
+            self.log(f"读取进程输出时出错: {str(e)}\n", job)
+
+        log_thread.join(timeout=5)
+
+    def monitor_stderr(self, job, process):
+        """读取合并到stdout的FFmpeg状态行，解析总时长和当前进度（兼容旧版FFmpeg）"""
+        on_line = self.status_line_handler(job)
+
+        while True:
+            if self.stopped:
+                break
+
+            # 读取一行输出
+            try:
+                line = process.stdout.readline()
+            except Exception as e:
+                self.log(f"读取进程输出时出错: {str(e)}\n", job)
+                break
+
+            if not line:
+                # 输出结束（进程即将退出），由finish()回收进程并读取CPU时间
+                break
+
+            on_line(line)
+
+    def finish(self, job, process):
+        """等待进程结束并返回返回码"""
+        try:
+            return_code, usage = wait_process(process, timeout=5)
+            job.metrics.add_usage(usage)
+            return return_code
+        except subprocess.TimeoutExpired:
+            # wait_process已经强制结束并回收了进程
+            self.log("FFmpeg进程超时，强制终止\n", job)
+            return -1  # 超时返回码
+
+    def remove_incomplete(self, job):
+        """删除不完整的输出文件（多格式输出时逐个删除）"""
+        for output_file in job.output_files():
+            if os.path.exists(output_file):
+                try:
+                    os.remove(output_file)
+                    self.log(f"已删除不完整的输出文件: {os.path.basename(output_file)}\n", job)
+                except Exception as e:
+                    self.log(f"删除不完整文件失败: {str(e)}\n", job)
@@ -0,0 +1,342 @@
+"""FFmpeg查找与编码器能力检测
+
+解析 ffmpeg -encoders / -hwaccels 的输出，并对每个候选编码器做一次很小的试编码，
+只有真正能工作的编码器才会被使用，自动选择时按试编码的实测耗时排序。找到的FFmpeg路径和检测结果
+都按FFmpeg可执行文件（路径、大小、修改时间）和版本缓存到磁盘，FFmpeg没有变化时启动时不需要运行任何子进程。
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import convert_engine as engine
+
+
+# 缓存文件格式版本
+CACHE_VERSION = 2
+
+# 候选H.264编码器，试编码耗时相同时按此顺序优先：硬件编码器在前，CPU编码器在后
+CANDIDATE_ENCODERS = [
+    "h264_nvenc",
+    "h264_qsv",
+    "h264_amf",
+    "h264_videotoolbox",
+    "libx264",
+    "libopenh264",
+]
+
+# CPU编码器（任何平台上都可以作为后备）
+CPU_ENCODERS = {"libx264", "libopenh264"}
+
+# 试编码使用的测试源，硬件编码器通常对最小分辨率有要求；分辨率和帧数足够大，耗时才能反映编码速度而不只是启动时间
+TRIAL_SOURCE = "testsrc2=size=1280x720:rate=30:duration=1"
+
+# 试编码的帧数
+TRIAL_FRAMES = 30
+
+
+def run_ffmpeg(ffmpeg_path, args, timeout=20):
+    """运行FFmpeg并返回(返回码, 标准输出)，无法运行时返回(None, "")"""
+    try:
+        result = subprocess.run(
+            [ffmpeg_path, *args],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            timeout=timeout,
+            **engine.popen_options()
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None, ""
+    return result.returncode, result.stdout
+
+
+def ffmpeg_version(ffmpeg_path):
+    """FFmpeg版本字符串，如"ffmpeg version 6.1.1"，无法获取时返回None"""
+    code, output = run_ffmpeg(ffmpeg_path, ["-hide_banner", "-version"])
+    if code != 0 or not output:
+        return None
+    return output.splitlines()[0].strip()
+
+
+def list_encoders(ffmpeg_path):
+    """解析 ffmpeg -encoders，返回编码器名称集合"""
+    code, output = run_ffmpeg(ffmpeg_path, ["-hide_banner", "-encoders"])
+    encoders = set()
+    if code != 0:
+        return encoders
+
+    started = False
+    for line in output.splitlines():
+        if not started:
+            # 编码器列表在"------"分隔线之后
+            started = line.strip().startswith("------")
+            continue
+        parts = line.split()
+        if len(parts) >= 2 and len(parts[0]) == 6:
+            encoders.add(parts[1])
+    return encoders
+
+
+def list_hwaccels(ffmpeg_path):
+    """解析 ffmpeg -hwaccels，返回硬件加速方式列表"""
+    code, output = run_ffmpeg(ffmpeg_path, ["-hide_banner", "-hwaccels"])
+    if code != 0:
+        return []
+    hwaccels = []
+    for line in output.splitlines():
+        line = line.strip()
+        if line and not line.endswith(":"):
+            hwaccels.append(line)
+    return hwaccels
+
+
+def trial_encode(ffmpeg_path, encoder):
+    """用测试源试编码几帧，成功时返回耗时（秒），失败时返回None"""
+    args = [
+        "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", TRIAL_SOURCE,
+        "-frames:v", str(TRIAL_FRAMES),
+        "-pix_fmt", "yuv420p",
+        "-c:v", encoder,
+        "-f", "null", "-"
+    ]
+    start = time.perf_counter()
+    code, _ = run_ffmpeg(ffmpeg_path, args)
+    if code != 0:
+        return None
+    return time.perf_counter() - start
+
+
+def report(message, log=None):
+    """报告缓存写入失败等问题：有log时调用log(消息)，否则输出到stderr"""
+    if log is not None:
+        log(message)
+    else:
+        print(message, file=sys.stderr)
+
+
+def binary_identity(ffmpeg_path):
+    """FFmpeg可执行文件标识：(绝对路径, 大小, 修改时间纳秒)，找不到时返回None"""
+    resolved = shutil.which(ffmpeg_path) or ffmpeg_path
+    try:
+        st = os.stat(resolved)
+    except OSError:
+        return None
+    return os.path.abspath(resolved), st.st_size, st.st_mtime_ns
+
+
+class EncoderCapabilities:
+    """FFmpeg的编码器能力"""
+
+    def __init__(self, ffmpeg_path, version=None, available=None, hwaccels=None, working=None):
+        self.ffmpeg_path = ffmpeg_path
+        self.version = version
+        self.available = set(available or [])  # ffmpeg -encoders列出的编码器
+        self.hwaccels = list(hwaccels or [])
+        # 试编码成功的候选编码器 {名称: 试编码耗时}
+        self.working = dict(working or {})
+
+    def works(self, encoder):
+        """编码器是否试编码成功"""
+        return encoder in self.working
+
+    def ranked_encoders(self):
+        """能工作的编码器，按试编码耗时从快到慢排列（耗时相同时按CANDIDATE_ENCODERS的顺序）"""
+        def rank(encoder):
+            order = CANDIDATE_ENCODERS.index(encoder) if encoder in CANDIDATE_ENCODERS else len(CANDIDATE_ENCODERS)
+            return self.working[encoder], order
+        return sorted(self.working, key=rank)
+
+    def best_encoder(self):
+        """试编码最快的编码器，都不能工作时返回默认CPU编码器"""
+        ranked = self.ranked_encoders()
+        return ranked[0] if ranked else engine.DEFAULT_VIDEO_CODEC
+
+    def cpu_encoder(self):
+        """能工作的CPU编码器中试编码最快的一个，都不能工作时返回默认CPU编码器"""
+        for encoder in self.ranked_encoders():
+            if encoder in CPU_ENCODERS:
+                return encoder
+        return engine.DEFAULT_VIDEO_CODEC
+
+    def accel_options(self):
+        """图形界面中可用的加速选项（硬件编码器按试编码耗时排列，CPU编码始终在最后）"""
+        labels = {codec: label for label, codec in engine.GPU_ENCODERS.items()}
+        options = [labels[encoder] for encoder in self.ranked_encoders()
+                   if encoder not in CPU_ENCODERS and encoder in labels]
+        options.append("CPU编码")
+        return options
+
+    def best_accel_option(self):
+        """默认的加速选项：试编码最快的编码器对应的选项，CPU编码器最快时为CPU编码"""
+        labels = {codec: label for label, codec in engine.GPU_ENCODERS.items()}
+        best = self.best_encoder()
+        if best in CPU_ENCODERS or best not in labels:
+            return "CPU编码"
+        return labels[best]
+
+    def video_codec_for(self, option):
+        """加速选项对应的视频编码器，CPU编码使用实际能工作的CPU编码器（如只有libopenh264时）"""
+        if option == "CPU编码":
+            return self.cpu_encoder()
+        return engine.video_codec_for(option)
+
+    def to_dict(self):
+        return {
+            "version": self.version,
+            "available": sorted(self.available),
+            "hwaccels": self.hwaccels,
+            "working": self.working,
+        }
+
+    @classmethod
+    def from_dict(cls, ffmpeg_path, data):
+        return cls(ffmpeg_path, data.get("version"), data.get("available"),
+                   data.get("hwaccels"), data.get("working"))
+
+    def __repr__(self):
+        return f"EncoderCapabilities({self.version!r}, working={list(self.working)})"
+
+
+def detect_capabilities(ffmpeg_path):
+    """检测编码器能力（不使用缓存）"""
+    available = list_encoders(ffmpeg_path)
+    working = {}
+    for encoder in CANDIDATE_ENCODERS:
+        if encoder not in available:
+            continue
+        elapsed = trial_encode(ffmpeg_path, encoder)
+        if elapsed is not None:
+            working[encoder] = round(elapsed, 3)
+    return EncoderCapabilities(
+        ffmpeg_path,
+        version=ffmpeg_version(ffmpeg_path),
+        available=available,
+        hwaccels=list_hwaccels(ffmpeg_path),
+        working=working
+    )
+
+
+class CapabilityCache:
+    """编码器能力的磁盘缓存，按FFmpeg可执行文件（路径、大小、修改时间）和版本字符串区分
+
+    写入失败时调用log(消息)，没有log时输出到stderr。
+    """
+
+    def __init__(self, path=None, log=None):
+        self.path = path or os.path.join(engine.default_cache_dir(), "encoder_cache.json")
+        self.log = log
+        self.lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                return data.get("binaries", {})
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _save(self, binaries):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": CACHE_VERSION, "binaries": binaries}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            report(f"保存编码器缓存失败: {e}", self.log)
+
+    @staticmethod
+    def key_for(identity, version):
+        abspath, size, mtime_ns = identity
+        return f"{abspath}|{size}|{mtime_ns}|{version or ''}"
+
+    def get(self, ffmpeg_path, version=None):
+        """返回缓存的能力，FFmpeg文件或版本变化时返回None
+
+        version为已知的版本字符串（如locate_ffmpeg缓存的版本），为None时运行ffmpeg -version获取。
+        """
+        identity = binary_identity(ffmpeg_path)
+        if identity is None:
+            return None
+        if version is None:
+            version = ffmpeg_version(ffmpeg_path)
+        with self.lock:
+            entry = self._load().get(self.key_for(identity, version))
+        if not entry:
+            return None
+        return EncoderCapabilities.from_dict(ffmpeg_path, entry)
+
+    def put(self, capabilities):
+        """保存检测结果"""
+        identity = binary_identity(capabilities.ffmpeg_path)
+        if identity is None:
+            return
+        with self.lock:
+            binaries = self._load()
+            # 同一路径只保留最新的记录
+            binaries = {k: v for k, v in binaries.items() if not k.startswith(identity[0] + "|")}
+            binaries[self.key_for(identity, capabilities.version)] = capabilities.to_dict()
+            self._save(binaries)
+
+
+def probe_capabilities(ffmpeg_path, cache=None, refresh=False, version=None, log=None):
+    """获取编码器能力：优先使用缓存，FFmpeg变化或refresh为True时重新检测
+
+    version为已知的FFmpeg版本字符串，传入时查找缓存不需要运行ffmpeg -version。
+    log为没有传入cache时新建缓存使用的日志回调。
+    """
+    if cache is None:
+        cache = CapabilityCache(log=log)
+    if not refresh:
+        capabilities = cache.get(ffmpeg_path, version)
+        if capabilities is not None:
+            return capabilities
+    capabilities = detect_capabilities(ffmpeg_path)
+    cache.put(capabilities)
+    return capabilities
+
+
+def locate_ffmpeg(cache_path=None, refresh=False, log=None):
+    """查找FFmpeg，返回(路径, 版本, 是否来自缓存)，找不到时路径为None
+
+    上次找到的FFmpeg文件大小和修改时间都没有变化时直接使用缓存，不运行ffmpeg -version。
+    缓存写入失败时调用log(消息)，没有log时输出到stderr。
+    """
+    cache_path = cache_path or os.path.join(engine.default_cache_dir(), "ffmpeg_location.json")
+    if not refresh:
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            identity = binary_identity(cached["path"])
+            if identity is not None and [identity[1], identity[2]] == [cached["size"], cached["mtime_ns"]]:
+                return cached["path"], cached.get("version"), True
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    ffmpeg_path = engine.find_ffmpeg()
+    if not ffmpeg_path:
+        return None, None, False
+    version = ffmpeg_version(ffmpeg_path)
+    identity = binary_identity(ffmpeg_path)
+    if identity is not None:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"path": identity[0], "size": identity[1], "mtime_ns": identity[2], "version": version},
+                          f, ensure_ascii=False)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            report(f"保存FFmpeg路径缓存失败: {e}", log)
+        # 统一使用绝对路径，与缓存命中时返回的路径一致
+        ffmpeg_path = identity[0]
+    return ffmpeg_path, version, False
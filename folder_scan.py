@@ -0,0 +1,320 @@
+"""高速并行扫描文件夹
+
+添加包含几十万个文件的文件夹时，os.walk在一个线程中逐个目录列出，网络共享上每个目录都要等待一次往返。
+扫描器用多个线程同时列出不同的目录（os.scandir，普通文件和目录的类型判断不需要额外的stat），
+按扩展名集合筛选视频文件，结果分批交给回调（每批一个数据库事务），可以随时取消，并统计每秒扫描的文件数。
+
+目录按(设备号, inode)去重，符号链接形成的循环和重叠的扫描路径都只扫描一次；
+同一个文件（符号链接、硬链接或重叠的路径）也只返回一次。
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+
+import convert_engine as engine
+
+
+# 视频文件扩展名（小写）
+VIDEO_SUFFIXES = frozenset(engine.VIDEO_EXTENSIONS)
+
+# 扫描线程数：列出目录主要在等待磁盘或网络，线程数可以多于CPU数
+DEFAULT_WORKERS = 8
+
+# 每批结果的文件数上限
+BATCH_SIZE = 1000
+
+# 结果不足一批时最长等待的时间（秒）
+BATCH_INTERVAL = 0.5
+
+# 每列出这么多个目录项检查一次是否已取消
+CANCEL_CHECK_INTERVAL = 1000
+
+
+def has_suffix(name, suffixes):
+    """文件扩展名（不区分大小写）是否在集合中"""
+    return os.path.splitext(name)[1].lower() in suffixes
+
+
+def directory_key(path):
+    """目录的唯一标识(设备号, inode)，无法读取时抛出OSError"""
+    st = os.stat(path)
+    return st.st_dev, st.st_ino
+
+
+class ScanStats:
+    """扫描统计，扫描过程中由扫描线程更新，其他线程可以随时读取"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.directories = 0  # 已列出的目录数
+        self.files = 0  # 已列出的文件数（包括不是视频的文件）
+        self.matched = 0  # 找到的视频文件数
+        self.delivered = 0  # 已成功交给on_batch的文件数
+        self.duplicates = 0  # 重复的目录和文件（符号链接循环、硬链接等）
+        self.errors = 0  # 无法读取的目录和文件，以及回调出错的批次
+        self.callback_errors = 0  # on_batch出错（如写入数据库失败）的批次数
+        self.last_error = None  # 最近一次回调出错的信息
+        self.cancelled = False
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def files_per_second(self):
+        return self.files / self.elapsed if self.elapsed > 0 else 0.0
+
+    def describe(self):
+        """统计摘要，如"找到 1200 个视频文件（扫描 35000 个文件、800 个目录，12.3 秒，2845 个文件/秒）" """
+        text = (f"找到 {self.matched} 个视频文件（扫描 {self.files} 个文件、{self.directories} 个目录，"
+                f"{self.elapsed:.1f} 秒，{self.files_per_second:.0f} 个文件/秒）")
+        if self.duplicates:
+            text += f"，跳过 {self.duplicates} 个重复项"
+        read_errors = self.errors - self.callback_errors
+        if read_errors:
+            text += f"，{read_errors} 个无法读取"
+        if self.callback_errors:
+            text += f"，{self.callback_errors} 批结果处理出错（{self.last_error}）"
+        return text
+
+
+class FolderScanner:
+    """在后台线程中并行扫描目录，找到的文件分批交给on_batch(文件路径列表)，结束时调用on_done(ScanStats)
+
+    回调在扫描线程中调用，同一时间只调用一个回调；每个目录中的文件按名称排序，目录之间的顺序不固定。
+    on_batch抛出的异常不会中断扫描：计入stats.errors和stats.callback_errors，该批结果丢弃，
+    扫描结束时总会调用on_done。
+    exclude中的目录（如位于扫描目录中的输出目录）不扫描；follow_symlinks为False时不进入符号链接指向的目录。
+    取消后不再调用on_batch，已经找到但还没交出的文件丢弃。
+    """
+
+    def __init__(self, paths, on_batch, on_done=None, workers=DEFAULT_WORKERS, suffixes=VIDEO_SUFFIXES,
+                 batch_size=BATCH_SIZE, batch_interval=BATCH_INTERVAL, follow_symlinks=True, exclude=None):
+        self.paths = list(paths)
+        self.on_batch = on_batch
+        self.on_done = on_done
+        self.workers = max(1, workers)
+        self.suffixes = frozenset(suffix.lower() for suffix in suffixes)
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.follow_symlinks = follow_symlinks
+        self.exclude = set()
+        for path in exclude or []:
+            try:
+                self.exclude.add(directory_key(path))
+            except OSError:
+                # 还不存在的目录不需要排除
+                pass
+        self.stats = ScanStats()
+        self.lock = threading.Lock()
+        self.emit_lock = threading.RLock()
+        self._directories = queue.Queue()
+        self._pending = 0  # 已排队但还没列完的目录数
+        self._visited = set()  # 已排队的目录(设备号, inode)
+        self._seen = set()  # 已找到的文件
+        self._batch = []
+        self._last_emit = time.perf_counter()
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def done(self):
+        return self._done_event.is_set()
+
+    def start(self):
+        """开始扫描（不阻塞），返回self"""
+        for path in self.paths:
+            try:
+                self._push(path, directory_key(path))
+            except OSError:
+                with self.lock:
+                    self.stats.errors += 1
+        with self.lock:
+            empty = self._pending == 0
+        if empty:
+            self._complete()
+            return self
+        for n in range(self.workers):
+            threading.Thread(target=self._worker, daemon=True, name=f"folder-scan-{n+1}").start()
+        return self
+
+    def cancel(self):
+        """取消扫描，正在列出的目录会在下一次检查时停止；返回后不会再调用on_batch"""
+        self._cancel_event.set()
+        # 等待正在执行的on_batch返回
+        with self.emit_lock:
+            pass
+
+    def wait(self, timeout=None):
+        """等待扫描结束，返回是否已经结束"""
+        return self._done_event.wait(timeout)
+
+    def run(self):
+        """扫描直到结束（阻塞），返回统计"""
+        self.start()
+        self.wait()
+        return self.stats
+
+    def _push(self, path, key):
+        """目录加入扫描队列，已经扫描过的目录（符号链接循环、重叠的扫描路径）和排除的目录跳过"""
+        with self.lock:
+            if key in self.exclude:
+                return
+            if key in self._visited:
+                self.stats.duplicates += 1
+                return
+            self._visited.add(key)
+            self._pending += 1
+        self._directories.put((path, key[0]))
+
+    def _worker(self):
+        while True:
+            item = self._directories.get()
+            if item is None:
+                return
+            try:
+                if not self.cancelled:
+                    self._scan_directory(*item)
+            except Exception as e:
+                # 无法列出的目录（OSError）或其他意外错误，都不能让扫描线程退出
+                with self.lock:
+                    self.stats.errors += 1
+                    if not isinstance(e, OSError):
+                        self.stats.last_error = f"{type(e).__name__}: {e}"
+            finally:
+                self._finish_directory()
+
+    def _file_key(self, entry, device):
+        """文件的唯一标识：普通文件用(所在目录的设备号, inode)（POSIX上不需要额外的stat），符号链接用目标文件"""
+        if entry.is_symlink():
+            st = os.stat(entry.path)
+            return st.st_dev, st.st_ino
+        inode = entry.inode()
+        if not inode:
+            # 不提供inode的文件系统按路径去重
+            return os.path.normcase(entry.path)
+        return device, inode
+
+    def _scan_directory(self, path, device):
+        """列出一个目录：子目录加入扫描队列，扩展名匹配的文件加入结果"""
+        found = []
+        files = 0
+        with os.scandir(path) as entries:
+            for count, entry in enumerate(entries, 1):
+                if count % CANCEL_CHECK_INTERVAL == 0 and self.cancelled:
+                    return
+                try:
+                    if entry.is_dir(follow_symlinks=self.follow_symlinks):
+                        self._push(entry.path, directory_key(entry.path))
+                        continue
+                    files += 1
+                    if has_suffix(entry.name, self.suffixes) and entry.is_file(follow_symlinks=self.follow_symlinks):
+                        found.append((entry.path, self._file_key(entry, device)))
+                except OSError:
+                    # 失效的符号链接、列出后被删除的文件等
+                    with self.lock:
+                        self.stats.errors += 1
+
+        found.sort()
+        batch = None
+        with self.lock:
+            self.stats.directories += 1
+            self.stats.files += files
+            for file_path, key in found:
+                if key in self._seen:
+                    self.stats.duplicates += 1
+                    continue
+                self._seen.add(key)
+                self._batch.append(file_path)
+                self.stats.matched += 1
+            now = time.perf_counter()
+            if self._batch and (len(self._batch) >= self.batch_size or now - self._last_emit >= self.batch_interval):
+                batch, self._batch = self._batch, []
+                self._last_emit = now
+        if batch:
+            self._emit(batch)
+
+    def _emit(self, batch):
+        with self.emit_lock:
+            if self.cancelled:
+                return
+            try:
+                self.on_batch(batch)
+                with self.lock:
+                    self.stats.delivered += len(batch)
+            except Exception as e:
+                # 如数据库被锁定（sqlite3.OperationalError），这一批结果丢弃，扫描继续
+                with self.lock:
+                    self.stats.errors += 1
+                    self.stats.callback_errors += 1
+                    self.stats.last_error = f"{type(e).__name__}: {e}"
+
+    def _finish_directory(self):
+        with self.lock:
+            self._pending -= 1
+            last = self._pending == 0
+        if last:
+            # 最后一个目录列完，通知所有扫描线程退出（可能有线程还在启动，按线程数发送）
+            for _ in range(self.workers):
+                self._directories.put(None)
+            self._complete()
+
+    def _complete(self):
+        try:
+            with self.lock:
+                batch, self._batch = self._batch, []
+            if batch:
+                self._emit(batch)
+        finally:
+            self.stats.cancelled = self.cancelled
+            self.stats.finished = time.perf_counter()
+            self._done_event.set()
+            if self.on_done is not None:
+                self.on_done(self.stats)
+
+
+def scan_paths(paths, workers=DEFAULT_WORKERS, suffixes=VIDEO_SUFFIXES):
+    """展开路径列表：文件直接加入，目录并行扫描（每个目录的结果排序），返回文件路径列表"""
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            FolderScanner([path], found.extend, workers=workers, suffixes=suffixes).run()
+            file_paths.extend(sorted(found))
+        else:
+            file_paths.append(path)
+    return file_paths
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="扫描目录中的视频文件并输出统计（测试扫描速度）")
+    parser.add_argument("paths", nargs="+", help="要扫描的目录")
+    parser.add_argument("-j", "--workers", type=int, default=DEFAULT_WORKERS, help="扫描线程数")
+    parser.add_argument("--list", action="store_true", help="输出找到的文件")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    on_batch = (lambda batch: print("\n".join(batch))) if args.list else (lambda batch: None)
+    scanner = FolderScanner(args.paths, on_batch, workers=args.workers)
+    try:
+        stats = scanner.run()
+    except KeyboardInterrupt:
+        scanner.cancel()
+        scanner.wait()
+        stats = scanner.stats
+    print(stats.describe())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
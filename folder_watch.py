@@ -0,0 +1,376 @@
+"""监视文件夹
+
+持续监视目录中新出现的视频文件（扩展名与添加文件夹相同），文件不再增长（大小和修改时间在
+一段时间内不变）后加入持久化任务队列。每个文件（路径、大小和修改时间相同）只加入一次，
+记录保存在队列数据库中，重新启动监视后也不会重复添加。
+
+Linux上通过ctypes使用inotify，只为目录添加监视，空闲时几乎不占用CPU；其他系统或inotify不可用
+（如超过max_user_watches）时改为轮询：每次只检查目录的修改时间，只重新列出发生变化的目录，
+监视几十万个文件时CPU占用也保持稳定。
+
+    python folder_watch.py 监视目录... -o output -f mp4
+    python job_queue.py work -j 2          # 另一个进程处理队列中的任务
+"""
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+import convert_engine as engine
+import job_queue
+
+
+# 文件大小和修改时间保持不变多长时间（秒）后认为已经写完
+SETTLE_TIME = 5.0
+
+# 检查待定文件的间隔（秒）
+CHECK_INTERVAL = 1.0
+
+# 轮询模式下检查目录修改时间的间隔（秒）
+POLL_INTERVAL = 5.0
+
+# inotify事件和标志（<sys/inotify.h>）
+IN_CREATE = 0x00000100
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# 不监视IN_MODIFY：复制大文件时每次写入都会产生事件，文件是否写完由定期检查大小和修改时间判断
+WATCH_MASK = IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_video_file(name):
+    """是否为需要监视的视频文件（跳过以.开头的临时文件）"""
+    return not name.startswith(".") and name.lower().endswith(tuple(engine.VIDEO_EXTENSIONS))
+
+
+class Inotify:
+    """通过ctypes调用的inotify接口"""
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify仅在Linux上可用")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "C库不支持inotify")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path):
+        """监视目录，返回监视描述符"""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def remove_watch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout):
+        """等待事件（最多timeout秒），返回(监视描述符, 事件, 文件名)列表"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 256 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """监视目录中写完的新视频文件，对每个文件调用on_file(路径, 大小, 修改时间)
+
+    known为已经处理过的文件（路径 -> (大小, 修改时间)），这些文件没有变化时不会再次调用on_file。
+    """
+
+    def __init__(self, paths, on_file, recursive=True, use_inotify=True, settle_time=SETTLE_TIME,
+                 poll_interval=POLL_INTERVAL, exclude=None, known=None, log=None):
+        # 使用真实路径，避免符号链接造成重复监视
+        self.roots = [os.path.realpath(path) for path in paths]
+        self.on_file = on_file
+        self.recursive = recursive
+        self.use_inotify = use_inotify
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        # 不监视的目录（如位于监视目录中的输出目录）
+        self.exclude = {os.path.realpath(path) for path in exclude or []}
+        self.seen = dict(known or {})
+        self.log = log or (lambda message: print(message, file=sys.stderr))
+        self.pending = {}  # 路径 -> [大小, 修改时间, 开始保持不变的时间]
+        self.dir_mtimes = {}  # 目录 -> 修改时间（轮询模式据此判断是否需要重新列出）
+        self.watches = {}  # inotify监视描述符 -> 目录
+        self.inotify = None
+        self.found = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def mode(self):
+        return "inotify" if self.inotify is not None else "轮询"
+
+    def start(self):
+        """在后台线程中开始监视"""
+        self._thread = threading.Thread(target=self.run, daemon=True, name="folder-watch")
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def run(self):
+        """监视直到被停止"""
+        if self.use_inotify:
+            try:
+                self.inotify = Inotify()
+            except OSError as e:
+                self.log(f"inotify不可用（{e}），使用轮询")
+        for root in self.roots:
+            self.scan(root)
+        self.log(f"开始监视 {len(self.dir_mtimes)} 个目录（{self.mode}）")
+
+        last_poll = time.monotonic()
+        try:
+            while not self._stop_event.is_set():
+                if self.inotify is not None:
+                    for wd, mask, name in self.inotify.read_events(CHECK_INTERVAL):
+                        self.handle_event(wd, mask, name)
+                else:
+                    self._stop_event.wait(CHECK_INTERVAL)
+                    if time.monotonic() - last_poll >= self.poll_interval:
+                        last_poll = time.monotonic()
+                        self.poll()
+                self.check_pending()
+        finally:
+            if self.inotify is not None:
+                self.inotify.close()
+                self.inotify = None
+
+    def scan(self, directory, rescan=False):
+        """列出目录，记录目录修改时间，inotify模式下为目录添加监视
+
+        递归时扫描新出现的子目录，rescan为True时扫描所有子目录。
+        """
+        stack = [directory]
+        while stack:
+            directory = stack.pop()
+            if directory in self.exclude:
+                continue
+            try:
+                # 先记录修改时间和添加监视再列出，列出期间新增的文件不会遗漏
+                self.dir_mtimes[directory] = os.stat(directory).st_mtime_ns
+                if self.inotify is not None:
+                    self.add_watch(directory)
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if self.recursive and (rescan or entry.path not in self.dir_mtimes):
+                                    stack.append(entry.path)
+                            elif entry.is_file() and is_video_file(entry.name):
+                                self.consider(entry.path, entry.stat())
+                        except OSError:
+                            continue
+            except OSError:
+                self.dir_mtimes.pop(directory, None)
+
+    def add_watch(self, directory):
+        try:
+            self.watches[self.inotify.add_watch(directory)] = directory
+        except OSError as e:
+            if e.errno != errno.ENOSPC:
+                raise
+            # 超过系统允许的监视数量（/proc/sys/fs/inotify/max_user_watches）
+            self.log("inotify监视数量已达系统上限，改为轮询")
+            self.inotify.close()
+            self.inotify = None
+            self.watches = {}
+
+    def handle_event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # 事件队列溢出，可能漏掉了事件，重新列出所有目录
+            self.log("inotify事件队列溢出，重新扫描监视目录")
+            for root in self.roots:
+                self.scan(root, rescan=True)
+            return
+        directory = self.watches.get(wd)
+        if directory is None:
+            return
+        if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+            # 目录被删除或移走：移走的目录如果仍在监视范围内，会在新位置收到IN_MOVED_TO
+            if mask & IN_MOVE_SELF:
+                self.forget_directory(directory)
+            else:
+                self.watches.pop(wd, None)
+                self.dir_mtimes.pop(directory, None)
+            return
+        path = os.path.join(directory, name)
+        if mask & IN_ISDIR:
+            if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                self.scan(path)
+        elif is_video_file(name):
+            try:
+                self.consider(path, os.stat(path))
+            except OSError:
+                pass
+
+    def forget_directory(self, directory):
+        """停止监视目录及其子目录"""
+        prefix = directory + os.sep
+        for wd, path in list(self.watches.items()):
+            if path == directory or path.startswith(prefix):
+                self.inotify.remove_watch(wd)
+                del self.watches[wd]
+        for path in list(self.dir_mtimes):
+            if path == directory or path.startswith(prefix):
+                del self.dir_mtimes[path]
+
+    def poll(self):
+        """轮询：检查每个目录的修改时间，只重新列出发生变化的目录（新增的子目录在列出时扫描）"""
+        for directory, mtime in list(self.dir_mtimes.items()):
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except OSError:
+                self.dir_mtimes.pop(directory, None)
+                continue
+            if current != mtime:
+                self.scan(directory)
+
+    def consider(self, path, stat):
+        """发现新文件或文件发生变化：加入待定列表，等待写完"""
+        key = (stat.st_size, stat.st_mtime_ns)
+        if self.seen.get(path) == key or path in self.pending:
+            return
+        now = time.monotonic()
+        # 修改时间早于等待时间的文件（如移动进来的已完成文件）下次检查时即可处理
+        if time.time() - stat.st_mtime_ns / 1e9 >= self.settle_time:
+            now -= self.settle_time
+        self.pending[path] = [stat.st_size, stat.st_mtime_ns, now]
+
+    def check_pending(self):
+        """检查待定文件：大小和修改时间保持不变超过等待时间的文件交给on_file"""
+        now = time.monotonic()
+        for path, state in list(self.pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # 文件已被删除或移走
+                del self.pending[path]
+                continue
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+            if (size, mtime_ns) != (state[0], state[1]):
+                self.pending[path] = [size, mtime_ns, now]
+                continue
+            if now - state[2] < self.settle_time:
+                continue
+            del self.pending[path]
+            if size == 0:
+                # 空文件不加入队列，之后写入内容时（inotify的IN_CLOSE_WRITE或目录变化）会重新发现
+                continue
+            self.seen[path] = (size, mtime_ns)
+            self.found += 1
+            try:
+                self.on_file(path, size, mtime_ns)
+            except Exception as e:
+                self.log(f"处理文件失败: {path}: {e}")
+
+
+def enqueue_to(queue, params=None, priority=0, log=None):
+    """返回把写完的文件加入任务队列的on_file回调（每个文件只加入一次）"""
+    def on_file(path, size, mtime_ns):
+        job_id = queue.add_once(path, size, mtime_ns, params, priority)
+        if job_id is not None and log is not None:
+            log(f"[{job_id}] 已加入队列: {path}")
+    return on_file
+
+
+def watch_queue(queue, paths, params=None, priority=0, log=None, **options):
+    """创建把目录中写完的新文件加入任务队列的FolderWatcher，已经加入过的文件不会重复添加"""
+    exclude = [params["output_dir"]] if params else []
+    return FolderWatcher(paths, enqueue_to(queue, params, priority, log), exclude=exclude,
+                         known=queue.ingested_files(), log=log, **options)
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="监视文件夹，把新视频文件加入持久化任务队列")
+    parser.add_argument("paths", nargs="+", help="监视的目录")
+    parser.add_argument("--queue", default=None, help=f"队列数据库路径（默认：{job_queue.default_queue_path()}）")
+    parser.add_argument("-o", "--output-dir", default=os.path.join(os.getcwd(), "output"), help="输出目录")
+    parser.add_argument("-f", "--format", default="mp4", help="输出格式，多个格式用逗号分隔，如mp4,mkv")
+    parser.add_argument("-r", "--resolution", default="", help="输出分辨率，如1920x1080（默认：原始分辨率）")
+    parser.add_argument("-b", "--bitrate", default="", help="视频码率，如10M（默认：自动）")
+    parser.add_argument("-e", "--encoder", default=engine.DEFAULT_VIDEO_CODEC, help="视频编码器")
+    parser.add_argument("-p", "--priority", type=int, default=0, help="任务优先级（默认：0）")
+    parser.add_argument("--settle", type=float, default=SETTLE_TIME,
+                        help=f"文件大小和修改时间保持不变多少秒后加入队列（默认：{SETTLE_TIME:g}）")
+    parser.add_argument("--poll", action="store_true", help="不使用inotify，始终轮询")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL,
+                        help=f"轮询间隔秒数（默认：{POLL_INTERVAL:g}）")
+    parser.add_argument("--no-recursive", action="store_true", help="不监视子目录")
+    return parser
+
+
+def main(argv=None):
+    """命令行入口，返回进程退出码"""
+    args = build_parser().parse_args(argv)
+    for path in args.paths:
+        if not os.path.isdir(path):
+            print(f"目录不存在: {path}", file=sys.stderr)
+            return 2
+    try:
+        output_formats = engine.parse_formats(args.format)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    queue = job_queue.JobQueue(args.queue)
+    params = job_queue.job_params(os.path.abspath(args.output_dir), ",".join(output_formats),
+                                  engine.parse_resolution(args.resolution), engine.parse_bitrate(args.bitrate),
+                                  args.encoder)
+
+    def log(message):
+        print(message, flush=True)
+
+    watcher = watch_queue(queue, args.paths, params, args.priority, log, recursive=not args.no_recursive,
+                          use_inotify=not args.poll, settle_time=args.settle, poll_interval=args.poll_interval)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    print(f"共发现 {watcher.found} 个新文件")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
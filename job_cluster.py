@@ -0,0 +1,650 @@
+"""多台机器协同转换（协调进程 / 工作进程）
+
+协调进程持有持久化任务队列（job_queue.JobQueue，SQLite数据库只在协调进程所在的机器上读写），
+监听TCP端口。各台编码机器上的工作进程连接到协调进程，领取任务后用与本机转换相同的ConversionRunner转换，
+并把进度和结果发回协调进程。输入和输出文件位于所有机器共享的文件系统（如NFS）上，
+挂载路径不同时可以用--map-path换算。
+
+工作进程每隔几秒发送一次心跳；连接断开或超时未收到心跳时，协调进程把该工作进程的运行中任务重新排队。
+协调进程回复每次心跳，工作进程超时未收到回复或连接断开时终止正在运行的转换（这些任务会被重新排队），
+然后不断尝试重新连接。
+
+    python job_queue.py add 输入文件或目录... -o /mnt/nfs/output -f mp4
+    python job_cluster.py coordinator --host 0.0.0.0 --port 8770 --token 密钥
+    python job_cluster.py worker 协调进程地址:8770 -j 2 --token 密钥
+    python job_cluster.py status 协调进程地址:8770 --token 密钥
+
+消息为每行一个JSON对象：
+    工作进程 -> 协调进程  hello（worker, slots, token）、claim、ping、progress（id, percent, fps, speed）、
+                          done（id, state, return_code）
+    协调进程 -> 工作进程  welcome、error（message）、job（id, input_file, params, priority）、idle、pong、
+                          cancel（ids）
+    查询状态              status（token） -> status（counts, workers）
+"""
+import argparse
+import hmac
+import json
+import queue
+import socket
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+
+import convert_engine as engine
+import encoder_probe
+import job_queue
+import job_telemetry
+import media_probe
+import output_staging
+import process_supervisor
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8770
+
+# 工作进程发送心跳的间隔（秒）
+PING_INTERVAL = 5
+
+# 超过这一时间（秒）没有收到对方的任何消息时视为断开
+WORKER_TIMEOUT = 30
+
+# 工作进程与协调进程断开后重新连接的间隔（秒）
+RECONNECT_DELAY = 5
+
+# 队列中没有任务时工作进程重新领取的间隔（秒）
+CLAIM_RETRY = 2
+
+# 进度消息的最小间隔（秒）
+PROGRESS_INTERVAL = 1.0
+
+# 单条消息的大小上限（字节）
+MAX_MESSAGE_SIZE = 1024 * 1024
+
+
+def parse_address(value, default_port=DEFAULT_PORT):
+    """解析"主机:端口"，省略端口时使用默认端口"""
+    host, _, port = value.rpartition(":")
+    if not host:
+        return value, default_port
+    try:
+        return host.strip("[]"), int(port)
+    except ValueError:
+        raise ValueError(f"无效的地址: {value}")
+
+
+def parse_path_map(values):
+    """解析路径换算，如["/mnt/nfs=/data"]，返回[(协调进程上的路径前缀, 本机路径前缀)]"""
+    mappings = []
+    for value in values or []:
+        remote, sep, local = value.partition("=")
+        if not sep or not remote:
+            raise ValueError(f"无效的路径换算: {value}（格式：协调进程上的路径=本机路径）")
+        mappings.append((remote.rstrip("/\\"), local.rstrip("/\\")))
+    return mappings
+
+
+def map_path(path, mappings):
+    """按路径换算把协调进程上的路径换成本机路径"""
+    for remote, local in mappings:
+        if path == remote or (path.startswith(remote) and path[len(remote)] in "/\\"):
+            return local + path[len(remote):]
+    return path
+
+
+def send_message(sock, lock, message):
+    """发送一条消息（多个线程共用一个连接时用lock保证消息完整）"""
+    data = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+    with lock:
+        sock.sendall(data)
+
+
+def read_message(reader):
+    """读取一条消息，连接关闭时返回None，消息无效时抛出ValueError"""
+    line = reader.readline(MAX_MESSAGE_SIZE + 1)
+    if not line:
+        return None
+    if len(line) > MAX_MESSAGE_SIZE or not line.endswith(b"\n"):
+        raise ValueError("消息过长或不完整")
+    message = json.loads(line.decode("utf-8"))
+    if not isinstance(message, dict):
+        raise ValueError("消息格式无效")
+    return message
+
+
+def check_token(expected, message):
+    return not expected or hmac.compare_digest(str(message.get("token", "")), expected)
+
+
+class WorkerConnection:
+    """协调进程中一个已连接的工作进程"""
+
+    def __init__(self, worker_id, sock, slots, address, send_lock):
+        self.worker_id = worker_id
+        self.sock = sock
+        self.slots = slots
+        self.address = address
+        self.send_lock = send_lock
+        self.connected_at = time.time()
+        self.running = {}  # 任务编号 -> 进度信息（由Coordinator.lock保护）
+        self.cancel_sent = set()
+
+    def send(self, message):
+        send_message(self.sock, self.send_lock, message)
+
+    def to_dict(self):
+        return {
+            "worker": self.worker_id,
+            "address": self.address[0],
+            "slots": self.slots,
+            "connected_at": self.connected_at,
+            "running": [dict(info, id=job_id) for job_id, info in sorted(self.running.items())],
+        }
+
+
+class ClusterServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class Coordinator:
+    """协调进程：把持久化队列中的任务分配给通过TCP连接的工作进程"""
+
+    def __init__(self, queue_, host=DEFAULT_HOST, port=DEFAULT_PORT, token=None, log=None):
+        self.queue = queue_
+        self.token = token
+        self.log = log or (lambda message: print(message, flush=True))
+        self.lock = threading.Lock()
+        self.workers = {}  # 工作进程标识 -> WorkerConnection
+        self._stop_event = threading.Event()
+
+        coordinator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                coordinator.handle_connection(self.request, self.client_address)
+
+        self.server = ClusterServer((host, port), Handler)
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def serve_forever(self):
+        """处理连接直到shutdown被调用"""
+        # 上次运行时分配出去、心跳已经超时的任务重新排队
+        self.queue.requeue_stale()
+        threading.Thread(target=self._monitor, daemon=True, name="cluster-monitor").start()
+        self.server.serve_forever()
+
+    def start(self):
+        """在后台线程中运行"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True, name="cluster-coordinator")
+        thread.start()
+        return thread
+
+    def shutdown(self):
+        self._stop_event.set()
+        self.server.shutdown()
+        self.server.server_close()
+        with self.lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            try:
+                worker.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def handle_connection(self, sock, address):
+        """一个连接的处理线程：先握手，之后逐条处理工作进程的消息"""
+        sock.settimeout(WORKER_TIMEOUT)
+        reader = sock.makefile("rb")
+        send_lock = threading.Lock()
+        worker = None
+        reason = "连接关闭"
+        try:
+            hello = read_message(reader)
+            if hello is None:
+                return
+            if not check_token(self.token, hello):
+                send_message(sock, send_lock, {"type": "error", "message": "密钥不正确"})
+                return
+            if hello.get("type") == "status":
+                send_message(sock, send_lock, self.status())
+                return
+            if hello.get("type") != "hello" or not hello.get("worker"):
+                send_message(sock, send_lock, {"type": "error", "message": "需要先发送hello"})
+                return
+
+            worker_id = str(hello["worker"])
+            with self.lock:
+                if worker_id in self.workers:
+                    send_message(sock, send_lock, {"type": "error", "message": f"工作进程 {worker_id} 已经连接"})
+                    return
+                worker = WorkerConnection(worker_id, sock, int(hello.get("slots") or 1), address, send_lock)
+                self.workers[worker_id] = worker
+            # 工作进程断开时已经终止了所有转换，重新连接（如协调进程重启后）时它名下的运行中任务立即重新排队
+            count = self.queue.requeue_worker(worker_id)
+            worker.send({"type": "welcome"})
+            self.log(f"工作进程 {worker_id} 已连接（{address[0]}，并行任务数 {worker.slots}）"
+                     + (f"，之前的 {count} 个任务重新排队" if count else ""))
+
+            while True:
+                message = read_message(reader)
+                if message is None:
+                    break
+                self.handle_message(worker, message)
+        except socket.timeout:
+            reason = f"{WORKER_TIMEOUT} 秒没有心跳"
+        except (OSError, ValueError) as e:
+            reason = str(e)
+        finally:
+            if worker is not None:
+                self.drop(worker, reason)
+            reader.close()
+            sock.close()
+
+    def handle_message(self, worker, message):
+        kind = message.get("type")
+        if kind == "ping":
+            self.queue.heartbeat(worker.worker_id)
+            worker.send({"type": "pong"})
+        elif kind == "claim":
+            entries = self.queue.claim(worker.worker_id)
+            if not entries:
+                worker.send({"type": "idle"})
+                return
+            entry = entries[0]
+            with self.lock:
+                worker.running[entry.id] = {"input_file": entry.input_file, "percent": 0.0, "fps": None, "speed": None}
+            worker.send({"type": "job", "id": entry.id, "input_file": entry.input_file,
+                         "params": entry.params, "priority": entry.priority})
+            self.log(f"[{entry.id}] 分配给 {worker.worker_id}: {entry.input_file}")
+        elif kind == "progress":
+            with self.lock:
+                info = worker.running.get(message.get("id"))
+                if info is not None:
+                    info.update(percent=message.get("percent"), fps=message.get("fps"), speed=message.get("speed"))
+        elif kind == "done":
+            job_id = message.get("id")
+            state = message.get("state")
+            with self.lock:
+                worker.running.pop(job_id, None)
+                worker.cancel_sent.discard(job_id)
+            if state == "stopped":
+                # 被取消的任务保持取消状态，其余放回队列
+                self.queue.release(job_id)
+                self.log(f"[{job_id}] {worker.worker_id}: 已停止")
+            elif state in ("done", "failed"):
+                self.queue.finish(job_id, state, message.get("return_code"))
+                self.log(f"[{job_id}] {worker.worker_id}: {job_queue.STATE_LABELS[state]}")
+
+    def drop(self, worker, reason):
+        """工作进程断开：运行中的任务重新排队"""
+        with self.lock:
+            if self.workers.get(worker.worker_id) is worker:
+                del self.workers[worker.worker_id]
+        count = self.queue.requeue_worker(worker.worker_id)
+        self.log(f"工作进程 {worker.worker_id} 已断开（{reason}）" + (f"，{count} 个任务重新排队" if count else ""))
+
+    def _monitor(self):
+        """定期处理心跳超时的任务，并通知工作进程终止被取消的任务"""
+        while not self._stop_event.wait(PING_INTERVAL):
+            try:
+                self.queue.requeue_stale()
+                with self.lock:
+                    workers = list(self.workers.values())
+                for worker in workers:
+                    with self.lock:
+                        running = set(worker.running) - worker.cancel_sent
+                    cancelled = self.queue.cancelled_ids(worker.worker_id, running)
+                    with self.lock:
+                        cancelled -= worker.cancel_sent
+                        worker.cancel_sent |= cancelled
+                    if cancelled:
+                        worker.send({"type": "cancel", "ids": sorted(cancelled)})
+            except (OSError, sqlite3.Error) as e:
+                self.log(f"检查任务状态失败: {e}")
+
+    def status(self):
+        with self.lock:
+            workers = [worker.to_dict() for worker in self.workers.values()]
+        return {"type": "status", "counts": self.queue.counts(), "workers": workers}
+
+
+class Session:
+    """工作进程到协调进程的一次连接"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.replies = queue.Queue()  # 领取任务的回复（job / idle），连接关闭时放入None
+
+    def send(self, message):
+        send_message(self.sock, self.lock, message)
+
+    def close(self):
+        if not self.closed.is_set():
+            self.closed.set()
+            self.replies.put(None)
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class ClusterWorker:
+    """工作进程：连接协调进程，多个工作线程不断领取任务，每个任务由单独的ConversionRunner转换"""
+
+    def __init__(self, address, ffmpeg_path, max_workers=None, worker_id=None, token=None, prober=None,
+                 telemetry=None, path_map=None, on_event=None, log=None, supervisor=None,
+                 staging=None):
+        self.address = address
+        self.ffmpeg_path = ffmpeg_path
+        self.max_workers = max(1, max_workers or engine.default_workers())
+        self.worker_id = worker_id or job_queue.default_worker_id()
+        self.token = token
+        self.prober = prober
+        self.telemetry = telemetry
+        self.path_map = path_map or []
+        self.on_event = on_event
+        # 所有任务共用的asyncio进程监控器（process_supervisor.ProcessSupervisor），为None时使用线程读取输出
+        self.supervisor = supervisor
+        # 所有任务共用的输出暂存器（output_staging.OutputStager），为None时直接写入输出目录
+        self.staging = staging
+        self.log = log or (lambda message: print(message, flush=True))
+        self.lock = threading.Lock()
+        self.runners = {}  # 任务编号 -> 正在运行的ConversionRunner
+        self.cancelled = set()  # 协调进程要求取消的任务编号（取消消息可能在转换开始前到达）
+        self.session = None
+        self._claim_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        """连接协调进程并处理任务，断开后自动重新连接，直到被停止"""
+        while not self._stop_event.is_set():
+            try:
+                self.serve_once()
+            except (OSError, ValueError) as e:
+                if not self._stop_event.is_set():
+                    self.log(f"与协调进程 {self.address[0]}:{self.address[1]} 的连接中断: {e}")
+            self._stop_event.wait(RECONNECT_DELAY)
+
+    def stop(self):
+        """停止领取任务，并终止正在运行的转换（协调进程把这些任务放回队列）"""
+        self._stop_event.set()
+        self.stop_running()
+        session = self.session
+        if session is not None:
+            session.close()
+
+    def stop_running(self, job_ids=None):
+        """停止指定任务（None表示所有任务）的转换；还没开始的任务记下编号，开始时直接停止"""
+        with self.lock:
+            if job_ids is not None:
+                self.cancelled |= set(job_ids)
+            runners = [runner for job_id, runner in self.runners.items() if job_ids is None or job_id in job_ids]
+        for runner in runners:
+            runner.stop()
+
+    def serve_once(self):
+        """一次连接：握手后启动心跳和工作线程，读取协调进程的消息直到连接断开"""
+        sock = socket.create_connection(self.address, timeout=WORKER_TIMEOUT)
+        session = Session(sock)
+        reader = sock.makefile("rb")
+        threads = []
+        try:
+            session.send({"type": "hello", "worker": self.worker_id, "slots": self.max_workers,
+                          "token": self.token or ""})
+            reply = read_message(reader)
+            if reply is None or reply.get("type") != "welcome":
+                raise ConnectionError(reply.get("message") if reply else "协调进程关闭了连接")
+            self.session = session
+            self.log(f"工作进程 {self.worker_id} 已连接到协调进程 {self.address[0]}:{self.address[1]}"
+                     f"（并行任务数 {self.max_workers}）")
+
+            threads.append(threading.Thread(target=self._ping, args=(session,), daemon=True, name="cluster-ping"))
+            threads.extend(threading.Thread(target=self._slot, args=(session,), daemon=True,
+                                            name=f"cluster-worker-{n+1}") for n in range(self.max_workers))
+            for t in threads:
+                t.start()
+
+            while True:
+                message = read_message(reader)
+                if message is None:
+                    raise ConnectionError("协调进程关闭了连接")
+                # 读取超时（协调进程没有回复心跳）时抛出socket.timeout
+                if message.get("type") in ("job", "idle"):
+                    session.replies.put(message)
+                elif message.get("type") == "cancel":
+                    ids = set(message.get("ids") or [])
+                    self.log(f"任务 {', '.join(map(str, sorted(ids)))} 已被取消")
+                    self.stop_running(ids)
+        finally:
+            session.close()
+            # 断开后协调进程会把运行中的任务重新排队，这里不再继续转换
+            self.stop_running()
+            for t in threads:
+                t.join()
+            with self.lock:
+                self.cancelled.clear()
+            self.session = None
+            reader.close()
+            sock.close()
+
+    def _ping(self, session):
+        while not session.closed.wait(PING_INTERVAL):
+            try:
+                session.send({"type": "ping"})
+            except OSError:
+                session.close()
+
+    def _slot(self, session):
+        """工作线程：领取一个任务并转换，直到连接断开或被停止"""
+        while not session.closed.is_set() and not self._stop_event.is_set():
+            # 同一时间只有一个领取请求在等待回复，回复与请求一一对应
+            with self._claim_lock:
+                try:
+                    session.send({"type": "claim"})
+                    reply = session.replies.get(timeout=WORKER_TIMEOUT)
+                except (OSError, queue.Empty):
+                    session.close()
+                    return
+            if reply is None:
+                return
+            if reply["type"] == "idle":
+                session.closed.wait(CLAIM_RETRY)
+                continue
+            self.convert(session, reply)
+
+    def convert(self, session, message):
+        """转换一个任务，把进度和结果发回协调进程"""
+        job_id = message["id"]
+        input_file = map_path(message["input_file"], self.path_map)
+        try:
+            params = dict(message["params"])
+            params["output_dir"] = map_path(params["output_dir"], self.path_map)
+            jobs = job_queue.jobs_from_params(input_file, params)
+        except (KeyError, TypeError, ValueError) as e:
+            self.log(f"[{job_id}] 任务参数无效: {e}")
+            self._send(session, {"type": "done", "id": job_id, "state": "failed", "return_code": None})
+            return
+        for job in jobs:
+            job.queue_id = job_id
+            job.priority = message.get("priority", 0)
+
+        last_sent = [0.0]
+
+        def on_event(event):
+            if self.on_event is not None:
+                self.on_event(event)
+            if event.kind == "progress":
+                now = time.monotonic()
+                if now - last_sent[0] < PROGRESS_INTERVAL:
+                    return
+                last_sent[0] = now
+                stats = event.stats
+                self._send(session, {
+                    "type": "progress",
+                    "id": job_id,
+                    "percent": round(event.overall, 1),
+                    "fps": stats.fps if stats is not None else None,
+                    "speed": stats.speed if stats is not None else None,
+                })
+
+        runner = engine.ConversionRunner(
+            self.ffmpeg_path,
+            jobs,
+            max_workers=1,
+            on_event=on_event,
+            prober=self.prober,
+            telemetry=self.telemetry,
+            supervisor=self.supervisor,
+            staging=self.staging
+        )
+        with self.lock:
+            self.runners[job_id] = runner
+            # 登记之前已经断开、被停止或收到取消消息时不再转换（登记之后的停止由stop_running处理）
+            if session.closed.is_set() or self._stop_event.is_set() or job_id in self.cancelled:
+                runner.stop()
+        try:
+            runner.run()
+        finally:
+            with self.lock:
+                self.runners.pop(job_id, None)
+                self.cancelled.discard(job_id)
+
+        failed = [job for job in jobs if job.state == "failed"]
+        if runner.stopped:
+            state, return_code = "stopped", None
+        elif failed:
+            state, return_code = "failed", failed[0].return_code
+        else:
+            state, return_code = "done", 0
+        self._send(session, {"type": "done", "id": job_id, "state": state, "return_code": return_code})
+
+    def _send(self, session, message):
+        try:
+            session.send(message)
+        except OSError:
+            session.close()
+
+
+def request_status(address, token=None, timeout=10):
+    """查询协调进程的状态"""
+    with socket.create_connection(address, timeout=timeout) as sock:
+        send_message(sock, threading.Lock(), {"type": "status", "token": token or ""})
+        with sock.makefile("rb") as reader:
+            reply = read_message(reader)
+    if reply is None or reply.get("type") != "status":
+        raise ConnectionError(reply.get("message") if reply else "协调进程关闭了连接")
+    return reply
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="多台机器协同转换（协调进程/工作进程）")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    coordinator = commands.add_parser("coordinator", help="运行协调进程")
+    coordinator.add_argument("--queue", default=None, help=f"队列数据库路径（默认：{job_queue.default_queue_path()}）")
+    coordinator.add_argument("--host", default=DEFAULT_HOST,
+                             help="监听地址（默认只监听本机，其他机器连接时使用0.0.0.0）")
+    coordinator.add_argument("--port", type=int, default=DEFAULT_PORT, help="监听端口")
+    coordinator.add_argument("--token", default=None, help="工作进程连接时需要提供的密钥")
+
+    worker = commands.add_parser("worker", help="运行工作进程")
+    worker.add_argument("address", help="协调进程地址，如192.168.1.10:8770")
+    worker.add_argument("-j", "--jobs", type=int, default=engine.default_workers(), help="并行任务数")
+    worker.add_argument("--token", default=None, help="协调进程的密钥")
+    worker.add_argument("--worker-id", default=None, help="工作进程标识（默认：主机名-进程号）")
+    worker.add_argument("--map-path", action="append", default=[],
+                        help="路径换算，如/mnt/nfs=/data（共享存储在本机的挂载路径不同时使用，可以指定多次）")
+    worker.add_argument("--ffmpeg", default=None, help="FFmpeg可执行文件路径")
+    worker.add_argument("--no-probe", action="store_true", help="转换前不使用ffprobe分析媒体信息")
+    worker.add_argument("--scratch-dir", default=None, help="暂存目录（如本机SSD），输出先写到这里再发布到输出目录")
+    worker.add_argument("--scratch-limit", default=None, help="暂存空间上限，如20G")
+    worker.add_argument("--idle-timeout", type=float, default=process_supervisor.DEFAULT_IDLE_TIMEOUT,
+                        help=f"FFmpeg进程超过这一时间（秒）没有任何输出时终止，0表示不限制"
+                             f"（默认：{process_supervisor.DEFAULT_IDLE_TIMEOUT}）")
+
+    status = commands.add_parser("status", help="查看协调进程状态")
+    status.add_argument("address", help="协调进程地址")
+    status.add_argument("--token", default=None, help="协调进程的密钥")
+    return parser
+
+
+def main(argv=None):
+    """命令行入口，返回进程退出码"""
+    args = build_parser().parse_args(argv)
+
+    if args.command == "coordinator":
+        coordinator = Coordinator(job_queue.JobQueue(args.queue), args.host, args.port, args.token)
+        host, port = coordinator.address
+        print(f"协调进程已启动: {host}:{port}，队列 {coordinator.queue.path}", flush=True)
+        try:
+            coordinator.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    try:
+        address = parse_address(args.address)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
+    if args.command == "status":
+        try:
+            status = request_status(address, args.token)
+        except (OSError, ValueError) as e:
+            print(f"无法查询协调进程状态: {e}", file=sys.stderr)
+            return 1
+        counts = status["counts"]
+        print("  ".join(f"{job_queue.STATE_LABELS[state]} {counts.get(state, 0)}" for state in job_queue.STATES))
+        for worker in status["workers"]:
+            print(f"{worker['worker']}（{worker['address']}，并行任务数 {worker['slots']}）")
+            for info in worker["running"]:
+                speed = f"，{info['speed']:.2f}x" if info.get("speed") is not None else ""
+                print(f"  [{info['id']}] {info['percent'] or 0:.1f}%{speed}  {info['input_file']}")
+        return 0
+
+    # worker
+    try:
+        path_map = parse_path_map(args.map_path)
+        staging = output_staging.create_stager(args.scratch_dir, args.scratch_limit)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    ffmpeg_path = args.ffmpeg or encoder_probe.locate_ffmpeg()[0]
+    if not ffmpeg_path:
+        print("未找到FFmpeg，请确保已安装FFmpeg并添加到系统PATH，或使用--ffmpeg指定路径", file=sys.stderr)
+        return 2
+    prober = None
+    if not args.no_probe:
+        ffprobe_path = media_probe.find_ffprobe(ffmpeg_path)
+        if ffprobe_path:
+            prober = media_probe.MediaProber(ffprobe_path, media_probe.ProbeCache())
+
+    def report(event):
+        if event.kind == "job_done":
+            status = "完成" if event.success else f"失败（返回码 {event.return_code}）"
+            print(f"[{event.job.queue_id}] {status}: {event.job.input_file}", flush=True)
+        elif event.kind == "job_start":
+            print(f"[{event.job.queue_id}] 开始: {event.job.input_file}", flush=True)
+
+    worker = ClusterWorker(address, ffmpeg_path, args.jobs, args.worker_id, args.token, prober=prober,
+                           telemetry=job_telemetry.TelemetryWriter(), path_map=path_map, on_event=report,
+                           supervisor=process_supervisor.ProcessSupervisor(args.idle_timeout or None),
+                           staging=staging)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
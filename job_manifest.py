@@ -0,0 +1,191 @@
+"""转换任务清单
+
+把每个任务的输入文件标识（路径、大小、修改时间）、编码参数、输出文件和最终状态保存到磁盘。
+程序崩溃或关闭后重新转换同一批文件时，已经成功完成且参数相同的任务会被跳过。
+
+清单是只追加的日志（JSON Lines，每次状态变化追加一行），同一输出文件以最后一行为准；
+读取时过期的行较多就重写为每个输出文件一行。旧版整文件JSON格式的清单在第一次读取时自动转换。
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+import media_probe
+
+
+# 清单文件名（默认保存在输出目录中）
+MANIFEST_NAME = ".video_converter_manifest.jsonl"
+
+# 旧版清单文件名（整个文件为一个JSON对象）
+LEGACY_MANIFEST_NAME = ".video_converter_manifest.json"
+
+# 旧版清单文件格式版本
+MANIFEST_VERSION = 1
+
+# 过期的行数超过有效记录数和这一数值时，读取后重写清单
+COMPACT_MIN_LINES = 1000
+
+
+def default_manifest_path(output_dir):
+    """输出目录中的默认清单文件路径"""
+    return os.path.join(output_dir, MANIFEST_NAME)
+
+
+def job_params(job):
+    """影响输出结果的编码参数"""
+    params = {
+        "output_format": job.output_format,
+        "resolution": job.resolution,
+        "bitrate": job.bitrate,
+        "video_codec": job.video_codec,
+        "audio_codec": job.audio_codec,
+        "quality_params": job.quality_params,
+        "copy_video": job.copy_video,
+        "copy_audio": job.copy_audio,
+    }
+    if job.extra_outputs:
+        # 多格式tee输出时同时写入的其他格式
+        params["extra_formats"] = [output_format for output_format, _ in job.extra_outputs]
+    return params
+
+
+def legacy_manifest_path(path):
+    """同一目录中旧版清单文件的路径"""
+    return os.path.join(os.path.dirname(path), LEGACY_MANIFEST_NAME)
+
+
+class JobManifest:
+    """任务清单，按输出文件的绝对路径记录每个任务
+
+    resume为False时仍然记录本次结果，但不跳过任何任务（清单中其他批次的记录保留）。
+    写入失败时调用log(消息)，没有log时输出到stderr。
+    """
+
+    def __init__(self, path, resume=True, log=None):
+        self.path = path
+        self.resume = resume
+        self.log = log
+        self.lock = threading.Lock()
+        # 保证多个工作线程追加的行不会交错
+        self.save_lock = threading.Lock()
+        self.entries = {}
+        self.load()
+
+    def report(self, message):
+        if self.log is not None:
+            self.log(message)
+        else:
+            print(message, file=sys.stderr)
+
+    def load(self):
+        """从磁盘读取清单，文件不存在时使用空清单，无法解析的行（如崩溃时写了一半）跳过"""
+        self.entries = {}
+        lines = 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(entry, dict) and entry.get("output"):
+                        self.entries[entry["output"]] = entry
+                        lines += 1
+        except OSError:
+            if not self.load_legacy():
+                return
+            lines = None
+        if lines is None or lines - len(self.entries) > len(self.entries) + COMPACT_MIN_LINES:
+            try:
+                self.save()
+            except OSError as e:
+                self.report(f"保存任务清单失败: {e}")
+
+    def load_legacy(self):
+        """读取旧版整文件JSON格式的清单，返回是否读到"""
+        try:
+            with open(legacy_manifest_path(self.path), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+            return False
+        self.entries = dict(data.get("jobs", {}))
+        return True
+
+    def save(self):
+        """把所有记录重写为每个输出文件一行（先写临时文件再替换，避免崩溃时损坏清单）"""
+        with self.save_lock:
+            with self.lock:
+                entries = list(self.entries.values())
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+
+    def append(self, entry):
+        """在清单末尾追加一条记录"""
+        with self.save_lock:
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def get(self, job):
+        """返回任务在清单中的记录，没有记录时返回None"""
+        with self.lock:
+            return self.entries.get(os.path.abspath(job.output_file))
+
+    def is_complete(self, job):
+        """任务是否已经成功完成：输入文件未变化、参数相同，并且输出文件完整存在"""
+        if not self.resume:
+            return False
+        entry = self.get(job)
+        if not entry or entry.get("state") != "done":
+            return False
+
+        identity = media_probe.file_identity(job.input_file)
+        if identity is None or list(identity) != entry.get("input"):
+            return False
+        if entry.get("params") != job_params(job):
+            return False
+
+        try:
+            output_size = os.path.getsize(job.output_file)
+            # 多格式或多分辨率输出时其他输出文件也必须存在
+            if not all(os.path.getsize(path) > 0 for path in job.output_files()[1:]):
+                return False
+        except OSError:
+            return False
+        return output_size > 0 and output_size == entry.get("output_size")
+
+    def mark(self, job, state):
+        """记录任务状态，立即追加到清单文件"""
+        identity = media_probe.file_identity(job.input_file)
+        output_size = None
+        if state == "done":
+            try:
+                output_size = os.path.getsize(job.output_file)
+            except OSError:
+                output_size = None
+
+        entry = {
+            "input": list(identity) if identity else [os.path.abspath(job.input_file), None, None],
+            "params": job_params(job),
+            "output": os.path.abspath(job.output_file),
+            "output_size": output_size,
+            "state": state,
+            "return_code": job.return_code,
+            "updated_at": time.time(),
+        }
+        with self.lock:
+            self.entries[entry["output"]] = entry
+        try:
+            self.append(entry)
+        except OSError as e:
+            self.report(f"保存任务清单失败: {e}")
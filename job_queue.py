@@ -0,0 +1,705 @@
+"""持久化优先级任务队列
+
+任务保存在SQLite数据库中（默认在缓存目录下），程序关闭后不会丢失。每个任务有优先级、状态
+（queued / running / done / failed / cancelled）、尝试次数和时间戳。工作进程在事务中领取任务，
+同一台机器上的多个工作进程（以及图形界面）可以安全地同时处理同一个队列。
+工作进程定期更新心跳，心跳超时（进程崩溃）的任务会重新排队。
+
+    python job_queue.py add 输入文件或目录... -o output -f mp4 --priority 5
+    python job_queue.py list
+    python job_queue.py cancel 3 4
+    python job_queue.py purge
+    python job_queue.py work -j 2
+"""
+import argparse
+import contextlib
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+import convert_engine as engine
+import encoder_probe
+import folder_scan
+import job_telemetry
+import media_probe
+import output_staging
+import process_supervisor
+
+
+# 任务状态
+STATES = ["queued", "running", "done", "failed", "cancelled"]
+
+# 已结束的任务状态
+FINISHED_STATES = ["done", "failed", "cancelled"]
+
+# 状态的显示名称
+STATE_LABELS = {
+    "queued": "排队中",
+    "running": "转换中",
+    "done": "已完成",
+    "failed": "失败",
+    "cancelled": "已取消",
+}
+
+# 默认最多尝试次数
+DEFAULT_MAX_ATTEMPTS = 3
+
+# 心跳间隔和超时（秒）：超过超时时间没有心跳的running任务视为工作进程已退出
+HEARTBEAT_INTERVAL = 10
+STALE_TIMEOUT = 60
+
+# 图形界面每次领取的任务数：一批转换完后再领取下一批，其他工作进程可以同时领取剩下的任务
+CLAIM_BATCH = 200
+
+# 图形界面列表最多显示的运行中和排队任务数、已结束任务数（队列中有几十万个任务时只读取这些行）
+ACTIVE_WINDOW = 1000
+FINISHED_WINDOW = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'queued',
+    input_file TEXT NOT NULL,
+    params TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    worker TEXT,
+    return_code INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (state, priority DESC, id);
+CREATE INDEX IF NOT EXISTS jobs_state_id ON jobs (state, id);
+CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated_at);
+CREATE TABLE IF NOT EXISTS ingested (
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    job_id INTEGER,
+    ingested_at REAL NOT NULL,
+    PRIMARY KEY (path, size, mtime_ns)
+);
+"""
+
+
+def default_queue_path():
+    """默认的队列数据库路径"""
+    return os.path.join(engine.default_cache_dir(), "job_queue.db")
+
+
+def default_worker_id():
+    """工作进程标识：主机名-进程号"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def job_params(output_dir, output_format, resolution="", bitrate="", video_codec=engine.DEFAULT_VIDEO_CODEC,
+               quality_params=engine.DEFAULT_QUALITY_PARAMS):
+    """任务的转换参数，output_format可以是用逗号分隔的多个格式（如"mp4,mkv"）"""
+    return {
+        "output_dir": output_dir,
+        "output_format": output_format.lower(),
+        "resolution": resolution,
+        "bitrate": bitrate,
+        "video_codec": video_codec,
+        "quality_params": quality_params,
+    }
+
+
+def jobs_from_params(input_file, params, index=0):
+    """根据转换参数创建ConversionJob列表（输出多个格式时每个格式组一个），编号从index开始，参数无效时抛出KeyError或ValueError"""
+    jobs = engine.create_multi_format_jobs(
+        [input_file],
+        params["output_dir"],
+        engine.parse_formats(params["output_format"]),
+        resolution=params.get("resolution", ""),
+        bitrate=params.get("bitrate", ""),
+        video_codec=params.get("video_codec", engine.DEFAULT_VIDEO_CODEC),
+        quality_params=params.get("quality_params", engine.DEFAULT_QUALITY_PARAMS)
+    )
+    for offset, job in enumerate(jobs):
+        job.index = index + offset
+    return jobs
+
+
+class QueueEntry:
+    """队列中的一行"""
+
+    COLUMNS = ["id", "priority", "state", "input_file", "params", "attempts", "max_attempts", "worker",
+               "return_code", "created_at", "updated_at", "started_at", "finished_at", "heartbeat_at"]
+
+    def __init__(self, row):
+        for name, value in zip(self.COLUMNS, row):
+            setattr(self, name, value)
+        # params为None表示使用开始转换时界面上的设置
+        self.params = json.loads(self.params) if self.params else None
+
+    @property
+    def state_label(self):
+        return STATE_LABELS.get(self.state, self.state)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.COLUMNS}
+
+    def __repr__(self):
+        return f"QueueEntry({self.id}, {self.state}, priority={self.priority}, {self.input_file!r})"
+
+
+class JobQueue:
+    """SQLite任务队列，每个线程使用自己的数据库连接"""
+
+    def __init__(self, path=None):
+        self.path = path or default_queue_path()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self.connection().executescript(SCHEMA)
+        # 输出多个格式时一个队列任务对应多个ConversionJob：任务编号 -> 这些ConversionJob
+        self.lock = threading.Lock()
+        self.groups = {}
+
+    def connection(self):
+        """当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None：自己控制事务，领取任务时使用BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """写事务：开始时即获取写锁，避免多个进程同时领取同一个任务"""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def add(self, input_file, params=None, priority=0, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """添加一个任务，返回任务编号"""
+        return self.add_many([input_file], params, priority, max_attempts)[0]
+
+    def add_many(self, input_files, params=None, priority=0, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """添加多个任务（同一事务），返回任务编号列表"""
+        now = time.time()
+        params_json = json.dumps(params, ensure_ascii=False) if params is not None else None
+        ids = []
+        with self.transaction() as conn:
+            for input_file in input_files:
+                cursor = conn.execute(
+                    "INSERT INTO jobs (priority, state, input_file, params, max_attempts, created_at, updated_at) "
+                    "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                    (priority, os.path.abspath(input_file), params_json, max_attempts, now, now)
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def add_once(self, input_file, size, mtime_ns, params=None, priority=0, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """添加监视文件夹中发现的文件：路径、大小和修改时间都相同的文件只添加一次
+
+        返回任务编号，已经添加过时返回None。记录和任务在同一事务中写入，多个监视进程同时发现同一文件时也只添加一次。
+        """
+        now = time.time()
+        input_file = os.path.abspath(input_file)
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO ingested (path, size, mtime_ns, ingested_at) VALUES (?, ?, ?, ?)",
+                (input_file, size, mtime_ns, now)
+            )
+            if cursor.rowcount == 0:
+                return None
+            cursor = conn.execute(
+                "INSERT INTO jobs (priority, state, input_file, params, max_attempts, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (priority, input_file, json.dumps(params, ensure_ascii=False) if params is not None else None,
+                 max_attempts, now, now)
+            )
+            job_id = cursor.lastrowid
+            conn.execute("UPDATE ingested SET job_id = ? WHERE path = ? AND size = ? AND mtime_ns = ?",
+                         (job_id, input_file, size, mtime_ns))
+        return job_id
+
+    def ingested_files(self):
+        """已经添加过的监视文件：路径 -> (大小, 修改时间)，同一路径有多个版本时为最后添加的版本"""
+        rows = self.connection().execute("SELECT path, size, mtime_ns FROM ingested ORDER BY ingested_at")
+        return {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+    def fill_params(self, params):
+        """为没有设置参数的排队任务填入参数，返回更新的任务数"""
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET params = ?, updated_at = ? WHERE state = 'queued' AND params IS NULL",
+                (json.dumps(params, ensure_ascii=False), time.time())
+            )
+            return cursor.rowcount
+
+    def claim(self, worker, limit=1):
+        """领取最多limit个优先级最高的排队任务（优先级相同时先进先出），返回QueueEntry列表
+
+        一次领取的任务用一条UPDATE更新；每次领取是一个短事务，多个工作进程可以交替领取。
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            ids = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE state = 'queued' AND params IS NOT NULL "
+                "ORDER BY priority DESC, id LIMIT ?", (limit,))]
+            if ids:
+                conn.execute(
+                    f"UPDATE jobs SET state = 'running', attempts = attempts + 1, worker = ?, return_code = NULL, "
+                    f"started_at = ?, finished_at = NULL, heartbeat_at = ?, updated_at = ? "
+                    f"WHERE id IN ({','.join('?' * len(ids))})",
+                    (worker, now, now, now, *ids)
+                )
+            return self._select(conn, ids)
+
+    def _select(self, conn, ids):
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        rows = conn.execute(f"SELECT {', '.join(QueueEntry.COLUMNS)} FROM jobs WHERE id IN ({placeholders}) "
+                            f"ORDER BY priority DESC, id", ids)
+        return [QueueEntry(row) for row in rows]
+
+    def get(self, job_id):
+        entries = self._select(self.connection(), [job_id])
+        return entries[0] if entries else None
+
+    def list(self, states=None):
+        """列出任务：排队和运行中的在前（按领取顺序），其余按编号倒序"""
+        sql = f"SELECT {', '.join(QueueEntry.COLUMNS)} FROM jobs"
+        args = []
+        if states:
+            sql += f" WHERE state IN ({','.join('?' * len(states))})"
+            args = list(states)
+        sql += (" ORDER BY CASE state WHEN 'running' THEN 0 WHEN 'queued' THEN 1 ELSE 2 END, "
+                "CASE WHEN state IN ('running', 'queued') THEN -priority ELSE 0 END, "
+                "CASE WHEN state IN ('running', 'queued') THEN id ELSE -id END")
+        return [QueueEntry(row) for row in self.connection().execute(sql, args)]
+
+    def window(self, active_limit=ACTIVE_WINDOW, finished_limit=FINISHED_WINDOW):
+        """列出一部分任务（顺序与list()相同）：运行中和排队的任务按领取顺序最多active_limit个，
+        已结束的任务按编号倒序最多finished_limit个；每个状态单独按索引读取，不扫描整个表"""
+        conn = self.connection()
+        columns = ", ".join(QueueEntry.COLUMNS)
+        entries = []
+        for state in ("running", "queued"):
+            remaining = active_limit - len(entries)
+            if remaining <= 0:
+                break
+            rows = conn.execute(f"SELECT {columns} FROM jobs WHERE state = ? ORDER BY priority DESC, id LIMIT ?",
+                                (state, remaining))
+            entries.extend(QueueEntry(row) for row in rows)
+        finished = []
+        for state in FINISHED_STATES:
+            rows = conn.execute(f"SELECT {columns} FROM jobs WHERE state = ? ORDER BY id DESC LIMIT ?",
+                                (state, finished_limit))
+            finished.extend(QueueEntry(row) for row in rows)
+        finished.sort(key=lambda entry: -entry.id)
+        return entries + finished[:finished_limit]
+
+    def version(self):
+        """队列的变化标识(任务数, 最后修改时间)，添加、删除任务和任务状态变化后都会改变（心跳不会）"""
+        return tuple(self.connection().execute("SELECT COUNT(*), MAX(updated_at) FROM jobs").fetchone())
+
+    def counts(self):
+        """各状态的任务数"""
+        counts = dict.fromkeys(STATES, 0)
+        for state, count in self.connection().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"):
+            counts[state] = count
+        return counts
+
+    def finish(self, job_id, state, return_code=None, retry=True):
+        """记录运行结果：失败且还有尝试次数时重新排队（retry为False时不重试，如参数无效）；
+        任务在运行中被取消时保持取消状态"""
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute("SELECT state, attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row[0] != "running":
+                return
+            _, attempts, max_attempts = row
+            if state == "failed" and retry and attempts < max_attempts:
+                state = "queued"
+            finished_at = now if state in ("done", "failed") else None
+            conn.execute(
+                "UPDATE jobs SET state = ?, return_code = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+                (state, return_code, finished_at, now, job_id)
+            )
+
+    def release(self, job_id):
+        """把被停止的任务放回队列，这次不计入尝试次数"""
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = 'queued', attempts = MAX(attempts - 1, 0), updated_at = ? "
+                "WHERE id = ? AND state = 'running'",
+                (time.time(), job_id)
+            )
+
+    def mark(self, job, state):
+        """记录执行器中任务的状态变化（ConversionRunner.set_state调用）
+
+        一个队列任务对应多个ConversionJob时，全部结束后才记录结果，其中有失败的记为失败。
+        被停止的任务放回队列，被取消的任务保持取消状态；两种情况都不再等待同组的其他ConversionJob。
+        """
+        if job.queue_id is None:
+            return
+        if state in ("stopped", "cancelled"):
+            with self.lock:
+                self.groups.pop(job.queue_id, None)
+            if state == "stopped":
+                self.release(job.queue_id)
+            return
+        if state not in ("done", "skipped", "failed"):
+            return
+        with self.lock:
+            jobs = self.groups.get(job.queue_id, [job])
+            if any(j.state in ("pending", "running") for j in jobs):
+                return
+            self.groups.pop(job.queue_id, None)
+        failed = [j for j in jobs if j.state == "failed"]
+        if failed:
+            self.finish(job.queue_id, "failed", failed[0].return_code)
+        else:
+            self.finish(job.queue_id, "done", job.return_code)
+
+    def cancel(self, job_ids):
+        """取消排队或运行中的任务，返回取消的任务数（运行中的任务由其工作进程终止）"""
+        if not job_ids:
+            return 0
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET state = 'cancelled', finished_at = ?, updated_at = ? "
+                f"WHERE state IN ('queued', 'running') AND id IN ({','.join('?' * len(job_ids))})",
+                (now, now, *job_ids)
+            )
+            return cursor.rowcount
+
+    def retry(self, job_ids):
+        """把失败或取消的任务重新排队（尝试次数清零），返回重新排队的任务数"""
+        if not job_ids:
+            return 0
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET state = 'queued', attempts = 0, finished_at = NULL, updated_at = ? "
+                f"WHERE state IN ('failed', 'cancelled') AND id IN ({','.join('?' * len(job_ids))})",
+                (time.time(), *job_ids)
+            )
+            return cursor.rowcount
+
+    def remove(self, job_ids):
+        """删除不在运行中的任务，返回删除的任务数"""
+        if not job_ids:
+            return 0
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM jobs WHERE state != 'running' AND id IN ({','.join('?' * len(job_ids))})",
+                list(job_ids)
+            )
+            return cursor.rowcount
+
+    def purge(self, states=FINISHED_STATES):
+        """删除指定状态（默认为已结束）的所有任务，运行中的任务不会被删除，返回删除的任务数"""
+        states = [state for state in states if state != "running"]
+        if not states:
+            return 0
+        with self.transaction() as conn:
+            cursor = conn.execute(f"DELETE FROM jobs WHERE state IN ({','.join('?' * len(states))})", states)
+            return cursor.rowcount
+
+    def cancelled_ids(self, worker, job_ids):
+        """job_ids（该工作进程正在处理的任务）中已被取消的任务编号，只按主键查询这些任务"""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return set()
+        rows = self.connection().execute(
+            f"SELECT id FROM jobs WHERE worker = ? AND state = 'cancelled' AND id IN ({','.join('?' * len(job_ids))})",
+            (worker, *job_ids))
+        return {row[0] for row in rows}
+
+    def heartbeat(self, worker):
+        """更新该工作进程所有运行中任务的心跳时间"""
+        with self.transaction() as conn:
+            conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE worker = ? AND state = 'running'",
+                         (time.time(), worker))
+
+    def requeue_stale(self, timeout=STALE_TIMEOUT):
+        """心跳超时的运行中任务重新排队（超过尝试次数的标记为失败），返回处理的任务数"""
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+                "updated_at = ? WHERE state = 'running' AND heartbeat_at < ?",
+                (now, now - timeout)
+            )
+            return cursor.rowcount
+
+    def requeue_worker(self, worker):
+        """工作进程断开连接：它的运行中任务重新排队（超过尝试次数的标记为失败），返回处理的任务数"""
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+                "updated_at = ? WHERE state = 'running' AND worker = ?",
+                (time.time(), worker)
+            )
+            return cursor.rowcount
+
+    def start_heartbeat(self, worker, interval=HEARTBEAT_INTERVAL, on_cancelled=None, held_ids=None):
+        """启动后台心跳线程；held_ids()返回正在处理的任务编号，其中有任务被取消时调用on_cancelled(ids)"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.heartbeat(worker)
+                    if on_cancelled is not None and held_ids is not None:
+                        cancelled = self.cancelled_ids(worker, held_ids())
+                        if cancelled:
+                            on_cancelled(cancelled)
+                except sqlite3.Error as e:
+                    print(f"更新任务队列心跳失败: {e}", file=sys.stderr)
+
+        thread = threading.Thread(target=loop, daemon=True, name="queue-heartbeat")
+        thread.start()
+        return thread
+
+    def claim_jobs(self, worker, index=0, limit=CLAIM_BATCH):
+        """领取最多limit个任务并创建ConversionJob列表（编号从index开始），参数无效的任务直接记为失败"""
+        jobs = []
+        for entry in self.claim(worker, limit):
+            try:
+                jobs.extend(self.to_jobs(entry, index + len(jobs)))
+            except (KeyError, ValueError):
+                self.finish(entry.id, "failed", retry=False)
+        return jobs
+
+    def to_jobs(self, entry, index=0):
+        """根据队列中的任务创建ConversionJob列表（输出多个格式时每个格式组一个），编号从index开始"""
+        jobs = jobs_from_params(entry.input_file, entry.params, index)
+        for job in jobs:
+            job.queue_id = entry.id
+            job.priority = entry.priority
+        if len(jobs) > 1:
+            with self.lock:
+                self.groups[entry.id] = jobs
+        return jobs
+
+
+class QueueWorker:
+    """队列工作进程：多个工作线程不断领取任务，每个任务由单独的ConversionRunner转换"""
+
+    def __init__(self, job_queue, ffmpeg_path, max_workers=None, worker_id=None, prober=None, telemetry=None,
+                 poll_interval=2.0, exit_when_empty=False, on_event=None, supervisor=None,
+                 staging=None):
+        self.queue = job_queue
+        self.ffmpeg_path = ffmpeg_path
+        self.max_workers = max(1, max_workers or engine.default_workers())
+        self.worker_id = worker_id or default_worker_id()
+        self.prober = prober
+        self.telemetry = telemetry
+        self.poll_interval = poll_interval
+        self.exit_when_empty = exit_when_empty
+        self.on_event = on_event
+        # 所有任务共用的asyncio进程监控器（process_supervisor.ProcessSupervisor），为None时使用线程读取输出
+        self.supervisor = supervisor
+        # 所有任务共用的输出暂存器（output_staging.OutputStager），为None时直接写入输出目录
+        self.staging = staging
+        self.lock = threading.Lock()
+        self.runners = {}  # 任务编号 -> 正在运行的ConversionRunner
+        self._stop_event = threading.Event()
+
+    def run(self):
+        """处理队列直到被停止（exit_when_empty为True时队列为空即退出）"""
+        self.queue.requeue_stale()
+        self.queue.start_heartbeat(self.worker_id, on_cancelled=self.cancel_running, held_ids=self.held_ids)
+        threads = [threading.Thread(target=self._worker, daemon=True, name=f"queue-worker-{n+1}")
+                   for n in range(self.max_workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            while t.is_alive():
+                t.join(timeout=0.5)
+
+    def stop(self):
+        """停止领取任务，并终止正在运行的转换（被停止的任务放回队列）"""
+        self._stop_event.set()
+        with self.lock:
+            runners = list(self.runners.values())
+        for runner in runners:
+            runner.stop()
+
+    def held_ids(self):
+        """正在转换的任务编号"""
+        with self.lock:
+            return list(self.runners)
+
+    def cancel_running(self, job_ids):
+        """终止在其他进程中被取消的任务"""
+        with self.lock:
+            runners = [runner for job_id, runner in self.runners.items() if job_id in job_ids]
+        for runner in runners:
+            runner.stop()
+
+    def _worker(self):
+        while not self._stop_event.is_set():
+            entries = self.queue.claim(self.worker_id)
+            if not entries:
+                if self.exit_when_empty:
+                    return
+                self._stop_event.wait(self.poll_interval)
+                continue
+            entry = entries[0]
+            try:
+                jobs = self.queue.to_jobs(entry)
+            except (KeyError, ValueError) as e:
+                print(f"[{entry.id}] 任务参数无效: {e}", file=sys.stderr)
+                self.queue.finish(entry.id, "failed", retry=False)
+                continue
+            runner = engine.ConversionRunner(
+                self.ffmpeg_path,
+                jobs,
+                max_workers=1,
+                on_event=self.on_event,
+                prober=self.prober,
+                telemetry=self.telemetry,
+                job_queue=self.queue,
+                supervisor=self.supervisor,
+                staging=self.staging
+            )
+            with self.lock:
+                self.runners[entry.id] = runner
+            try:
+                runner.run()
+            finally:
+                with self.lock:
+                    self.runners.pop(entry.id, None)
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="持久化视频转换任务队列")
+    parser.add_argument("--queue", default=None, help=f"队列数据库路径（默认：{default_queue_path()}）")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="添加任务")
+    add.add_argument("inputs", nargs="+", help="输入视频文件或目录")
+    add.add_argument("-o", "--output-dir", default=os.path.join(os.getcwd(), "output"), help="输出目录")
+    add.add_argument("-f", "--format", default="mp4", help="输出格式，多个格式用逗号分隔，如mp4,mkv")
+    add.add_argument("-r", "--resolution", default="", help="输出分辨率，如1920x1080（默认：原始分辨率）")
+    add.add_argument("-b", "--bitrate", default="", help="视频码率，如10M（默认：自动）")
+    add.add_argument("-e", "--encoder", default=engine.DEFAULT_VIDEO_CODEC, help="视频编码器")
+    add.add_argument("-p", "--priority", type=int, default=0, help="优先级，数值大的先转换（默认：0）")
+    add.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help="失败后最多尝试次数")
+
+    listing = commands.add_parser("list", help="列出任务")
+    listing.add_argument("--state", nargs="+", choices=STATES, help="只列出这些状态的任务")
+
+    for name, help_text in (("cancel", "取消任务"), ("retry", "重新排队失败或取消的任务"), ("remove", "删除任务")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("ids", nargs="+", type=int, help="任务编号")
+
+    purge = commands.add_parser("purge", help="删除已结束的任务")
+    purge.add_argument("--state", nargs="+", choices=[state for state in STATES if state != "running"],
+                       default=FINISHED_STATES, help="删除这些状态的任务（默认：已完成、失败和已取消）")
+
+    work = commands.add_parser("work", help="处理队列中的任务")
+    work.add_argument("-j", "--jobs", type=int, default=engine.default_workers(), help="并行任务数")
+    work.add_argument("--ffmpeg", default=None, help="FFmpeg可执行文件路径")
+    work.add_argument("--no-probe", action="store_true", help="转换前不使用ffprobe分析媒体信息")
+    work.add_argument("--exit-when-empty", action="store_true", help="队列为空时退出")
+    work.add_argument("--scratch-dir", default=None, help="暂存目录（如本机SSD），输出先写到这里再发布到输出目录")
+    work.add_argument("--scratch-limit", default=None, help="暂存空间上限，如20G")
+    work.add_argument("--idle-timeout", type=float, default=process_supervisor.DEFAULT_IDLE_TIMEOUT,
+                      help=f"FFmpeg进程超过这一时间（秒）没有任何输出时终止，0表示不限制"
+                           f"（默认：{process_supervisor.DEFAULT_IDLE_TIMEOUT}）")
+    return parser
+
+
+def main(argv=None):
+    """命令行入口，返回进程退出码"""
+    args = build_parser().parse_args(argv)
+    job_queue = JobQueue(args.queue)
+
+    if args.command == "add":
+        # 与命令行版本相同的输入收集方式：文件直接加入，目录并行递归查找视频文件
+        file_paths = folder_scan.scan_paths(args.inputs)
+        if not file_paths:
+            print("未找到待转换文件", file=sys.stderr)
+            return 2
+        try:
+            output_formats = engine.parse_formats(args.format)
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            return 2
+        params = job_params(os.path.abspath(args.output_dir), ",".join(output_formats),
+                            engine.parse_resolution(args.resolution),
+                            engine.parse_bitrate(args.bitrate), args.encoder)
+        ids = job_queue.add_many(file_paths, params, args.priority, args.max_attempts)
+        print(f"已添加 {len(ids)} 个任务（编号 {ids[0]}-{ids[-1]}）")
+        return 0
+
+    if args.command == "list":
+        for entry in job_queue.list(args.state):
+            print(f"{entry.id:>6}  {entry.state_label:<4}  优先级 {entry.priority:<3}  "
+                  f"尝试 {entry.attempts}/{entry.max_attempts}  {entry.input_file}")
+        counts = job_queue.counts()
+        print("  ".join(f"{STATE_LABELS[state]} {counts[state]}" for state in STATES))
+        return 0
+
+    if args.command == "purge":
+        print(f"已删除 {job_queue.purge(args.state)} 个任务")
+        return 0
+
+    if args.command in ("cancel", "retry", "remove"):
+        count = getattr(job_queue, args.command)(args.ids)
+        print(f"已处理 {count} 个任务")
+        return 0
+
+    # work
+    try:
+        staging = output_staging.create_stager(args.scratch_dir, args.scratch_limit)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    ffmpeg_path = args.ffmpeg or encoder_probe.locate_ffmpeg()[0]
+    if not ffmpeg_path:
+        print("未找到FFmpeg，请确保已安装FFmpeg并添加到系统PATH，或使用--ffmpeg指定路径", file=sys.stderr)
+        return 2
+    prober = None
+    if not args.no_probe:
+        ffprobe_path = media_probe.find_ffprobe(ffmpeg_path)
+        if ffprobe_path:
+            prober = media_probe.MediaProber(ffprobe_path, media_probe.ProbeCache())
+
+    def report(event):
+        if event.kind == "job_done":
+            status = "完成" if event.success else f"失败（返回码 {event.return_code}）"
+            print(f"[{event.job.queue_id}] {status}: {event.job.input_file}", flush=True)
+        elif event.kind == "job_start":
+            print(f"[{event.job.queue_id}] 开始: {event.job.input_file}", flush=True)
+
+    worker = QueueWorker(job_queue, ffmpeg_path, args.jobs, prober=prober, telemetry=job_telemetry.TelemetryWriter(),
+                         exit_when_empty=args.exit_when_empty, on_event=report,
+                         supervisor=process_supervisor.ProcessSupervisor(args.idle_timeout or None), staging=staging)
+    print(f"工作进程 {worker.worker_id} 开始处理队列 {job_queue.path}（并行任务数 {worker.max_workers}）")
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""任务调度策略
+
+并行转换时任务默认按添加顺序领取。如果最后添加的是一个很长的4K文件，其他工作线程早已空闲，
+整批任务只能等它一个完成。调度器根据ffprobe分析得到的时长、输出像素数和编码器估算每个任务的工作量，
+按策略重新排列待转换的任务：
+
+    fifo  按添加顺序
+    lpt   工作量大的任务先转换（最长处理时间优先），缩短整批任务的总耗时
+    spt   工作量小的任务先转换（最短处理时间优先），尽快得到更多完成的文件
+
+从持久化队列领取的任务仍然先按队列优先级排列，同一优先级内再按策略排列。
+"""
+import heapq
+import os
+
+import preset_planner
+import target_size
+
+
+STRATEGIES = {
+    "fifo": "按添加顺序",
+    "lpt": "最长任务优先",
+    "spt": "最短任务优先",
+}
+DEFAULT_STRATEGY = "lpt"
+
+# 各编码器相对libx264 medium的编码耗时（经验值，只用于比较任务之间的相对大小）
+ENCODER_COST = {
+    "libx264": 1.0,
+    "libopenh264": 0.5,
+    "libx265": 4.0,
+    "libvpx": 2.0,
+    "libvpx-vp9": 5.0,
+    "libaom-av1": 20.0,
+    "libsvtav1": 3.0,
+    "mpeg4": 0.3,
+    "msmpeg4v2": 0.3,
+    "msmpeg4v3": 0.3,
+    "wmv1": 0.3,
+    "wmv2": 0.3,
+    "mpeg1video": 0.3,
+    "mpeg2video": 0.3,
+    "flv1": 0.3,
+}
+
+# 硬件编码器（名称后缀）的相对耗时，主要是解码和上传画面的开销
+HARDWARE_SUFFIXES = ("_nvenc", "_qsv", "_amf", "_videotoolbox", "_vaapi", "_v4l2m2m", "_mf")
+HARDWARE_COST = 0.15
+
+# 未知编码器的相对耗时
+UNKNOWN_ENCODER_COST = 1.0
+
+# 直接复制视频流或没有视频流时的相对耗时（只需读写数据）
+COPY_COST = 0.02
+
+# 没有时长时按文件大小估算时长（字节/秒，约8 Mbit/s）
+FALLBACK_BYTES_PER_SECOND = 1000000
+
+# 有预设可选的编码器，按preset_planner.PRESET_SPEED换算预设的耗时
+PRESET_ENCODERS = {"libx264", "libx265"}
+
+
+def encoder_cost(video_codec, preset=None):
+    """编码器（和预设）相对libx264 medium的耗时"""
+    if video_codec.endswith(HARDWARE_SUFFIXES):
+        return HARDWARE_COST
+    cost = ENCODER_COST.get(video_codec, UNKNOWN_ENCODER_COST)
+    if video_codec in PRESET_ENCODERS and preset in preset_planner.PRESET_SPEED:
+        cost /= preset_planner.PRESET_SPEED[preset]
+    return cost
+
+
+def job_preset(job):
+    """任务使用的编码预设：规划器选择的预设，否则为质量参数中的-preset"""
+    if job.preset:
+        return job.preset
+    args = job.quality_params.split()
+    if "-preset" in args[:-1]:
+        return args[args.index("-preset") + 1]
+    return None
+
+
+def job_duration(job):
+    """任务时长（秒），没有分析到时长时按文件大小估算"""
+    if job.duration > 0:
+        return job.duration
+    try:
+        return os.path.getsize(job.input_file) / FALLBACK_BYTES_PER_SECOND
+    except OSError:
+        return 0
+
+
+def job_cost(job, two_pass=False):
+    """估算任务的工作量：时长 × 每帧百万像素数 × 编码器相对耗时
+
+    多分辨率输出按所有分辨率的像素数之和计算；两遍编码时加上第一遍分析的耗时。
+    """
+    duration = job_duration(job)
+    if job.copy_video or (job.media_info is not None and job.media_info.video is None):
+        return duration * COPY_COST
+    if job.renditions:
+        pixels = sum(preset_planner.job_pixels(rendition) for rendition in job.renditions)
+    else:
+        pixels = preset_planner.job_pixels(job)
+    cost = duration * pixels / 1000000 * encoder_cost(job.video_codec, job_preset(job))
+    if two_pass:
+        cost *= 1 + target_size.FIRST_PASS_WEIGHT
+    return cost
+
+
+def order_jobs(jobs, costs, strategy):
+    """按策略排列任务，队列优先级高的任务总是在前；同样工作量的任务保持原来的顺序"""
+    if strategy not in STRATEGIES:
+        raise ValueError(f"无效的调度策略: {strategy}（可用：{', '.join(STRATEGIES)}）")
+    if strategy == "lpt":
+        key = lambda job: (-job.priority, -costs[job.index])
+    elif strategy == "spt":
+        key = lambda job: (-job.priority, costs[job.index])
+    else:
+        key = lambda job: -job.priority
+    return sorted(jobs, key=key)
+
+
+def estimate_makespan(costs, workers):
+    """按顺序把任务分给最先空闲的工作线程，估算整批任务的总耗时（与工作量同一单位）"""
+    finish_times = [0.0] * max(1, workers)
+    for cost in costs:
+        heapq.heapreplace(finish_times, finish_times[0] + cost)
+    return max(finish_times)
+
+
+class JobScheduler:
+    """按估算的工作量安排任务的转换顺序，由ConversionRunner在批次开始时调用"""
+
+    def __init__(self, strategy=DEFAULT_STRATEGY):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"无效的调度策略: {strategy}（可用：{', '.join(STRATEGIES)}）")
+        self.strategy = strategy
+        # 最近一次排列的估算结果，用于批次结束时汇总
+        self.makespan = None
+        self.fifo_makespan = None
+
+    def describe(self):
+        return f"{self.strategy.upper()}（{STRATEGIES[self.strategy]}）"
+
+    def order(self, runner, jobs):
+        """返回排列后的待转换任务，并记录估算的总耗时（相对按添加顺序转换）"""
+        two_pass = runner.target_size is not None
+        costs = {job.index: job_cost(job, two_pass and job.video_codec in target_size.TWO_PASS_ENCODERS)
+                 for job in jobs}
+        ordered = order_jobs(jobs, costs, self.strategy)
+        self.makespan = estimate_makespan([costs[job.index] for job in ordered], runner.max_workers)
+        self.fifo_makespan = estimate_makespan([costs[job.index] for job in order_jobs(jobs, costs, "fifo")],
+                                               runner.max_workers)
+        if self.strategy != "fifo" and len(ordered) > 1:
+            head = ", ".join(os.path.basename(job.input_file) for job in ordered[:3])
+            runner.log(f"调度策略 {self.describe()}：先转换 {head}{' 等' if len(ordered) > 3 else ''}\n")
+        return ordered
+
+    def summary(self):
+        """调度结果摘要，如"LPT（最长任务优先），预计总耗时为按添加顺序的 82%" """
+        text = self.describe()
+        if self.strategy != "fifo" and self.makespan and self.fifo_makespan:
+            text += f"，预计总耗时为按添加顺序的 {self.makespan / self.fifo_makespan:.0%}"
+        return text
@@ -0,0 +1,439 @@
+"""本机HTTP任务接口
+
+在转换引擎外包一层只监听本机地址的HTTP服务，其他程序可以提交、查看和取消转换任务，
+并读取队列长度、正在运行的任务、总帧率、成功/失败数等实时指标。只使用Python标准库。
+
+    python job_server.py -o output -j 2 --port 8765
+
+接口（请求和响应都是JSON）：
+    POST   /jobs        提交任务 {"input": 路径, "format": "mp4", "resolution": "1280x720",
+                                  "bitrate": "5M", "encoder": "auto", "output_dir": 目录}
+                        output_dir必须位于服务的输出目录之下（相对路径按输出目录解析），
+                        encoder必须是本机FFmpeg可用的编码器
+    GET    /jobs        列出所有任务
+    GET    /jobs/<id>   查看单个任务
+    DELETE /jobs/<id>   取消任务（排队中的任务不再执行，正在运行的任务被终止）
+    GET    /metrics     实时指标
+"""
+import argparse
+import collections
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import convert_engine as engine
+import encoder_probe
+import job_telemetry
+import media_probe
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# 请求体大小上限（字节）
+MAX_BODY_SIZE = 64 * 1024
+
+# 保留的已结束任务数，超过时删除最早结束的任务（GET /jobs不再列出，计数仍在/metrics中）
+MAX_FINISHED_JOBS = 1000
+
+# 任务结束状态 -> 计数名称
+FINISHED_COUNTERS = {"done": "completed", "failed": "failed", "cancelled": "cancelled"}
+
+
+class ServiceJob:
+    """服务中的一个任务：包装ConversionJob，并记录排队和运行状态"""
+
+    def __init__(self, job_id, job):
+        self.id = job_id
+        self.job = job
+        # 状态：queued / running / done / failed / cancelled
+        self.state = "queued"
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.runner = None
+        self.stats = None  # 最近一组-progress进度数据
+        self.cancel_requested = False
+
+    def to_dict(self):
+        job = self.job
+        stats = self.stats
+        return {
+            "id": self.id,
+            "state": self.state,
+            "input": job.input_file,
+            "output": job.output_file,
+            "format": job.output_format,
+            "resolution": job.resolution,
+            "bitrate": job.bitrate,
+            "encoder": job.video_codec,
+            "progress": round(job.progress, 2),
+            "duration": job.duration,
+            "fps": stats.fps if stats is not None else None,
+            "speed": stats.speed if stats is not None else None,
+            "return_code": job.return_code,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobService:
+    """任务服务：接收提交的任务，由固定数量的工作线程逐个转换
+
+    提交的output_dir限制在output_dir之下；capabilities为编码器检测结果，不为None时只接受可用的编码器。
+    已结束的任务最多保留max_finished个。
+    """
+
+    def __init__(self, ffmpeg_path, output_dir, max_workers=None, prober=None, telemetry=None,
+                 default_encoder=engine.DEFAULT_VIDEO_CODEC, stream_copy=True, capabilities=None,
+                 max_finished=MAX_FINISHED_JOBS):
+        self.ffmpeg_path = ffmpeg_path
+        self.output_dir = output_dir
+        self.max_workers = max(1, max_workers or engine.default_workers())
+        self.prober = prober
+        self.telemetry = telemetry
+        self.default_encoder = default_encoder
+        self.stream_copy = stream_copy
+        self.capabilities = capabilities
+        self.max_finished = max_finished
+
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.finished = collections.deque()  # 已结束任务的编号（按结束顺序）
+        self.next_id = 1
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0}
+        self.started_at = time.time()
+        self._queue = queue.Queue()
+        self._shutdown = threading.Event()
+        self._workers = []
+
+    def start(self):
+        """启动工作线程"""
+        for n in range(self.max_workers):
+            t = threading.Thread(target=self._worker, daemon=True, name=f"service-worker-{n+1}")
+            t.start()
+            self._workers.append(t)
+
+    def shutdown(self):
+        """停止服务：不再领取任务，并终止所有正在运行的转换"""
+        self._shutdown.set()
+        with self.lock:
+            runners = [sj.runner for sj in self.jobs.values() if sj.runner is not None]
+        for runner in runners:
+            runner.stop()
+
+    def submit(self, params):
+        """提交任务，参数无效时抛出ValueError"""
+        input_file = params.get("input")
+        if not input_file or not isinstance(input_file, str):
+            raise ValueError("缺少input")
+        if not os.path.isfile(input_file):
+            raise ValueError(f"输入文件不存在: {input_file}")
+
+        output_format = str(params.get("format", "mp4")).lower()
+        if output_format not in [value for _, value in engine.OUTPUT_FORMATS]:
+            raise ValueError(f"不支持的输出格式: {output_format}")
+
+        encoder = params.get("encoder") or "auto"
+        if encoder == "auto":
+            encoder = self.default_encoder
+        elif not self.encoder_allowed(encoder):
+            raise ValueError(f"不可用的编码器: {encoder}")
+
+        output_dir = self.resolve_output_dir(params.get("output_dir"))
+        os.makedirs(output_dir, exist_ok=True)
+        job = engine.create_jobs(
+            [input_file],
+            output_dir,
+            output_format,
+            resolution=engine.parse_resolution(params.get("resolution", "")),
+            bitrate=engine.parse_bitrate(params.get("bitrate", "")),
+            video_codec=encoder
+        )[0]
+
+        with self.lock:
+            sj = ServiceJob(self.next_id, job)
+            self.next_id += 1
+            self.jobs[sj.id] = sj
+            self.counters["submitted"] += 1
+        self._queue.put(sj.id)
+        return sj
+
+    def encoder_allowed(self, encoder):
+        """编码器是否可用：试编码成功的，或FFmpeg列出但不在试编码候选中的（如libvpx-vp9）"""
+        if not isinstance(encoder, str):
+            return False
+        capabilities = self.capabilities
+        if capabilities is None:
+            return True
+        if capabilities.works(encoder):
+            return True
+        return encoder in capabilities.available and encoder not in encoder_probe.CANDIDATE_ENCODERS
+
+    def resolve_output_dir(self, output_dir):
+        """解析提交的输出目录（相对路径按服务的输出目录解析），不在服务的输出目录之下时抛出ValueError"""
+        root = os.path.realpath(self.output_dir)
+        if not output_dir:
+            return root
+        if not isinstance(output_dir, str):
+            raise ValueError("output_dir必须是字符串")
+        # 解析符号链接和..后再比较，防止写到输出目录之外
+        path = os.path.realpath(os.path.join(root, output_dir))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError(f"output_dir必须位于输出目录之下: {root}")
+        return path
+
+    def _finish(self, sj, state):
+        """记录任务结束（调用方持有self.lock），超过保留数时删除最早结束的任务"""
+        sj.state = state
+        sj.finished_at = time.time()
+        self.counters[FINISHED_COUNTERS[state]] += 1
+        self.finished.append(sj.id)
+        while len(self.finished) > self.max_finished:
+            self.jobs.pop(self.finished.popleft(), None)
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        """取消任务，返回取消后的任务，任务不存在时返回None"""
+        with self.lock:
+            sj = self.jobs.get(job_id)
+            if sj is None:
+                return None
+            if sj.state == "queued":
+                self._finish(sj, "cancelled")
+                return sj
+            if sj.state != "running":
+                return sj
+            sj.cancel_requested = True
+            runner = sj.runner
+        if runner is not None:
+            runner.stop()
+        return sj
+
+    def metrics(self):
+        """实时指标"""
+        with self.lock:
+            running = [sj for sj in self.jobs.values() if sj.state == "running"]
+            queued = sum(1 for sj in self.jobs.values() if sj.state == "queued")
+            counters = dict(self.counters)
+        return {
+            "uptime": round(time.time() - self.started_at, 1),
+            "max_workers": self.max_workers,
+            "queue_depth": queued,
+            "active_jobs": len(running),
+            # 所有正在运行任务的帧率和速度之和
+            "fps": round(sum(sj.stats.fps or 0 for sj in running if sj.stats is not None), 2),
+            "speed": round(sum(sj.stats.speed or 0 for sj in running if sj.stats is not None), 2),
+            **counters,
+        }
+
+    def _worker(self):
+        """工作线程：逐个领取排队的任务"""
+        while not self._shutdown.is_set():
+            try:
+                job_id = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with self.lock:
+                sj = self.jobs.get(job_id)
+                if sj is None or sj.state != "queued":
+                    # 排队时已被取消
+                    continue
+                sj.state = "running"
+                sj.started_at = time.time()
+                sj.runner = engine.ConversionRunner(
+                    self.ffmpeg_path,
+                    [sj.job],
+                    max_workers=1,
+                    on_event=lambda event, sj=sj: self._on_event(sj, event),
+                    prober=self.prober,
+                    stream_copy=self.stream_copy,
+                    telemetry=self.telemetry
+                )
+            # 从这里到run()之间收到的取消请求由runner.stop()记录，run()开始后直接结束
+            try:
+                success = sj.runner.run()
+            except Exception as e:
+                print(f"任务 {sj.id} 出错: {str(e)}", file=sys.stderr)
+                success = False
+            with self.lock:
+                sj.stats = None
+                if sj.cancel_requested or sj.runner.stopped:
+                    self._finish(sj, "cancelled")
+                elif success:
+                    self._finish(sj, "done")
+                else:
+                    self._finish(sj, "failed")
+                sj.runner = None
+
+    def _on_event(self, sj, event):
+        if event.kind == "progress" and event.stats is not None:
+            sj.stats = event.stats
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """HTTP请求处理，服务对象为self.server.service"""
+
+    server_version = "VideoConverterJobAPI/1.0"
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_json(status, {"error": message})
+
+    def job_id_from_path(self):
+        """从/jobs/<id>中取出任务编号，不是该形式的路径返回None"""
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+            return int(parts[1])
+        return None
+
+    def do_GET(self):
+        service = self.server.service
+        path = self.path.split("?")[0].rstrip("/")
+        if path == "/metrics":
+            self.send_json(200, service.metrics())
+        elif path == "/jobs":
+            self.send_json(200, {"jobs": [sj.to_dict() for sj in service.list()]})
+        elif self.job_id_from_path() is not None:
+            sj = service.get(self.job_id_from_path())
+            if sj is None:
+                self.send_error_json(404, "任务不存在")
+            else:
+                self.send_json(200, sj.to_dict())
+        else:
+            self.send_error_json(404, "未知路径")
+
+    def do_POST(self):
+        if self.path.split("?")[0].rstrip("/") != "/jobs":
+            self.send_error_json(404, "未知路径")
+            return
+        # 只接受JSON请求：浏览器跨站提交JSON需要预检请求，本服务不响应预检
+        if not self.headers.get("Content-Type", "").startswith("application/json"):
+            self.send_error_json(415, "Content-Type必须为application/json")
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY_SIZE:
+            self.send_error_json(413, "请求体过大")
+            return
+        try:
+            params = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(params, dict):
+                raise ValueError("请求体必须是JSON对象")
+            sj = self.server.service.submit(params)
+        except ValueError as e:
+            self.send_error_json(400, str(e))
+            return
+        except OSError as e:
+            self.send_error_json(500, str(e))
+            return
+        self.send_json(201, sj.to_dict())
+
+    def do_DELETE(self):
+        job_id = self.job_id_from_path()
+        sj = self.server.service.cancel(job_id) if job_id is not None else None
+        if sj is None:
+            self.send_error_json(404, "任务不存在")
+        else:
+            self.send_json(200, sj.to_dict())
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def create_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, quiet=False):
+    """创建HTTP服务（尚未开始处理请求）"""
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.quiet = quiet
+    return server
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="视频转换本机HTTP任务接口")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"监听地址（默认：{DEFAULT_HOST}，只允许本机访问）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"监听端口（默认：{DEFAULT_PORT}）")
+    parser.add_argument("-o", "--output-dir", default=os.path.join(os.getcwd(), "output"),
+                        help="默认输出目录（默认：当前目录下的output）")
+    parser.add_argument("-j", "--jobs", type=int, default=engine.default_workers(),
+                        help="并行任务数（默认：按CPU核心数计算）")
+    parser.add_argument("--ffmpeg", default=None, help="FFmpeg可执行文件路径")
+    parser.add_argument("--no-probe", action="store_true", help="转换前不使用ffprobe分析媒体信息")
+    parser.add_argument("--no-stream-copy", action="store_true",
+                        help="始终重新编码，不直接复制兼容的音视频流")
+    parser.add_argument("--telemetry", default=None,
+                        help="任务性能数据记录文件（.csv或.jsonl，默认：缓存目录下的.jsonl文件）")
+    parser.add_argument("-q", "--quiet", action="store_true", help="不输出HTTP访问日志")
+    return parser
+
+
+def main(argv=None):
+    """服务入口，返回进程退出码"""
+    args = build_parser().parse_args(argv)
+    ffmpeg_path = args.ffmpeg or encoder_probe.locate_ffmpeg()[0]
+    if not ffmpeg_path:
+        print("未找到FFmpeg，请确保已安装FFmpeg并添加到系统PATH，或使用--ffmpeg指定路径", file=sys.stderr)
+        return 2
+
+    prober = None
+    if not args.no_probe:
+        ffprobe_path = media_probe.find_ffprobe(ffmpeg_path)
+        if ffprobe_path:
+            prober = media_probe.MediaProber(ffprobe_path, media_probe.ProbeCache())
+
+    capabilities = encoder_probe.probe_capabilities(ffmpeg_path)
+    service = JobService(
+        ffmpeg_path,
+        args.output_dir,
+        max_workers=args.jobs,
+        prober=prober,
+        telemetry=job_telemetry.TelemetryWriter(args.telemetry),
+        default_encoder=capabilities.best_encoder(),
+        stream_copy=not args.no_stream_copy,
+        capabilities=capabilities
+    )
+    try:
+        server = create_server(service, args.host, args.port, args.quiet)
+    except OSError as e:
+        print(f"无法监听 {args.host}:{args.port}: {e}", file=sys.stderr)
+        return 2
+
+    service.start()
+    print(f"任务接口已启动: http://{args.host}:{server.server_address[1]}/（并行任务数 {service.max_workers}，"
+          f"默认编码器 {service.default_encoder}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""任务性能数据记录
+
+每个任务结束时，把媒体信息分析耗时、进程创建耗时、转换耗时、FFmpeg进程的CPU时间、
+帧率和速度、输入输出大小等写入记录文件（每个批次一个文件），用于统计大量任务的处理能力。
+文件扩展名为.csv时写CSV，否则每行写一条JSON（JSONL）。
+"""
+import csv
+import json
+import os
+import threading
+import time
+
+import convert_engine as engine
+
+
+# 记录的字段（CSV列顺序）
+FIELDS = [
+    "batch_id", "input", "output", "state", "return_code",
+    "output_format", "video_codec", "audio_codec", "resolution", "bitrate", "preset", "threads", "duration",
+    "started_at", "probe_time", "processes", "spawn_latency", "encode_time", "publish_time",
+    "cpu_user", "cpu_sys", "fps_avg", "fps_min", "speed_avg", "speed_min",
+    "input_bytes", "output_bytes", "compression_ratio",
+]
+
+
+def new_batch_id():
+    """批次标识，如"20240101_120000_1234" """
+    return f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+
+
+def default_telemetry_path(batch_id):
+    """默认的记录文件路径：缓存目录下的telemetry/batch_<批次>.jsonl"""
+    return os.path.join(engine.default_cache_dir(), "telemetry", f"batch_{batch_id}.jsonl")
+
+
+class TelemetryWriter:
+    """把任务性能数据追加到记录文件，可以被多个工作线程同时调用"""
+
+    def __init__(self, path=None, batch_id=None):
+        self.batch_id = batch_id or new_batch_id()
+        self.path = path or default_telemetry_path(self.batch_id)
+        self.csv = self.path.lower().endswith(".csv")
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def write(self, record):
+        """追加一条记录"""
+        record = dict(record, batch_id=self.batch_id)
+        with self.lock:
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            if self.csv:
+                new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+                with open(self.path, "a", encoding="utf-8", newline="") as f:
+                    writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction="ignore")
+                    if new_file:
+                        writer.writeheader()
+                    writer.writerow(record)
+            else:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.count += 1
@@ -0,0 +1,346 @@
+"""媒体信息分析
+
+在转换开始前用ffprobe并行分析所有输入文件（时长、编码、分辨率、音视频流），
+结果按 路径 + 文件大小 + 修改时间 缓存到磁盘（SQLite），重复添加同一批文件时不需要重新分析。
+"""
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import convert_engine as engine
+
+
+# 缓存数据库格式版本（PRAGMA user_version），结构变化时修改以丢弃旧缓存
+CACHE_VERSION = 2
+
+# 缓存最多保存的文件数，超过时删除最久没有使用的结果
+MAX_CACHE_ENTRIES = 50000
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS probes (
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (path, size, mtime_ns)
+);
+CREATE INDEX IF NOT EXISTS probes_used ON probes (used_at);
+"""
+
+
+def find_ffprobe(ffmpeg_path=None):
+    """查找ffprobe：优先使用与FFmpeg同目录的ffprobe，其次在PATH中查找"""
+    ffprobe_exe = "ffprobe.exe" if sys.platform.startswith("win") else "ffprobe"
+    if ffmpeg_path and os.path.dirname(ffmpeg_path):
+        candidate = os.path.join(os.path.dirname(ffmpeg_path), ffprobe_exe)
+        if os.path.exists(candidate):
+            return candidate
+    found = shutil.which("ffprobe")
+    if found:
+        return found
+    if os.path.exists(os.path.join(os.getcwd(), ffprobe_exe)):
+        return os.path.join(os.getcwd(), ffprobe_exe)
+    return None
+
+
+def file_identity(path):
+    """文件标识：(绝对路径, 大小, 修改时间纳秒)，文件不存在时返回None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+
+def _float(value):
+    """把ffprobe输出中的数值字符串转换为float，无法转换时返回None"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(value):
+    """把ffprobe输出中的数值字符串转换为int，无法转换时返回None"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class StreamInfo:
+    """单个音视频流的信息"""
+
+    def __init__(self, data):
+        self.index = data.get("index")
+        self.codec_type = data.get("codec_type")
+        self.codec_name = data.get("codec_name")
+        self.profile = data.get("profile")
+        self.width = _int(data.get("width"))
+        self.height = _int(data.get("height"))
+        self.pix_fmt = data.get("pix_fmt")
+        self.bit_rate = _int(data.get("bit_rate"))
+        self.sample_rate = _int(data.get("sample_rate"))
+        self.channels = _int(data.get("channels"))
+        self.avg_frame_rate = data.get("avg_frame_rate")
+
+    @property
+    def frame_rate(self):
+        """平均帧率，如"30000/1001" -> 29.97"""
+        try:
+            num, den = self.avg_frame_rate.split("/")
+            return float(num) / float(den) if float(den) else None
+        except (AttributeError, ValueError):
+            return None
+
+    def __repr__(self):
+        if self.codec_type == "video":
+            return f"StreamInfo(video {self.codec_name} {self.width}x{self.height})"
+        return f"StreamInfo({self.codec_type} {self.codec_name})"
+
+
+class MediaInfo:
+    """ffprobe分析得到的媒体信息"""
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data  # ffprobe原始JSON
+        fmt = data.get("format", {})
+        self.format_name = fmt.get("format_name", "")
+        self.size = _int(fmt.get("size"))
+        self.bit_rate = _int(fmt.get("bit_rate"))
+        self.streams = [StreamInfo(s) for s in data.get("streams", [])]
+        self.probe_time = None  # 分析耗时（秒，包括读取缓存），由MediaProber设置
+
+        # 容器没有时长时，使用最长的流时长
+        duration = _float(fmt.get("duration"))
+        if not duration:
+            durations = [_float(s.get("duration")) for s in data.get("streams", [])]
+            duration = max([d for d in durations if d], default=None)
+        self.duration = duration or 0
+
+    @property
+    def video_streams(self):
+        return [s for s in self.streams if s.codec_type == "video"]
+
+    @property
+    def audio_streams(self):
+        return [s for s in self.streams if s.codec_type == "audio"]
+
+    @property
+    def video(self):
+        """第一个视频流，没有视频流时返回None"""
+        streams = self.video_streams
+        return streams[0] if streams else None
+
+    @property
+    def audio(self):
+        """第一个音频流，没有音频流时返回None"""
+        streams = self.audio_streams
+        return streams[0] if streams else None
+
+    @property
+    def pixels(self):
+        """每帧像素数，没有视频流时为0"""
+        video = self.video
+        if video is None or not video.width or not video.height:
+            return 0
+        return video.width * video.height
+
+    def summary(self):
+        """一行摘要，用于日志"""
+        parts = [f"时长 {self.duration:.2f} 秒"]
+        video = self.video
+        if video is not None:
+            parts.append(f"视频 {video.codec_name} {video.width}x{video.height}")
+        audio = self.audio
+        if audio is not None:
+            parts.append(f"音频 {audio.codec_name}")
+        return ", ".join(parts)
+
+    def __repr__(self):
+        return f"MediaInfo({self.path!r}, {self.summary()})"
+
+
+class ProbeCache:
+    """ffprobe结果的磁盘缓存（SQLite），按 (绝对路径, 大小, 修改时间) 保存，文件变化后旧结果不再使用
+
+    put()先暂存在内存中，save()在一个事务中写入新结果、更新命中结果的使用时间，并删除超过max_entries的最久没有使用的结果。
+    多个进程（图形界面、队列工作进程等）同时使用同一个缓存时各自只写入自己的结果，不会互相覆盖。
+    写入失败时调用log(消息)，没有log时输出到stderr。
+    """
+
+    def __init__(self, path=None, max_entries=MAX_CACHE_ENTRIES, log=None):
+        self.path = path or os.path.join(engine.default_cache_dir(), "probe_cache.db")
+        self.max_entries = max_entries
+        self.log = log
+        self.lock = threading.Lock()
+        self.pending = {}  # (绝对路径, 大小, 修改时间) -> 还没写入的ffprobe结果
+        self.hits = set()  # 命中的缓存项，保存时更新使用时间
+        self.conn = None
+        self.open()
+
+    def report(self, message):
+        if self.log is not None:
+            self.log(message)
+        else:
+            print(message, file=sys.stderr)
+
+    def open(self):
+        """打开缓存数据库，版本不同时丢弃旧缓存；无法打开时不使用磁盘缓存"""
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # 所有线程共用一个连接，由self.lock保护
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != CACHE_VERSION:
+                conn.executescript(f"DROP TABLE IF EXISTS probes;{CACHE_SCHEMA}PRAGMA user_version = {CACHE_VERSION};")
+            else:
+                conn.executescript(CACHE_SCHEMA)
+            self.conn = conn
+        except (OSError, sqlite3.Error) as e:
+            self.report(f"无法打开媒体信息缓存: {e}")
+
+    def get(self, path):
+        """返回缓存的ffprobe结果，未命中时返回None"""
+        identity = file_identity(path)
+        if identity is None:
+            return None
+        with self.lock:
+            data = self.pending.get(identity)
+            if data is not None or self.conn is None:
+                return data
+            try:
+                row = self.conn.execute("SELECT data FROM probes WHERE path = ? AND size = ? AND mtime_ns = ?",
+                                        identity).fetchone()
+            except sqlite3.Error:
+                return None
+            if row is None:
+                return None
+            self.hits.add(identity)
+        try:
+            return json.loads(row[0])
+        except ValueError:
+            return None
+
+    def put(self, path, data):
+        """保存ffprobe结果（调用save()后写入磁盘）"""
+        identity = file_identity(path)
+        if identity is None:
+            return
+        with self.lock:
+            self.pending[identity] = data
+
+    def save(self):
+        """在一个事务中写入新结果、更新命中结果的使用时间，超过上限时删除最久没有使用的结果"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            hits, self.hits = self.hits, set()
+            if self.conn is None or not (pending or hits):
+                return
+            now = time.time()
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for (path, size, mtime_ns), data in pending.items():
+                        # 同一文件的旧版本（大小或修改时间不同）不会再命中
+                        self.conn.execute("DELETE FROM probes WHERE path = ?", (path,))
+                        self.conn.execute("INSERT INTO probes (path, size, mtime_ns, data, used_at) "
+                                          "VALUES (?, ?, ?, ?, ?)",
+                                          (path, size, mtime_ns, json.dumps(data, ensure_ascii=False), now))
+                    self.conn.executemany("UPDATE probes SET used_at = ? WHERE path = ? AND size = ? AND mtime_ns = ?",
+                                          [(now, *identity) for identity in hits])
+                    if pending and self.max_entries:
+                        self.conn.execute("DELETE FROM probes WHERE rowid IN (SELECT rowid FROM probes "
+                                          "ORDER BY used_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+                except BaseException:
+                    self.conn.execute("ROLLBACK")
+                    raise
+                self.conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                self.report(f"保存媒体信息缓存失败: {e}")
+
+
+class MediaProber:
+    """用ffprobe并行分析媒体文件，结果写入缓存"""
+
+    def __init__(self, ffprobe_path, cache=None, max_workers=None):
+        self.ffprobe_path = ffprobe_path
+        self.cache = cache
+        # ffprobe主要等待磁盘读取，可以比转换任务多开一些
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 2)
+
+    def run_ffprobe(self, path):
+        """运行ffprobe并返回JSON结果，失败时返回None"""
+        cmd = [
+            self.ffprobe_path,
+            "-v", "error",
+            "-print_format", "json",
+            "-show_format",
+            "-show_streams",
+            path
+        ]
+        try:
+            result = subprocess.run(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+                timeout=60,
+                **engine.popen_options()
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if result.returncode != 0:
+            return None
+        try:
+            return json.loads(result.stdout)
+        except ValueError:
+            return None
+
+    def probe(self, path):
+        """分析单个文件，优先使用缓存，失败时返回None"""
+        start = time.perf_counter()
+        data = self.cache.get(path) if self.cache is not None else None
+        if data is None:
+            data = self.run_ffprobe(path)
+            if data is None:
+                return None
+            if self.cache is not None:
+                self.cache.put(path, data)
+        info = MediaInfo(path, data)
+        info.probe_time = time.perf_counter() - start
+        return info
+
+    def probe_many(self, paths, on_result=None):
+        """并行分析多个文件，返回 {路径: MediaInfo或None}，每完成一个调用on_result(path, info)"""
+        results = {}
+        unique_paths = list(dict.fromkeys(paths))
+        if not unique_paths:
+            return results
+
+        def task(path):
+            info = self.probe(path)
+            if on_result is not None:
+                on_result(path, info)
+            return path, info
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(unique_paths))) as executor:
+            for path, info in executor.map(task, unique_paths):
+                results[path] = info
+
+        if self.cache is not None:
+            self.cache.save()
+        return results
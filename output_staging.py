@@ -0,0 +1,319 @@
+"""输出文件暂存与原子发布
+
+FFmpeg默认直接写入输出目录，输出目录在较慢的网络共享上时写入慢，其他程序还会读到不完整的文件。
+指定暂存目录（本机SSD或tmpfs）后，每个任务的输出先写到暂存目录下单独的子目录中，转换成功后再分两步发布到输出目录：
+先把所有输出移到输出目录中的临时文件（同一文件系统内重命名，跨文件系统时复制并fsync），全部成功后
+再逐个原子重命名（os.replace）为最终文件名。第一步失败时只删除临时文件，输出目录中原有的文件保持不变；
+输出目录中只会出现完整的文件，转换失败或被停止时直接删除暂存子目录。
+
+暂存空间上限限制同时暂存的任务：每个任务开始前按预计输出大小预留空间，空间不足时等待其他任务发布，
+预计大小超过上限的任务直接写入输出目录。
+"""
+import errno
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import target_size
+
+
+# 暂存子目录名前缀
+SCRATCH_PREFIX = "vc_stage_"
+
+# 复制到输出目录时临时文件名的后缀
+PARTIAL_SUFFIX = ".partial"
+
+# 跨文件系统复制时每次读写的字节数
+COPY_BUFFER_SIZE = 4 * 1024 * 1024
+
+# 预计输出大小的余量（编码码率波动、容器开销）
+SIZE_MARGIN = 1.2
+
+# 没有指定码率时按输入文件大小的这一比例估计输出大小
+INPUT_SIZE_RATIO = 1.0
+
+# 默认音频码率（bit/s），按码率估计输出大小时使用
+AUDIO_BITS = 128000
+
+# 暂存目录所在磁盘至少保留的空闲空间（字节）
+RESERVED_FREE_BYTES = 256 * 1024 * 1024
+
+# 等待暂存空间时检查停止状态的间隔（秒）
+WAIT_INTERVAL = 1.0
+
+
+def parse_bits(bitrate):
+    """解析FFmpeg码率参数，如"10M" -> 10000000、"800k" -> 800000（bit/s），无法解析时返回None"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([kmg]?)", (bitrate or "").strip().lower())
+    if not match:
+        return None
+    return float(match.group(1)) * {"": 1, "k": 1000, "m": 1000 ** 2, "g": 1000 ** 3}[match.group(2)]
+
+
+def format_size(size):
+    """格式化字节数，如1536 -> "1.5 KiB" """
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def create_stager(scratch_dir, limit=None):
+    """按命令行参数创建暂存器，limit为暂存空间上限（如"20G"），无效时抛出ValueError"""
+    if not scratch_dir:
+        return None
+    return OutputStager(scratch_dir, target_size.parse_size(limit) if limit else None)
+
+
+def estimate_output_size(job):
+    """预计任务所有输出文件的总大小（字节）：指定码率时按码率和时长计算，否则按输入文件大小估计"""
+    bits = parse_bits(job.bitrate)
+    if bits and job.duration > 0 and not job.copy_video:
+        per_output = (bits + AUDIO_BITS) * job.duration / 8
+    else:
+        try:
+            per_output = os.path.getsize(job.input_file) * INPUT_SIZE_RATIO
+        except OSError:
+            per_output = 0
+    # 多格式和多分辨率输出按输出文件数计算（低分辨率的输出实际更小）
+    return int(per_output * len(job.output_files()) * SIZE_MARGIN)
+
+
+def fsync_directory(path):
+    """把目录项（重命名结果）写入磁盘，Windows不支持打开目录，直接跳过"""
+    if sys.platform == "win32":
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def partial_path(target):
+    """发布时target所在目录中的临时文件"""
+    return f"{target}{PARTIAL_SUFFIX}"
+
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def copy_with_fsync(source, target):
+    """把文件复制到target并fsync，失败时删除不完整的target"""
+    try:
+        with open(source, "rb") as src, open(target, "wb") as dst:
+            shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+            dst.flush()
+            os.fsync(dst.fileno())
+        shutil.copystat(source, target)
+    except BaseException:
+        remove_quietly(target)
+        raise
+
+
+def move_to_partial(source, target):
+    """发布第一步：把暂存文件移到target旁边的临时文件（同一文件系统内重命名，跨文件系统时复制并fsync），
+    返回(临时文件, 是否经过复制)；target本身不变"""
+    partial = partial_path(target)
+    try:
+        os.replace(source, partial)
+        return partial, False
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    copy_with_fsync(source, partial)
+    return partial, True
+
+
+class StagedJob:
+    """一个任务的暂存信息：暂存子目录、预留空间和原来的输出路径"""
+
+    def __init__(self, directory, reserved, output_file, extra_outputs, rendition_files):
+        self.directory = directory
+        self.reserved = reserved
+        self.output_file = output_file
+        self.extra_outputs = extra_outputs
+        self.rendition_files = rendition_files
+
+
+class OutputStager:
+    """把任务输出暂存到本地目录，成功后发布到输出目录，由ConversionRunner在任务开始和结束时调用
+
+    scratch_dir为暂存目录；max_bytes为暂存空间上限（字节），None表示只受磁盘空闲空间限制。
+    多个执行器可以共用一个暂存器，共同受上限限制。
+    """
+
+    def __init__(self, scratch_dir, max_bytes=None):
+        self.scratch_dir = os.path.abspath(scratch_dir)
+        self.max_bytes = max_bytes
+        self.condition = threading.Condition()
+        self.staged = {}  # 任务 -> StagedJob
+        self.reserved = 0
+
+    def describe(self):
+        text = f"暂存目录 {self.scratch_dir}"
+        if self.max_bytes:
+            text += f"，上限 {format_size(self.max_bytes)}"
+        return text
+
+    def free_bytes(self):
+        try:
+            return shutil.disk_usage(self.scratch_dir).free - RESERVED_FREE_BYTES
+        except OSError:
+            return 0
+
+    def has_room(self, size):
+        """调用方持有self.condition"""
+        if self.max_bytes and self.reserved + size > self.max_bytes:
+            return False
+        # 已预留但还没写入的空间也从空闲空间中扣除（保守估计）
+        return self.reserved + size <= self.free_bytes()
+
+    def stage(self, runner, job):
+        """预留暂存空间并把任务的输出路径改到暂存子目录，返回是否暂存
+
+        空间不足时等待其他任务发布；单个任务超过上限、没有其他任务可以等待或转换被停止时不暂存，直接写入输出目录。
+        """
+        size = estimate_output_size(job)
+        if self.max_bytes and size > self.max_bytes:
+            runner.log(f"预计输出 {format_size(size)} 超过暂存空间上限，直接写入输出目录\n", job)
+            return False
+        try:
+            os.makedirs(self.scratch_dir, exist_ok=True)
+        except OSError as e:
+            runner.log(f"⚠ 无法创建暂存目录: {str(e)}，直接写入输出目录\n", job)
+            return False
+
+        with self.condition:
+            waited = False
+            while not self.has_room(size):
+                if runner.stopped or not self.staged:
+                    break
+                if not waited:
+                    waited = True
+                    runner.log(f"等待暂存空间（预计输出 {format_size(size)}，"
+                               f"已预留 {format_size(self.reserved)}）...\n", job)
+                self.condition.wait(WAIT_INTERVAL)
+            if runner.stopped:
+                return False
+            if not self.has_room(size):
+                runner.log(f"暂存目录空间不足（预计输出 {format_size(size)}），直接写入输出目录\n", job)
+                return False
+            self.reserved += size
+
+        try:
+            directory = tempfile.mkdtemp(prefix=f"{SCRATCH_PREFIX}{job.index}_", dir=self.scratch_dir)
+        except OSError as e:
+            self.release(size)
+            runner.log(f"⚠ 无法创建暂存目录: {str(e)}，直接写入输出目录\n", job)
+            return False
+
+        staged = StagedJob(directory, size, job.output_file, list(job.extra_outputs),
+                           [rendition.output_file for rendition in job.renditions])
+        with self.condition:
+            self.staged[job] = staged
+        job.output_file = self.scratch_path(staged, job.output_file)
+        job.extra_outputs = [(output_format, self.scratch_path(staged, path))
+                             for output_format, path in job.extra_outputs]
+        for rendition in job.renditions:
+            rendition.output_file = self.scratch_path(staged, rendition.output_file)
+        runner.log(f"输出暂存到 {directory}（预留 {format_size(size)}）\n", job)
+        return True
+
+    def scratch_path(self, staged, path):
+        return os.path.join(staged.directory, os.path.basename(path))
+
+    def complete(self, runner, job, return_code):
+        """任务结束：成功时把暂存文件发布到输出目录，否则删除；恢复原来的输出路径，返回返回码
+
+        发布失败时返回-1（任务记为失败），输出目录中不会留下不完整的文件。
+        """
+        with self.condition:
+            staged = self.staged.pop(job, None)
+        if staged is None:
+            return return_code
+
+        pairs = [(job.output_file, staged.output_file)]
+        pairs += [(path, target) for (_, path), (_, target) in zip(job.extra_outputs, staged.extra_outputs)]
+        pairs += [(rendition.output_file, target)
+                  for rendition, target in zip(job.renditions, staged.rendition_files)]
+        if job.renditions:
+            # 多分辨率输出时job.output_file就是最高分辨率的输出
+            pairs = pairs[1:]
+        job.output_file = staged.output_file
+        job.extra_outputs = staged.extra_outputs
+        for rendition, target in zip(job.renditions, staged.rendition_files):
+            rendition.output_file = target
+
+        try:
+            if return_code == 0 and not runner.stopped:
+                return_code = self.publish(runner, job, pairs)
+        finally:
+            shutil.rmtree(staged.directory, ignore_errors=True)
+            self.release(staged.reserved)
+        return return_code
+
+    def publish(self, runner, job, pairs):
+        """分两步发布暂存文件，返回返回码
+
+        第一步把所有输出移到输出目录中的临时文件，失败时删除这些临时文件，原有的输出文件不受影响；
+        第二步逐个原子重命名为最终文件名。第二步中途失败时已经替换的文件都是完整的新输出，保留不删除。
+        """
+        start = time.perf_counter()
+        partials = []
+        copied = 0
+        try:
+            for source, target in pairs:
+                if not os.path.exists(source):
+                    # 没有生成的输出文件跳过
+                    continue
+                size = os.path.getsize(source)
+                partial, was_copied = move_to_partial(source, target)
+                partials.append((partial, target))
+                if was_copied:
+                    copied += size
+        except OSError as e:
+            runner.log(f"发布输出文件失败: {str(e)}，输出目录中原有的文件保持不变\n", job)
+            for partial, _ in partials:
+                remove_quietly(partial)
+            return -1
+
+        replaced = 0
+        try:
+            for partial, target in partials:
+                os.replace(partial, target)
+                replaced += 1
+        except OSError as e:
+            runner.log(f"发布输出文件失败: {str(e)}，已替换 {replaced}/{len(partials)} 个输出文件\n", job)
+            for partial, _ in partials[replaced:]:
+                remove_quietly(partial)
+            return -1
+        finally:
+            for directory in {os.path.dirname(os.path.abspath(target)) for _, target in partials}:
+                fsync_directory(directory)
+        elapsed = time.perf_counter() - start
+        job.metrics.publish_time = elapsed
+        if copied:
+            runner.log(f"已复制并发布 {len(partials)} 个输出文件（{format_size(copied)}，"
+                       f"{format_size(copied / max(elapsed, 1e-6))}/s）\n", job)
+        else:
+            runner.log(f"已发布 {len(partials)} 个输出文件（原子重命名）\n", job)
+        return 0
+
+    def release(self, size):
+        with self.condition:
+            self.reserved -= size
+            self.condition.notify_all()
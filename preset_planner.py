@@ -0,0 +1,208 @@
+"""时间预算自适应预设选择
+
+给一批任务指定完成时间（如2小时）后，先用第一个任务的一小段试编码测出实际速度，
+然后为每个开始转换的libx264任务选择能在预算内完成剩余任务的最慢（压缩率最高）预设。
+每个任务开始时都会根据已完成任务和正在运行任务的实测速度重新规划。
+"""
+import re
+import subprocess
+import threading
+import time
+
+import convert_engine as engine
+
+
+# x264预设，从快到慢
+X264_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+
+# 各预设相对medium的编码速度（经验值，实际速度由实测数据修正，这里只使用相对比例）
+PRESET_SPEED = {
+    "ultrafast": 6.0,
+    "superfast": 4.5,
+    "veryfast": 3.2,
+    "faster": 1.8,
+    "fast": 1.35,
+    "medium": 1.0,
+    "slow": 0.6,
+    "slower": 0.3,
+    "veryslow": 0.13,
+}
+
+# 试编码时长（秒）和使用的预设
+SAMPLE_SECONDS = 10
+SAMPLE_PRESET = "medium"
+
+# 只使用预算的这一比例，为估算误差留出余量
+SAFETY_FACTOR = 0.9
+
+# 没有媒体信息时假设的每帧像素数（1080p）
+DEFAULT_PIXELS = 1920 * 1080
+
+
+def parse_budget(value):
+    """解析时间预算，如"2h"、"90m"、"45s"、"1:30:00"、"3600"，返回秒数，无效时抛出ValueError"""
+    value = str(value).strip().lower()
+    if ":" in value:
+        seconds = engine.parse_timestamp(value if value.count(":") == 2 else f"0:{value}")
+        if seconds is None:
+            raise ValueError(f"无效的时间预算: {value}")
+        return seconds
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([hms]?)", value)
+    if not match:
+        raise ValueError(f"无效的时间预算: {value}")
+    number, unit = float(match.group(1)), match.group(2)
+    return number * {"h": 3600, "m": 60, "s": 1, "": 1}[unit]
+
+
+def job_pixels(job):
+    """任务输出每帧的像素数"""
+    if job.resolution and "x" in job.resolution:
+        try:
+            width, height = job.resolution.split("x")
+            return int(width) * int(height)
+        except ValueError:
+            pass
+    if job.media_info is not None and job.media_info.pixels:
+        return job.media_info.pixels
+    return DEFAULT_PIXELS
+
+
+class PresetPlanner:
+    """按时间预算为libx264任务选择预设
+
+    编码速度用"每秒处理的 媒体秒数×每帧像素数"表示，并换算到medium预设，
+    不同分辨率和时长的任务可以共用同一个速度估计。
+    """
+
+    def __init__(self, budget, slowest="veryslow", fastest="ultrafast", sample_seconds=SAMPLE_SECONDS):
+        self.budget = budget
+        self.presets = X264_PRESETS[X264_PRESETS.index(fastest):X264_PRESETS.index(slowest) + 1]
+        self.sample_seconds = sample_seconds
+        self.lock = threading.Lock()
+        # 试编码只做一次，其他工作线程等待结果
+        self.calibrate_lock = threading.Lock()
+        self.deadline = None
+        self.rate = None  # medium预设下单个进程的速度估计
+        self.calibrated = False
+
+    def applies(self, job):
+        """是否为该任务选择预设：只处理需要用libx264重新编码视频的任务"""
+        return job.video_codec == "libx264" and not job.copy_video
+
+    def begin(self, runner):
+        """批次开始时设置截止时间"""
+        with self.lock:
+            self.deadline = time.monotonic() + self.budget
+        runner.log(f"时间预算: {engine.format_duration(self.budget)}，"
+                   f"将在 {self.presets[0]} 到 {self.presets[-1]} 之间为每个任务选择预设\n")
+
+    def work(self, job, default_duration=0):
+        """任务的工作量：媒体秒数×每帧像素数"""
+        return (job.duration or default_duration) * job_pixels(job)
+
+    def calibrate(self, runner, job):
+        """用任务开头的一小段试编码，测出medium预设下的速度"""
+        sample = min(self.sample_seconds, job.duration)
+        if sample <= 0:
+            return
+        cmd = [
+            runner.ffmpeg_path,
+            "-hide_banner", "-loglevel", "error",
+            "-t", f"{sample:.3f}",
+            "-i", job.input_file,
+            "-map", "0:v:0", "-an", "-sn",
+            "-vcodec", job.video_codec,
+        ]
+        if job.resolution:
+            cmd.extend(["-s", job.resolution])
+        job.preset = SAMPLE_PRESET
+        cmd.extend([*engine.quality_args(job), "-f", "null", "-"])
+        job.preset = None
+        start = time.perf_counter()
+        try:
+            result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                    timeout=max(60, sample * 30), **engine.popen_options())
+        except (OSError, subprocess.TimeoutExpired):
+            return
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0 or elapsed <= 0:
+            return
+        rate = sample * job_pixels(job) / elapsed
+        with self.lock:
+            if self.rate is None:
+                self.rate = rate
+        runner.log(f"试编码 {sample:.1f} 秒用时 {elapsed:.2f} 秒（{SAMPLE_PRESET}，{sample / elapsed:.2f}x）\n", job)
+
+    def observe_running(self, runner):
+        """根据正在运行任务的最新速度修正速度估计"""
+        observed = []
+        with runner.lock:
+            running = [job for job in runner.jobs if job.state == "running" and job.preset]
+        for job in running:
+            with job.metrics.lock:
+                speed = job.metrics.speed_samples[-1] if job.metrics.speed_samples else None
+            if speed:
+                observed.append(speed * job_pixels(job) / PRESET_SPEED[job.preset])
+        return observed
+
+    def update_rate(self, observed):
+        """用新的实测速度更新估计（指数平均，新数据权重0.5）"""
+        with self.lock:
+            for rate in observed:
+                self.rate = rate if self.rate is None else 0.5 * self.rate + 0.5 * rate
+
+    def choose(self, runner, job):
+        """为任务选择预设，无法估算时返回None"""
+        self.update_rate(self.observe_running(runner))
+        with self.lock:
+            rate = self.rate
+            remaining_time = self.deadline - time.monotonic() if self.deadline is not None else None
+        if rate is None or remaining_time is None:
+            return None
+
+        with runner.lock:
+            jobs = [j for j in runner.jobs if self.applies(j) and j.state in ("pending", "running")]
+        known = [j.duration for j in jobs if j.duration]
+        # 时长未知的任务按已知任务的平均时长估算
+        default_duration = sum(known) / len(known) if known else 0
+
+        # 已经选定预设、正在运行的任务剩余所需时间
+        committed = 0
+        unplanned = 0
+        for j in jobs:
+            if j is not job and j.state == "running" and j.preset:
+                committed += self.work(j, default_duration) * (1 - j.progress / 100) / (rate * PRESET_SPEED[j.preset])
+            else:
+                unplanned += self.work(j, default_duration)
+
+        available = max(remaining_time, 0) * runner.max_workers * SAFETY_FACTOR - committed
+        for preset in reversed(self.presets):
+            if unplanned / (rate * PRESET_SPEED[preset]) <= available:
+                return preset
+        return self.presets[0]
+
+    def plan(self, runner, job):
+        """任务开始前选择预设"""
+        if not self.applies(job):
+            return
+        with self.calibrate_lock:
+            if not self.calibrated:
+                self.calibrated = True
+                self.calibrate(runner, job)
+        preset = self.choose(runner, job)
+        if preset is None:
+            runner.log("无法估算编码速度，使用默认预设\n", job)
+            return
+        job.preset = preset
+        with self.lock:
+            remaining = self.deadline - time.monotonic()
+        runner.log(f"预算剩余 {engine.format_duration(remaining)}，选择预设: {preset}\n", job)
+
+    def record(self, job):
+        """任务完成后用实际编码速度更新估计"""
+        if not self.applies(job) or job.state != "done" or not job.preset:
+            return
+        encode_time = job.metrics.encode_time
+        if not encode_time or not job.duration:
+            return
+        self.update_rate([self.work(job) / encode_time / PRESET_SPEED[job.preset]])
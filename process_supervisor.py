@@ -0,0 +1,433 @@
+"""基于asyncio的FFmpeg进程监控
+
+线程模式下每个FFmpeg进程需要两个线程分别阻塞读取stdout和stderr。
+监控器在一个后台线程中运行asyncio事件循环，在同一个事件循环中同时读取所有进程的输出，几十个并行进程也不需要额外的线程。
+POSIX上进程由监控器自己回收：用pidfd（Linux）在事件循环中得知进程退出后调用os.wait4，得到该进程自己的CPU时间；
+没有pidfd时每个进程用一个线程阻塞等待。Windows上用asyncio.create_subprocess_exec启动（不记录CPU时间）。
+超时（长时间没有输出）和取消用同一种方式处理：先终止进程，等待片刻后强制结束。
+
+ProcessSupervisor.run()把输出回调交回调用线程执行，回调中的阻塞操作（写入数据库、发送网络消息、图形界面事件）
+不会拖慢事件循环和其他进程；asyncio程序可以用EventStream / run_runner逐个读取事件。
+"""
+import asyncio
+import codecs
+import functools
+import os
+import queue
+import re
+import signal
+import subprocess
+import threading
+
+import convert_engine as engine
+
+
+# 输出结束后等待进程退出的时间（秒），超时后强制终止（与线程模式相同）
+EXIT_TIMEOUT = 5
+
+# 终止进程后等待退出的时间（秒），超时后强制结束
+TERMINATE_TIMEOUT = 2
+
+# 默认允许FFmpeg没有任何输出的最长时间（秒）：-progress每0.5秒输出一次，长时间没有输出说明进程已经卡住
+DEFAULT_IDLE_TIMEOUT = 600
+
+# 每次读取的字节数
+READ_SIZE = 64 * 1024
+
+# FFmpeg的状态行以\r结尾，按\r\n、\r、\n分行
+LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+
+# 进程中所有监控器共用的事件循环和运行它的线程
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def shared_loop():
+    """返回共用的事件循环，第一次调用时在后台线程中启动"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, daemon=True, name="process-supervisor").start()
+            _loop = loop
+        return _loop
+
+
+async def read_lines(stream, on_line, on_data=None):
+    """读取输出流直到结束，每行调用一次on_line(行 + "\\n")，空行跳过"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    while True:
+        chunk = await stream.read(READ_SIZE)
+        if on_data is not None:
+            on_data()
+        pending += decoder.decode(chunk, final=not chunk)
+        if chunk and pending.endswith("\r"):
+            # 可能是\r\n的前一半，留到下次
+            body, held = pending[:-1], "\r"
+        else:
+            body, held = pending, ""
+        *lines, rest = LINE_BREAK.split(body)
+        pending = rest + held
+        for line in lines:
+            if line and on_line is not None:
+                on_line(line + "\n")
+        if not chunk:
+            if pending.strip("\r") and on_line is not None:
+                on_line(pending.strip("\r") + "\n")
+            return
+
+
+def discard_spawned(spawn):
+    """结束启动后已经没有人需要的进程，在线程中回收（不阻塞事件循环）"""
+    if spawn.cancelled() or spawn.exception() is not None:
+        return
+    popen = spawn.result()
+    popen.kill()
+    threading.Thread(target=popen.communicate, daemon=True, name=f"discard-{popen.pid}").start()
+
+
+class ReapedProcess:
+    """POSIX上由监控器自己回收的子进程，提供asyncio.subprocess.Process的一部分接口（stdout、stderr、wait()、
+    terminate()、kill()、returncode），退出后usage为(用户态秒数, 内核态秒数)
+
+    用subprocess.Popen启动（在线程池中执行，fork/exec不阻塞事件循环），管道接到事件循环读取；
+    asyncio的子进程监视器不知道这个进程，不会先于os.wait4回收它。所有方法都在事件循环线程中调用。
+    """
+
+    def __init__(self, popen, loop):
+        self.popen = popen
+        self.pid = popen.pid
+        self.loop = loop
+        self.returncode = None
+        self.usage = None
+        self.stdout = None
+        self.stderr = None
+        self._exit = loop.create_future()
+
+    @classmethod
+    async def start(cls, cmd, merge_stderr=False):
+        """启动进程并把管道接到当前事件循环，无法启动时抛出OSError"""
+        loop = asyncio.get_running_loop()
+        spawn = loop.run_in_executor(None, functools.partial(
+            subprocess.Popen,
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT if merge_stderr else subprocess.PIPE,
+            **engine.popen_options()
+        ))
+        try:
+            popen = await asyncio.shield(spawn)
+        except asyncio.CancelledError:
+            # 启动期间被取消：进程启动后立即结束
+            spawn.add_done_callback(discard_spawned)
+            raise
+        process = cls(popen, loop)
+        process._watch_exit()
+        try:
+            process.stdout = await process._connect(popen.stdout)
+            if popen.stderr is not None:
+                process.stderr = await process._connect(popen.stderr)
+        except BaseException:
+            # 管道无法接到事件循环时不留下没人读取输出的进程
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            raise
+        return process
+
+    async def _connect(self, pipe):
+        reader = asyncio.StreamReader()
+        await self.loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        return reader
+
+    def _watch_exit(self):
+        """进程退出时回收：有pidfd时在事件循环中等待其可读，否则用一个线程阻塞等待"""
+        try:
+            pidfd = os.pidfd_open(self.pid)
+        except (AttributeError, OSError):
+            pidfd = None
+        if pidfd is not None:
+            def on_exit():
+                self.loop.remove_reader(pidfd)
+                os.close(pidfd)
+                self._reap(os.WNOHANG)
+            self.loop.add_reader(pidfd, on_exit)
+            return
+
+        def wait():
+            try:
+                result = os.wait4(self.pid, 0)
+            except ChildProcessError:
+                result = None
+            self.loop.call_soon_threadsafe(self._reaped, result)
+        threading.Thread(target=wait, daemon=True, name=f"reap-{self.pid}").start()
+
+    def _reap(self, options):
+        try:
+            result = os.wait4(self.pid, options)
+        except ChildProcessError:
+            result = None
+        self._reaped(result)
+
+    def _reaped(self, result):
+        if self._exit.done():
+            return
+        if result is None:
+            # 已被其他代码回收，返回码未知
+            self.returncode = -1
+        else:
+            _, status, usage = result
+            self.returncode = os.waitstatus_to_exitcode(status)
+            self.usage = (usage.ru_utime, usage.ru_stime)
+        # Popen对象不再尝试回收这个进程
+        self.popen.returncode = self.returncode
+        self._exit.set_result(self.returncode)
+
+    async def wait(self):
+        return await asyncio.shield(self._exit)
+
+    def send_signal(self, sig):
+        # 不能用Popen.send_signal：它会先调用poll()回收进程，丢失CPU时间
+        if self.returncode is not None:
+            raise ProcessLookupError(self.pid)
+        os.kill(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class SupervisedProcess:
+    """监控器中的进程，提供subprocess.Popen的一部分接口（ConversionRunner.stop和资源管理器使用）
+
+    可以在任何线程中调用，终止信号转到事件循环线程发送。
+    """
+
+    def __init__(self, supervisor, process, args):
+        self.supervisor = supervisor
+        self.process = process
+        self.pid = process.pid
+        self.args = args
+        self.returncode = None
+        self.timed_out = None  # 因超时被终止时为原因说明
+        self.usage = None  # 进程自己的CPU时间(用户态秒数, 内核态秒数)，无法获取时为None
+        self._exited = threading.Event()
+
+    def _signal(self, name):
+        if self.process.returncode is None:
+            try:
+                getattr(self.process, name)()
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.supervisor.loop.call_soon_threadsafe(self._signal, "terminate")
+
+    def kill(self):
+        self.supervisor.loop.call_soon_threadsafe(self._signal, "kill")
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if not self._exited.wait(timeout):
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        return self.returncode
+
+
+class ProcessSupervisor:
+    """在后台asyncio事件循环中运行和监控FFmpeg进程（进程中的所有监控器共用一个事件循环）
+
+    idle_timeout为允许进程没有任何输出的最长时间（秒），None或0表示不限制。
+    """
+
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+
+    @property
+    def loop(self):
+        return shared_loop()
+
+    def submit(self, coroutine):
+        """在事件循环中运行协程，返回concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, cmd, on_stdout=None, on_stderr=None, on_start=None, on_timeout=None, merge_stderr=False):
+        """运行进程直到结束（阻塞调用线程），返回返回码；无法启动进程时抛出OSError
+
+        回调不在事件循环线程中执行：事件循环把每次回调放入队列，由调用线程按顺序执行，
+        回调阻塞时只影响这一个进程的处理。回调抛出异常时终止进程，进程结束后在调用线程中重新抛出。
+        """
+        calls = queue.Queue()
+
+        def deliver(callback):
+            if callback is None:
+                return None
+            return lambda *args: calls.put((callback, args))
+
+        future = self.submit(self.supervise(cmd, deliver(on_stdout), deliver(on_stderr), deliver(on_start),
+                                            deliver(on_timeout), merge_stderr))
+        future.add_done_callback(lambda _: calls.put(None))
+        error = None
+        try:
+            while True:
+                item = calls.get()
+                if item is None:
+                    break
+                if error is not None:
+                    # 出错后剩余的回调丢弃，等待进程被终止
+                    continue
+                callback, args = item
+                try:
+                    callback(*args)
+                except Exception as e:
+                    error = e
+                    future.cancel()
+        except BaseException:
+            # 调用线程被中断时终止进程
+            future.cancel()
+            raise
+        if error is not None:
+            raise error
+        return future.result()
+
+    async def supervise(self, cmd, on_stdout=None, on_stderr=None, on_start=None, on_timeout=None,
+                        merge_stderr=False):
+        """启动进程并读取输出，on_stdout/on_stderr在每行输出时调用，on_start(SupervisedProcess)在进程启动后调用
+
+        回调在事件循环线程中调用（不能阻塞），需要阻塞的回调应通过run()运行。
+        merge_stderr为True时stderr合并到stdout（旧版FFmpeg的状态行模式）。超过idle_timeout秒没有输出时
+        终止进程，调用on_timeout(原因)并返回-1。协程被取消时同样终止进程。
+        """
+        if hasattr(os, "wait4"):
+            process = await ReapedProcess.start(cmd, merge_stderr)
+        else:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT if merge_stderr else subprocess.PIPE,
+                **engine.popen_options()
+            )
+        handle = SupervisedProcess(self, process, cmd)
+        loop = asyncio.get_running_loop()
+        last_output = [loop.time()]
+
+        def touch():
+            last_output[0] = loop.time()
+
+        streams = [read_lines(process.stdout, on_stdout, touch)]
+        if not merge_stderr:
+            streams.append(read_lines(process.stderr, on_stderr, touch))
+        reading = asyncio.ensure_future(asyncio.gather(*streams))
+        try:
+            if on_start is not None:
+                on_start(handle)
+            reason = await self._wait_output(reading, last_output)
+            if reason is not None:
+                handle.timed_out = reason
+                if on_timeout is not None:
+                    on_timeout(reason)
+                await self._terminate(process)
+                await self._drain(reading)
+                return_code = -1
+            else:
+                try:
+                    return_code = await asyncio.wait_for(process.wait(), EXIT_TIMEOUT)
+                except asyncio.TimeoutError:
+                    handle.timed_out = f"输出结束后 {EXIT_TIMEOUT} 秒仍未退出"
+                    if on_timeout is not None:
+                        on_timeout(handle.timed_out)
+                    await self._terminate(process)
+                    return_code = -1
+            return return_code
+        except BaseException:
+            # 被取消或处理输出时出错
+            await asyncio.shield(self._terminate(process))
+            reading.cancel()
+            raise
+        finally:
+            handle.returncode = process.returncode if process.returncode is not None else -1
+            handle.usage = getattr(process, "usage", None)
+            handle._exited.set()
+
+    async def _wait_output(self, reading, last_output):
+        """等待输出结束，超时时返回原因说明，正常结束时返回None"""
+        loop = asyncio.get_running_loop()
+        while True:
+            wait = max(last_output[0] + self.idle_timeout - loop.time(), 0) if self.idle_timeout else None
+            try:
+                await asyncio.wait_for(asyncio.shield(reading), wait)
+                return None
+            except asyncio.TimeoutError:
+                if loop.time() - last_output[0] >= self.idle_timeout:
+                    return f"{self.idle_timeout:g} 秒没有输出"
+
+    async def _terminate(self, process):
+        """先终止进程，超时后强制结束"""
+        if process.returncode is not None:
+            return
+        try:
+            process.terminate()
+        except ProcessLookupError:
+            return
+        try:
+            await asyncio.wait_for(process.wait(), TERMINATE_TIMEOUT)
+        except asyncio.TimeoutError:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+
+    async def _drain(self, reading):
+        """进程终止后读完剩余的输出"""
+        try:
+            await asyncio.wait_for(reading, TERMINATE_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            reading.cancel()
+
+
+class EventStream:
+    """把执行器事件转到asyncio队列，asyncio程序用async for读取（on_event可以在任何线程中调用）"""
+
+    def __init__(self, loop=None):
+        self.loop = loop or asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    def __call__(self, event):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+    def close(self):
+        """事件结束，async for随之结束"""
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self.queue.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+
+async def run_runner(runner):
+    """在asyncio程序中执行批量转换，逐个产生转换事件（最后一个为batch_done或error）
+
+        async for event in run_runner(runner):
+            ...
+    """
+    stream = EventStream()
+    runner.on_event = stream
+    future = asyncio.get_running_loop().run_in_executor(None, runner.run)
+    future.add_done_callback(lambda _: stream.close())
+    async for event in stream:
+        yield event
+    await future
@@ -0,0 +1,200 @@
+"""多分辨率输出（码率阶梯）
+
+同一个源文件需要输出1080p、720p、480p等多个分辨率时，只启动一个FFmpeg进程、只解码一次：
+在一个滤镜图中用split把解码后的画面分成多路，每一路分别scale后编码，写入各自的输出文件。
+每个分辨率的进度和输出大小单独报告，停止转换时逐个删除不完整的输出文件。
+"""
+import os
+import re
+import threading
+
+import convert_engine as engine
+
+
+# 分辨率名称，如"1080p" -> "1920x1080"（来自界面上的分辨率选项）
+RENDITION_NAMES = {
+    label.split(" (")[0]: engine.parse_resolution(label)
+    for label in engine.RESOLUTIONS if " (" in label
+}
+
+DEFAULT_LADDER = ["1080p", "720p", "480p"]
+
+
+def parse_ladder(value):
+    """解析分辨率列表，如"1080p,720p,480p"或"1920x1080,1280x720"，返回[(名称, 分辨率)]，无效时抛出ValueError"""
+    renditions = []
+    for name in re.split(r"[,\s]+", str(value).strip()):
+        if not name:
+            continue
+        if name in RENDITION_NAMES:
+            resolution = RENDITION_NAMES[name]
+        elif re.fullmatch(r"\d+x\d+", name):
+            resolution = name
+        else:
+            raise ValueError(f"无效的分辨率: {name}（可用：{', '.join(RENDITION_NAMES)}，或宽x高）")
+        if resolution not in [r for _, r in renditions]:
+            renditions.append((name, resolution))
+    if not renditions:
+        raise ValueError("没有指定分辨率")
+    return renditions
+
+
+def rendition_path(output_file, name):
+    """分辨率对应的输出文件：原始文件名_converted_720p.mp4"""
+    base, ext = os.path.splitext(output_file)
+    return f"{base}_{name}{ext}"
+
+
+def pixels_of(resolution):
+    width, height = resolution.split("x")
+    return int(width) * int(height)
+
+
+def bitrate_kbits(bitrate):
+    """解析码率，如"10M" -> 10000、"800K" -> 800（kbit/s），无法解析时返回None"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([kKmM]?)", bitrate or "")
+    if not match:
+        return None
+    number, unit = float(match.group(1)), match.group(2).lower()
+    return number * {"": 0.001, "k": 1, "m": 1000}[unit]
+
+
+class Rendition:
+    """多分辨率输出中的一路"""
+
+    def __init__(self, name, resolution, output_file):
+        self.name = name
+        self.resolution = resolution
+        self.output_file = output_file
+        self.bitrate = ""
+        self.state = "pending"
+        self.progress = 0.0
+        self.size = 0
+
+    def __repr__(self):
+        return f"Rendition({self.name!r}, {self.resolution}, {self.state}, {self.progress:.1f}%)"
+
+
+def build_ladder_command(ffmpeg_path, job, renditions, global_args=None):
+    """构建一个进程输出多个分辨率的命令：split分路，每路scale后编码"""
+    count = len(renditions)
+    branches = "".join(f"[v{i}]" for i in range(count))
+    filters = [f"[0:v:0]split={count}{branches}"]
+    filters.extend(f"[v{i}]scale={r.resolution.replace('x', ':')}[out{i}]" for i, r in enumerate(renditions))
+    has_audio = job.media_info is None or job.media_info.audio is not None
+
+    cmd = [
+        ffmpeg_path,
+        *(global_args or []),
+        "-i", job.input_file,
+        "-y",
+        "-filter_complex", ";".join(filters),
+    ]
+    for i, rendition in enumerate(renditions):
+        cmd.extend(["-map", f"[out{i}]"])
+        if has_audio:
+            # 没有媒体信息时音频流可能不存在，用?忽略
+            cmd.extend(["-map", "0:a:0?", "-acodec", "copy" if job.copy_audio else job.audio_codec])
+        cmd.extend(["-vcodec", job.video_codec])
+        if rendition.bitrate:
+            cmd.extend(["-b:v", rendition.bitrate])
+        cmd.extend(engine.quality_args(job))
+        cmd.append(rendition.output_file)
+    return cmd
+
+
+class RenditionLadder:
+    """多分辨率输出编码器，由ConversionRunner在转换每个任务时调用"""
+
+    def __init__(self, renditions=None):
+        # [(名称, 分辨率)]，从高到低
+        self.renditions = sorted(renditions or parse_ladder(",".join(DEFAULT_LADDER)),
+                                 key=lambda item: pixels_of(item[1]), reverse=True)
+
+    def prepare(self, job):
+        """批次开始前为任务创建各分辨率的输出，job.output_file为最高分辨率的输出
+
+        job.resolution记录所有分辨率（任务清单据此判断参数是否变化），没有视频流的文件不使用多分辨率输出。
+        """
+        if job.media_info is not None and job.media_info.video is None:
+            return
+        if not job.renditions:
+            job.renditions = [Rendition(name, resolution, rendition_path(job.output_file, name))
+                              for name, resolution in self.renditions]
+            job.output_file = job.renditions[0].output_file
+            job.resolution = ",".join(resolution for _, resolution in self.renditions)
+        # 指定了码率时作为最高分辨率的码率，其他分辨率按像素数等比例降低
+        top_kbits = bitrate_kbits(job.bitrate)
+        top_pixels = pixels_of(job.renditions[0].resolution)
+        for rendition in job.renditions:
+            rendition.state = "pending"
+            rendition.progress = 0.0
+            rendition.size = 0
+            rendition.bitrate = job.bitrate
+            if top_kbits:
+                rendition.bitrate = f"{max(int(top_kbits * pixels_of(rendition.resolution) / top_pixels), 1)}k"
+
+    def should_use(self, job):
+        return bool(job.renditions)
+
+    def convert(self, runner, job):
+        """用一个FFmpeg进程输出所有分辨率，返回返回码"""
+        cmd = build_ladder_command(runner.ffmpeg_path, job, job.renditions,
+                                   engine.progress_args("pipe", runner.stats_period, "error"))
+        runner.log(f"多分辨率输出（{', '.join(r.name for r in job.renditions)}）: {' '.join(cmd)}\n", job)
+        for rendition in job.renditions:
+            rendition.state = "running"
+        return_code = runner.run_process(job, ("ladder", job.index), cmd, self.progress_reporter(runner, job))
+
+        if runner.stopped:
+            # 逐个删除不完整的输出
+            for rendition in job.renditions:
+                rendition.state = "stopped"
+                if os.path.exists(rendition.output_file):
+                    try:
+                        os.remove(rendition.output_file)
+                        runner.log(f"已删除不完整的输出文件（{rendition.name}）: "
+                                   f"{os.path.basename(rendition.output_file)}\n", job)
+                    except OSError as e:
+                        runner.log(f"删除不完整文件失败（{rendition.name}）: {str(e)}\n", job)
+            return return_code
+
+        for rendition in job.renditions:
+            rendition.state = "done" if return_code == 0 else "failed"
+            try:
+                rendition.size = os.path.getsize(rendition.output_file)
+            except OSError:
+                rendition.size = 0
+            if return_code == 0:
+                rendition.progress = 100.0
+                runner.log(f"{rendition.name}（{rendition.resolution}）: {rendition.size / 1024 / 1024:.1f} MiB "
+                           f"-> {rendition.output_file}\n", job)
+        return return_code
+
+    def progress_reporter(self, runner, job):
+        """各分辨率在同一个进程中同步编码：按已输出时长计算进度，并记录每个输出文件的当前大小"""
+        lock = threading.Lock()
+        count = [0]
+
+        def report(out_time, stats):
+            with lock:
+                count[0] += 1
+                update_count = count[0]
+            if stats.finished:
+                percent = 100.0
+            elif out_time is not None and job.duration > 0:
+                percent = min(out_time / job.duration * 100, 100)
+            else:
+                percent = job.progress
+            for rendition in job.renditions:
+                rendition.progress = percent
+                try:
+                    rendition.size = os.path.getsize(rendition.output_file)
+                except OSError:
+                    pass
+            with runner.lock:
+                job.progress = percent
+            job.metrics.add_sample(stats)
+            runner.emit("progress", job, percent=percent, overall=runner.overall_progress(),
+                        count=update_count, stats=stats, renditions=job.renditions)
+        return report
@@ -0,0 +1,200 @@
+"""并行任务的CPU资源分配
+
+多个FFmpeg进程同时运行时默认各自按全部核心数创建线程，互相争抢CPU。资源管理器把全局线程预算
+平均分给正在运行的任务（-threads / -filter_threads），可以把每个任务绑定到互不重叠的CPU集合
+（os.sched_setaffinity），并降低FFmpeg进程的CPU和磁盘优先级（nice / ionice），
+避免批量转换影响同一台机器上的其他工作。任务开始和结束时重新分配：新任务按当前任务数分配线程，
+正在运行的进程重新绑定CPU（线程数在进程启动后不能修改）。
+"""
+import ctypes
+import ctypes.util
+import os
+import platform
+import sys
+import threading
+
+
+# ionice优先级类别
+IOPRIO_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+
+# ioprio_set系统调用号
+IOPRIO_SET_SYSCALLS = {"x86_64": 251, "amd64": 251, "i386": 289, "i686": 289, "aarch64": 30, "arm64": 30,
+                       "armv7l": 314, "ppc64le": 273, "s390x": 282, "riscv64": 30}
+
+# Windows进程优先级类别
+BELOW_NORMAL_PRIORITY_CLASS = 0x00004000
+IDLE_PRIORITY_CLASS = 0x00000040
+PROCESS_SET_INFORMATION = 0x0200
+
+
+def available_cpus():
+    """当前进程可以使用的CPU编号"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cpus(cpus, count):
+    """把CPU分成count个互不重叠的连续集合；任务数多于CPU数时每个任务一个CPU（轮流使用）"""
+    if count <= 0:
+        return []
+    if count >= len(cpus):
+        return [{cpus[i % len(cpus)]} for i in range(count)]
+    size, extra = divmod(len(cpus), count)
+    sets = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        sets.append(set(cpus[start:end]))
+        start = end
+    return sets
+
+
+def format_cpus(cpus):
+    """格式化CPU集合，如{0, 1, 2, 5} -> "0-2,5" """
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def thread_ids(pid):
+    """进程的所有线程编号（Linux上亲和性和nice值按线程设置），无法读取时只返回进程编号"""
+    try:
+        return [int(tid) for tid in os.listdir(f"/proc/{pid}/task")]
+    except (OSError, ValueError):
+        return [pid]
+
+
+def set_ionice(pid, ioclass, level=7):
+    """设置Linux进程的磁盘优先级，不支持时返回False"""
+    number = IOPRIO_SET_SYSCALLS.get(platform.machine().lower())
+    if not sys.platform.startswith("linux") or number is None:
+        return False
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    value = (IOPRIO_CLASSES[ioclass] << IOPRIO_CLASS_SHIFT) | (0 if ioclass == "idle" else level)
+    return libc.syscall(number, IOPRIO_WHO_PROCESS, pid, value) == 0
+
+
+def set_windows_priority(pid, nice):
+    """Windows上按nice值设置进程优先级类别"""
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenProcess(PROCESS_SET_INFORMATION, False, pid)
+    if not handle:
+        return False
+    try:
+        priority = IDLE_PRIORITY_CLASS if nice >= 15 else BELOW_NORMAL_PRIORITY_CLASS
+        return bool(kernel32.SetPriorityClass(handle, priority))
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+class ResourceManager:
+    """在正在运行的任务之间分配线程预算和CPU，由ConversionRunner在任务开始、结束和创建进程时调用
+
+    total_threads为全局线程预算（默认为可用CPU数）；pin为True时把每个任务绑定到单独的CPU集合；
+    nice为FFmpeg进程的nice值（0表示不修改）；ionice为磁盘优先级类别（idle / best-effort，None表示不修改）。
+    """
+
+    def __init__(self, total_threads=None, pin=False, nice=0, ionice=None):
+        self.cpus = available_cpus()
+        self.total_threads = total_threads or len(self.cpus)
+        self.pin = pin and hasattr(os, "sched_setaffinity")
+        self.nice = nice
+        self.ionice = ionice
+        self.lock = threading.Lock()
+        self.active = []  # 正在运行的任务（按开始顺序）
+        self.cpu_sets = {}  # 任务 -> CPU集合
+        self.processes = {}  # 进程键 -> (任务, 进程)
+        self.warned = False
+
+    def describe(self):
+        parts = [f"线程预算 {self.total_threads}"]
+        if self.pin:
+            parts.append(f"绑定CPU（{format_cpus(self.cpus)}）")
+        if self.nice:
+            parts.append(f"nice {self.nice}")
+        if self.ionice:
+            parts.append(f"ionice {self.ionice}")
+        return "，".join(parts)
+
+    def start(self, runner, job):
+        """任务开始：按同时运行的任务数分配线程，并重新划分CPU
+
+        同时运行的任务数按正在运行的任务数和执行器的并行数（剩余任务较少时为剩余任务数）中较大的计算，
+        批次刚开始时第一个任务不会占用全部线程。
+        """
+        with runner.lock:
+            remaining = sum(1 for j in runner.jobs if j.state in ("pending", "running"))
+        with self.lock:
+            self.active.append(job)
+            slots = max(len(self.active), min(runner.max_workers, remaining))
+            job.threads = max(1, self.total_threads // slots)
+            self.rebalance()
+            cpus = self.cpu_sets.get(job)
+        message = f"资源分配: {job.threads} 个线程"
+        if cpus:
+            message += f"，CPU {format_cpus(cpus)}"
+        runner.log(message + "\n", job)
+
+    def finish(self, job):
+        """任务结束：释放线程和CPU，其余任务重新划分CPU"""
+        with self.lock:
+            if job in self.active:
+                self.active.remove(job)
+            self.cpu_sets.pop(job, None)
+            self.rebalance()
+
+    def attach(self, key, job, process):
+        """登记任务的FFmpeg进程，设置优先级和CPU亲和性"""
+        self.apply_priority(process.pid)
+        with self.lock:
+            self.processes[key] = (job, process)
+            cpus = self.cpu_sets.get(job)
+        if cpus:
+            self.apply_affinity(process, cpus)
+
+    def detach(self, key):
+        with self.lock:
+            self.processes.pop(key, None)
+
+    def rebalance(self):
+        """重新划分CPU（调用方持有self.lock）：每个运行中的任务一个集合，已经运行的进程立即重新绑定"""
+        if not self.pin:
+            return
+        self.cpu_sets = dict(zip(self.active, split_cpus(self.cpus, len(self.active))))
+        for job, process in self.processes.values():
+            cpus = self.cpu_sets.get(job)
+            if cpus:
+                self.apply_affinity(process, cpus)
+
+    def apply_affinity(self, process, cpus):
+        if process.returncode is not None:
+            return
+        for tid in thread_ids(process.pid):
+            try:
+                os.sched_setaffinity(tid, cpus)
+            except OSError:
+                # 进程或线程已经退出
+                pass
+
+    def apply_priority(self, pid):
+        """降低进程（所有线程）的CPU和磁盘优先级"""
+        try:
+            if self.nice and sys.platform == "win32":
+                set_windows_priority(pid, self.nice)
+            elif self.nice:
+                for tid in thread_ids(pid):
+                    os.setpriority(os.PRIO_PROCESS, tid, self.nice)
+            if self.ionice:
+                for tid in thread_ids(pid):
+                    set_ionice(tid, self.ionice)
+        except OSError as e:
+            if not self.warned:
+                self.warned = True
+                print(f"设置进程优先级失败: {e}", file=sys.stderr)
@@ -0,0 +1,283 @@
+"""长视频分段并行编码
+
+单个FFmpeg进程编码长视频时，libx264无法用满所有CPU核心。分段模式在关键帧处把视频切成
+若干时间段，每段由独立的FFmpeg进程并行编码，音频单独处理一次，最后用concat分离器
+直接复制（不重新编码）拼接成输出文件。一个分段或音频失败时立即终止同一任务的其他进程，
+不再等待注定要丢弃的分段编码完成。
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import convert_engine as engine
+
+
+# 默认每段时长（秒）
+DEFAULT_SEGMENT_LENGTH = 120
+# 时长达到该值（秒）的视频才分段编码
+DEFAULT_MIN_DURATION = 600
+
+# 读取关键帧的超时时间（秒），需要读完整个文件的数据包，比media_probe的分析超时长
+KEYFRAME_TIMEOUT = 300
+
+
+def default_segment_workers():
+    """默认同时编码的分段数：每段进程约占用2个核心"""
+    return max(2, (os.cpu_count() or 1) // 2)
+
+
+def find_keyframes(ffprobe_path, input_file, timeout=KEYFRAME_TIMEOUT):
+    """读取第一个视频流所有关键帧的时间（秒），ffprobe出错或超时（进程被终止）时返回None
+
+    只读取数据包标志而不解码，长视频也能较快完成。
+    """
+    cmd = [
+        ffprobe_path,
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=print_section=0",
+        input_file
+    ]
+    try:
+        result = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            timeout=timeout,
+            **engine.popen_options()
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if not flags.startswith("K"):
+            continue
+        try:
+            keyframes.append(float(pts_time))
+        except ValueError:
+            continue
+    return sorted(set(keyframes))
+
+
+def plan_segments(keyframes, duration, segment_length):
+    """根据关键帧规划分段，返回[(开始, 结束), ...]，每段从关键帧开始
+
+    每段长度约为segment_length，最后一段过短时合并到前一段。
+    """
+    boundaries = [0.0]
+    target = segment_length
+    for keyframe in keyframes:
+        if keyframe >= duration:
+            break
+        if keyframe >= target and keyframe - boundaries[-1] >= segment_length / 2:
+            boundaries.append(keyframe)
+            target = keyframe + segment_length
+
+    # 最后一段太短时合并到前一段
+    if len(boundaries) > 1 and duration - boundaries[-1] < segment_length / 4:
+        boundaries.pop()
+
+    ends = boundaries[1:] + [duration]
+    return list(zip(boundaries, ends))
+
+
+def build_segment_command(ffmpeg_path, job, start, end, segment_file, global_args=None, threads=None):
+    """构建单个分段的编码命令（只编码视频，音频单独处理），threads为每个分段进程的线程数"""
+    cmd = [
+        ffmpeg_path,
+        *(global_args or []),
+        "-ss", f"{start:.6f}",
+        "-i", job.input_file,
+        "-t", f"{end - start:.6f}",
+        "-map", "0:v:0",
+        "-an", "-sn",
+        "-vcodec", job.video_codec,
+    ]
+    if job.resolution:
+        cmd.extend(["-s", job.resolution])
+    if job.bitrate:
+        cmd.extend(["-b:v", job.bitrate])
+    cmd.extend(engine.quality_args(job, threads))
+    cmd.extend(["-y", segment_file])
+    return cmd
+
+
+def build_audio_command(ffmpeg_path, job, audio_file, global_args=None):
+    """构建音频处理命令：可以直接复制时复制，否则重新编码"""
+    return [
+        ffmpeg_path,
+        *(global_args or []),
+        "-i", job.input_file,
+        "-map", "0:a:0",
+        "-vn", "-sn",
+        "-acodec", "copy" if job.copy_audio else job.audio_codec,
+        "-y", audio_file
+    ]
+
+
+def write_concat_list(list_file, segment_files):
+    """写入concat分离器使用的文件列表"""
+    with open(list_file, "w", encoding="utf-8") as f:
+        for segment_file in segment_files:
+            escaped = segment_file.replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+
+def build_concat_command(ffmpeg_path, job, list_file, audio_file=None):
+    """构建拼接命令：用concat分离器拼接视频分段并合并音频，全部直接复制"""
+    cmd = [
+        ffmpeg_path,
+        "-hide_banner", "-loglevel", "error",
+        "-f", "concat", "-safe", "0",
+        "-i", list_file,
+    ]
+    if audio_file:
+        cmd.extend(["-i", audio_file])
+    cmd.extend(["-map", "0:v"])
+    if audio_file:
+        cmd.extend(["-map", "1:a"])
+    cmd.extend(["-c", "copy", "-y", job.output_file])
+    return cmd
+
+
+class SegmentEncoder:
+    """分段并行编码器，由ConversionRunner在转换长视频时调用"""
+
+    def __init__(self, ffprobe_path, segment_length=DEFAULT_SEGMENT_LENGTH, max_workers=None,
+                 min_duration=DEFAULT_MIN_DURATION):
+        self.ffprobe_path = ffprobe_path
+        self.segment_length = segment_length
+        self.max_workers = max_workers or default_segment_workers()
+        self.min_duration = min_duration
+
+    def should_split(self, job):
+        """是否对该任务分段编码：需要重新编码视频、时长已知并且足够长"""
+        return (
+            self.segment_length > 0
+            and job.media_info is not None
+            and job.media_info.video is not None
+            and not job.copy_video
+            and job.duration >= max(self.min_duration, self.segment_length * 2)
+        )
+
+    def convert(self, runner, job):
+        """分段编码并拼接，返回返回码（0表示成功）"""
+        keyframes = find_keyframes(self.ffprobe_path, job.input_file)
+        if keyframes is None:
+            runner.log("无法读取关键帧（ffprobe出错或超时），改为整体编码\n", job)
+            return runner.convert_single(job)
+        segments = plan_segments(keyframes, job.duration, self.segment_length)
+        if len(segments) < 2:
+            runner.log("关键帧不足，无法分段，改为整体编码\n", job)
+            return runner.convert_single(job)
+
+        runner.log(f"分段并行编码: {len(segments)} 段，每段约 {self.segment_length} 秒，"
+                   f"同时编码 {min(self.max_workers, len(segments))} 段\n", job)
+
+        # concat分离器按列表文件所在目录解析相对路径，这里统一使用绝对路径
+        output_dir = os.path.dirname(os.path.abspath(job.output_file))
+        work_dir = tempfile.mkdtemp(prefix=".segments_", dir=output_dir)
+        try:
+            return self._convert_segments(runner, job, segments, work_dir)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _convert_segments(self, runner, job, segments, work_dir):
+        """编码所有分段和音频，然后拼接"""
+        segment_files = [os.path.join(work_dir, f"segment_{k:05d}.mkv") for k in range(len(segments))]
+        segment_progress = [0.0] * len(segments)
+        progress_lock = threading.Lock()
+        total_length = sum(end - start for start, end in segments)
+        update_count = [0]
+
+        # 一个进程失败后不再启动新的分段，并终止同一任务的其他进程
+        audio_key = ("audio", job.index)
+        segment_keys = [("segment", job.index, k) for k in range(len(segments))]
+        failure = []  # [(失败的进程, 返回码)]，只记录第一个
+        cancelled = threading.Event()
+
+        def cancel_siblings(name, return_code):
+            with progress_lock:
+                if cancelled.is_set():
+                    return
+                failure.append((name, return_code))
+                cancelled.set()
+            runner.signal_processes([audio_key] + segment_keys)
+
+        def report(k, out_time, stats):
+            """汇总所有分段的进度"""
+            if cancelled.is_set():
+                # 检查取消与登记进程之间启动的分段，收到进度时再终止
+                runner.signal_processes([segment_keys[k]])
+                return
+            start, end = segments[k]
+            with progress_lock:
+                segment_progress[k] = min(out_time, end - start) if out_time is not None else segment_progress[k]
+                percent = min(sum(segment_progress) / total_length * 100, 100)
+                update_count[0] += 1
+                count = update_count[0]
+            with runner.lock:
+                job.progress = percent
+            job.metrics.add_sample(stats)
+            runner.emit("progress", job, percent=percent, overall=runner.overall_progress(),
+                        count=count, stats=stats)
+
+        global_args = engine.progress_args("pipe", runner.stats_period, "error")
+        # 资源管理器分配给任务的线程数由同时编码的分段平分（不修改job.threads，性能数据中仍为任务的线程数）
+        segment_threads = None
+        if job.threads:
+            segment_threads = max(1, job.threads // min(self.max_workers, len(segments)))
+
+        def encode_segment(k):
+            if cancelled.is_set():
+                return -1
+            start, end = segments[k]
+            cmd = build_segment_command(runner.ffmpeg_path, job, start, end, segment_files[k], global_args,
+                                        segment_threads)
+            return_code = runner.run_process(job, segment_keys[k], cmd,
+                                             lambda out_time, stats: report(k, out_time, stats))
+            if return_code != 0:
+                cancel_siblings(f"第 {k + 1} 段", return_code)
+            return return_code
+
+        def encode_audio(cmd):
+            return_code = runner.run_process(job, audio_key, cmd)
+            if return_code != 0:
+                cancel_siblings("音频", return_code)
+            return return_code
+
+        audio_file = None
+        futures = []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(segments)) + 1) as executor:
+            if job.media_info.audio is not None:
+                audio_file = os.path.join(work_dir, "audio.mka")
+                audio_cmd = build_audio_command(runner.ffmpeg_path, job, audio_file, global_args)
+                futures.append(executor.submit(encode_audio, audio_cmd))
+            futures.extend(executor.submit(encode_segment, k) for k in range(len(segments)))
+            for future in futures:
+                future.result()
+
+        if runner.stopped:
+            return -1
+        if failure:
+            name, return_code = failure[0]
+            runner.log(f"{name}编码失败，已终止其余分段\n", job)
+            return return_code if return_code is not None else -1
+
+        # 拼接所有分段（直接复制，不重新编码）
+        list_file = os.path.join(work_dir, "segments.txt")
+        write_concat_list(list_file, segment_files)
+        concat_cmd = build_concat_command(runner.ffmpeg_path, job, list_file, audio_file)
+        runner.log(f"拼接分段: {' '.join(concat_cmd)}\n", job)
+        return runner.run_process(job, ("concat", job.index), concat_cmd)
@@ -0,0 +1,185 @@
+"""目标文件大小模式
+
+根据ffprobe分析得到的时长和音频码率计算视频码率，使输出文件大小接近指定值。
+libx264使用两遍编码：第一遍只分析视频（x264默认对第一遍使用快速设置），第二遍按分析结果分配码率。
+每个任务的两遍编码日志保存在输出目录下单独的临时目录中，并行任务之间互不干扰。
+其他编码器不支持-pass，使用单遍固定码率（带-maxrate/-bufsize限制）编码。
+"""
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+import convert_engine as engine
+
+
+# 默认音频码率（kbit/s）
+DEFAULT_AUDIO_BITRATE = 128
+
+# 容器开销（文件头、索引等）按目标大小的这一比例预留
+CONTAINER_OVERHEAD = 0.02
+
+# 视频码率下限（kbit/s），目标大小过小时使用
+MIN_VIDEO_BITRATE = 100
+
+# 支持两遍编码的编码器
+TWO_PASS_ENCODERS = {"libx264"}
+
+# 第一遍在总进度中所占比例（第一遍比第二遍快）
+FIRST_PASS_WEIGHT = 0.3
+
+
+def parse_size(value):
+    """解析文件大小，如"700M"、"1.5G"、"500K"、"123456"（字节），返回字节数，无效时抛出ValueError"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([kmg]?)i?b?", str(value).strip().lower())
+    if not match:
+        raise ValueError(f"无效的文件大小: {value}")
+    number, unit = float(match.group(1)), match.group(2)
+    return int(number * {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}[unit])
+
+
+def strip_rate_control(args):
+    """去掉质量参数中的-crf/-qp/-b:v，目标大小模式只按码率控制"""
+    result = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+            continue
+        if arg in ("-crf", "-qp", "-b:v"):
+            skip = True
+            continue
+        result.append(arg)
+    return result
+
+
+def video_bitrate_for(target_size, duration, audio_bitrate):
+    """计算视频码率（kbit/s）：(目标大小 - 容器开销) / 时长 - 音频码率"""
+    if not duration or duration <= 0:
+        return None
+    total_kbits = target_size * 8 * (1 - CONTAINER_OVERHEAD) / 1000
+    return int(total_kbits / duration - (audio_bitrate or 0))
+
+
+def build_pass_command(ffmpeg_path, job, video_bitrate, audio_bitrate, pass_number=None, passlog=None,
+                       global_args=None):
+    """构建目标大小模式的编码命令
+
+    pass_number为1时只分析视频并输出到空设备，为2时按第一遍的日志编码，为None时单遍编码。
+    """
+    cmd = [
+        ffmpeg_path,
+        *(global_args or []),
+        "-i", job.input_file,
+        "-y",
+        "-vcodec", job.video_codec,
+    ]
+    if job.resolution:
+        cmd.extend(["-s", job.resolution])
+    cmd.extend(strip_rate_control(engine.quality_args(job)))
+    cmd.extend(["-b:v", f"{video_bitrate}k"])
+    if pass_number is None:
+        # 单遍编码时限制峰值码率，使文件大小接近目标
+        cmd.extend(["-maxrate", f"{video_bitrate}k", "-bufsize", f"{video_bitrate * 2}k"])
+    else:
+        cmd.extend(["-pass", str(pass_number), "-passlogfile", passlog])
+
+    if pass_number == 1:
+        cmd.extend(["-an", "-f", "null", os.devnull])
+    else:
+        if audio_bitrate:
+            cmd.extend(["-acodec", job.audio_codec, "-b:a", f"{audio_bitrate}k"])
+        else:
+            cmd.append("-an")
+        cmd.append(job.output_file)
+    return cmd
+
+
+class TargetSizeEncoder:
+    """目标文件大小编码器，由ConversionRunner在转换每个任务时调用"""
+
+    def __init__(self, target_size, audio_bitrate=DEFAULT_AUDIO_BITRATE):
+        self.target_size = target_size  # 字节
+        self.audio_bitrate = audio_bitrate  # kbit/s
+
+    def audio_bitrate_for(self, job):
+        """任务的音频码率，没有音频流时为0"""
+        if job.media_info is not None and job.media_info.audio is None:
+            return 0
+        return self.audio_bitrate
+
+    def prepare(self, job):
+        """批次开始前计算视频码率，写入job.bitrate（任务清单据此判断参数是否变化）"""
+        job.copy_video = job.copy_audio = False
+        video_bitrate = video_bitrate_for(self.target_size, job.duration, self.audio_bitrate_for(job))
+        if video_bitrate is not None:
+            job.bitrate = f"{max(video_bitrate, MIN_VIDEO_BITRATE)}k"
+
+    def should_use(self, job):
+        """时长已知时才能按目标大小编码"""
+        return job.duration > 0 and job.media_info is not None and job.media_info.video is not None
+
+    def convert(self, runner, job):
+        """按目标大小编码，返回返回码（0表示成功）"""
+        audio_bitrate = self.audio_bitrate_for(job)
+        video_bitrate = video_bitrate_for(self.target_size, job.duration, audio_bitrate)
+        if video_bitrate < MIN_VIDEO_BITRATE:
+            runner.log(f"⚠ 目标大小过小，视频码率 {video_bitrate} kbit/s 低于下限，"
+                       f"使用 {MIN_VIDEO_BITRATE} kbit/s，输出文件会超过目标大小\n", job)
+            video_bitrate = MIN_VIDEO_BITRATE
+        runner.log(f"目标大小 {self.target_size / 1024 / 1024:.1f} MiB，时长 {job.duration:.1f} 秒："
+                   f"视频 {video_bitrate} kbit/s，音频 {audio_bitrate} kbit/s\n", job)
+
+        global_args = engine.progress_args("pipe", runner.stats_period, "error")
+        if job.video_codec not in TWO_PASS_ENCODERS:
+            runner.log(f"{job.video_codec} 不支持两遍编码，使用单遍固定码率编码\n", job)
+            cmd = build_pass_command(runner.ffmpeg_path, job, video_bitrate, audio_bitrate,
+                                     global_args=global_args)
+            return runner.run_process(job, ("target", job.index), cmd, self.progress_reporter(runner, job, 0, 1))
+
+        # 两遍编码日志保存在输出目录下每个任务单独的临时目录中
+        output_dir = os.path.dirname(os.path.abspath(job.output_file))
+        work_dir = tempfile.mkdtemp(prefix=".2pass_", dir=output_dir)
+        passlog = os.path.join(work_dir, "pass")
+        try:
+            for pass_number, offset, weight in ((1, 0, FIRST_PASS_WEIGHT), (2, FIRST_PASS_WEIGHT, 1 - FIRST_PASS_WEIGHT)):
+                cmd = build_pass_command(runner.ffmpeg_path, job, video_bitrate, audio_bitrate,
+                                         pass_number, passlog, global_args)
+                runner.log(f"第 {pass_number} 遍编码: {' '.join(cmd)}\n", job)
+                return_code = runner.run_process(job, ("pass", job.index, pass_number), cmd,
+                                                 self.progress_reporter(runner, job, offset, weight))
+                if return_code != 0 or runner.stopped:
+                    return return_code
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        try:
+            size = os.path.getsize(job.output_file)
+            runner.log(f"输出大小 {size / 1024 / 1024:.1f} MiB（目标的 {size / self.target_size:.0%}）\n", job)
+        except OSError:
+            pass
+        return 0
+
+    def progress_reporter(self, runner, job, offset, weight):
+        """把单遍的进度换算为任务进度（offset到offset+weight之间）"""
+        lock = threading.Lock()
+        count = [0]
+
+        def report(out_time, stats):
+            with lock:
+                count[0] += 1
+                update_count = count[0]
+            if stats.finished:
+                fraction = 1.0
+            elif out_time is not None:
+                fraction = min(out_time / job.duration, 1.0)
+            else:
+                return
+            percent = (offset + weight * fraction) * 100
+            with runner.lock:
+                job.progress = percent
+            job.metrics.add_sample(stats)
+            runner.emit("progress", job, percent=percent, overall=runner.overall_progress(),
+                        count=update_count, stats=stats)
+        return report
@@ -0,0 +1,62 @@
+"""测试公共设置：模块位于仓库根目录；缓存目录改到临时目录；提供模拟FFmpeg"""
+import os
+import sys
+import textwrap
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# 模拟FFmpeg：-version/-encoders/-hwaccels输出固定内容，试编码只有libx264成功；
+# 转换时按-progress pipe:1输出几组进度，然后写出最后一个参数指定的输出文件。
+# STUB_DELAY为每组进度之间的间隔（秒）
+STUB_FFMPEG = textwrap.dedent('''\
+    import os
+    import sys
+    import time
+
+    args = sys.argv[1:]
+    if "-version" in args:
+        print(os.environ.get("STUB_VERSION", "ffmpeg version 6.0-stub"))
+        sys.exit(0)
+    if "-encoders" in args:
+        print("Encoders:\\n V..... = Video\\n ------\\n V....D libx264              libx264 H.264\\n"
+              " V....D h264_nvenc           NVIDIA NVENC\\n A....D aac                  AAC")
+        sys.exit(0)
+    if "-hwaccels" in args:
+        print("Hardware acceleration methods:\\ncuda\\n")
+        sys.exit(0)
+    if "lavfi" in args:
+        sys.exit(0 if args[args.index("-c:v") + 1] == "libx264" else 1)
+    delay = float(os.environ.get("STUB_DELAY", "0.05"))
+    for t in range(1, 5):
+        time.sleep(delay)
+        if "-progress" in args:
+            sys.stdout.write(f"frame={t * 10}\\nfps=100.0\\nout_time_us={t * 500000}\\nspeed=5.0x\\n"
+                             f"progress={'end' if t == 4 else 'continue'}\\n")
+            sys.stdout.flush()
+    with open(args[-1], "wb") as f:
+        f.write(b"converted")
+''')
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """每个测试使用单独的缓存目录（编码器缓存、媒体信息缓存、性能数据）"""
+    path = tmp_path / "cache"
+    monkeypatch.setenv("XDG_CACHE_HOME", str(path))
+    return path
+
+
+@pytest.fixture
+def stub_ffmpeg(tmp_path):
+    """写出模拟FFmpeg可执行文件，返回路径"""
+    if sys.platform == "win32":
+        pytest.skip("模拟FFmpeg是POSIX脚本")
+    path = tmp_path / "bin" / "ffmpeg"
+    path.parent.mkdir()
+    path.write_text(f"#!{sys.executable}\n{STUB_FFMPEG}", encoding="utf-8")
+    path.chmod(0o755)
+    return str(path)
+
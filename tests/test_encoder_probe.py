@@ -0,0 +1,71 @@
+import os
+
+import encoder_probe
+
+
+def test_cache_key_includes_version(stub_ffmpeg, tmp_path):
+    cache = encoder_probe.CapabilityCache(str(tmp_path / "encoders.json"))
+    capabilities = encoder_probe.probe_capabilities(stub_ffmpeg, cache)
+    assert capabilities.version == "ffmpeg version 6.0-stub"
+    assert capabilities.works("libx264") and not capabilities.works("h264_nvenc")
+
+    assert cache.get(stub_ffmpeg, "ffmpeg version 6.0-stub") is not None
+    # 版本字符串不同（如同一路径换了构建）时不使用缓存
+    assert cache.get(stub_ffmpeg, "ffmpeg version 7.0") is None
+    # 不传版本时运行ffmpeg -version获取
+    assert cache.get(stub_ffmpeg) is not None
+
+
+def test_cache_invalidated_when_binary_changes(stub_ffmpeg, tmp_path):
+    cache = encoder_probe.CapabilityCache(str(tmp_path / "encoders.json"))
+    encoder_probe.probe_capabilities(stub_ffmpeg, cache)
+    version = "ffmpeg version 6.0-stub"
+    assert cache.get(stub_ffmpeg, version) is not None
+    st = os.stat(stub_ffmpeg)
+    os.utime(stub_ffmpeg, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert cache.get(stub_ffmpeg, version) is None
+
+
+def test_cache_key_format():
+    identity = ("/usr/bin/ffmpeg", 123, 456)
+    assert (encoder_probe.CapabilityCache.key_for(identity, "ffmpeg version 6.1")
+            != encoder_probe.CapabilityCache.key_for(identity, "ffmpeg version 6.1.1"))
+
+
+def test_rank_by_trial_time():
+    capabilities = encoder_probe.EncoderCapabilities(
+        "ffmpeg", working={"h264_nvenc": 0.8, "h264_qsv": 0.3, "libx264": 0.5, "libopenh264": 0.4})
+    assert capabilities.ranked_encoders() == ["h264_qsv", "libopenh264", "libx264", "h264_nvenc"]
+    assert capabilities.best_encoder() == "h264_qsv"
+    assert capabilities.accel_options() == ["Intel QSV", "NVIDIA CUDA", "CPU编码"]
+    assert capabilities.best_accel_option() == "Intel QSV"
+
+
+def test_cpu_option_uses_working_cpu_encoder():
+    capabilities = encoder_probe.EncoderCapabilities("ffmpeg", working={"libopenh264": 0.4})
+    assert capabilities.video_codec_for("CPU编码") == "libopenh264"
+    assert capabilities.best_accel_option() == "CPU编码"
+    capabilities = encoder_probe.EncoderCapabilities("ffmpeg", working={"libx264": 0.5, "h264_nvenc": 0.2})
+    assert capabilities.video_codec_for("CPU编码") == "libx264"
+    assert capabilities.video_codec_for("NVIDIA CUDA") == "h264_nvenc"
+
+
+def test_cache_write_failure_reported_to_log(stub_ffmpeg, tmp_path, capsys):
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    messages = []
+    cache = encoder_probe.CapabilityCache(str(blocker / "encoders.json"), log=messages.append)
+    encoder_probe.probe_capabilities(stub_ffmpeg, cache)
+    assert messages and messages[0].startswith("保存编码器缓存失败")
+    assert capsys.readouterr().out == ""
+
+
+def test_location_cache_failure_goes_to_stderr(tmp_path, monkeypatch, stub_ffmpeg, capsys):
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    monkeypatch.setattr(encoder_probe.engine, "find_ffmpeg", lambda: stub_ffmpeg)
+    path, version, cached = encoder_probe.locate_ffmpeg(str(blocker / "location.json"))
+    assert path == stub_ffmpeg and not cached
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert "保存FFmpeg路径缓存失败" in captured.err
@@ -0,0 +1,109 @@
+import os
+import threading
+
+import pytest
+
+import folder_scan
+
+
+@pytest.fixture
+def library(tmp_path):
+    """两层目录：视频文件、其他文件、大写扩展名、空目录"""
+    root = tmp_path / "library"
+    for relative in ("a.mp4", "notes.txt", "season1/e01.MKV", "season1/e02.avi", "season1/cover.jpg",
+                     "season2/deep/e03.mov", "empty/.keep"):
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x")
+    return root
+
+
+def scan(paths, **options):
+    batches = []
+    stats = folder_scan.FolderScanner([str(p) for p in paths], batches.append, **options).run()
+    return sorted(path for batch in batches for path in batch), batches, stats
+
+
+def test_finds_videos_in_all_subdirectories(library):
+    found, _, stats = scan([library], workers=4)
+    names = [os.path.relpath(path, library) for path in found]
+    assert names == ["a.mp4", os.path.join("season1", "e01.MKV"), os.path.join("season1", "e02.avi"),
+                     os.path.join("season2", "deep", "e03.mov")]
+    assert stats.matched == stats.delivered == 4
+    assert stats.files == 7
+    assert stats.directories == 5
+    assert not stats.cancelled and stats.finished is not None
+
+
+def test_results_are_batched_per_directory(tmp_path):
+    for directory in ("d1", "d2", "d3"):
+        (tmp_path / directory).mkdir()
+        for n in range(4):
+            (tmp_path / directory / f"clip{n}.mp4").write_bytes(b"x")
+    found, batches, _ = scan([tmp_path], workers=1, batch_size=5, batch_interval=60)
+    assert len(found) == 12
+    # 累计达到batch_size后交出（同一目录的文件不拆开），剩下的在扫描结束时交出
+    assert [len(batch) for batch in batches] == [8, 4]
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink") or os.name == "nt", reason="需要符号链接")
+def test_symlink_loops_and_duplicates_counted_once(library):
+    os.symlink(library, library / "season1" / "loop")
+    os.symlink(library / "a.mp4", library / "alias.mp4")
+    os.link(library / "season1" / "e02.avi", library / "hardlink.avi")
+    found, _, stats = scan([library, library / "season1"])
+    assert len(found) == 4
+    assert stats.duplicates >= 4
+
+
+def test_excluded_output_directory_is_skipped(library):
+    found, _, _ = scan([library], exclude=[str(library / "season1")])
+    assert [os.path.basename(path) for path in found] == ["a.mp4", "e03.mov"]
+
+
+def test_callback_errors_do_not_stop_scan(library):
+    calls = []
+
+    def flaky(batch):
+        calls.append(batch)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+
+    done = []
+    stats = folder_scan.FolderScanner([str(library)], flaky, on_done=done.append, batch_size=1).run()
+    assert done == [stats]
+    assert stats.callback_errors == 1 and "database is locked" in stats.last_error
+    assert stats.delivered == stats.matched - len(calls[0])
+
+
+def test_cancel_stops_delivering(library):
+    delivered = []
+    release = threading.Event()
+
+    def slow(batch):
+        delivered.append(batch)
+        release.wait(5)
+
+    scanner = folder_scan.FolderScanner([str(library)], slow, batch_size=1, workers=1).start()
+    while not delivered:
+        release.wait(0.01)
+    canceller = threading.Thread(target=scanner.cancel)
+    canceller.start()
+    release.set()
+    canceller.join(5)
+    count = len(delivered)
+    assert scanner.wait(5)
+    assert scanner.stats.cancelled
+    assert len(delivered) == count
+
+
+def test_missing_path_counts_as_error(tmp_path):
+    found, _, stats = scan([tmp_path / "missing"])
+    assert found == [] and stats.errors == 1
+
+
+def test_scan_paths_mixes_files_and_directories(library, tmp_path):
+    loose = tmp_path / "loose.webm"
+    loose.write_bytes(b"x")
+    paths = folder_scan.scan_paths([str(loose), str(library / "season1")])
+    assert paths == [str(loose), str(library / "season1" / "e01.MKV"), str(library / "season1" / "e02.avi")]
@@ -0,0 +1,117 @@
+import os
+import time
+
+import pytest
+
+import folder_watch
+import job_queue
+
+
+def write(path, data=b"frames", age=None):
+    """写入文件，age为修改时间距现在的秒数（模拟已经写完的旧文件）"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    if age is not None:
+        t = time.time() - age
+        os.utime(path, (t, t))
+    return str(path)
+
+
+class Polling:
+    """不启动线程，直接调用轮询模式的各个步骤"""
+
+    def __init__(self, root, **options):
+        self.found = []
+        options.setdefault("settle_time", 0.3)
+        self.watcher = folder_watch.FolderWatcher([str(root)], lambda *args: self.found.append(args),
+                                                  use_inotify=False, log=lambda message: None, **options)
+        self.watcher.scan(self.watcher.roots[0])
+
+    def step(self):
+        self.watcher.poll()
+        self.watcher.check_pending()
+        return [path for path, _, _ in self.found]
+
+
+def test_finished_files_are_picked_up_on_first_check(tmp_path):
+    old = write(tmp_path / "a.mp4", age=60)
+    write(tmp_path / "notes.txt", age=60)
+    write(tmp_path / ".a.mp4.part", age=60)
+    polling = Polling(tmp_path)
+    assert polling.step() == [old]
+    # 没有变化的文件不再重复
+    assert polling.step() == [old]
+
+
+def test_growing_file_waits_until_stable(tmp_path):
+    polling = Polling(tmp_path)
+    path = write(tmp_path / "sub" / "upload.mkv")
+    # 轮询发现新目录和新文件，刚写入的文件先等待
+    assert polling.step() == []
+    time.sleep(0.2)
+    with open(path, "ab") as f:
+        f.write(b"more")
+    assert polling.step() == []
+    time.sleep(0.35)
+    assert polling.step() == [path]
+    assert polling.found[0][1] == len(b"framesmore")
+
+
+def test_only_changed_directories_are_listed(tmp_path, monkeypatch):
+    for n in range(5):
+        write(tmp_path / f"dir{n}" / "old.mp4", age=60)
+    polling = Polling(tmp_path)
+    polling.step()
+
+    listed = []
+    real_scandir = os.scandir
+    monkeypatch.setattr(folder_watch.os, "scandir", lambda path: listed.append(path) or real_scandir(path))
+    new = write(tmp_path / "dir3" / "new.mp4", age=60)
+    # 修改时间粒度较粗的文件系统上确保目录修改时间变化
+    st = os.stat(tmp_path / "dir3")
+    os.utime(tmp_path / "dir3", ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert new in polling.step()
+    assert listed == [str(tmp_path / "dir3")]
+
+
+def test_known_files_skipped_until_changed(tmp_path):
+    path = write(tmp_path / "a.mp4", age=60)
+    st = os.stat(path)
+    polling = Polling(tmp_path, known={path: (st.st_size, st.st_mtime_ns)})
+    assert polling.step() == []
+    write(tmp_path / "a.mp4", b"re-exported", age=30)
+    polling.watcher.scan(str(tmp_path))
+    assert polling.step() == [path]
+
+
+def test_excluded_and_empty_files(tmp_path):
+    write(tmp_path / "output" / "a_converted.mp4", age=60)
+    write(tmp_path / "empty.mp4", b"", age=60)
+    polling = Polling(tmp_path, exclude=[str(tmp_path / "output")])
+    assert polling.step() == []
+
+
+def test_non_recursive_ignores_subdirectories(tmp_path):
+    top = write(tmp_path / "top.mov", age=60)
+    write(tmp_path / "nested" / "deep.mov", age=60)
+    assert Polling(tmp_path, recursive=False).step() == [top]
+
+
+def test_watch_queue_adds_each_file_once_across_restarts(tmp_path, monkeypatch):
+    monkeypatch.setattr(folder_watch, "CHECK_INTERVAL", 0.05)
+    inbox = tmp_path / "inbox"
+    path = write(inbox / "a.mp4", age=60)
+    queue = job_queue.JobQueue(str(tmp_path / "queue.db"))
+    params = job_queue.job_params(str(tmp_path / "out"), "mp4")
+
+    for _ in range(2):
+        watcher = folder_watch.watch_queue(queue, [str(inbox)], params, use_inotify=False, settle_time=0,
+                                           poll_interval=0.05, log=lambda message: None)
+        watcher.start()
+        deadline = time.monotonic() + 5
+        while not queue.ingested_files() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.2)
+        watcher.stop()
+    assert list(queue.ingested_files()) == [os.path.abspath(path)]
+    assert queue.counts().get("queued") == 1
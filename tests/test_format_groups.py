@@ -0,0 +1,56 @@
+import convert_engine as engine
+
+
+def encodes(output_formats, video_codec=engine.DEFAULT_VIDEO_CODEC):
+    """每个输入文件运行的FFmpeg命令"""
+    jobs = engine.create_multi_format_jobs(["/videos/a.mp4"], "/out", output_formats, video_codec=video_codec)
+    return [engine.build_command("ffmpeg", job) for job in jobs]
+
+
+def option(cmd, name):
+    return cmd[cmd.index(name) + 1]
+
+
+def test_compatible_containers_share_one_encode():
+    groups = engine.group_formats(["mp4", "mkv", "mov", "flv", "3gp"])
+    assert [group.formats for group in groups] == [["mp4", "mkv", "mov", "flv", "3gp"]]
+    commands = encodes(["mp4", "mkv", "mov"])
+    assert len(commands) == 1
+    assert commands[0].count("-f") == 1 and option(commands[0], "-f") == "tee"
+
+
+def test_incompatible_containers_use_native_codecs():
+    groups = engine.group_formats(["mp4", "avi", "wmv", "mpeg"])
+    assert [(group.formats, group.video_codec, group.audio_codec) for group in groups] == [
+        (["mp4"], "libx264", "aac"),
+        (["avi"], "mpeg4", "libmp3lame"),
+        (["wmv"], "wmv2", "wmav2"),
+        (["mpeg"], "mpeg2video", "mp2"),
+    ]
+    commands = encodes(["mp4", "avi", "wmv"])
+    # 三次编码各不相同，不再是三次相同的libx264/aac编码
+    assert [(option(cmd, "-vcodec"), option(cmd, "-acodec")) for cmd in commands] == [
+        ("libx264", "aac"), ("mpeg4", "libmp3lame"), ("wmv2", "wmav2")]
+    assert "-crf" in commands[0] and "-crf" not in commands[1]
+    assert commands[1][-1] == "/out/a_converted.avi"
+
+
+def test_containers_accepting_native_codecs_join_the_group():
+    # mp4和3gp能容纳mpeg4/aac，avi不能容纳aac，改用原生编码单独编码
+    groups = engine.group_formats(["avi", "mp4", "3gp"], video_codec="mpeg4")
+    assert [group.formats for group in groups] == [["mp4", "3gp"], ["avi"]]
+    # 所选编码放不进任何容器时，能容纳同一组原生编码的容器共用一次编码
+    groups = engine.group_formats(["avi", "mkv", "mov"], video_codec="wmv2")
+    assert [(group.formats, group.video_codec) for group in groups] == [(["avi", "mkv", "mov"], "mpeg4")]
+
+
+def test_tee_output_args():
+    jobs = engine.create_multi_format_jobs(["/videos/a b|c.mp4"], "/out", ["mp4", "mkv", "wmv"])
+    assert len(jobs) == 2 and jobs[1].extra_outputs == []
+    job = jobs[0]
+    args = engine.tee_output_args(job)
+    assert args[:4] == ["-map", "0:v:0?", "-map", "0:a:0?"]
+    assert args[-3:-1] == ["-f", "tee"]
+    assert args[-1] == r"[f=mp4]/out/a b\|c_converted.mp4|[f=matroska]/out/a b\|c_converted.mkv"
+    job.copy_video = job.copy_audio = True
+    assert "-flags:v" not in engine.tee_output_args(job)
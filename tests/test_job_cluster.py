@@ -0,0 +1,152 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import job_cluster
+import job_queue
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return job_queue.JobQueue(str(tmp_path / "queue.db"))
+
+
+@pytest.fixture
+def coordinator(queue):
+    coordinator = job_cluster.Coordinator(queue, port=0, token="secret", log=lambda message: None)
+    coordinator.start()
+    yield coordinator
+    coordinator.shutdown()
+
+
+@pytest.fixture
+def input_files(tmp_path):
+    """几个输入文件（内容无关紧要，模拟FFmpeg不读取）"""
+    directory = tmp_path / "inputs"
+    directory.mkdir()
+    paths = []
+    for n in range(3):
+        path = directory / f"clip{n}.mp4"
+        path.write_bytes(b"\0" * 1000)
+        paths.append(str(path))
+    return paths
+
+
+def connect(coordinator, worker_id="fake"):
+    """模拟工作进程：握手后返回(socket, reader)"""
+    sock = socket.create_connection(coordinator.address, timeout=10)
+    reader = sock.makefile("rb")
+    job_cluster.send_message(sock, threading.Lock(), {"type": "hello", "worker": worker_id, "slots": 1,
+                                                      "token": "secret"})
+    assert job_cluster.read_message(reader)["type"] == "welcome"
+    return sock, reader
+
+
+def claim(sock, reader):
+    job_cluster.send_message(sock, threading.Lock(), {"type": "claim"})
+    return job_cluster.read_message(reader)
+
+
+def test_rejects_wrong_token(coordinator):
+    with socket.create_connection(coordinator.address, timeout=10) as sock:
+        job_cluster.send_message(sock, threading.Lock(), {"type": "hello", "worker": "w", "token": "wrong"})
+        with sock.makefile("rb") as reader:
+            assert job_cluster.read_message(reader)["type"] == "error"
+
+
+def test_claim_and_finish_round_trip(coordinator, queue, tmp_path):
+    job_id = queue.add("/videos/a.mp4", job_queue.job_params(str(tmp_path), "mp4"), priority=3)
+    sock, reader = connect(coordinator)
+    try:
+        message = claim(sock, reader)
+        assert message["type"] == "job" and message["id"] == job_id and message["priority"] == 3
+        assert message["input_file"] == queue.get(job_id).input_file
+        assert claim(sock, reader)["type"] == "idle"
+
+        job_cluster.send_message(sock, threading.Lock(), {"type": "done", "id": job_id, "state": "done",
+                                                          "return_code": 0})
+        assert wait_until(lambda: queue.get(job_id).state == "done")
+        assert coordinator.status()["counts"]["done"] == 1
+    finally:
+        reader.close()
+        sock.close()
+
+
+def test_requeue_on_disconnect(coordinator, queue, tmp_path):
+    job_id = queue.add("/videos/a.mp4", job_queue.job_params(str(tmp_path), "mp4"))
+    sock, reader = connect(coordinator)
+    assert claim(sock, reader)["id"] == job_id
+    assert queue.get(job_id).state == "running"
+    reader.close()
+    sock.close()
+    assert wait_until(lambda: queue.get(job_id).state == "queued")
+    assert wait_until(lambda: not coordinator.workers)
+
+
+def test_requeue_on_missed_heartbeat(coordinator, queue, tmp_path, monkeypatch):
+    monkeypatch.setattr(job_cluster, "WORKER_TIMEOUT", 0.5)
+    job_id = queue.add("/videos/a.mp4", job_queue.job_params(str(tmp_path), "mp4"))
+    sock, reader = connect(coordinator)
+    try:
+        assert claim(sock, reader)["id"] == job_id
+        # 不再发送心跳，协调进程超时后断开并把任务重新排队
+        assert wait_until(lambda: queue.get(job_id).state == "queued")
+        assert job_cluster.read_message(reader) is None
+    finally:
+        reader.close()
+        sock.close()
+
+
+def test_worker_converts_job(coordinator, queue, stub_ffmpeg, input_files, tmp_path):
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    job_id = queue.add(input_files[0], job_queue.job_params(str(output_dir), "mp4"))
+    worker = job_cluster.ClusterWorker(coordinator.address, stub_ffmpeg, max_workers=1, worker_id="w1",
+                                       token="secret", log=lambda message: None)
+    thread = threading.Thread(target=worker.run, daemon=True)
+    thread.start()
+    try:
+        assert wait_until(lambda: queue.get(job_id).state == "done", timeout=30)
+        assert (output_dir / "clip0_converted.mp4").exists()
+    finally:
+        worker.stop()
+        thread.join(timeout=10)
+
+
+class FakeSession:
+    def __init__(self):
+        self.closed = threading.Event()
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+
+def test_cancel_before_start_is_not_lost(stub_ffmpeg, input_files, tmp_path):
+    worker = job_cluster.ClusterWorker(("127.0.0.1", 1), stub_ffmpeg, worker_id="w1", log=lambda message: None)
+    message = {"id": 7, "input_file": input_files[0], "priority": 0,
+               "params": job_queue.job_params(str(tmp_path / "out"), "mp4")}
+    # 取消消息在任务开始转换之前到达
+    worker.stop_running({7})
+    session = FakeSession()
+    worker.convert(session, message)
+    assert session.sent[-1] == {"type": "done", "id": 7, "state": "stopped", "return_code": None}
+    assert not (tmp_path / "out" / "clip0_converted.mp4").exists()
+    assert 7 not in worker.cancelled
+
+    # 连接已经断开时同样不转换
+    session = FakeSession()
+    session.closed.set()
+    worker.convert(session, dict(message, id=8))
+    assert session.sent[-1]["state"] == "stopped"
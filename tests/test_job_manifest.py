@@ -0,0 +1,108 @@
+import json
+import os
+
+import pytest
+
+import convert_engine as engine
+import job_manifest
+
+
+@pytest.fixture
+def converted(tmp_path):
+    """一个已经写出输出文件的任务"""
+    source = tmp_path / "movie.avi"
+    source.write_bytes(b"source frames")
+    out = tmp_path / "out"
+    out.mkdir()
+    job = engine.create_jobs([str(source)], str(out), "mp4")[0]
+    with open(job.output_file, "wb") as f:
+        f.write(b"encoded")
+    job.return_code = 0
+    return job
+
+
+def reopen(manifest):
+    return job_manifest.JobManifest(manifest.path)
+
+
+def test_done_job_is_complete_after_reload(tmp_path, converted):
+    manifest = job_manifest.JobManifest(str(tmp_path / "m.jsonl"))
+    manifest.mark(converted, "done")
+    assert reopen(manifest).is_complete(converted)
+    assert not job_manifest.JobManifest(manifest.path, resume=False).is_complete(converted)
+
+
+def test_failed_or_changed_job_is_not_complete(tmp_path, converted):
+    manifest = job_manifest.JobManifest(str(tmp_path / "m.jsonl"))
+    manifest.mark(converted, "failed")
+    assert not reopen(manifest).is_complete(converted)
+
+    manifest.mark(converted, "done")
+    converted.bitrate = "2M"
+    assert not reopen(manifest).is_complete(converted)
+
+
+def test_modified_input_or_truncated_output_not_complete(tmp_path, converted):
+    manifest = job_manifest.JobManifest(str(tmp_path / "m.jsonl"))
+    manifest.mark(converted, "done")
+    with open(converted.output_file, "ab") as f:
+        f.write(b"partial")
+    assert not reopen(manifest).is_complete(converted)
+
+    manifest.mark(converted, "done")
+    with open(converted.input_file, "ab") as f:
+        f.write(b"more frames")
+    assert not reopen(manifest).is_complete(converted)
+
+
+def test_torn_last_line_is_skipped(tmp_path, converted):
+    manifest = job_manifest.JobManifest(str(tmp_path / "m.jsonl"))
+    manifest.mark(converted, "done")
+    with open(manifest.path, "a", encoding="utf-8") as f:
+        f.write('{"output": "half written')
+    assert reopen(manifest).is_complete(converted)
+
+
+def test_stale_lines_are_compacted(tmp_path, converted, monkeypatch):
+    monkeypatch.setattr(job_manifest, "COMPACT_MIN_LINES", 5)
+    manifest = job_manifest.JobManifest(str(tmp_path / "m.jsonl"))
+    for _ in range(3):
+        manifest.mark(converted, "running")
+        manifest.mark(converted, "done")
+    # 6行中只有1行有效，过期的5行没有超过有效记录数加阈值（1 + 5），不重写
+    with open(manifest.path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 6
+    reopen(manifest)
+    with open(manifest.path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 6
+
+    manifest.mark(converted, "running")
+    manifest.mark(converted, "done")
+    reloaded = reopen(manifest)
+    with open(manifest.path, encoding="utf-8") as f:
+        lines = f.readlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["state"] == "done"
+    assert reloaded.is_complete(converted)
+
+
+def test_legacy_manifest_is_converted(tmp_path, converted):
+    path = str(tmp_path / job_manifest.MANIFEST_NAME)
+    entry = {"output": os.path.abspath(converted.output_file), "state": "failed"}
+    with open(job_manifest.legacy_manifest_path(path), "w", encoding="utf-8") as f:
+        json.dump({"version": job_manifest.MANIFEST_VERSION, "jobs": {entry["output"]: entry}}, f)
+
+    manifest = job_manifest.JobManifest(path)
+    assert manifest.get(converted)["state"] == "failed"
+    assert os.path.exists(path)
+
+
+def test_write_failure_goes_to_log(tmp_path, converted):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    messages = []
+    manifest = job_manifest.JobManifest(str(blocker / "m.jsonl"), log=messages.append)
+    manifest.mark(converted, "done")
+    assert messages and messages[0].startswith("保存任务清单失败")
+    # 写入失败时内存中的记录仍然有效
+    assert manifest.is_complete(converted)
@@ -0,0 +1,164 @@
+import time
+
+import convert_engine as engine
+import job_queue
+
+
+def make_queue(tmp_path):
+    return job_queue.JobQueue(str(tmp_path / "queue.db"))
+
+
+def params(tmp_path):
+    return job_queue.job_params(str(tmp_path / "out"), "mp4")
+
+
+def test_claim_by_priority_then_fifo(tmp_path):
+    queue = make_queue(tmp_path)
+    low = queue.add_many(["a.mp4", "b.mp4"], params(tmp_path))
+    high = queue.add("c.mp4", params(tmp_path), priority=5)
+    claimed = [queue.claim("w1")[0].id for _ in range(3)]
+    assert claimed == [high, low[0], low[1]]
+    assert queue.claim("w1") == []
+
+
+def test_claim_skips_jobs_without_params(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.add("a.mp4")
+    assert queue.claim("w1") == []
+    assert queue.fill_params(params(tmp_path)) == 1
+    entry = queue.claim("w1")[0]
+    assert entry.state == "running" and entry.attempts == 1 and entry.worker == "w1"
+
+
+def test_finish_requeues_until_attempts_exhausted(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.add("a.mp4", params(tmp_path), max_attempts=2)
+    queue.claim("w1")
+    queue.finish(job_id, "failed", 1)
+    assert queue.get(job_id).state == "queued"
+    queue.claim("w1")
+    queue.finish(job_id, "failed", 1)
+    entry = queue.get(job_id)
+    assert entry.state == "failed" and entry.return_code == 1 and entry.attempts == 2
+
+
+def test_finish_done_and_cancelled_while_running(tmp_path):
+    queue = make_queue(tmp_path)
+    done_id, cancelled_id = queue.add_many(["a.mp4", "b.mp4"], params(tmp_path))
+    queue.claim("w1", limit=2)
+    queue.finish(done_id, "done", 0)
+    assert queue.cancel([cancelled_id]) == 1
+    # 运行中被取消的任务结束时保持取消状态
+    queue.finish(cancelled_id, "failed", 255)
+    assert queue.get(done_id).state == "done"
+    assert queue.get(cancelled_id).state == "cancelled"
+    assert queue.cancelled_ids("w1", [done_id, cancelled_id]) == {cancelled_id}
+
+
+def test_release_does_not_count_attempt(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.add("a.mp4", params(tmp_path))
+    queue.claim("w1")
+    queue.release(job_id)
+    entry = queue.get(job_id)
+    assert entry.state == "queued" and entry.attempts == 0
+
+
+def test_requeue_stale_and_worker(tmp_path):
+    queue = make_queue(tmp_path)
+    stale_id, live_id = queue.add_many(["a.mp4", "b.mp4"], params(tmp_path))
+    queue.claim("dead")
+    queue.claim("alive")
+    queue.connection().execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time() - 3600, stale_id))
+    assert queue.requeue_stale() == 1
+    assert queue.get(stale_id).state == "queued"
+    assert queue.get(live_id).state == "running"
+    assert queue.requeue_worker("alive") == 1
+    assert queue.get(live_id).state == "queued"
+
+
+def test_window_version_and_purge(tmp_path):
+    queue = make_queue(tmp_path)
+    ids = queue.add_many([f"{n}.mp4" for n in range(10)], params(tmp_path))
+    for entry in queue.claim("w1", limit=4):
+        queue.finish(entry.id, "done", 0)
+    version = queue.version()
+    window = queue.window(active_limit=3, finished_limit=2)
+    # 排队任务按领取顺序在前，已结束的任务按编号倒序
+    assert [entry.id for entry in window] == ids[4:7] + [ids[3], ids[2]]
+    assert [entry.id for entry in window] == [entry.id for entry in queue.list()][:3] + [ids[3], ids[2]]
+
+    assert queue.purge() == 4
+    assert queue.version() != version
+    assert queue.counts() == {"queued": 6, "running": 0, "done": 0, "failed": 0, "cancelled": 0}
+    # 运行中的任务不会被删除
+    queue.claim("w1")
+    assert queue.purge(job_queue.STATES) == 5
+    assert queue.counts()["running"] == 1
+
+
+def test_claim_is_bounded(tmp_path):
+    queue = make_queue(tmp_path)
+    ids = queue.add_many([f"{n}.mp4" for n in range(5)], params(tmp_path))
+    assert [entry.id for entry in queue.claim("w1", limit=3)] == ids[:3]
+    assert [entry.id for entry in queue.claim("w2", limit=3)] == ids[3:]
+    assert queue.counts()["running"] == 5
+
+
+def test_cancelled_ids_only_checks_held_jobs(tmp_path):
+    queue = make_queue(tmp_path)
+    old_id, held_id = queue.add_many(["a.mp4", "b.mp4"], params(tmp_path))
+    queue.claim("w1", limit=2)
+    queue.cancel([old_id, held_id])
+    assert queue.cancelled_ids("w1", [held_id]) == {held_id}
+    assert queue.cancelled_ids("w2", [held_id]) == set()
+    assert queue.cancelled_ids("w1", []) == set()
+
+
+def test_mark_releases_group_on_every_terminal_state(tmp_path):
+    queue = make_queue(tmp_path)
+    stopped_id, cancelled_id = queue.add_many(["a.mp4", "b.mp4"], job_queue.job_params(str(tmp_path), "mp4,avi"))
+    entries = queue.claim("w1", limit=2)
+    jobs = {entry.id: queue.to_jobs(entry) for entry in entries}
+    assert set(queue.groups) == {stopped_id, cancelled_id}
+
+    jobs[stopped_id][0].state = "stopped"
+    queue.mark(jobs[stopped_id][0], "stopped")
+    queue.cancel([cancelled_id])
+    jobs[cancelled_id][0].state = "cancelled"
+    queue.mark(jobs[cancelled_id][0], "cancelled")
+    assert queue.groups == {}
+    assert queue.get(stopped_id).state == "queued"
+    assert queue.get(cancelled_id).state == "cancelled"
+
+
+def test_claim_jobs_fails_invalid_params(tmp_path):
+    queue = make_queue(tmp_path)
+    bad_id = queue.add("a.mp4", job_queue.job_params(str(tmp_path), "xyz"))
+    good_id = queue.add("b.mp4", params(tmp_path))
+    jobs = queue.claim_jobs("w1", index=5)
+    assert [(job.queue_id, job.index) for job in jobs] == [(good_id, 5)]
+    assert queue.get(bad_id).state == "failed"
+
+
+def test_runner_claims_in_batches(tmp_path, stub_ffmpeg):
+    queue = make_queue(tmp_path)
+    inputs = []
+    for n in range(5):
+        path = tmp_path / f"clip{n}.mp4"
+        path.write_bytes(b"\0" * 100)
+        inputs.append(str(path))
+    ids = queue.add_many(inputs, params(tmp_path))
+    claims = []
+
+    def job_source(index):
+        jobs = queue.claim_jobs("w1", index, limit=2)
+        claims.append(len(jobs))
+        return jobs
+
+    runner = engine.ConversionRunner(stub_ffmpeg, queue.claim_jobs("w1", limit=2), max_workers=2,
+                                     job_queue=queue, job_source=job_source)
+    assert runner.run()
+    assert claims == [2, 1, 0]
+    assert [job.index for job in runner.jobs] == [0, 1, 2, 3, 4]
+    assert all(queue.get(job_id).state == "done" for job_id in ids)
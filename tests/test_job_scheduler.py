@@ -0,0 +1,62 @@
+import pytest
+
+import convert_engine as engine
+import job_scheduler
+
+
+def jobs_with(priorities):
+    jobs = engine.create_jobs([f"/videos/{n}.mp4" for n in range(len(priorities))], "/out", "mp4")
+    for job, priority in zip(jobs, priorities):
+        job.priority = priority
+    return jobs
+
+
+def indexes(jobs):
+    return [job.index for job in jobs]
+
+
+def test_lpt_and_spt_order_by_cost():
+    jobs = jobs_with([0, 0, 0, 0])
+    costs = {0: 5.0, 1: 20.0, 2: 1.0, 3: 8.0}
+    assert indexes(job_scheduler.order_jobs(jobs, costs, "lpt")) == [1, 3, 0, 2]
+    assert indexes(job_scheduler.order_jobs(jobs, costs, "spt")) == [2, 0, 3, 1]
+    assert indexes(job_scheduler.order_jobs(jobs, costs, "fifo")) == [0, 1, 2, 3]
+
+
+def test_queue_priority_comes_first_and_ties_keep_order():
+    jobs = jobs_with([0, 5, 0, 5, 0])
+    costs = {0: 3.0, 1: 1.0, 2: 3.0, 3: 9.0, 4: 7.0}
+    assert indexes(job_scheduler.order_jobs(jobs, costs, "lpt")) == [3, 1, 4, 0, 2]
+    assert indexes(job_scheduler.order_jobs(jobs, costs, "fifo")) == [1, 3, 0, 2, 4]
+
+
+def test_unknown_strategy_rejected():
+    with pytest.raises(ValueError):
+        job_scheduler.order_jobs(jobs_with([0]), {0: 1.0}, "random")
+
+
+def test_makespan_assigns_to_first_free_worker():
+    assert job_scheduler.estimate_makespan([5, 4, 3, 3, 3], 2) == 10
+    # 长任务最后开始时整批任务要等它
+    assert job_scheduler.estimate_makespan([1, 1, 1, 1, 8], 2) == 10
+    assert job_scheduler.estimate_makespan([8, 1, 1, 1, 1], 2) == 8
+
+
+def test_makespan_edge_cases():
+    assert job_scheduler.estimate_makespan([], 4) == 0
+    assert job_scheduler.estimate_makespan([2, 3], 0) == 5
+    assert job_scheduler.estimate_makespan([2, 3], 8) == 3
+
+
+def test_job_cost_reflects_encoder_and_copy():
+    job = jobs_with([0])[0]
+    job.duration = 100
+    megapixels = 1920 * 1080 / 1000000
+    # 默认质量参数为-preset slow，耗时为medium的1 / 0.6
+    assert job_scheduler.job_cost(job) == pytest.approx(100 * megapixels / 0.6)
+    job.preset = "ultrafast"
+    assert job_scheduler.job_cost(job) == pytest.approx(100 * megapixels / 6.0)
+    job.video_codec = "h264_nvenc"
+    assert job_scheduler.job_cost(job) == pytest.approx(100 * megapixels * job_scheduler.HARDWARE_COST)
+    job.copy_video = True
+    assert job_scheduler.job_cost(job) == pytest.approx(100 * job_scheduler.COPY_COST)
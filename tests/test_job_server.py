@@ -0,0 +1,107 @@
+import os
+import time
+
+import pytest
+
+import encoder_probe
+import job_server
+
+
+@pytest.fixture
+def clip(tmp_path):
+    path = tmp_path / "clip.mov"
+    path.write_bytes(b"not really a video")
+    return str(path)
+
+
+@pytest.fixture
+def service(tmp_path):
+    capabilities = encoder_probe.EncoderCapabilities(
+        "ffmpeg",
+        available=["libx264", "h264_nvenc", "libvpx-vp9"],
+        working={"libx264": 0.2}
+    )
+    # 不启动工作线程，提交的任务一直排队
+    return job_server.JobService("ffmpeg", str(tmp_path / "out"), max_workers=1,
+                                 capabilities=capabilities, max_finished=2)
+
+
+def test_submit_defaults_to_output_root(service, clip):
+    sj = service.submit({"input": clip, "format": "mkv"})
+    assert sj.state == "queued"
+    assert os.path.dirname(sj.job.output_file) == os.path.realpath(service.output_dir)
+    assert sj.job.output_file.endswith(".mkv")
+    assert service.metrics()["queue_depth"] == 1
+
+
+def test_submit_relative_output_dir_stays_under_root(service, clip):
+    sj = service.submit({"input": clip, "output_dir": "shows/s01"})
+    expected = os.path.join(os.path.realpath(service.output_dir), "shows", "s01")
+    assert os.path.dirname(sj.job.output_file) == expected
+
+
+@pytest.mark.parametrize("output_dir", ["../escape", "/tmp", "shows/../../escape"])
+def test_submit_rejects_output_dir_outside_root(service, clip, output_dir):
+    with pytest.raises(ValueError):
+        service.submit({"input": clip, "output_dir": output_dir})
+    assert service.list() == []
+
+
+def test_submit_rejects_symlink_out_of_root(service, clip, tmp_path):
+    os.makedirs(service.output_dir)
+    os.symlink(tmp_path, os.path.join(service.output_dir, "link"))
+    with pytest.raises(ValueError):
+        service.submit({"input": clip, "output_dir": "link"})
+
+
+def test_submit_validates_encoder(service, clip):
+    assert service.submit({"input": clip, "encoder": "libvpx-vp9"}).job.video_codec == "libvpx-vp9"
+    assert service.submit({"input": clip, "encoder": "auto"}).job.video_codec == service.default_encoder
+    # 试编码失败的硬件编码器和不存在的编码器
+    for encoder in ("h264_nvenc", "-f null", ["libx264"]):
+        with pytest.raises(ValueError):
+            service.submit({"input": clip, "encoder": encoder})
+
+
+def test_submit_rejects_missing_input(service, tmp_path):
+    with pytest.raises(ValueError):
+        service.submit({"input": str(tmp_path / "missing.mp4")})
+    with pytest.raises(ValueError):
+        service.submit({"format": "mp4"})
+
+
+def test_cancel_queued_job(service, clip):
+    sj = service.submit({"input": clip})
+    assert service.cancel(sj.id).state == "cancelled"
+    assert sj.finished_at is not None
+    # 再次取消不重复计数
+    service.cancel(sj.id)
+    metrics = service.metrics()
+    assert metrics["cancelled"] == 1
+    assert metrics["queue_depth"] == 0
+    assert service.cancel(999) is None
+
+
+def test_finished_jobs_are_pruned(service, clip):
+    jobs = [service.submit({"input": clip}) for _ in range(4)]
+    for sj in jobs[:3]:
+        service.cancel(sj.id)
+    # 只保留最近结束的2个，排队中的任务不删除
+    assert [sj.id for sj in service.list()] == [jobs[1].id, jobs[2].id, jobs[3].id]
+    assert service.get(jobs[0].id) is None
+    assert service.metrics()["cancelled"] == 3
+
+
+def test_worker_runs_submitted_job(tmp_path, stub_ffmpeg, clip):
+    service = job_server.JobService(stub_ffmpeg, str(tmp_path / "out"), max_workers=1)
+    service.start()
+    try:
+        sj = service.submit({"input": clip})
+        deadline = time.monotonic() + 10
+        while sj.state in ("queued", "running") and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert sj.state == "done"
+        assert os.path.exists(sj.job.output_file)
+        assert service.metrics()["completed"] == 1
+    finally:
+        service.shutdown()
@@ -0,0 +1,87 @@
+import csv
+import json
+import os
+import threading
+
+import convert_engine as engine
+import job_telemetry
+
+
+def finished_job(tmp_path):
+    """转换完成、带性能数据的任务"""
+    source = tmp_path / "in.mov"
+    source.write_bytes(b"x" * 4000)
+    job = engine.create_jobs([str(source)], str(tmp_path), "mp4")[0]
+    with open(job.output_file, "wb") as f:
+        f.write(b"x" * 1000)
+    job.state = "done"
+    job.return_code = 0
+    job.duration = 12.3456
+    metrics = job.metrics
+    metrics.add_spawn(0.0125)
+    metrics.add_spawn(0.0175)
+    metrics.add_usage((3.5, 0.25))
+    metrics.add_usage((1.0, 0.25))
+    metrics.add_sample(engine.ProgressInfo(fps=100.0, speed=4.0))
+    metrics.add_sample(engine.ProgressInfo(fps=50.0, speed=2.0))
+    metrics.encode_time = 3.0
+    return job
+
+
+def test_jsonl_records_carry_batch_id(tmp_path):
+    writer = job_telemetry.TelemetryWriter(str(tmp_path / "t" / "batch.jsonl"), batch_id="b1")
+    writer.write({"input": "a.mp4", "state": "done"})
+    writer.write({"input": "b.mp4", "state": "failed"})
+    with open(writer.path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [(r["input"], r["batch_id"]) for r in records] == [("a.mp4", "b1"), ("b.mp4", "b1")]
+    assert writer.count == 2
+
+
+def test_csv_has_one_header_in_field_order(tmp_path):
+    path = str(tmp_path / "batch.CSV")
+    for batch_id in ("b1", "b2"):
+        # 第二个写入器追加到同一文件，不再写表头
+        job_telemetry.TelemetryWriter(path, batch_id=batch_id).write({"input": "a.mp4", "unknown": 1})
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == job_telemetry.FIELDS
+    assert len(rows) == 3
+    assert [dict(zip(rows[0], row))["batch_id"] for row in rows[1:]] == ["b1", "b2"]
+
+
+def test_default_path_under_cache_dir(cache_dir):
+    writer = job_telemetry.TelemetryWriter(batch_id="20240101_000000_1")
+    writer.write({"input": "a.mp4"})
+    assert os.path.commonpath([writer.path, str(cache_dir)]) == str(cache_dir)
+    assert os.path.basename(writer.path) == "batch_20240101_000000_1.jsonl"
+
+
+def test_concurrent_writes_do_not_interleave(tmp_path):
+    writer = job_telemetry.TelemetryWriter(str(tmp_path / "batch.jsonl"))
+
+    def write_many(n):
+        for k in range(50):
+            writer.write({"input": f"{n}-{k}", "output": "y" * 2000})
+
+    threads = [threading.Thread(target=write_many, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    with open(writer.path, encoding="utf-8") as f:
+        inputs = {json.loads(line)["input"] for line in f}
+    assert len(inputs) == 400 and writer.count == 400
+
+
+def test_job_metrics_record(tmp_path):
+    job = finished_job(tmp_path)
+    record = job.metrics.to_dict(job)
+    assert set(record) <= set(job_telemetry.FIELDS)
+    assert record["processes"] == 2
+    assert record["spawn_latency"] == 0.015
+    assert (record["cpu_user"], record["cpu_sys"]) == (4.5, 0.5)
+    assert (record["fps_avg"], record["fps_min"], record["speed_min"]) == (75.0, 50.0, 2.0)
+    assert record["duration"] == 12.346
+    assert (record["input_bytes"], record["output_bytes"]) == (4000, 1000)
+    assert record["compression_ratio"] == 0.25
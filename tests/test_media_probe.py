@@ -0,0 +1,79 @@
+import os
+
+import media_probe
+
+
+def make_file(tmp_path, name, content=b"video"):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_cache_round_trip_across_instances(tmp_path):
+    db = str(tmp_path / "probe.db")
+    video = make_file(tmp_path, "a.mp4")
+    cache = media_probe.ProbeCache(db)
+    cache.put(video, {"format": {"duration": "12.5"}})
+    # 保存前同一实例也能命中
+    assert cache.get(video) == {"format": {"duration": "12.5"}}
+    cache.save()
+
+    assert media_probe.ProbeCache(db).get(video) == {"format": {"duration": "12.5"}}
+
+
+def test_changed_file_misses(tmp_path):
+    db = str(tmp_path / "probe.db")
+    video = make_file(tmp_path, "a.mp4")
+    cache = media_probe.ProbeCache(db)
+    cache.put(video, {"format": {}})
+    cache.save()
+
+    st = os.stat(video)
+    os.utime(video, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert media_probe.ProbeCache(db).get(video) is None
+
+
+def test_concurrent_instances_keep_each_others_entries(tmp_path):
+    db = str(tmp_path / "probe.db")
+    a, b = make_file(tmp_path, "a.mp4"), make_file(tmp_path, "b.mp4")
+    first, second = media_probe.ProbeCache(db), media_probe.ProbeCache(db)
+    first.put(a, {"name": "a"})
+    second.put(b, {"name": "b"})
+    first.save()
+    second.save()
+
+    cache = media_probe.ProbeCache(db)
+    assert cache.get(a) == {"name": "a"}
+    assert cache.get(b) == {"name": "b"}
+
+
+def test_eviction_keeps_recently_used(tmp_path, monkeypatch):
+    db = str(tmp_path / "probe.db")
+    files = [make_file(tmp_path, f"{i}.mp4") for i in range(3)]
+    clock = iter(range(100, 200))
+    monkeypatch.setattr(media_probe.time, "time", lambda: next(clock))
+    cache = media_probe.ProbeCache(db, max_entries=2)
+    for path in files[:2]:
+        cache.put(path, {"name": path})
+        cache.save()
+    # 命中第一个文件后它比第二个更新，加入第三个时删除第二个
+    assert cache.get(files[0]) is not None
+    cache.put(files[2], {"name": files[2]})
+    cache.save()
+
+    cache = media_probe.ProbeCache(db, max_entries=2)
+    assert cache.get(files[0]) is not None
+    assert cache.get(files[1]) is None
+    assert cache.get(files[2]) is not None
+
+
+def test_unwritable_cache_reports_to_log(tmp_path):
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("")
+    messages = []
+    video = make_file(tmp_path, "a.mp4")
+    cache = media_probe.ProbeCache(str(blocker / "probe.db"), log=messages.append)
+    cache.put(video, {"format": {}})
+    cache.save()
+
+    assert messages and "媒体信息缓存" in messages[0]
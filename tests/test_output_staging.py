@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+import output_staging
+
+
+class FakeRunner:
+    stopped = False
+
+    def __init__(self):
+        self.messages = []
+
+    def log(self, message, job=None):
+        self.messages.append(message)
+
+
+class FakeJob:
+    class metrics:
+        publish_time = None
+
+
+@pytest.fixture
+def outputs(tmp_path):
+    """暂存目录中的两个新输出和输出目录中的两个旧输出"""
+    scratch, out = tmp_path / "scratch", tmp_path / "out"
+    scratch.mkdir()
+    out.mkdir()
+    pairs = []
+    for name in ("a.mp4", "b.mp4"):
+        (scratch / name).write_bytes(b"new")
+        (out / name).write_bytes(b"old")
+        pairs.append((str(scratch / name), str(out / name)))
+    return pairs
+
+
+def test_publish_replaces_outputs(outputs):
+    stager = output_staging.OutputStager(os.path.dirname(outputs[0][0]))
+    assert stager.publish(FakeRunner(), FakeJob(), outputs) == 0
+    for source, target in outputs:
+        assert not os.path.exists(source)
+        assert open(target, "rb").read() == b"new"
+        assert not os.path.exists(output_staging.partial_path(target))
+
+
+def test_failed_first_phase_keeps_old_outputs(outputs, monkeypatch):
+    move_to_partial = output_staging.move_to_partial
+
+    def fail_second(source, target):
+        if target == outputs[1][1]:
+            raise OSError(28, "No space left on device")
+        return move_to_partial(source, target)
+
+    monkeypatch.setattr(output_staging, "move_to_partial", fail_second)
+    runner = FakeRunner()
+    stager = output_staging.OutputStager(os.path.dirname(outputs[0][0]))
+    assert stager.publish(runner, FakeJob(), outputs) == -1
+    for _, target in outputs:
+        assert open(target, "rb").read() == b"old"
+        assert not os.path.exists(output_staging.partial_path(target))
+    assert "原有的文件保持不变" in runner.messages[-1]
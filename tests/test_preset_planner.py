@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+import convert_engine as engine
+import preset_planner
+
+
+PIXELS_1080P = 1920 * 1080
+
+
+class Batch:
+    """choose()只读取执行器的锁、任务列表和并行数"""
+
+    def __init__(self, durations, max_workers=1):
+        self.lock = threading.Lock()
+        self.max_workers = max_workers
+        self.jobs = engine.create_jobs([f"/videos/{n}.mov" for n in range(len(durations))], "/out", "mp4")
+        for job, duration in zip(self.jobs, durations):
+            job.duration = duration
+
+
+def planner_for(budget, rate=PIXELS_1080P):
+    """medium预设下实时速度（rate为每秒处理的 媒体秒数×1080p像素数）"""
+    planner = preset_planner.PresetPlanner(budget)
+    planner.rate = rate
+    planner.deadline = time.monotonic() + budget
+    return planner
+
+
+@pytest.mark.parametrize("budget, preset", [
+    (1000, "veryslow"),  # 100 / 0.13 = 770秒
+    (200, "slow"),       # 100 / 0.6 = 167秒，slower需要333秒
+    (100, "fast"),       # 100 / 1.35 = 74秒，medium需要100秒超过90%的预算
+    (10, "ultrafast"),   # 最快的预设也来不及时仍使用最快的预设
+])
+def test_slowest_preset_that_fits(budget, preset):
+    batch = Batch([100])
+    assert planner_for(budget).choose(batch, batch.jobs[0]) == preset
+
+
+def test_parallel_workers_share_the_budget():
+    batch = Batch([100, 100], max_workers=2)
+    assert planner_for(200).choose(batch, batch.jobs[0]) == "slow"
+    batch.max_workers = 1
+    assert planner_for(200).choose(batch, batch.jobs[0]) == "fast"
+
+
+def test_running_jobs_commit_part_of_the_budget():
+    batch = Batch([100, 100], max_workers=1)
+    running = batch.jobs[1]
+    running.state = "running"
+    running.preset = "veryslow"
+    running.progress = 50.0
+    # 可用450秒中正在运行的任务还需要 50 / 0.13 = 385秒，剩下的65秒只够faster（56秒）
+    assert planner_for(500).choose(batch, batch.jobs[0]) == "faster"
+
+
+def test_unknown_durations_use_average_of_known():
+    batch = Batch([100, 0])
+    # 时长未知的任务按100秒估算，共200秒：200 / 0.6 = 333秒
+    assert planner_for(400).choose(batch, batch.jobs[0]) == "slow"
+
+
+def test_finished_and_other_codecs_are_ignored():
+    batch = Batch([100, 1000, 1000])
+    batch.jobs[1].state = "done"
+    batch.jobs[2].video_codec = "h264_nvenc"
+    assert planner_for(1000).choose(batch, batch.jobs[0]) == "veryslow"
+
+
+def test_no_estimate_without_rate_or_deadline():
+    batch = Batch([100])
+    planner = planner_for(1000)
+    planner.rate = None
+    assert planner.choose(batch, batch.jobs[0]) is None
+    planner = preset_planner.PresetPlanner(1000)
+    planner.rate = PIXELS_1080P
+    assert planner.choose(batch, batch.jobs[0]) is None
+
+
+def test_resolution_scales_work():
+    batch = Batch([100])
+    batch.jobs[0].resolution = "960x540"
+    # 四分之一的像素，相当于25秒的1080p：slower需要83秒，veryslow需要192秒
+    assert planner_for(200).choose(batch, batch.jobs[0]) == "slower"
+
+
+@pytest.mark.parametrize("value, seconds", [("2h", 7200), ("90m", 5400), ("45s", 45), ("1:30:00", 5400),
+                                            ("1:30", 90), ("3600", 3600), ("1.5h", 5400)])
+def test_parse_budget(value, seconds):
+    assert preset_planner.parse_budget(value) == seconds
+
+
+def test_parse_budget_rejects_garbage():
+    with pytest.raises(ValueError):
+        preset_planner.parse_budget("soon")
@@ -0,0 +1,84 @@
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import convert_engine as engine
+import process_supervisor
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="os.wait4只在POSIX上可用")
+
+
+def make_runner(stub_ffmpeg, tmp_path, supervisor=None, count=2):
+    inputs = []
+    for n in range(count):
+        path = tmp_path / f"in{n}.mp4"
+        path.write_bytes(b"\0" * 100)
+        inputs.append(str(path))
+    jobs = engine.create_jobs(inputs, str(tmp_path / "out"), "mp4")
+    return engine.ConversionRunner(stub_ffmpeg, jobs, max_workers=count, supervisor=supervisor)
+
+
+@pytest.mark.parametrize("supervised", [False, True])
+def test_records_cpu_time(stub_ffmpeg, tmp_path, supervised):
+    supervisor = process_supervisor.ProcessSupervisor() if supervised else None
+    runner = make_runner(stub_ffmpeg, tmp_path, supervisor)
+    assert runner.run()
+    for job in runner.jobs:
+        assert job.state == "done"
+        assert job.metrics.cpu_user is not None and job.metrics.cpu_user > 0
+
+
+@pytest.mark.parametrize("supervised", [False, True])
+def test_stop_returns_without_waiting(stub_ffmpeg, tmp_path, monkeypatch, supervised):
+    monkeypatch.setenv("STUB_DELAY", "30")
+    supervisor = process_supervisor.ProcessSupervisor() if supervised else None
+    runner = make_runner(stub_ffmpeg, tmp_path, supervisor)
+    runner.start()
+    deadline = time.monotonic() + 10
+    while len(runner.active_processes) < 2 and time.monotonic() < deadline:
+        time.sleep(0.02)
+
+    start = time.monotonic()
+    assert runner.stop() == 2
+    assert time.monotonic() - start < 0.5
+    runner.wait(10)
+    assert not runner._thread.is_alive()
+    assert [job.state for job in runner.jobs] == ["stopped", "stopped"]
+
+
+def test_stop_kills_processes_that_ignore_sigterm(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine, "STOP_TIMEOUT", 0.2)
+    process = subprocess.Popen([sys.executable, "-c",
+                                "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); "
+                                "print(flush=True); time.sleep(30)"], stdout=subprocess.PIPE)
+    process.stdout.readline()
+    runner = engine.ConversionRunner("ffmpeg", [])
+    runner.register_process("key", process)
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(engine.wait_process(process)))
+    waiter.start()
+    runner.stop()
+    waiter.join(5)
+    return_code, usage = result[0]
+    # 只有等待线程回收了进程，返回码是真实的SIGKILL而不是0
+    assert return_code == -9 and usage is not None
+
+
+def test_wait_process_timeout_kills(tmp_path):
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        engine.wait_process(process, timeout=0.2)
+    assert time.monotonic() - start < 5
+    assert process.returncode == -9
+
+
+def test_supervisor_idle_timeout():
+    supervisor = process_supervisor.ProcessSupervisor(idle_timeout=0.3)
+    reasons = []
+    return_code = supervisor.run([sys.executable, "-c", "import time; time.sleep(30)"], on_timeout=reasons.append)
+    assert return_code == -1
+    assert reasons == ["0.3 秒没有输出"]
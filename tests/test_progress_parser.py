@@ -0,0 +1,63 @@
+import convert_engine as engine
+
+
+def feed_all(parser, text):
+    """输入多行，返回所有完整的进度组"""
+    results = []
+    for line in text.splitlines(keepends=True):
+        info = parser.feed(line)
+        if info is not None:
+            results.append(info)
+    return results
+
+
+def test_full_block_is_parsed():
+    block = ("frame=240\nfps=59.94\nstream_0_0_q=28.0\nbitrate=1234.5kbits/s\ntotal_size=1048576\n"
+             "out_time_us=4004000\nout_time_ms=4004000\nout_time=00:00:04.004000\ndup_frames=0\n"
+             "drop_frames=0\nspeed=2.03x\nprogress=continue\n")
+    (info,) = feed_all(engine.ProgressParser(), block)
+    assert info.frame == 240
+    assert info.fps == 59.94
+    assert info.bitrate == 1234.5
+    assert info.total_size == 1048576
+    assert info.out_time == 4.004
+    assert info.speed == 2.03
+    assert not info.finished
+
+
+def test_values_do_not_leak_between_blocks():
+    parser = engine.ProgressParser()
+    first, second = feed_all(parser, "frame=10\nfps=25\nspeed=1.5x\nprogress=continue\n"
+                                     "frame=20\nprogress=end\n")
+    assert first.fps == 25.0
+    assert second.frame == 20
+    assert second.fps is None and second.speed is None
+    assert second.finished
+
+
+def test_na_and_negative_values_become_none():
+    (info,) = feed_all(engine.ProgressParser(),
+                       "frame=0\nfps=0.00\nbitrate=N/A\ntotal_size=N/A\nout_time_us=-9223372036854775807\n"
+                       "speed=N/A\nprogress=continue\n")
+    assert info.frame == 0
+    assert info.bitrate is None and info.total_size is None and info.speed is None
+    assert info.out_time_us is None and info.out_time is None
+
+
+def test_old_out_time_ms_is_microseconds():
+    (info,) = feed_all(engine.ProgressParser(), "out_time_ms=2500000\nprogress=continue\n")
+    assert info.out_time == 2.5
+
+
+def test_noise_lines_are_ignored():
+    parser = engine.ProgressParser()
+    assert parser.feed("\n") is None
+    assert parser.feed("[libx264 @ 0x55] using cpu capabilities\n") is None
+    (info,) = feed_all(parser, "frame=5\r\nprogress=end\r\n")
+    assert info.frame == 5 and info.finished
+
+
+def test_legacy_status_line():
+    info = engine.parse_status_line("frame=  120 fps= 30 q=28.0 size=  512kB time=00:00:04.00 speed=1.25x")
+    assert info.fps == 30.0 and info.speed == 1.25
+    assert engine.parse_status_line("Input #0, mov,mp4,m4a") is None
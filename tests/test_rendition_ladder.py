@@ -0,0 +1,72 @@
+import pytest
+
+import convert_engine as engine
+import media_probe
+import rendition_ladder
+
+
+def prepared_job(ladder="1080p,720p,480p", bitrate="", streams=None):
+    job = engine.create_jobs(["/videos/keynote.mov"], "/out", "mp4", bitrate=bitrate)[0]
+    if streams is not None:
+        job.media_info = media_probe.MediaInfo(job.input_file, {"format": {"duration": "30"}, "streams": streams})
+    rendition_ladder.RenditionLadder(rendition_ladder.parse_ladder(ladder)).prepare(job)
+    return job
+
+
+def outputs(cmd):
+    """每路输出：从-map [outN]到输出文件的参数"""
+    starts = [i for i, arg in enumerate(cmd) if arg.startswith("[out")]
+    return [cmd[start - 1:end - 1] for start, end in zip(starts, starts[1:] + [len(cmd) + 1])]
+
+
+def test_one_decode_split_into_scaled_branches():
+    job = prepared_job("480p,1080p,720p")
+    cmd = rendition_ladder.build_ladder_command("ffmpeg", job, job.renditions, ["-progress", "pipe:1"])
+    assert cmd.count("-i") == 1
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert graph == ("[0:v:0]split=3[v0][v1][v2];[v0]scale=1920:1080[out0];"
+                     "[v1]scale=1280:720[out1];[v2]scale=854:480[out2]")
+    # 从高到低输出，最高分辨率为任务的主输出
+    assert [branch[-1] for branch in outputs(cmd)] == [r.output_file for r in job.renditions]
+    assert job.output_file.endswith("_1080p.mp4")
+    assert job.resolution == "1920x1080,1280x720,854x480"
+
+
+def test_each_branch_has_its_own_codecs():
+    job = prepared_job()
+    for branch in outputs(rendition_ladder.build_ladder_command("ffmpeg", job, job.renditions)):
+        assert branch[branch.index("-vcodec") + 1] == job.video_codec
+        assert branch[branch.index("-acodec") + 1] == job.audio_codec
+        assert "0:a:0?" in branch
+        assert "-crf" in branch
+
+
+def test_bitrate_scales_with_pixels():
+    job = prepared_job("1080p,720p", bitrate="4M")
+    branches = outputs(rendition_ladder.build_ladder_command("ffmpeg", job, job.renditions))
+    assert [branch[branch.index("-b:v") + 1] for branch in branches] == ["4000k", "1777k"]
+
+
+def test_audio_copy_and_silent_sources():
+    video = {"index": 0, "codec_type": "video", "codec_name": "h264"}
+    job = prepared_job(streams=[video, {"index": 1, "codec_type": "audio", "codec_name": "aac"}])
+    job.copy_audio = True
+    cmd = rendition_ladder.build_ladder_command("ffmpeg", job, job.renditions)
+    assert all(branch[branch.index("-acodec") + 1] == "copy" for branch in outputs(cmd))
+
+    job = prepared_job(streams=[video])
+    cmd = rendition_ladder.build_ladder_command("ffmpeg", job, job.renditions)
+    assert "-acodec" not in cmd and "0:a:0?" not in cmd
+
+
+def test_audio_only_files_are_not_laddered():
+    job = prepared_job(streams=[{"index": 0, "codec_type": "audio", "codec_name": "mp3"}])
+    assert not job.renditions
+
+
+def test_parse_ladder():
+    assert rendition_ladder.parse_ladder("720p 1920x1080,720p") == [("720p", "1280x720"), ("1920x1080", "1920x1080")]
+    with pytest.raises(ValueError):
+        rendition_ladder.parse_ladder("4k")
+    with pytest.raises(ValueError):
+        rendition_ladder.parse_ladder(" , ")
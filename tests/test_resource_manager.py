@@ -0,0 +1,77 @@
+import threading
+
+import resource_manager
+
+
+class Job:
+    def __init__(self, state="pending"):
+        self.state = state
+        self.threads = None
+
+
+class Runner:
+    """ResourceManager.start只用到锁、任务列表、并行数和日志"""
+
+    def __init__(self, jobs, max_workers):
+        self.lock = threading.Lock()
+        self.jobs = jobs
+        self.max_workers = max_workers
+        self.messages = []
+
+    def log(self, message, job=None):
+        self.messages.append(message)
+
+
+def test_split_cpus_contiguous_and_disjoint():
+    sets = resource_manager.split_cpus(list(range(8)), 3)
+    assert sets == [{0, 1, 2}, {3, 4, 5}, {6, 7}]
+
+
+def test_split_cpus_more_jobs_than_cpus_round_robin():
+    assert resource_manager.split_cpus([2, 5], 3) == [{2}, {5}, {2}]
+    assert resource_manager.split_cpus([0, 1], 0) == []
+
+
+def test_format_cpus_ranges():
+    assert resource_manager.format_cpus({0, 1, 2, 5, 7, 8}) == "0-2,5,7-8"
+
+
+def test_first_job_does_not_take_whole_budget():
+    jobs = [Job() for _ in range(10)]
+    runner = Runner(jobs, max_workers=4)
+    manager = resource_manager.ResourceManager(16)
+    manager.start(runner, jobs[0])
+    # 批次刚开始时按并行数分配
+    assert jobs[0].threads == 4
+
+
+def test_budget_follows_remaining_jobs_and_never_below_one():
+    jobs = [Job("done") for _ in range(5)] + [Job(), Job()]
+    runner = Runner(jobs, max_workers=4)
+    manager = resource_manager.ResourceManager(12)
+    manager.start(runner, jobs[5])
+    # 只剩两个任务时每个任务一半
+    assert jobs[5].threads == 6
+
+    manager = resource_manager.ResourceManager(3)
+    crowded = [Job() for _ in range(8)]
+    runner = Runner(crowded, max_workers=8)
+    for job in crowded:
+        manager.start(runner, job)
+    assert all(job.threads == 1 for job in crowded)
+
+
+def test_finish_releases_slot():
+    jobs = [Job(), Job()]
+    runner = Runner(jobs, max_workers=2)
+    manager = resource_manager.ResourceManager(8)
+    manager.start(runner, jobs[0])
+    manager.start(runner, jobs[1])
+    assert jobs[1].threads == 4
+    manager.finish(jobs[0])
+    jobs[0].state = "done"
+    late = Job()
+    runner.jobs.append(late)
+    manager.start(runner, late)
+    assert late.threads == 4
+    assert manager.active == [jobs[1], late]
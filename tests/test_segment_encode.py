@@ -0,0 +1,91 @@
+import threading
+
+import segment_encode
+
+
+def test_boundaries_fall_on_keyframes():
+    keyframes = [0.0, 50.0, 95.0, 130.0, 190.0, 250.0, 310.0, 370.0]
+    segments = segment_encode.plan_segments(keyframes, 400.0, 120)
+    assert segments == [(0.0, 130.0), (130.0, 250.0), (250.0, 370.0), (370.0, 400.0)]
+    # 除第一段外每段都从关键帧开始，相邻分段首尾相接
+    assert all(start in keyframes for start, _ in segments)
+    assert all(a[1] == b[0] for a, b in zip(segments, segments[1:]))
+
+
+def test_sparse_keyframes_give_longer_segments():
+    segments = segment_encode.plan_segments([0.0, 300.0, 310.0], 600.0, 120)
+    assert segments == [(0.0, 300.0), (300.0, 600.0)]
+
+
+def test_short_tail_is_merged():
+    keyframes = [float(t) for t in range(0, 250, 10)]
+    # 240秒处的关键帧之后只剩10秒，不单独成段
+    assert segment_encode.plan_segments(keyframes, 250.0, 120) == [(0.0, 120.0), (120.0, 250.0)]
+
+
+def test_short_input_is_single_segment():
+    assert segment_encode.plan_segments([0.0, 10.0, 20.0], 45.0, 120) == [(0.0, 45.0)]
+    assert segment_encode.plan_segments([], 300.0, 120) == [(0.0, 300.0)]
+
+
+def test_keyframes_past_duration_ignored():
+    segments = segment_encode.plan_segments([0.0, 130.0, 500.0], 260.0, 120)
+    assert segments == [(0.0, 130.0), (130.0, 260.0)]
+
+
+class FakeRunner:
+    """第一段立即失败，其他分段一直运行到收到终止信号"""
+    ffmpeg_path = "ffmpeg"
+    stats_period = 0.5
+    stopped = False
+
+    def __init__(self):
+        self.started = []
+        self.signalled = []
+        self.killed = threading.Event()
+        self.messages = []
+
+    def run_process(self, job, key, cmd, on_progress=None):
+        self.started.append(key)
+        if key[-1] == 0:
+            return 1
+        self.killed.wait(5)
+        return 255
+
+    def signal_processes(self, keys):
+        self.signalled.extend(keys)
+        self.killed.set()
+        return len(keys)
+
+    def log(self, message, job=None):
+        self.messages.append(message)
+
+
+class FakeJob:
+    index = 3
+    input_file = "in.mp4"
+    video_codec = "libx264"
+    resolution = None
+    bitrate = None
+    threads = None
+    quality_params = "-crf 23"
+    preset = None
+
+    class media_info:
+        audio = None
+
+
+def test_failed_segment_cancels_siblings(tmp_path):
+    runner = FakeRunner()
+    encoder = segment_encode.SegmentEncoder("ffprobe", max_workers=2)
+    segments = [(float(k * 120), float(k * 120 + 120)) for k in range(6)]
+
+    return_code = encoder._convert_segments(runner, FakeJob, segments, str(tmp_path))
+
+    assert return_code == 1
+    assert ("segment", 3, 1) in runner.signalled
+    # 失败后没有再启动其他分段，也没有拼接
+    # （第二段可能在第一段失败前已经启动）
+    assert ("segment", 3, 0) in runner.started
+    assert set(runner.started) <= {("segment", 3, 0), ("segment", 3, 1)}
+    assert "第 1 段编码失败" in runner.messages[-1]
@@ -0,0 +1,60 @@
+import convert_engine as engine
+import media_probe
+
+
+def probed_job(output_format, video="h264", audio="aac", **settings):
+    """带ffprobe信息的任务，video/audio为None时没有该流"""
+    streams = []
+    if video:
+        streams.append({"index": 0, "codec_type": "video", "codec_name": video, "width": 1920, "height": 1080})
+    if audio:
+        streams.append({"index": 1, "codec_type": "audio", "codec_name": audio})
+    job = engine.create_jobs(["/videos/a.mkv"], "/out", output_format, **settings)[0]
+    job.media_info = media_probe.MediaInfo("/videos/a.mkv", {"format": {"duration": "60"}, "streams": streams})
+    return job
+
+
+def test_compatible_streams_are_copied():
+    job = probed_job("mp4")
+    assert engine.plan_stream_copy(job) == (True, True)
+    cmd = engine.build_command("ffmpeg", job)
+    assert cmd[cmd.index("-vcodec") + 1] == "copy"
+    assert cmd[cmd.index("-acodec") + 1] == "copy"
+
+
+def test_only_the_incompatible_stream_is_reencoded():
+    # mp4不能容纳opus音频，mkv不能容纳wmv3视频
+    assert engine.plan_stream_copy(probed_job("mp4", audio="opus")) == (True, False)
+    assert engine.plan_stream_copy(probed_job("mkv", video="wmv3", audio="opus")) == (False, True)
+
+
+def test_scaling_or_bitrate_forces_video_encode():
+    assert engine.plan_stream_copy(probed_job("mp4", resolution="1280x720")) == (False, True)
+    assert engine.plan_stream_copy(probed_job("mp4", bitrate="2M")) == (False, True)
+
+
+def test_missing_streams_and_info():
+    assert engine.plan_stream_copy(probed_job("mp4", audio=None)) == (True, False)
+    job = probed_job("mp4")
+    job.media_info = None
+    assert engine.plan_stream_copy(job) == (False, False)
+
+
+def test_tee_outputs_need_every_container_to_accept():
+    job = probed_job("mkv", video="h264", audio="flac")
+    job.extra_outputs = [("mp4", "/out/a.mp4")]
+    # flac不能放入mp4
+    assert engine.plan_stream_copy(job) == (True, False)
+    job.extra_outputs = [("mov", "/out/a.mov")]
+    assert engine.plan_stream_copy(job) == (True, False)
+    job = probed_job("mkv", video="h264", audio="aac")
+    job.extra_outputs = [("mp4", "/out/a.mp4"), ("flv", "/out/a.flv")]
+    assert engine.plan_stream_copy(job) == (True, True)
+
+
+def test_previous_plan_is_reset():
+    job = probed_job("mp4")
+    engine.plan_stream_copy(job)
+    job.bitrate = "2M"
+    job.media_info.streams[1].codec_name = "opus"
+    assert engine.plan_stream_copy(job) == (False, False)
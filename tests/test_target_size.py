@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+import convert_engine as engine
+import target_size
+
+
+@pytest.fixture
+def job():
+    job = engine.create_jobs(["/videos/talk.mov"], "/out", "mp4", resolution="1280x720")[0]
+    job.quality_params = "-preset fast -crf 20"
+    return job
+
+
+def option(cmd, name):
+    return cmd[cmd.index(name) + 1]
+
+
+def test_video_bitrate_leaves_room_for_audio_and_container():
+    # 100 MB / 400秒：100e6 * 8 * 0.98 / 1000 / 400 = 1960 kbit/s，减去128 kbit/s音频
+    assert target_size.video_bitrate_for(100_000_000, 400, 128) == 1832
+    assert target_size.video_bitrate_for(100_000_000, 400, 0) == 1960
+    assert target_size.video_bitrate_for(100_000_000, 0, 128) is None
+    # 目标过小时可能为负数，由调用方使用下限
+    assert target_size.video_bitrate_for(1_000_000, 600, 128) < target_size.MIN_VIDEO_BITRATE
+
+
+def test_first_pass_only_analyses_video(job):
+    cmd = target_size.build_pass_command("ffmpeg", job, 1832, 128, 1, "/tmp/2pass/pass")
+    assert "-crf" not in cmd
+    assert option(cmd, "-preset") == "fast"
+    assert option(cmd, "-b:v") == "1832k"
+    assert option(cmd, "-pass") == "1" and option(cmd, "-passlogfile") == "/tmp/2pass/pass"
+    assert cmd[-4:] == ["-an", "-f", "null", os.devnull]
+    assert job.output_file not in cmd
+
+
+def test_second_pass_writes_output_with_audio(job):
+    cmd = target_size.build_pass_command("ffmpeg", job, 1832, 128, 2, "/tmp/2pass/pass", ["-progress", "pipe:1"])
+    assert cmd[1:3] == ["-progress", "pipe:1"]
+    assert option(cmd, "-pass") == "2"
+    assert option(cmd, "-s") == "1280x720"
+    assert option(cmd, "-acodec") == job.audio_codec and option(cmd, "-b:a") == "128k"
+    assert cmd[-1] == job.output_file
+    assert "-maxrate" not in cmd
+
+
+def test_single_pass_caps_peak_rate(job):
+    job.video_codec = "h264_nvenc"
+    cmd = target_size.build_pass_command("ffmpeg", job, 1500, 0, passlog=None)
+    assert "-pass" not in cmd
+    assert option(cmd, "-maxrate") == "1500k" and option(cmd, "-bufsize") == "3000k"
+    # 没有音频流时不输出音频
+    assert "-an" in cmd and "-acodec" not in cmd
+    assert cmd[-1] == job.output_file
+
+
+def test_strip_rate_control_keeps_other_options():
+    args = ["-preset", "slow", "-crf", "18", "-b:v", "5M", "-qp", "0", "-tune", "film"]
+    assert target_size.strip_rate_control(args) == ["-preset", "slow", "-tune", "film"]
+
+
+@pytest.mark.parametrize("value, size", [("700M", 700 * 1024 ** 2), ("1.5G", int(1.5 * 1024 ** 3)),
+                                         ("500KiB", 500 * 1024), ("123456", 123456)])
+def test_parse_size(value, size):
+    assert target_size.parse_size(value) == size
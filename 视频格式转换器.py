@@ -1,9 +1,48 @@
+import time
+
+# 记录进程启动时间，用于统计启动耗时
+STARTUP_BEGIN = time.perf_counter()
+
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import subprocess
 import os
 import sys
-import re
+import queue
+import sqlite3
+import threading
+
+import convert_engine as engine
+import media_probe
+import job_manifest
+import job_queue
+import job_scheduler
+import job_telemetry
+import segment_encode
+import encoder_probe
+import folder_scan
+import folder_watch
+import preset_planner
+import output_staging
+import process_supervisor
+import rendition_ladder
+import resource_manager
+import target_size
+
+# 界面刷新间隔（毫秒），约20帧/秒
+UI_FRAME_MS = 50
+# 每帧最多处理的事件数，防止事件过多时界面卡顿
+MAX_EVENTS_PER_FRAME = 2000
+# 日志最多保留的行数
+MAX_LOG_LINES = 5000
+# 任务队列列表的刷新间隔（毫秒），其他进程（命令行工作进程）修改队列后也能看到
+QUEUE_REFRESH_MS = 1000
+
+# 后台线程放入事件队列的非转换事件的来源标识
+QUEUE_VIEW = "queue_view"  # 任务列表的刷新结果
+BATCH_READY = "batch_ready"  # 开始转换时领取任务、创建执行器的结果
+
+# 扫描文件夹时刷新进度的间隔（毫秒）
+SCAN_STATUS_MS = 200
 
 class VideoConverter:
     def __init__(self, root):
@@ -13,91 +52,143 @@ class VideoConverter:
         self.root.resizable(False, False)  # 不允许调整大小
         
         # 支持的输出格式
-        self.output_formats = [
-            "MP4", "MKV", "AVI", "WMV", "MOV", 
-            "FLV", "MPEG", "3GP"
-        ]
+        self.output_formats = [name for name, _ in engine.OUTPUT_FORMATS]
         
         # 默认使用高质量输出
-        self.quality_params = "-crf 18 -preset slow"
+        self.quality_params = engine.DEFAULT_QUALITY_PARAMS
         
-        # 检查FFmpeg
-        self.ffmpeg_path = self.find_ffmpeg()
+        # 默认并行任务数
+        self.default_workers = engine.default_workers()
+        
+        # 当前的转换执行器
+        self.runner = None
+        
+        # 工作线程产生的事件先放入线程安全队列，由主线程按固定帧率统一处理
+        self.event_queue = queue.Queue()
+        # 所有FFmpeg进程由一个asyncio事件循环监控，事件同样放入上面的队列
+        self.supervisor = process_supervisor.ProcessSupervisor()
+        
+        # FFmpeg、编码器能力和ffprobe在后台检测，检测完成前不能开始转换
+        self.ffmpeg_path = None
+        self.capabilities = None
+        self.prober = None
+        self.startup_queue = queue.Queue()
+        
+        # 待转换文件保存在SQLite任务队列中，关闭程序后不会丢失，也可以由命令行工作进程处理
+        self.job_queue = job_queue.JobQueue()
+        self.worker_id = job_queue.default_worker_id()
+        # 领取的任务在其他进程中被取消（如命令行 job_queue.py cancel）时只终止这些任务
+        self.job_queue.start_heartbeat(self.worker_id, on_cancelled=self.cancel_queue_jobs,
+                                       held_ids=self.held_queue_ids)
+        # 任务列表中当前显示的行：行标识 -> 显示的值
+        self.queue_rows = {}
+        # 设置后后台刷新线程立即检查队列，不等刷新间隔
+        self.queue_refresh_event = threading.Event()
+        # 开始转换时在后台领取任务，领取完成前保存界面上的设置
+        self.pending_batch = None
+        # 正在监视的文件夹（folder_watch.FolderWatcher）
+        self.watchers = {}
+        # 正在扫描的文件夹（folder_scan.FolderScanner）
+        self.scanners = []
+        
+        # 创建界面：窗口先显示出来，不等待FFmpeg检测
+        self.create_widgets()
+        self.root.after_idle(self.report_first_paint)
+        
+        threading.Thread(target=self.detect_environment, daemon=True, name="detect-ffmpeg").start()
+        self.root.after(UI_FRAME_MS, self.check_environment)
+        # 任务列表在后台线程中读取，队列中有几十万个任务时界面也不会卡住
+        threading.Thread(target=self.queue_refresh_loop, daemon=True, name="queue-refresh").start()
+    
+    def report_first_paint(self):
+        """记录窗口首次显示的耗时"""
+        self.first_paint_time = time.perf_counter() - STARTUP_BEGIN
+    
+    def detect_environment(self):
+        """在后台线程中查找FFmpeg并检测编码器能力（优先使用缓存）"""
+        detect_begin = time.perf_counter()
+        # 缓存写入失败等提示，检测完成后显示在日志中
+        warnings = []
+        try:
+            ffmpeg_path, version, cached = encoder_probe.locate_ffmpeg(log=warnings.append)
+            capabilities = None
+            prober = None
+            if ffmpeg_path:
+                capabilities = encoder_probe.probe_capabilities(ffmpeg_path, version=version, log=warnings.append)
+                # 媒体信息分析器：转换前用ffprobe获取准确时长，结果缓存到磁盘（打开缓存也在后台线程中进行）
+                ffprobe_path = media_probe.find_ffprobe(ffmpeg_path)
+                if ffprobe_path:
+                    prober = media_probe.MediaProber(ffprobe_path, media_probe.ProbeCache())
+            result = {
+                "ffmpeg_path": ffmpeg_path,
+                "cached": cached,
+                "capabilities": capabilities,
+                "prober": prober,
+                "warnings": warnings,
+                "elapsed": time.perf_counter() - detect_begin,
+                "error": None,
+            }
+        except Exception as e:
+            result = {"ffmpeg_path": None, "error": str(e)}
+        self.startup_queue.put(result)
+    
+    def check_environment(self):
+        """在主线程中等待后台检测结果"""
+        try:
+            result = self.startup_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(UI_FRAME_MS, self.check_environment)
+            return
+        self.apply_environment(result)
+    
+    def apply_environment(self, result):
+        """应用后台检测结果：更新加速选项、启用开始按钮并报告启动耗时"""
+        self.ffmpeg_path = result["ffmpeg_path"]
         if not self.ffmpeg_path:
             import webbrowser
-            answer = messagebox.askyesno(
-                "未找到FFmpeg", 
-                "未找到FFmpeg，请确保已安装FFmpeg并添加到系统PATH。\n\n是否跳转到FFmpeg官网下载？"
-            )
+            message = "未找到FFmpeg，请确保已安装FFmpeg并添加到系统PATH。\n\n是否跳转到FFmpeg官网下载？"
+            if result.get("error"):
+                message = f"检测FFmpeg时出错: {result['error']}\n\n" + message
+            answer = messagebox.askyesno("未找到FFmpeg", message)
             if answer:
                 # 跳转到FFmpeg官网
                 webbrowser.open("https://ffmpeg.org/download.html")
             self.root.destroy()
             return
         
-        # 创建界面
-        self.create_widgets()
-    
-    def find_ffmpeg(self):
-        """查找FFmpeg可执行文件"""
-        try:
-            # 尝试直接运行ffmpeg命令
-            subprocess.run(["ffmpeg", "-version"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            return "ffmpeg"
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            # 尝试在当前目录查找
-            if sys.platform.startswith("win"):
-                ffmpeg_exe = "ffmpeg.exe"
-            else:
-                ffmpeg_exe = "ffmpeg"
-            
-            if os.path.exists(ffmpeg_exe):
-                return ffmpeg_exe
-            if os.path.exists(os.path.join(os.getcwd(), ffmpeg_exe)):
-                return os.path.join(os.getcwd(), ffmpeg_exe)
-            
-            return None
-    
-    def detect_gpus(self):
-        """检测系统中的GPU显卡信息（仅支持Windows）"""
-        gpus = []
+        # 根据试编码成功的硬件编码器生成可用的加速选项（按试编码耗时排列），CPU编码始终可选
+        self.capabilities = result["capabilities"]
+        gpu_options = self.capabilities.accel_options()
+        default_gpu_accel = self.capabilities.best_accel_option()
+        self.gpu_combo.config(values=gpu_options)
+        self.gpu_accel_var.set(default_gpu_accel)
         
-        try:
-            # 仅保留Windows系统检测显卡
-            if sys.platform == 'win32':
-                # Windows系统检测显卡
-                result = subprocess.run(
-                    ["wmic", "path", "win32_VideoController", "get", "name"],
-                    capture_output=True,
-                    text=True,
-                    check=True
-                )
-                
-                # 解析输出
-                for line in result.stdout.strip().split('\n')[1:]:
-                    line = line.strip()
-                    if line:
-                        gpus.append(line)
+        self.prober = result["prober"]
+        if self.prober is not None:
+            self.segment_checkbox.config(state=tk.NORMAL)
         
-        except Exception as e:
-            print(f"检测显卡时出错: {e}")
+        self.convert_btn.config(state=tk.NORMAL)
         
-        return gpus
-    
-    def get_optimal_gpu_accel(self):
-        """根据检测到的GPU选择最优的加速选项"""
-        gpus = self.detect_gpus()
-        
-        # 定义显卡优先级：NVIDIA > AMD > Intel
-        if any('nvidia' in gpu.lower() for gpu in gpus):
-            return "NVIDIA CUDA"
-        elif any('amd' in gpu.lower() or 'radeon' in gpu.lower() for gpu in gpus):
-            return "AMD VCE"
-        elif any('intel' in gpu.lower() or 'hd graphics' in gpu.lower() or 'iris' in gpu.lower() for gpu in gpus):
-            return "Intel QSV"
+        for warning in result.get("warnings", []):
+            self.append_log(f"{warning}\n")
+        
+        # 显示检测到的编码器信息
+        if self.capabilities.version:
+            self.append_log(f"{self.capabilities.version}\n")
+        hardware_encoders = [e for e in self.capabilities.ranked_encoders() if e not in encoder_probe.CPU_ENCODERS]
+        if hardware_encoders:
+            self.append_log(f"可用硬件编码器: {', '.join(hardware_encoders)}\n")
+            self.append_log(f"自动选择加速方式（试编码最快）: {default_gpu_accel}\n")
         else:
-            # 未检测到支持的GPU，使用自动模式
-            return "自动"
+            self.append_log("未检测到可用的硬件编码器，默认使用CPU编码\n")
+        
+        # 报告启动耗时
+        first_paint = getattr(self, "first_paint_time", None)
+        source = "缓存" if result["cached"] else "重新检测"
+        paint_info = f"界面显示 {first_paint:.2f} 秒，" if first_paint is not None else ""
+        self.append_log(f"启动耗时: {paint_info}FFmpeg检测 {result['elapsed']:.2f} 秒（{source}），"
+                        f"总计 {time.perf_counter() - STARTUP_BEGIN:.2f} 秒\n\n")
+        self.status_var.set("就绪")
     
     def create_widgets(self):
         """创建GUI界面组件"""
@@ -131,7 +222,7 @@ class VideoConverter:
         main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
         # 已选文件区域 - 左侧
-        files_frame = tk.LabelFrame(main_frame, text="已选择文件", font=("微软雅黑", 12, "bold"), bg="#ffffff", fg="#34495e", bd=1, relief=tk.GROOVE)
+        files_frame = tk.LabelFrame(main_frame, text="任务队列", font=("微软雅黑", 12, "bold"), bg="#ffffff", fg="#34495e", bd=1, relief=tk.GROOVE)
         files_frame.pack(fill=tk.BOTH, expand=True, pady=5, padx=5, side=tk.TOP)
         
         # 文件列表
@@ -142,19 +233,38 @@ class VideoConverter:
         list_scrollbar = tk.Scrollbar(files_inner_frame, bg="#ecf0f1")
         list_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        self.file_list = tk.Listbox(
+        # 队列列表：编号、优先级、状态、尝试次数和文件路径
+        self.queue_tree = ttk.Treeview(
             files_inner_frame, 
-            font=("微软雅黑", 10),
-            bg="#f8f9fa",
-            fg="#2c3e50",
-            bd=1,
-            relief=tk.SOLID,
-            selectmode=tk.MULTIPLE,
+            columns=("id", "priority", "state", "attempts", "file"),
+            show="headings",
+            selectmode="extended",
             height=6,  # 减小高度，适配小窗口
             yscrollcommand=list_scrollbar.set
         )
-        self.file_list.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
-        list_scrollbar.config(command=self.file_list.yview)
+        for column, text, width, stretch in (
+            ("id", "编号", 50, False),
+            ("priority", "优先级", 60, False),
+            ("state", "状态", 70, False),
+            ("attempts", "尝试", 50, False),
+            ("file", "文件", 400, True),
+        ):
+            self.queue_tree.heading(column, text=text)
+            self.queue_tree.column(column, width=width, stretch=stretch, anchor=tk.W if column == "file" else tk.CENTER)
+        self.queue_tree.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
+        list_scrollbar.config(command=self.queue_tree.yview)
+        
+        # 各状态的任务数（列表只显示其中一部分）
+        self.queue_summary_var = tk.StringVar(value="正在读取任务队列...")
+        queue_summary_label = tk.Label(
+            files_frame,
+            textvariable=self.queue_summary_var,
+            font=("微软雅黑", 9),
+            bg="#ffffff",
+            fg="#7f8c8d",
+            anchor=tk.W
+        )
+        queue_summary_label.pack(fill=tk.X, padx=10)
         
         # 文件操作按钮
         file_buttons_frame = tk.Frame(files_frame, bg="#ffffff")
@@ -172,7 +282,7 @@ class VideoConverter:
             relief=tk.RAISED,
             padx=15,
             pady=6, 
-            width=12
+            width=9
         )
         add_file_btn.pack(side=tk.LEFT, padx=5, pady=5)
         
@@ -188,7 +298,7 @@ class VideoConverter:
             relief=tk.RAISED,
             padx=15,
             pady=6, 
-            width=12
+            width=9
         )
         add_folder_btn.pack(side=tk.LEFT, padx=5, pady=5)
         
@@ -204,7 +314,7 @@ class VideoConverter:
             relief=tk.RAISED,
             padx=15,
             pady=6, 
-            width=12
+            width=9
         )
         remove_selected_btn.pack(side=tk.LEFT, padx=5, pady=5)
         
@@ -220,10 +330,26 @@ class VideoConverter:
             relief=tk.RAISED,
             padx=15,
             pady=6, 
-            width=12
+            width=9
         )
         clear_all_btn.pack(side=tk.LEFT, padx=5, pady=5)
         
+        # 清除已完成按钮：删除已完成、失败和已取消的任务，任务列表和数据库都不会越来越大
+        purge_btn = tk.Button(
+            file_buttons_frame, 
+            text="清除已完成", 
+            command=self.purge_finished, 
+            font=("微软雅黑", 11, "bold"),
+            bg="#95a5a6",
+            fg="white",
+            bd=1, 
+            relief=tk.RAISED,
+            padx=15,
+            pady=6, 
+            width=9
+        )
+        purge_btn.pack(side=tk.LEFT, padx=5, pady=5)
+        
         # 右侧设置区域
         settings_frame = tk.Frame(main_frame, bg="#ffffff")
         settings_frame.pack(fill=tk.BOTH, expand=True, pady=5, padx=5, side=tk.TOP)
@@ -285,11 +411,7 @@ class VideoConverter:
         
         # 常用格式按钮
         self.format_var = tk.StringVar(value="mp4")
-        formats = [
-            ("MP4", "mp4"), ("MKV", "mkv"), ("AVI", "avi"), 
-            ("WMV", "wmv"), ("MOV", "mov"), ("FLV", "flv"),
-            ("MPEG", "mpeg"), ("3GP", "3gp")
-        ]
+        formats = engine.OUTPUT_FORMATS
         
         # 格式按钮网格
         format_grid_frame = tk.Frame(format_frame, bg="#f8f9fa")
@@ -334,19 +456,7 @@ class VideoConverter:
         resolution_label.grid(row=0, column=0, sticky=tk.W, padx=10, pady=8)
         
         self.resolution_var = tk.StringVar(value="原始分辨率")
-        resolutions = [
-            "原始分辨率",
-            "4K (3840x2160)",
-            "2K (2560x1440)",
-            "1080p (1920x1080)",
-            "1080p竖屏 (1080x1920)",
-            "720p (1280x720)",
-            "720p竖屏 (720x1280)",
-            "480p (854x480)",
-            "480p竖屏 (480x854)",
-            "360p (640x360)",
-            "360p竖屏 (360x640)"
-        ]
+        resolutions = engine.RESOLUTIONS
         resolution_combo = ttk.Combobox(
             advanced_grid_frame, 
             textvariable=self.resolution_var, 
@@ -372,15 +482,7 @@ class VideoConverter:
         bitrate_label.grid(row=1, column=0, sticky=tk.W, padx=10, pady=8)
         
         self.bitrate_var = tk.StringVar(value="自动")
-        bitrates = [
-            "自动",
-            "50 Mbps",
-            "40 Mbps",
-            "30 Mbps",
-            "20 Mbps",
-            "10 Mbps",
-            "5 Mbps"
-        ]
+        bitrates = engine.BITRATES
         bitrate_combo = ttk.Combobox(
             advanced_grid_frame, 
             textvariable=self.bitrate_var, 
@@ -392,16 +494,6 @@ class VideoConverter:
         )
         bitrate_combo.grid(row=1, column=1, padx=10, pady=8, sticky=tk.W)
         
-        # 检测系统GPU
-        detected_gpus = self.detect_gpus()
-        
-        # 检测NVIDIA显卡
-        has_nvidia = any('nvidia' in gpu.lower() for gpu in detected_gpus)
-        # 检测AMD显卡
-        has_amd = any('amd' in gpu.lower() or 'radeon' in gpu.lower() for gpu in detected_gpus)
-        # 检测Intel显卡
-        has_intel = any('intel' in gpu.lower() or 'hd graphics' in gpu.lower() or 'iris' in gpu.lower() for gpu in detected_gpus)
-        
         # GPU加速选项
         gpu_label = tk.Label(
             advanced_grid_frame, 
@@ -415,38 +507,292 @@ class VideoConverter:
         )
         gpu_label.grid(row=2, column=0, sticky=tk.W, padx=10, pady=8)
         
-        # 根据检测到的GPU类型生成可用的加速选项
-        gpu_options = []
-        default_gpu_accel = ""
-        
-        if has_nvidia:
-            # 只显示NVIDIA CUDA选项
-            gpu_options = ["NVIDIA CUDA"]
-            default_gpu_accel = "NVIDIA CUDA"
-        elif has_amd:
-            # 只显示AMD VCE选项
-            gpu_options = ["AMD VCE"]
-            default_gpu_accel = "AMD VCE"
-        elif has_intel:
-            # 只显示Intel QSV选项
-            gpu_options = ["Intel QSV"]
-            default_gpu_accel = "Intel QSV"
-        else:
-            # 没有检测到显卡，使用CPU
-            gpu_options = ["CPU编码"]
-            default_gpu_accel = "CPU编码"
-        
-        self.gpu_accel_var = tk.StringVar(value=default_gpu_accel)
-        gpu_combo = ttk.Combobox(
+        # 加速选项在后台检测完成后更新
+        self.gpu_accel_var = tk.StringVar(value="检测中...")
+        self.gpu_combo = ttk.Combobox(
             advanced_grid_frame, 
             textvariable=self.gpu_accel_var, 
-            values=gpu_options, 
+            values=["检测中..."], 
             state="readonly", 
             font=(
             "微软雅黑", 10),
             width=25
         )
-        gpu_combo.grid(row=2, column=1, padx=10, pady=8, sticky=tk.W)
+        self.gpu_combo.grid(row=2, column=1, padx=10, pady=8, sticky=tk.W)
+        
+        # 并行任务数设置
+        workers_label = tk.Label(
+            advanced_grid_frame, 
+            text="并行任务数:", 
+            font=(
+            "微软雅黑", 11, "bold"),
+            bg="#ffffff",
+            fg="#34495e",
+            width=12, 
+            anchor=tk.W
+        )
+        workers_label.grid(row=3, column=0, sticky=tk.W, padx=10, pady=8)
+        
+        self.workers_var = tk.IntVar(value=self.default_workers)
+        workers_spinbox = tk.Spinbox(
+            advanced_grid_frame, 
+            from_=1, 
+            to=max(1, os.cpu_count() or 1), 
+            textvariable=self.workers_var, 
+            font=(
+            "微软雅黑", 10),
+            width=26, 
+            state="readonly"
+        )
+        workers_spinbox.grid(row=3, column=1, padx=10, pady=8, sticky=tk.W)
+        
+        # 时间预算设置（分钟，0表示不限制，使用固定的质量参数）
+        budget_label = tk.Label(
+            advanced_grid_frame, 
+            text="时间预算(分钟):", 
+            font=(
+            "微软雅黑", 11, "bold"),
+            bg="#ffffff",
+            fg="#34495e",
+            width=12, 
+            anchor=tk.W
+        )
+        budget_label.grid(row=4, column=0, sticky=tk.W, padx=10, pady=8)
+        
+        self.budget_var = tk.IntVar(value=0)
+        budget_spinbox = tk.Spinbox(
+            advanced_grid_frame, 
+            from_=0, 
+            to=10000, 
+            increment=10,
+            textvariable=self.budget_var, 
+            font=(
+            "微软雅黑", 10),
+            width=26
+        )
+        budget_spinbox.grid(row=4, column=1, padx=10, pady=8, sticky=tk.W)
+        
+        # 目标文件大小设置（MB，0表示不使用，设置后忽略码率选项）
+        target_size_label = tk.Label(
+            advanced_grid_frame, 
+            text="目标大小(MB):", 
+            font=(
+            "微软雅黑", 11, "bold"),
+            bg="#ffffff",
+            fg="#34495e",
+            width=12, 
+            anchor=tk.W
+        )
+        target_size_label.grid(row=5, column=0, sticky=tk.W, padx=10, pady=8)
+        
+        self.target_size_var = tk.IntVar(value=0)
+        target_size_spinbox = tk.Spinbox(
+            advanced_grid_frame, 
+            from_=0, 
+            to=100000, 
+            increment=50,
+            textvariable=self.target_size_var, 
+            font=(
+            "微软雅黑", 10),
+            width=26
+        )
+        target_size_spinbox.grid(row=5, column=1, padx=10, pady=8, sticky=tk.W)
+        
+        # 新添加文件的优先级（数值大的先转换）
+        priority_label = tk.Label(
+            advanced_grid_frame, 
+            text="新任务优先级:", 
+            font=(
+            "微软雅黑", 11, "bold"),
+            bg="#ffffff",
+            fg="#34495e",
+            width=12, 
+            anchor=tk.W
+        )
+        priority_label.grid(row=6, column=0, sticky=tk.W, padx=10, pady=8)
+        
+        self.priority_var = tk.IntVar(value=0)
+        priority_spinbox = tk.Spinbox(
+            advanced_grid_frame, 
+            from_=-100, 
+            to=100, 
+            increment=1,
+            textvariable=self.priority_var, 
+            font=(
+            "微软雅黑", 10),
+            width=26
+        )
+        priority_spinbox.grid(row=6, column=1, padx=10, pady=8, sticky=tk.W)
+        
+        # 多分辨率输出（如"1080p,720p,480p"，留空表示只输出一个分辨率，设置后忽略分辨率选项）
+        ladder_label = tk.Label(
+            advanced_grid_frame, 
+            text="多分辨率输出:", 
+            font=(
+            "微软雅黑", 11, "bold"),
+            bg="#ffffff",
+            fg="#34495e",
+            width=12, 
+            anchor=tk.W
+        )
+        ladder_label.grid(row=7, column=0, sticky=tk.W, padx=10, pady=8)
+        
+        self.ladder_var = tk.StringVar(value="")
+        ladder_entry = tk.Entry(
+            advanced_grid_frame, 
+            textvariable=self.ladder_var, 
+            font=(
+            "微软雅黑", 10),
+            width=28
+        )
+        ladder_entry.grid(row=7, column=1, padx=10, pady=8, sticky=tk.W)
+        
+        # 同时输出的其他格式（如"mkv,mov"），编码兼容的格式只编码一次，通过tee同时写入
+        extra_formats_label = tk.Label(
+            advanced_grid_frame, 
+            text="同时输出格式:", 
+            font=(
+            "微软雅黑", 11, "bold"),
+            bg="#ffffff",
+            fg="#34495e",
+            width=12, 
+            anchor=tk.W
+        )
+        extra_formats_label.grid(row=8, column=0, sticky=tk.W, padx=10, pady=8)
+        
+        self.extra_formats_var = tk.StringVar(value="")
+        extra_formats_entry = tk.Entry(
+            advanced_grid_frame, 
+            textvariable=self.extra_formats_var, 
+            font=(
+            "微软雅黑", 10),
+            width=28
+        )
+        extra_formats_entry.grid(row=8, column=1, padx=10, pady=8, sticky=tk.W)
+        
+        # 转换顺序：按估算的工作量（时长×分辨率×编码器）安排并行任务的顺序
+        schedule_label = tk.Label(
+            advanced_grid_frame, 
+            text="转换顺序:", 
+            font=(
+            "微软雅黑", 11, "bold"),
+            bg="#ffffff",
+            fg="#34495e",
+            width=12, 
+            anchor=tk.W
+        )
+        schedule_label.grid(row=9, column=0, sticky=tk.W, padx=10, pady=8)
+        
+        self.schedule_var = tk.StringVar(value=job_scheduler.STRATEGIES[job_scheduler.DEFAULT_STRATEGY])
+        schedule_combo = ttk.Combobox(
+            advanced_grid_frame, 
+            textvariable=self.schedule_var, 
+            values=list(job_scheduler.STRATEGIES.values()), 
+            state="readonly", 
+            font=(
+            "微软雅黑", 10),
+            width=25
+        )
+        schedule_combo.grid(row=9, column=1, padx=10, pady=8, sticky=tk.W)
+        
+        # 暂存目录：输出先写到本机目录，转换成功后再发布到输出目录（留空表示直接写入输出目录）
+        scratch_label = tk.Label(
+            advanced_grid_frame, 
+            text="暂存目录:", 
+            font=(
+            "微软雅黑", 11, "bold"),
+            bg="#ffffff",
+            fg="#34495e",
+            width=12, 
+            anchor=tk.W
+        )
+        scratch_label.grid(row=10, column=0, sticky=tk.W, padx=10, pady=8)
+        
+        self.scratch_dir_var = tk.StringVar(value="")
+        scratch_entry = tk.Entry(
+            advanced_grid_frame, 
+            textvariable=self.scratch_dir_var, 
+            font=(
+            "微软雅黑", 10),
+            width=28
+        )
+        scratch_entry.grid(row=10, column=1, padx=10, pady=8, sticky=tk.W)
+        
+        # FFmpeg线程总数，由同时运行的任务平分（0表示不限制，与"后台低优先级运行"无关，相当于--threads）
+        threads_label = tk.Label(
+            advanced_grid_frame, 
+            text="线程预算:", 
+            font=(
+            "微软雅黑", 11, "bold"),
+            bg="#ffffff",
+            fg="#34495e",
+            width=12, 
+            anchor=tk.W
+        )
+        threads_label.grid(row=11, column=0, sticky=tk.W, padx=10, pady=8)
+        
+        self.threads_var = tk.IntVar(value=0)
+        threads_spinbox = tk.Spinbox(
+            advanced_grid_frame, 
+            from_=0, 
+            to=max(1, os.cpu_count() or 1) * 4, 
+            increment=1,
+            textvariable=self.threads_var, 
+            font=(
+            "微软雅黑", 10),
+            width=26
+        )
+        threads_spinbox.grid(row=11, column=1, padx=10, pady=8, sticky=tk.W)
+        
+        # 长视频分段并行编码的每段时长（秒）和同时编码的分段数，勾选"长视频分段并行编码"后生效
+        segment_length_label = tk.Label(
+            advanced_grid_frame, 
+            text="分段时长(秒):", 
+            font=(
+            "微软雅黑", 11, "bold"),
+            bg="#ffffff",
+            fg="#34495e",
+            width=12, 
+            anchor=tk.W
+        )
+        segment_length_label.grid(row=12, column=0, sticky=tk.W, padx=10, pady=8)
+        
+        self.segment_length_var = tk.IntVar(value=segment_encode.DEFAULT_SEGMENT_LENGTH)
+        segment_length_spinbox = tk.Spinbox(
+            advanced_grid_frame, 
+            from_=10, 
+            to=3600, 
+            increment=30,
+            textvariable=self.segment_length_var, 
+            font=(
+            "微软雅黑", 10),
+            width=26
+        )
+        segment_length_spinbox.grid(row=12, column=1, padx=10, pady=8, sticky=tk.W)
+        
+        segment_workers_label = tk.Label(
+            advanced_grid_frame, 
+            text="分段并行数:", 
+            font=(
+            "微软雅黑", 11, "bold"),
+            bg="#ffffff",
+            fg="#34495e",
+            width=12, 
+            anchor=tk.W
+        )
+        segment_workers_label.grid(row=13, column=0, sticky=tk.W, padx=10, pady=8)
+        
+        self.segment_workers_var = tk.IntVar(value=segment_encode.default_segment_workers())
+        segment_workers_spinbox = tk.Spinbox(
+            advanced_grid_frame, 
+            from_=1, 
+            to=max(2, os.cpu_count() or 1), 
+            textvariable=self.segment_workers_var, 
+            font=(
+            "微软雅黑", 10),
+            width=26
+        )
+        segment_workers_spinbox.grid(row=13, column=1, padx=10, pady=8, sticky=tk.W)
         
         # 转换控制区域 - 底部
         control_frame = tk.LabelFrame(settings_frame, text="转换控制", font=("微软雅黑", 12, "bold"), bg="#ffffff", fg="#34495e", bd=1, relief=tk.GROOVE)
@@ -468,6 +814,7 @@ class VideoConverter:
             relief=tk.RAISED,
             padx=20,
             pady=10,
+            state=tk.DISABLED,  # FFmpeg检测完成后启用
             activebackground="#27ae60"
         )
         self.convert_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
@@ -507,6 +854,66 @@ class VideoConverter:
         )
         open_dir_checkbox.pack(side=tk.LEFT, anchor=tk.W)
         
+        # 兼容的音视频流直接复制选项（分辨率和码率为原始/自动时生效）
+        self.stream_copy_var = tk.BooleanVar(value=True)
+        stream_copy_checkbox = tk.Checkbutton(
+            options_frame, 
+            text="兼容的音视频流直接复制", 
+            variable=self.stream_copy_var,
+            font=("微软雅黑", 11),
+            bg="#ffffff",
+            fg="#34495e",
+            activebackground="#ffffff",
+            activeforeground="#34495e"
+        )
+        stream_copy_checkbox.pack(side=tk.LEFT, anchor=tk.W, padx=20)
+        
+        options_frame2 = tk.Frame(control_frame, bg="#ffffff")
+        options_frame2.pack(fill=tk.X, padx=20, pady=0)
+        
+        # 长视频分段并行编码选项（需要ffprobe分析关键帧）
+        self.segment_var = tk.BooleanVar(value=False)
+        self.segment_checkbox = tk.Checkbutton(
+            options_frame2, 
+            text=f"长视频分段并行编码（{segment_encode.DEFAULT_MIN_DURATION // 60}分钟以上）", 
+            variable=self.segment_var,
+            font=("微软雅黑", 11),
+            bg="#ffffff",
+            fg="#34495e",
+            activebackground="#ffffff",
+            activeforeground="#34495e",
+            state=tk.DISABLED  # 检测到ffprobe后启用
+        )
+        self.segment_checkbox.pack(side=tk.LEFT, anchor=tk.W)
+        
+        # 添加文件夹后继续监视其中新出现的视频文件（文件写完后自动加入队列）
+        self.watch_var = tk.BooleanVar(value=False)
+        watch_checkbox = tk.Checkbutton(
+            options_frame2, 
+            text="持续监视添加的文件夹", 
+            variable=self.watch_var,
+            font=("微软雅黑", 11),
+            bg="#ffffff",
+            fg="#34495e",
+            activebackground="#ffffff",
+            activeforeground="#34495e"
+        )
+        watch_checkbox.pack(side=tk.LEFT, anchor=tk.W, padx=20)
+        
+        # 后台低优先级运行：绑定CPU并降低FFmpeg进程的CPU和磁盘优先级（线程总数由"线程预算"设置）
+        self.background_var = tk.BooleanVar(value=False)
+        background_checkbox = tk.Checkbutton(
+            options_frame2, 
+            text="后台低优先级运行", 
+            variable=self.background_var,
+            font=("微软雅黑", 11),
+            bg="#ffffff",
+            fg="#34495e",
+            activebackground="#ffffff",
+            activeforeground="#34495e"
+        )
+        background_checkbox.pack(side=tk.LEFT, anchor=tk.W)
+        
         # 进度条和状态区域
         progress_status_frame = tk.Frame(control_frame, bg="#ffffff")
         progress_status_frame.pack(fill=tk.X, padx=20, pady=15)
@@ -523,7 +930,7 @@ class VideoConverter:
         self.progress_bar.pack(fill=tk.X, expand=True, pady=10)
         
         # 状态标签
-        self.status_var = tk.StringVar(value="就绪")
+        self.status_var = tk.StringVar(value="正在检测FFmpeg...")
         status_label = tk.Label(
             progress_status_frame, 
             textvariable=self.status_var, 
@@ -559,18 +966,6 @@ class VideoConverter:
         self.log_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         log_scrollbar.config(command=self.log_text.yview)
         
-        # 显示检测到的GPU信息
-        detected_gpus = self.detect_gpus()
-        optimal_gpu_accel = self.get_optimal_gpu_accel()
-        
-        if detected_gpus:
-            detected_gpus_str = ", ".join(detected_gpus)
-            self.log_text.insert(tk.END, f"检测到显卡: {detected_gpus_str}\n")
-            self.log_text.insert(tk.END, f"自动选择GPU加速: {optimal_gpu_accel}\n\n")
-        else:
-            self.log_text.insert(tk.END, "未检测到可用显卡，默认使用CPU编码\n\n")
-        self.log_text.see(tk.END)
-        
         # 配置ttk样式
         style = ttk.Style()
         style.theme_use('clam')
@@ -589,8 +984,8 @@ class VideoConverter:
                   fieldbackground=[('readonly', '#f8f9fa')],
                   background=[('readonly', '#3498db')])
         
-        # 初始化转换进程变量
-        self.conversion_process = None
+        # 启动界面刷新循环
+        self.root.after(UI_FRAME_MS, self.pump_events)
     
     def add_files(self):
         """添加多个视频文件"""
@@ -598,28 +993,165 @@ class VideoConverter:
             filetypes=[("视频文件", "*.mp4;*.mkv;*.avi;*.wmv;*.mov;*.flv;*.webm;*.mpg;*.mpeg;*.3gp")]
         )
         if file_paths:
-            for file_path in file_paths:
-                self.file_list.insert(tk.END, file_path)
+            self.enqueue_files(file_paths)
     
     def add_folder(self):
         """添加文件夹中的所有视频文件"""
         folder_path = filedialog.askdirectory()
-        if folder_path:
-            for root, _, files in os.walk(folder_path):
-                for file in files:
-                    if any(file.lower().endswith(ext) for ext in ['.mp4', '.mkv', '.avi', '.wmv', '.mov', '.flv', '.webm', '.mpg', '.mpeg', '.3gp']):
-                        file_path = os.path.join(root, file)
-                        self.file_list.insert(tk.END, file_path)
+        if folder_path and self.watch_var.get():
+            self.watch_folder(folder_path)
+        elif folder_path:
+            self.scan_folder(folder_path)
+    
+    def scan_folder(self, folder_path):
+        """在后台并行扫描文件夹，找到的视频文件分批加入任务队列（扫描线程中写入数据库，界面不会卡住）
+        
+        扫描进度只读取扫描器的统计，不读取数据库；任务列表由后台刷新线程更新。
+        """
+        try:
+            priority = int(self.priority_var.get())
+        except (tk.TclError, ValueError):
+            priority = 0
+        # 输出目录位于扫描的文件夹中时不扫描输出目录
+        output_dir = self.output_dir_entry.get().strip()
+        scanner = folder_scan.FolderScanner(
+            [folder_path],
+            lambda file_paths: self.job_queue.add_many(file_paths, None, priority),
+            exclude=[output_dir] if output_dir else None
+        )
+        self.scanners.append(scanner)
+        scanner.start()
+        if len(self.scanners) == 1:
+            self.root.after(SCAN_STATUS_MS, self.check_scans)
+    
+    def check_scans(self):
+        """显示扫描进度（找到和已加入队列的文件数、每秒扫描的文件数），扫描结束后刷新任务列表"""
+        finished = [scanner for scanner in self.scanners if scanner.done]
+        for scanner in finished:
+            self.scanners.remove(scanner)
+        if finished:
+            self.request_queue_refresh()
+        if self.scanners:
+            matched = sum(scanner.stats.matched for scanner in self.scanners)
+            delivered = sum(scanner.stats.delivered for scanner in self.scanners)
+            rate = sum(scanner.stats.files_per_second for scanner in self.scanners)
+            status = f"正在扫描文件夹：已找到 {matched} 个视频文件，已加入队列 {delivered} 个（{rate:.0f} 个文件/秒）"
+            errors = [scanner.stats.last_error for scanner in self.scanners if scanner.stats.callback_errors]
+            if errors:
+                status += f"；加入队列出错: {errors[-1]}"
+            self.status_var.set(status)
+            self.root.after(SCAN_STATUS_MS, self.check_scans)
+        elif finished:
+            stats = finished[-1].stats
+            self.status_var.set(("扫描已取消：" if stats.cancelled else "扫描完成：") + stats.describe())
+    
+    def watch_folder(self, folder_path):
+        """监视文件夹：现有文件和之后写完的新文件都加入队列，每个文件只加入一次"""
+        folder_path = os.path.realpath(folder_path)
+        if folder_path in self.watchers:
+            return
+        try:
+            priority = int(self.priority_var.get())
+        except (tk.TclError, ValueError):
+            priority = 0
+        # 输出目录位于监视的文件夹中时不监视输出目录
+        output_dir = self.output_dir_entry.get().strip()
+        watcher = folder_watch.FolderWatcher(
+            [folder_path],
+            folder_watch.enqueue_to(self.job_queue, None, priority),
+            exclude=[output_dir] if output_dir else None,
+            known=self.job_queue.ingested_files()
+        )
+        watcher.start()
+        self.watchers[folder_path] = watcher
+        self.status_var.set(f"正在监视 {len(self.watchers)} 个文件夹")
+    
+    def enqueue_files(self, file_paths):
+        """把文件加入任务队列，转换参数在开始转换时按界面设置填写"""
+        try:
+            priority = int(self.priority_var.get())
+        except (tk.TclError, ValueError):
+            priority = 0
+        self.job_queue.add_many(file_paths, None, priority)
+        self.request_queue_refresh()
     
     def remove_selected(self):
-        """移除选中的文件"""
-        selected_indices = self.file_list.curselection()[::-1]  # 从后往前删除
-        for index in selected_indices:
-            self.file_list.delete(index)
+        """移除选中的任务（运行中的任务不会被移除）"""
+        selected_ids = [int(item) for item in self.queue_tree.selection()]
+        self.job_queue.remove(selected_ids)
+        self.request_queue_refresh()
     
     def clear_all(self):
-        """清空所有文件"""
-        self.file_list.delete(0, tk.END)
+        """清空所有不在运行中的任务（正在扫描的文件夹同时取消），在后台线程中删除"""
+        for scanner in self.scanners:
+            scanner.cancel()
+        self.run_queue_task(lambda: self.job_queue.purge([state for state in job_queue.STATES if state != "running"]))
+    
+    def purge_finished(self):
+        """删除已完成、失败和已取消的任务，在后台线程中删除"""
+        self.run_queue_task(self.job_queue.purge)
+    
+    def run_queue_task(self, task):
+        """在后台线程中修改任务队列（几十万个任务时删除较慢），完成后刷新任务列表"""
+        def run():
+            try:
+                task()
+            except sqlite3.Error as e:
+                print(f"修改任务队列失败: {e}", file=sys.stderr)
+            self.request_queue_refresh()
+        threading.Thread(target=run, daemon=True, name="queue-task").start()
+    
+    def request_queue_refresh(self):
+        """让后台刷新线程立即检查任务队列"""
+        self.queue_refresh_event.set()
+    
+    def queue_refresh_loop(self):
+        """后台线程：定期检查任务队列，有变化时读取各状态的任务数和要显示的一部分任务，通过事件队列交给主线程
+        
+        其他进程（命令行工作进程）修改队列后也能看到；只比较变化标识时不读取任何任务。
+        """
+        version = None
+        while True:
+            self.queue_refresh_event.wait(QUEUE_REFRESH_MS / 1000)
+            self.queue_refresh_event.clear()
+            try:
+                # 先读取变化标识再读取任务，读取期间的修改会在下一次检查时发现
+                current = self.job_queue.version()
+                if current == version:
+                    continue
+                counts = self.job_queue.counts()
+                entries = self.job_queue.window()
+            except sqlite3.Error as e:
+                print(f"读取任务队列失败: {e}", file=sys.stderr)
+                continue
+            version = current
+            self.event_queue.put((QUEUE_VIEW, (counts, entries)))
+    
+    def apply_queue_view(self, counts, entries):
+        """在主线程中按行标识更新任务列表：只插入、删除和修改有变化的行，选中状态保持不变"""
+        rows = {}
+        for entry in entries:
+            rows[str(entry.id)] = (entry.id, entry.priority, entry.state_label,
+                                   f"{entry.attempts}/{entry.max_attempts}", entry.input_file)
+        removed = [item for item in self.queue_rows if item not in rows]
+        if removed:
+            self.queue_tree.delete(*removed)
+        for item, values in rows.items():
+            old = self.queue_rows.get(item)
+            if old is None:
+                self.queue_tree.insert("", tk.END, iid=item, values=values)
+            elif old != values:
+                self.queue_tree.item(item, values=values)
+        order = list(rows)
+        if list(self.queue_tree.get_children()) != order:
+            self.queue_tree.set_children("", *order)
+        self.queue_rows = rows
+        
+        summary = "  ".join(f"{job_queue.STATE_LABELS[state]} {counts[state]}" for state in job_queue.STATES)
+        total = sum(counts.values())
+        if len(rows) < total:
+            summary += f"（列表显示其中 {len(rows)} 个）"
+        self.queue_summary_var.set(summary)
     
     def browse_output_dir(self):
         """浏览选择输出目录"""
@@ -629,567 +1161,404 @@ class VideoConverter:
             self.output_dir_entry.insert(0, dir_path)
     
     def start_conversion(self):
-        """开始转换视频"""
-        import threading
-        import time
-        
+        """开始转换视频：在主线程中读取界面设置，在后台线程中领取任务并创建执行器"""
         try:
             # 验证输入
-            file_paths = list(self.file_list.get(0, tk.END))
             output_dir = self.output_dir_entry.get().strip()
             output_format = self.format_var.get().lower()
             
-            if not file_paths:
-                messagebox.showinfo("提示", "未检测到待转换文件，请先点击添加文件按钮选择需要转换的文件")
-                return
-            
             if not os.path.exists(output_dir):
                 messagebox.showerror("错误", "输出目录不存在")
                 return
             
-            # 使用默认高质量参数
-            quality_params = self.quality_params
-            
-            # 解析分辨率参数
+            # 解析分辨率、码率和GPU加速参数
             resolution = self.resolution_var.get()
-            resolution_param = ""
-            if resolution != "原始分辨率":
-                # 提取分辨率值，如"1920x1080"
-                res_value = resolution.split(" (")[1].rstrip(")")
-                resolution_param = f"-s {res_value}"
-            
-            # 解析码率参数
             bitrate = self.bitrate_var.get()
-            bitrate_param = ""
+            video_codec = self.capabilities.video_codec_for(self.gpu_accel_var.get())
             
-            if bitrate != "自动":
-                # 移除空格，如"10Mbps"
-                bitrate_value = bitrate.replace(" ", "")
-                # 转换为FFmpeg期望的格式，如"10Mbps" -> "10M"，"800Kbps" -> "800K"
-                if bitrate_value.endswith("Mbps"):
-                    bitrate_value = bitrate_value[:-4] + "M"
-                elif bitrate_value.endswith("Kbps"):
-                    bitrate_value = bitrate_value[:-4] + "K"
-                bitrate_param = f"-b:v {bitrate_value}"
-            
-            # 解析GPU加速参数
-            gpu_accel = self.gpu_accel_var.get()
-            gpu_param = ""
+            # 解析并行任务数
+            try:
+                max_workers = int(self.workers_var.get())
+            except (tk.TclError, ValueError):
+                max_workers = self.default_workers
             
-            # 根据选择的GPU加速类型设置相应的编码器
-            if gpu_accel == "NVIDIA CUDA":
-                gpu_param = "-vcodec h264_nvenc"
-            elif gpu_accel == "AMD VCE":
-                gpu_param = "-vcodec h264_amf"
-            elif gpu_accel == "Intel QSV":
-                gpu_param = "-vcodec h264_qsv"
-            else:  # CPU编码或其他选项
-                gpu_param = ""  # 使用默认的CPU编码器
+            # 同时输出多个格式
+            try:
+                output_formats = engine.parse_formats(f"{output_format},{self.extra_formats_var.get()}")
+            except ValueError as e:
+                messagebox.showerror("错误", str(e))
+                return
             
-            # 更新UI状态
-            self.log_text.delete(1.0, tk.END)
-            self.log_text.insert(tk.END, "开始转换按钮被点击...\n")
-            self.log_text.insert(tk.END, f"总共要转换 {len(file_paths)} 个文件\n\n")
-            self.status_var.set("转换中...")
-            self.progress_var.set(0)
+            # 设置了多分辨率输出时，一个FFmpeg进程解码一次，输出所有分辨率
+            ladder = None
+            if self.ladder_var.get().strip():
+                try:
+                    ladder = rendition_ladder.RenditionLadder(rendition_ladder.parse_ladder(self.ladder_var.get()))
+                except ValueError as e:
+                    messagebox.showerror("错误", str(e))
+                    return
+                if len(output_formats) > 1:
+                    messagebox.showerror("错误", "多分辨率输出不能与同时输出多个格式一起使用")
+                    return
             
-            # 禁用开始按钮，启用停止按钮
-            self.convert_btn.config(state=tk.DISABLED)
-            self.stop_btn.config(state=tk.NORMAL)
+            # 没有指定参数的任务使用当前界面设置
+            params = job_queue.job_params(
+                output_dir,
+                ",".join(output_formats),
+                resolution=engine.parse_resolution(resolution),
+                bitrate=engine.parse_bitrate(bitrate),
+                video_codec=video_codec,
+                quality_params=self.quality_params
+            )
             
-            # 初始化转换进程变量
-            self.conversion_process = None
-            self.done_flag = False
-            self.current_file_index = 0
+            # 设置了时间预算时按实测速度为libx264任务选择预设
+            try:
+                budget_minutes = int(self.budget_var.get())
+            except (tk.TclError, ValueError):
+                budget_minutes = 0
+            planner = preset_planner.PresetPlanner(budget_minutes * 60) if budget_minutes > 0 else None
             
-            # 立即显示一些信息
-            self.log_text.insert(tk.END, "初始化转换参数...\n")
-            self.log_text.insert(tk.END, f"输出格式: {output_format}\n")
-            self.log_text.insert(tk.END, f"质量设置: 高质量\n")
-            self.log_text.insert(tk.END, f"分辨率: {resolution}\n")
-            self.log_text.insert(tk.END, f"视频码率: {bitrate}\n")
-            self.log_text.insert(tk.END, f"输出目录: {output_dir}\n\n")
-            self.log_text.see(tk.END)
-            self.root.update()
+            # 设置了目标大小时按时长计算码率（需要ffprobe分析时长）
+            try:
+                target_mb = int(self.target_size_var.get())
+            except (tk.TclError, ValueError):
+                target_mb = 0
+            size_encoder = None
+            # 多分辨率输出和同时输出多个格式时不使用目标大小模式
+            if target_mb > 0 and self.prober is not None and ladder is None and len(output_formats) == 1:
+                size_encoder = target_size.TargetSizeEncoder(target_mb * 1024 * 1024)
             
-            # 定义转换线程函数
-            def conversion_thread():
-                """转换线程函数"""
-                nonlocal file_paths, output_dir, output_format, quality_params, resolution_param, bitrate_param, gpu_param
-                
-                # 记录当前正在转换的输出文件，用于停止时删除不完整文件
-                current_output_file = None
-                
+            segmenter = None
+            if self.segment_var.get() and self.prober is not None:
                 try:
-                    total_files = len(file_paths)
-                    for i, input_file in enumerate(file_paths):
-                        if self.done_flag:
-                            # 转换被停止
-                            break
-                            
-                        self.current_file_index = i + 1
-                        
-                        # 更新状态为当前正在转换的文件
-                        self.root.after(0, lambda f=input_file, idx=i+1: self.log_text.insert(tk.END, f"=== 开始转换第 {idx}/{total_files} 个文件: {f} ===\n"))
-                        self.root.after(0, lambda: self.log_text.see(tk.END))
-                        self.root.after(0, lambda: self.root.update())
-                        
-                        # 生成输出文件名
-                        input_filename = os.path.basename(input_file)
-                        input_name, _ = os.path.splitext(input_filename)
-                        current_output_file = os.path.join(output_dir, f"{input_name}_converted.{output_format}")
-                        
-                        # 确保输出目录存在
-                        os.makedirs(output_dir, exist_ok=True)
-                        
-                        # 检查输出目录权限
-                        try:
-                            test_file = os.path.join(output_dir, ".test_write.txt")
-                            with open(test_file, 'w') as f:
-                                f.write("test")
-                            os.remove(test_file)
-                            self.root.after(0, lambda: self.log_text.insert(tk.END, f"✓ 输出目录写入权限检查通过\n"))
-                        except Exception as e:
-                            self.root.after(0, lambda: self.log_text.insert(tk.END, f"⚠ 输出目录写入权限检查失败: {str(e)}\n"))
-                            self.root.after(0, lambda: self.log_text.see(tk.END))
-                            self.root.after(0, lambda: self.root.update())
-                        
-                        # 检查输入文件是否可读取
-                        try:
-                            with open(input_file, 'rb') as f:
-                                f.read(100)  # 读取前100字节测试
-                            self.root.after(0, lambda: self.log_text.insert(tk.END, f"✓ 输入文件读取权限检查通过\n"))
-                        except Exception as e:
-                            self.root.after(0, lambda: self.log_text.insert(tk.END, f"⚠ 输入文件读取权限检查失败: {str(e)}\n"))
-                            self.root.after(0, lambda: self.log_text.see(tk.END))
-                            self.root.after(0, lambda: self.root.update())
-                        
-                        # 构建FFmpeg命令
-                        cmd = [
-                            self.ffmpeg_path,
-                            "-i", input_file,
-                            "-y",  # 覆盖输出文件
-                        ]
-                        
-                        # 添加CPU/GPU编码参数
-                        if gpu_param:
-                            # GPU编码
-                            gpu_args = gpu_param.split()
-                            cmd.extend(gpu_args)
-                            # 添加音频编码参数（GPU编码时需要明确指定）
-                            cmd.extend(["-acodec", "aac"])
-                        else:
-                            # 默认使用CPU编码
-                            cmd.extend(["-vcodec", "libx264", "-acodec", "aac"])
-                        
-                        # 添加分辨率参数
-                        if resolution_param:
-                            resolution_args = resolution_param.split()
-                            cmd.extend(resolution_args)
-                        
-                        # 添加码率参数
-                        if bitrate_param:
-                            bitrate_args = bitrate_param.split()
-                            cmd.extend(bitrate_args)
-                        
-                        # 添加质量参数 - 确保正确分割参数
-                        quality_args = quality_params.split()
-                        cmd.extend(quality_args)
-                        
-                        # 添加输出文件
-                        cmd.append(current_output_file)
-                        
-                        # 显示执行的命令
-                        cmd_str = ' '.join(cmd)
-                        self.root.after(0, lambda: self.log_text.insert(tk.END, f"执行FFmpeg命令: {cmd_str}\n"))
-                        self.root.after(0, lambda: self.log_text.insert(tk.END, f"输入文件: {input_file}\n"))
-                        self.root.after(0, lambda: self.log_text.insert(tk.END, f"输出文件: {current_output_file}\n"))
-                        self.root.after(0, lambda: self.log_text.see(tk.END))
-                        self.root.after(0, lambda: self.root.update())
-                        
-                        # 执行FFmpeg命令，禁用缓冲并隐藏命令窗口
-                        startupinfo = None
-                        creationflags = 0
-                        if sys.platform == 'win32':
-                            startupinfo = subprocess.STARTUPINFO()
-                            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                            creationflags = subprocess.CREATE_NO_WINDOW
-                        
-                        # 执行策略：优先使用直接执行，失败后尝试shell=True
-                        process = None
-                        execution_attempts = []
-                        
-                        # 尝试1：直接执行（推荐方式）
-                        try:
-                            self.root.after(0, lambda: self.log_text.insert(tk.END, "尝试1：直接执行FFmpeg命令\n"))
-                            self.root.after(0, lambda: self.log_text.see(tk.END))
-                            self.root.after(0, lambda: self.root.update())
-                            
-                            process = subprocess.Popen(
-                                cmd,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.STDOUT,
-                                text=True,
-                                encoding='utf-8',
-                                bufsize=0,  # 禁用缓冲
-                                startupinfo=startupinfo,
-                                creationflags=creationflags
-                            )
-                            execution_attempts.append("直接执行成功")
-                        except Exception as e:
-                            execution_attempts.append(f"直接执行失败: {str(e)}")
-                            
-                            # 尝试2：使用shell=True（Windows特殊情况）
-                            try:
-                                self.root.after(0, lambda: self.log_text.insert(tk.END, f"尝试2：使用shell=True执行FFmpeg命令\n"))
-                                self.root.after(0, lambda: self.log_text.see(tk.END))
-                                self.root.after(0, lambda: self.root.update())
-                                
-                                # 对于Windows，确保路径使用双引号包裹
-                                if sys.platform == 'win32':
-                                    # 构建基础命令
-                                    cmd_str = f'"{self.ffmpeg_path}" -i "{input_file}" -y '
-                                    
-                                    # 添加编码参数
-                                    if gpu_param:
-                                        cmd_str += f'{gpu_param} -acodec aac '
-                                    else:
-                                        cmd_str += '-vcodec libx264 -acodec aac '
-                                    
-                                    # 添加分辨率参数
-                                    if resolution_param:
-                                        cmd_str += f"{resolution_param} "
-                                    
-                                    # 添加码率参数
-                                    if bitrate_param:
-                                        cmd_str += f"{bitrate_param} "
-                                    
-                                    # 添加质量参数
-                                    cmd_str += f"{quality_params} "
-                                    
-                                    # 添加输出文件
-                                    cmd_str += f'"{current_output_file}"'
-                                
-                                process = subprocess.Popen(
-                                    cmd_str,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.STDOUT,
-                                    text=True,
-                                    encoding='utf-8',
-                                    bufsize=0,  # 禁用缓冲
-                                    startupinfo=startupinfo,
-                                    creationflags=creationflags,
-                                    shell=True
-                                )
-                                execution_attempts.append("shell=True执行成功")
-                            except Exception as e2:
-                                execution_attempts.append(f"shell=True执行失败: {str(e2)}")
-                                
-                                # 尝试3：简化命令，只进行格式转换，不修改编码
-                                try:
-                                    self.root.after(0, lambda: self.log_text.insert(tk.END, "尝试3：使用简化命令执行FFmpeg（仅格式转换）\n"))
-                                    self.root.after(0, lambda: self.log_text.see(tk.END))
-                                    self.root.after(0, lambda: self.root.update())
-                                    
-                                    simple_cmd = [
-                                        self.ffmpeg_path,
-                                        "-i", input_file,
-                                        "-y",
-                                        "-c", "copy"  # 直接复制流，不重新编码
-                                    ]
-                                    simple_cmd.append(current_output_file)
-                                    
-                                    process = subprocess.Popen(
-                                        simple_cmd,
-                                        stdout=subprocess.PIPE,
-                                        stderr=subprocess.STDOUT,
-                                        text=True,
-                                        encoding='utf-8',
-                                        bufsize=0,
-                                        startupinfo=startupinfo,
-                                        creationflags=creationflags
-                                    )
-                                    execution_attempts.append("简化命令执行成功")
-                                except Exception as e3:
-                                    execution_attempts.append(f"简化命令执行失败: {str(e3)}")
-                                    
-                                    # 所有尝试都失败，记录错误
-                                    self.root.after(0, lambda: self.log_text.insert(tk.END, f"所有执行尝试都失败: {'; '.join(execution_attempts)}\n"))
-                                    self.root.after(0, lambda: self.log_text.see(tk.END))
-                                    self.root.after(0, lambda: self.root.update())
-                                    continue
-                        
-                        # 检查process是否成功创建
-                        if process is None:
-                            self.root.after(0, lambda: self.log_text.insert(tk.END, f"第 {i+1}/{total_files} 个文件转换失败：无法创建FFmpeg进程\n\n"))
-                            self.root.after(0, lambda: self.log_text.see(tk.END))
-                            self.root.after(0, lambda: self.root.update())
-                            continue
-                        
-                        # 更新进程引用
-                        self.conversion_process = process
-                        
-                        # 显示进程已启动
-                        self.root.after(0, lambda: self.log_text.insert(tk.END, "FFmpeg进程已启动...\n"))
-                        self.root.after(0, lambda: self.log_text.see(tk.END))
-                        self.root.after(0, lambda: self.root.update())
-                        
-                        # 读取输出
-                        duration = 0
-                        current_time = 0
-                        line_count = 0
-                        
-                        # 循环读取输出
-                        while True:
-                            if self.done_flag:
-                                break
-                            
-                            # 读取一行输出
-                            try:
-                                line = process.stdout.readline()
-                            except Exception as e:
-                                self.root.after(0, lambda: self.log_text.insert(tk.END, f"读取进程输出时出错: {str(e)}\n"))
-                                self.root.after(0, lambda: self.log_text.see(tk.END))
-                                self.root.after(0, lambda: self.root.update())
-                                break
-                            
-                            if not line:
-                                if process.poll() is not None:
-                                    break
-                                time.sleep(0.01)
-                                continue
-                            
-                            line_count += 1
-                            
-                            # 在主线程中更新日志
-                            def update_log():
-                                self.log_text.insert(tk.END, line)
-                                self.log_text.see(tk.END)
-                            self.root.after(0, update_log)
-                            
-                            # 解析总时长
-                            if "Duration:" in line and duration == 0:
-                                try:
-                                    duration_str = line.split("Duration:")[1].split(",")[0].strip()
-                                    h, m, s = duration_str.split(":")
-                                    duration = float(h) * 3600 + float(m) * 60 + float(s)
-                                    def update_duration():
-                                        self.log_text.insert(tk.END, f"\n解析到总时长: {duration:.2f} 秒\n")
-                                        self.log_text.see(tk.END)
-                                    self.root.after(0, update_duration)
-                                except Exception as e:
-                                    self.root.after(0, lambda: self.log_text.insert(tk.END, f"解析时长时出错: {str(e)}\n"))
-                                    self.root.after(0, lambda: self.log_text.see(tk.END))
-                                    self.root.after(0, lambda: self.root.update())
-                            
-                            # 解析当前进度
-                            if "time=" in line and duration > 0:
-                                try:
-                                    time_str = line.split("time=")[1].split()[0]
-                                    h, m, s = time_str.split(":")
-                                    current_time = float(h) * 3600 + float(m) * 60 + float(s)
-                                    file_progress = (current_time / duration) * 100
-                                    # 计算整体进度
-                                    overall_progress = ((i * 100) + file_progress) / total_files
-                                    def update_progress():
-                                        self.progress_var.set(min(overall_progress, 100))
-                                        if line_count % 10 == 0:
-                                            self.log_text.insert(tk.END, f"当前文件进度: {file_progress:.1f}% | 整体进度: {overall_progress:.1f}%\n")
-                                            self.log_text.see(tk.END)
-                                    self.root.after(0, update_progress)
-                                except Exception as e:
-                                    self.root.after(0, lambda: self.log_text.insert(tk.END, f"解析进度时出错: {str(e)}\n"))
-                                    self.root.after(0, lambda: self.log_text.see(tk.END))
-                                    self.root.after(0, lambda: self.root.update())
-                            
-                            # 定期更新UI
-                            if line_count % 5 == 0:
-                                def refresh_ui():
-                                    self.root.update()
-                                self.root.after(0, refresh_ui)
-                        
-                        # 等待进程结束
-                        try:
-                            return_code = process.wait(timeout=5)
-                        except subprocess.TimeoutExpired:
-                            self.root.after(0, lambda: self.log_text.insert(tk.END, "FFmpeg进程超时，强制终止\n"))
-                            self.root.after(0, lambda: self.log_text.see(tk.END))
-                            self.root.after(0, lambda: self.root.update())
-                            try:
-                                process.terminate()
-                                process.wait(timeout=2)
-                            except:
-                                try:
-                                    process.kill()
-                                    process.wait(timeout=1)
-                                except:
-                                    pass
-                            return_code = -1  # 超时返回码
-                        
-                        # 显示返回码
-                        def show_return_code():
-                            self.log_text.insert(tk.END, f"FFmpeg返回码: {return_code}\n")
-                            self.log_text.see(tk.END)
-                            
-                            if return_code == 0:
-                                self.log_text.insert(tk.END, f"第 {i+1}/{total_files} 个文件转换完成！\n\n")
-                            else:
-                                self.log_text.insert(tk.END, f"第 {i+1}/{total_files} 个文件转换失败！返回码: {return_code}\n\n")
-                            
-                            self.log_text.see(tk.END)
-                            self.root.update()
-                        
-                        self.root.after(0, show_return_code)
-                    
-                    # 删除不完整的输出文件（如果转换被停止）
-                    if self.done_flag and current_output_file and os.path.exists(current_output_file):
-                        try:
-                            os.remove(current_output_file)
-                            self.root.after(0, lambda: self.log_text.insert(tk.END, f"已删除不完整的输出文件: {os.path.basename(current_output_file)}\n"))
-                            self.root.after(0, lambda: self.log_text.see(tk.END))
-                        except Exception as e:
-                            self.root.after(0, lambda: self.log_text.insert(tk.END, f"删除不完整文件失败: {str(e)}\n"))
-                            self.root.after(0, lambda: self.log_text.see(tk.END))
-                    
-                    # 所有文件转换完成或被停止
-                    def show_final_result():
-                        if self.done_flag:
-                            self.log_text.insert(tk.END, "转换已被停止！\n")
-                            self.status_var.set("转换已停止")
-                            self.progress_var.set(0)
-                            messagebox.showinfo("提示", "转换已被停止")
-                        else:
-                            self.log_text.insert(tk.END, "=== 所有文件转换完成！ ===\n")
-                            self.status_var.set("转换完成")
-                            self.progress_var.set(100)
-                            messagebox.showinfo("成功", f"所有 {total_files} 个文件转换完成！\n输出目录: {output_dir}")
-                            
-                            # 自动打开输出目录
-                            if self.open_dir_var.get():
-                                try:
-                                    self.log_text.insert(tk.END, f"正在打开输出目录: {output_dir}\n")
-                                    self.log_text.see(tk.END)
-                                    self.root.update()
-                                    
-                                    # 仅支持Windows系统打开目录
-                                    if sys.platform == 'win32':
-                                        os.startfile(output_dir)
-                                        self.log_text.insert(tk.END, "输出目录已打开\n")
-                                    else:
-                                        self.log_text.insert(tk.END, "当前系统不支持自动打开目录\n")
-                                except Exception as e:
-                                    self.log_text.insert(tk.END, f"打开输出目录失败: {str(e)}\n")
-                        
-                        # 恢复按钮状态
-                        self.convert_btn.config(state=tk.NORMAL)
-                        self.stop_btn.config(state=tk.DISABLED)
-                        
-                        self.log_text.see(tk.END)
-                        self.root.update()
-                    
-                    self.root.after(0, show_final_result)
-                    
-                except Exception as e:
-                    import traceback
-                    error_msg = f"\n转换出错: {str(e)}\n"
-                    error_msg += f"详细信息: {traceback.format_exc()}\n"
-                    
-                    def show_error():
-                        self.log_text.insert(tk.END, error_msg)
-                        self.log_text.see(tk.END)
-                        self.status_var.set("转换失败")
-                        self.progress_var.set(0)
-                        self.convert_btn.config(state=tk.NORMAL)
-                        self.stop_btn.config(state=tk.DISABLED)
-                        messagebox.showerror("错误", f"转换出错: {str(e)}")
-                        self.root.update()
-                    
-                    self.root.after(0, show_error)
-                finally:
-                    self.conversion_process = None
-                    self.done_flag = False
+                    segment_length = max(10, int(self.segment_length_var.get()))
+                except (tk.TclError, ValueError):
+                    segment_length = segment_encode.DEFAULT_SEGMENT_LENGTH
+                try:
+                    segment_workers = max(1, int(self.segment_workers_var.get()))
+                except (tk.TclError, ValueError):
+                    segment_workers = None
+                segmenter = segment_encode.SegmentEncoder(
+                    self.prober.ffprobe_path,
+                    segment_length=segment_length,
+                    max_workers=segment_workers
+                )
+            
+            # 下拉框显示策略说明，换算回策略名称
+            strategy = next((name for name, label in job_scheduler.STRATEGIES.items()
+                             if label == self.schedule_var.get()), job_scheduler.DEFAULT_STRATEGY)
+            
+            # 线程预算和后台低优先级运行分别设置，与命令行的--threads和--pin-cpus --nice 10 --ionice idle相同
+            try:
+                total_threads = max(0, int(self.threads_var.get()))
+            except (tk.TclError, ValueError):
+                total_threads = 0
+            background = self.background_var.get()
+            resources = None
+            if total_threads or background:
+                resources = resource_manager.ResourceManager(
+                    total_threads or None,
+                    pin=background,
+                    nice=10 if background else 0,
+                    ionice="idle" if background else None
+                )
             
-            # 启动转换线程
-            self.conversion_thread = threading.Thread(target=conversion_thread, daemon=True)
-            self.conversion_thread.start()
+            staging = output_staging.create_stager(self.scratch_dir_var.get().strip())
             
+            options = dict(
+                max_workers=max_workers,
+                prober=self.prober,
+                stream_copy=self.stream_copy_var.get(),
+                segmenter=segmenter,
+                planner=planner,
+                target_size=size_encoder,
+                job_queue=self.job_queue,
+                ladder=ladder,
+                resources=resources,
+                scheduler=job_scheduler.JobScheduler(strategy),
+                supervisor=self.supervisor,
+                staging=staging
+            )
         except Exception as e:
-            # 处理主线程中的异常
             import traceback
-            error_msg = f"\n主线程出错: {str(e)}\n"
-            error_msg += f"详细信息: {traceback.format_exc()}\n"
-            
-            self.log_text.insert(tk.END, error_msg)
-            self.log_text.see(tk.END)
-            self.status_var.set("转换失败")
-            self.progress_var.set(0)
+            self.show_start_error(e, traceback.format_exc())
+            return
+        
+        # 领取任务期间不能再次开始
+        self.pending_batch = {
+            "output_dir": output_dir,
+            "output_formats": output_formats,
+            "resolution": resolution,
+            "bitrate": bitrate,
+        }
+        self.convert_btn.config(state=tk.DISABLED)
+        self.status_var.set("正在领取任务...")
+        threading.Thread(target=self.prepare_batch, args=(params, options, output_dir),
+                         daemon=True, name="prepare-batch").start()
+    
+    def prepare_batch(self, params, options, output_dir):
+        """后台线程：填写任务参数、领取第一批排队的任务并创建执行器，结果通过事件队列交给主线程
+        
+        任务分批领取（job_queue.CLAIM_BATCH个），执行器转换完一批后再领取下一批，
+        领取时不会长时间锁住队列，其他工作进程也可以同时处理同一个队列。
+        结果为(执行器, 异常, 错误详情)：没有待转换文件时执行器为None，出错时已领取的任务放回队列。
+        """
+        jobs = []
+        try:
+            # 上次异常退出时留下的运行中任务重新排队
+            self.job_queue.requeue_stale()
+            self.job_queue.fill_params(params)
+            jobs = self.job_queue.claim_jobs(self.worker_id)
+            if not jobs:
+                self.event_queue.put((BATCH_READY, (None, None, None)))
+                return
+            # 任务清单保存在输出目录中，重新转换时跳过已完成的文件
+            manifest = job_manifest.JobManifest(job_manifest.default_manifest_path(output_dir))
+            runner = engine.ConversionRunner(
+                self.ffmpeg_path,
+                jobs,
+                manifest=manifest,
+                # 每个批次的性能数据写入缓存目录下单独的文件
+                telemetry=job_telemetry.TelemetryWriter(),
+                job_source=lambda index: self.job_queue.claim_jobs(self.worker_id, index),
+                **options
+            )
+            # 事件附带所属的执行器，停止后重新开始时忽略旧执行器的残留事件
+            runner.on_event = lambda event: self.event_queue.put((runner, event))
+            # 清单写入失败时显示在转换日志中
+            manifest.log = lambda message: runner.log(message + "\n")
+        except Exception as e:
+            import traceback
+            details = traceback.format_exc()
+            # 已领取但没有开始转换的任务放回队列
+            for queue_id in {job.queue_id for job in jobs}:
+                try:
+                    self.job_queue.release(queue_id)
+                except sqlite3.Error:
+                    pass
+            self.event_queue.put((BATCH_READY, (None, e, details)))
+            return
+        self.event_queue.put((BATCH_READY, (runner, None, None)))
+    
+    def start_batch(self, runner, error, details):
+        """在主线程中处理后台领取任务的结果：开始转换，或提示没有待转换文件、显示错误"""
+        batch = self.pending_batch
+        self.pending_batch = None
+        self.request_queue_refresh()
+        if error is not None:
+            self.show_start_error(error, details)
+            return
+        if runner is None:
             self.convert_btn.config(state=tk.NORMAL)
-            self.stop_btn.config(state=tk.DISABLED)
-            self.log_text.see(tk.END)
-            self.root.update()
-            messagebox.showerror("错误", f"转换出错: {str(e)}")
+            self.status_var.set("就绪")
+            messagebox.showinfo("提示", "未检测到待转换文件，请先点击添加文件按钮选择需要转换的文件")
+            return
+        
+        self.runner = runner
+        
+        # 更新UI状态
+        self.log_text.delete(1.0, tk.END)
+        self.log_text.insert(tk.END, "开始转换按钮被点击...\n")
+        self.log_text.insert(tk.END, f"第一批领取 {len(runner.jobs)} 个文件，转换完后继续领取队列中的其他任务\n\n")
+        self.status_var.set("转换中...")
+        self.progress_var.set(0)
+        
+        # 禁用开始按钮，启用停止按钮
+        self.convert_btn.config(state=tk.DISABLED)
+        self.stop_btn.config(state=tk.NORMAL)
+        
+        # 立即显示一些信息
+        self.log_text.insert(tk.END, "初始化转换参数...\n")
+        self.log_text.insert(tk.END, f"输出格式: {', '.join(batch['output_formats'])}\n")
+        self.log_text.insert(tk.END, f"质量设置: 高质量\n")
+        self.log_text.insert(tk.END, f"分辨率: {batch['resolution']}\n")
+        self.log_text.insert(tk.END, f"视频码率: {batch['bitrate']}\n")
+        self.log_text.insert(tk.END, f"并行任务数: {runner.max_workers}\n")
+        self.log_text.insert(tk.END, f"输出目录: {batch['output_dir']}\n\n")
+        self.log_text.see(tk.END)
+        
+        # 启动转换线程
+        runner.start()
     
-    def stop_conversion(self):
-        """停止正在进行的转换"""
-        # 安全停止，忽略所有异常
+    def show_start_error(self, e, details):
+        """开始转换失败：显示错误并恢复按钮状态"""
+        error_msg = f"\n开始转换出错: {str(e)}\n"
+        error_msg += f"详细信息: {details}\n"
+        
+        self.log_text.insert(tk.END, error_msg)
+        self.log_text.see(tk.END)
+        self.status_var.set("转换失败")
+        self.progress_var.set(0)
+        self.convert_btn.config(state=tk.NORMAL)
+        self.stop_btn.config(state=tk.DISABLED)
+        messagebox.showerror("错误", f"转换出错: {str(e)}")
+    
+    def held_queue_ids(self):
+        """心跳线程：当前执行器中还没结束的任务编号"""
+        runner = self.runner
+        if runner is None:
+            return []
+        return {job.queue_id for job in list(runner.jobs) if job.state in ("pending", "running")}
+    
+    def cancel_queue_jobs(self, queue_ids):
+        """心跳线程发现已领取的任务被取消：通知当前执行器终止这些任务（其他任务继续转换）"""
+        runner = self.runner
+        if runner is not None:
+            runner.cancel_jobs(queue_ids)
+    
+    def pump_events(self):
+        """按固定帧率处理转换事件：批量插入日志，每帧只更新一次进度"""
         try:
-            # 检查转换进程是否存在
-            if hasattr(self, 'conversion_process') and self.conversion_process is not None:
-                self.status_var.set("正在停止...")
-                self.root.update()
+            log_chunks = []
+            overall = None
+            final_events = []
+            queue_view = None
+            batch_results = []
+            
+            for _ in range(MAX_EVENTS_PER_FRAME):
+                try:
+                    source, event = self.event_queue.get_nowait()
+                except queue.Empty:
+                    break
                 
-                # 设置完成标志，通知转换线程停止
-                if hasattr(self, 'done_flag'):
-                    self.done_flag = True
+                # 后台线程读取的任务列表只应用最新的一次
+                if source is QUEUE_VIEW:
+                    queue_view = event
+                    continue
+                if source is BATCH_READY:
+                    batch_results.append(event)
+                    continue
                 
-                # 记录当前进程
-                process = self.conversion_process
-                self.conversion_process = None
+                runner = self.runner
+                if runner is None or source is not runner:
+                    continue
                 
-                # 尝试终止进程
-                try:
-                    process.terminate()
-                    
-                    # 等待进程结束
-                    try:
-                        process.wait(timeout=2)
-                    except subprocess.TimeoutExpired:
-                        # 超时后强制终止
-                        try:
-                            process.kill()
-                            process.wait(timeout=1)
-                        except:
-                            pass
-                except:
-                    pass
-                
-                # 更新UI
-                self.log_text.insert(tk.END, "\n转换已被停止！\n")
-                self.status_var.set("转换已停止")
-                self.progress_var.set(0)
+                # 并行时为日志加上文件序号前缀，便于区分
+                prefix = ""
+                if event.job is not None and runner.max_workers > 1:
+                    prefix = f"[{event.job.index+1}] "
                 
-            # 恢复按钮状态
-            self.convert_btn.config(state=tk.NORMAL)
-            self.stop_btn.config(state=tk.DISABLED)
+                if event.kind in ("log", "output"):
+                    log_chunks.append(prefix + event.message)
+                elif event.kind == "probe_done":
+                    log_chunks.append(f"媒体信息分析完成：{event.probed} 个成功，{event.failed} 个失败，"
+                                      f"总时长 {engine.format_duration(event.total_duration)}\n\n")
+                elif event.kind == "duration":
+                    log_chunks.append(f"\n{prefix}解析到总时长: {event.duration:.2f} 秒\n")
+                elif event.kind == "progress":
+                    overall = event.overall
+                    if event.count % 10 == 0:
+                        speed_info = ""
+                        if event.stats is not None and event.stats.speed is not None:
+                            speed_info = f" | 速度: {event.stats.speed:.2f}x"
+                        # 多分辨率输出时显示每个分辨率的当前大小
+                        for rendition in getattr(event, "renditions", None) or []:
+                            speed_info += f" | {rendition.name}: {rendition.size / 1024 / 1024:.1f} MiB"
+                        log_chunks.append(f"{prefix}当前文件进度: {event.percent:.1f}% | 整体进度: {event.overall:.1f}%{speed_info}\n")
+                elif event.kind == "job_done":
+                    overall = runner.overall_progress()
+                elif event.kind in ("batch_done", "error"):
+                    final_events.append(event)
+            
+            # 一次性插入本帧的所有日志
+            if log_chunks:
+                self.append_log("".join(log_chunks))
+            
+            # 每帧只设置一次进度
+            if overall is not None:
+                self.progress_var.set(overall)
             
-            self.log_text.see(tk.END)
-            self.root.update()
+            for event in final_events:
+                if event.kind == "batch_done":
+                    self.show_final_result(event)
+                else:
+                    self.show_error(event)
             
+            if queue_view is not None:
+                self.apply_queue_view(*queue_view)
+            for result in batch_results:
+                self.start_batch(*result)
+        finally:
+            self.root.after(UI_FRAME_MS, self.pump_events)
+    
+    def append_log(self, text):
+        """追加日志并滚动到末尾，超过最大行数时删除最早的日志"""
+        self.log_text.insert(tk.END, text)
+        line_count = int(self.log_text.index("end-1c").split(".")[0])
+        if line_count > MAX_LOG_LINES:
+            self.log_text.delete("1.0", f"{line_count - MAX_LOG_LINES + 1}.0")
+        self.log_text.see(tk.END)
+    
+    def show_error(self, event):
+        """显示执行器内部错误"""
+        self.append_log(event.message)
+        self.status_var.set("转换失败")
+        self.progress_var.set(0)
+        self.convert_btn.config(state=tk.NORMAL)
+        self.stop_btn.config(state=tk.DISABLED)
+        messagebox.showerror("错误", f"转换出错: {event.message.strip()}")
+    
+    def show_final_result(self, event):
+        """所有文件转换完成或被停止"""
+        output_dir = self.output_dir_entry.get().strip()
+        total_files = len(self.runner.jobs)
+        telemetry = self.runner.telemetry
+        if telemetry is not None and telemetry.count:
+            self.log_text.insert(tk.END, f"性能数据已写入: {telemetry.path}\n")
+        if getattr(event, "schedule", None):
+            self.log_text.insert(tk.END, f"调度策略: {event.schedule}，耗时 {engine.format_duration(event.elapsed)}\n")
+        
+        if event.stopped:
+            self.log_text.insert(tk.END, "转换已被停止！\n")
+            self.status_var.set("转换已停止")
+            self.progress_var.set(0)
+            messagebox.showinfo("提示", "转换已被停止")
+        else:
+            self.log_text.insert(tk.END, "=== 所有文件转换完成！ ===\n")
+            self.status_var.set("转换完成")
+            self.progress_var.set(100)
+            skipped_info = f"（其中 {event.skipped} 个之前已完成，已跳过）" if event.skipped else ""
+            messagebox.showinfo("成功", f"所有 {total_files} 个文件转换完成！{skipped_info}\n输出目录: {output_dir}")
+            
+            # 自动打开输出目录
+            if self.open_dir_var.get():
+                try:
+                    self.log_text.insert(tk.END, f"正在打开输出目录: {output_dir}\n")
+                    self.log_text.see(tk.END)
+                    
+                    # 仅支持Windows系统打开目录
+                    if sys.platform == 'win32':
+                        os.startfile(output_dir)
+                        self.log_text.insert(tk.END, "输出目录已打开\n")
+                    else:
+                        self.log_text.insert(tk.END, "当前系统不支持自动打开目录\n")
+                except Exception as e:
+                    self.log_text.insert(tk.END, f"打开输出目录失败: {str(e)}\n")
+        
+        # 恢复按钮状态
+        self.convert_btn.config(state=tk.NORMAL)
+        self.stop_btn.config(state=tk.DISABLED)
+        
+        self.log_text.see(tk.END)
+    
+    def stop_conversion(self):
+        """停止正在进行的转换：只通知执行器终止所有FFmpeg进程，不等待进程退出
+        
+        执行器停止后发出batch_done事件，由show_final_result恢复按钮状态并显示结果；
+        在此之前开始按钮保持禁用，旧批次还没结束时不能开始新的批次。
+        """
+        runner = self.runner
+        if runner is None or runner.stopped:
+            return
+        self.stop_btn.config(state=tk.DISABLED)
+        self.status_var.set("正在停止...")
+        try:
+            stopped_count = runner.stop()
         except Exception as e:
-            # 忽略所有停止过程中的异常
-            try:
-                self.log_text.insert(tk.END, "\n转换已被停止！\n")
-                self.status_var.set("转换已停止")
-                self.progress_var.set(0)
-                self.convert_btn.config(state=tk.NORMAL)
-                self.stop_btn.config(state=tk.DISABLED)
-                # 确保done_flag为True，避免转换线程显示成功
-                if hasattr(self, 'done_flag'):
-                    self.done_flag = True
-                self.log_text.see(tk.END)
-                self.root.update()
-            except:
-                pass
+            self.append_log(f"\n停止转换时出错: {str(e)}\n")
+            self.stop_btn.config(state=tk.NORMAL)
+            return
+        self.append_log(f"\n正在停止转换，已向 {stopped_count} 个FFmpeg进程发送终止信号...\n")
 
 if __name__ == "__main__":
     root = tk.Tk()